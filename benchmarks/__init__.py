@@ -0,0 +1,3 @@
+"""
+离线基准测试（本地 mock 服务，不消耗真实 LLM / API 配额）
+"""
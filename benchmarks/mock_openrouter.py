@@ -0,0 +1,177 @@
+"""
+本地 mock OpenRouter 服务（OpenAI 兼容 /chat/completions）
+
+模拟上游前缀缓存：请求中带 cache_control 的消息（及之前的全部消息和 tools）构成前缀，
+同一前缀再次出现时按缓存命中计入 usage.prompt_tokens_details.cached_tokens，
+延迟按未命中 token 计算，用于离线评估 prompt 组织方式对 token 与延迟的影响。
+可叠加按分布采样的额外延迟（见 latency_distribution），模拟上游排队 / 生成耗时。
+
+用法:
+    with MockOpenRouter(responder=lambda payload: "ok") as server:
+        agent.api_url = server.url
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _text_of(content: Any) -> str:
+    """消息 content（字符串或内容块列表）→ 文本"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _has_cache_control(content: Any) -> bool:
+    return isinstance(content, list) and any(
+        isinstance(part, dict) and part.get("cache_control") for part in content
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """与 src.models.evidence_graph.estimate_tokens 相同的粗估（约 3 字符/token）"""
+    return len(text) // 3 + 1 if text else 0
+
+
+def latency_distribution(spec: str, seed: int = 0) -> Callable[[], float]:
+    """
+    延迟分布描述 → 采样函数（秒）
+
+    支持:
+        fixed:0.5            固定延迟
+        uniform:0.2,1.5      均匀分布
+        lognormal:1.2,0.6    对数正态（中位数秒, sigma），贴近 LLM 长尾延迟
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    rng = random.Random(seed)
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"无法解析延迟分布: {spec!r}（fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA）")
+
+
+class MockOpenRouter:
+    """
+    线程化本地 mock 服务
+
+    Args:
+        responder: payload -> 回复文本（或完整 message dict）；缺省回复 "ok"
+        base_latency: 每次请求固定延迟（秒）
+        uncached_token_latency: 每个未命中缓存的输入 token 的延迟（秒）
+        cached_token_latency: 每个命中缓存的输入 token 的延迟（秒）
+        min_cache_tokens: 前缀少于该 token 数时不缓存（与上游最小缓存长度一致）
+        latency_sampler: payload -> 额外延迟（秒），叠加在 token 延迟之上
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        base_latency: float = 0.02,
+        uncached_token_latency: float = 2e-5,
+        cached_token_latency: float = 2e-6,
+        min_cache_tokens: int = 1024,
+        latency_sampler: Optional[Callable[[Dict[str, Any]], float]] = None,
+    ):
+        self.responder = responder or (lambda payload: "ok")
+        self.base_latency = base_latency
+        self.uncached_token_latency = uncached_token_latency
+        self.cached_token_latency = cached_token_latency
+        self.min_cache_tokens = min_cache_tokens
+        self.latency_sampler = latency_sampler
+        self.requests: List[Dict[str, Any]] = []
+        self._prefix_cache: set = set()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def _usage(self, payload: Dict[str, Any]) -> Tuple[int, int]:
+        """返回 (prompt_tokens, cached_tokens)"""
+        tools_text = json.dumps(payload.get("tools") or [], ensure_ascii=False, sort_keys=True)
+        texts = [_text_of(m.get("content")) for m in payload.get("messages", [])]
+        prompt_tokens = estimate_tokens(tools_text) + sum(estimate_tokens(t) for t in texts)
+
+        prefix_end = -1
+        for i, m in enumerate(payload.get("messages", [])):
+            if _has_cache_control(m.get("content")):
+                prefix_end = i
+        if prefix_end < 0:
+            return prompt_tokens, 0
+
+        prefix_tokens = estimate_tokens(tools_text) + sum(estimate_tokens(t) for t in texts[:prefix_end + 1])
+        if prefix_tokens < self.min_cache_tokens:
+            return prompt_tokens, 0
+        digest = hashlib.sha256(
+            (payload.get("model", "") + tools_text + "\x00".join(texts[:prefix_end + 1])).encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            hit = digest in self._prefix_cache
+            self._prefix_cache.add(digest)
+        return prompt_tokens, prefix_tokens if hit else 0
+
+    def handle(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_tokens, cached_tokens = self._usage(payload)
+        time.sleep(
+            self.base_latency
+            + (prompt_tokens - cached_tokens) * self.uncached_token_latency
+            + cached_tokens * self.cached_token_latency
+            + (self.latency_sampler(payload) if self.latency_sampler else 0.0)
+        )
+        reply = self.responder(payload)
+        message = reply if isinstance(reply, dict) else {"role": "assistant", "content": reply}
+        completion_tokens = estimate_tokens(message.get("content") or "")
+        with self._lock:
+            self.requests.append(payload)
+        return {
+            "id": f"mock-{len(self.requests)}",
+            "model": payload.get("model", ""),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+
+    def __enter__(self) -> "MockOpenRouter":
+        mock = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                body = json.dumps(mock.handle(payload), ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
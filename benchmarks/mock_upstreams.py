@@ -0,0 +1,227 @@
+"""
+本地上游替身：NCBI E-utilities / CIViC GraphQL / ClinicalTrials.gov v2
+
+按查询内容确定性地生成合成数据（同一查询每次返回相同结果），使端到端基准
+在离线环境下仍走完整的检索 → 解析 → 入图路径。其余上游（GDC / cBioPortal /
+openFDA / RxNorm）统一返回 404，相当于"无结果"。
+
+路由（客户端 BASE_URL 指向 {url}/<前缀>）:
+    /ncbi/esearch.fcgi, /ncbi/efetch.fcgi   PubMed 检索与摘要（XML）
+    /civic                                  GeneSearch / MolecularProfileBatch
+    /ctgov                                  摘要分页（pageToken）与 filter.ids 详情
+
+用法:
+    with MockUpstreams() as upstreams:
+        NCBIClient.BASE_URL = f"{upstreams.url}/ncbi"
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+_ABSTRACT_SENTENCES = (
+    "We retrospectively analysed patients treated at multiple centres.",
+    "The primary endpoint was progression-free survival and the secondary endpoints were overall survival and objective response rate.",
+    "Molecular profiling was performed by next-generation sequencing of tumour tissue and circulating tumour DNA.",
+    "Grade 3 or higher treatment-related adverse events occurred in a minority of patients and were manageable.",
+    "These findings support biomarker-guided treatment selection in this population.",
+)
+
+
+def _seed(*parts: str) -> int:
+    return int(hashlib.md5("\x00".join(parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+class MockUpstreams:
+    """
+    线程化本地上游替身
+
+    Args:
+        pubmed_hits: 每次 PubMed 检索返回的 PMID 数
+        trials_per_query: 每个试验查询的命中总数（按 pageSize 分页）
+        latency: 每个请求的固定延迟（秒）
+    """
+
+    def __init__(self, pubmed_hits: int = 8, trials_per_query: int = 12, latency: float = 0.0):
+        self.pubmed_hits = pubmed_hits
+        self.trials_per_query = trials_per_query
+        self.latency = latency
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ==================== NCBI ====================
+
+    def _esearch(self, params: Dict[str, str]) -> Tuple[int, str, Any]:
+        if params.get("db", "pubmed") != "pubmed":
+            return 200, "application/json", {"esearchresult": {"count": "0", "idlist": []}}
+        base = 30000000 + _seed(params.get("term", "")) % 5000000
+        limit = min(self.pubmed_hits, int(params.get("retmax", self.pubmed_hits)))
+        ids = [str(base + i * 7) for i in range(limit)]
+        return 200, "application/json", {"esearchresult": {"count": str(len(ids)), "idlist": ids}}
+
+    @staticmethod
+    def _efetch(params: Dict[str, str]) -> Tuple[int, str, Any]:
+        articles = []
+        for pmid in filter(None, params.get("id", "").split(",")):
+            n = _seed(pmid)
+            abstract = " ".join(_ABSTRACT_SENTENCES[(n + i) % len(_ABSTRACT_SENTENCES)] for i in range(4))
+            pub_type = ("Clinical Trial, Phase III", "Review", "Meta-Analysis", "Journal Article")[n % 4]
+            articles.append(
+                "<PubmedArticle><MedlineCitation>"
+                f"<PMID>{pmid}</PMID><Article>"
+                f"<Journal><Title>Synthetic Journal of Oncology</Title><JournalIssue><PubDate><Year>{2015 + n % 10}</Year></PubDate></JournalIssue></Journal>"
+                f"<ArticleTitle>Synthetic study {pmid} of targeted therapy outcomes</ArticleTitle>"
+                f"<Abstract><AbstractText>{escape(abstract)}</AbstractText></Abstract>"
+                "<AuthorList><Author><LastName>Zhang</LastName><Initials>W</Initials></Author></AuthorList>"
+                f"<PublicationTypeList><PublicationType>{pub_type}</PublicationType></PublicationTypeList>"
+                "</Article></MedlineCitation></PubmedArticle>"
+            )
+        return 200, "text/xml", "<PubmedArticleSet>" + "".join(articles) + "</PubmedArticleSet>"
+
+    # ==================== CIViC ====================
+
+    @staticmethod
+    def _civic(body: Dict[str, Any]) -> Tuple[int, str, Any]:
+        query = body.get("query", "")
+        variables = body.get("variables") or {}
+        if "GeneSearch" in query:
+            name = str(variables.get("name", "")).upper()
+            node = {"id": _seed(name) % 10000, "name": name, "description": f"{name} is a synthetic gene record.", "entrezId": _seed(name) % 100000}
+            return 200, "application/json", {"data": {"genes": {"nodes": [node]}}}
+        if "MolecularProfileBatch" in query:
+            data = {}
+            for key, name in variables.items():
+                n = _seed(str(name))
+                evidence = [
+                    {
+                        "id": n % 100000 + i,
+                        "status": "ACCEPTED",
+                        "evidenceType": ("PREDICTIVE", "PROGNOSTIC", "DIAGNOSTIC")[i % 3],
+                        "evidenceLevel": "ABCDE"[(n + i) % 5],
+                        "evidenceDirection": "SUPPORTS",
+                        "significance": ("SENSITIVITYRESPONSE", "RESISTANCE", "POOR_OUTCOME")[i % 3],
+                        "disease": {"name": "Colorectal Cancer", "doid": "9256"},
+                        "therapies": [{"name": ("Sotorasib", "Cetuximab", "Osimertinib")[(n + i) % 3], "ncitId": "C000000"}],
+                        "source": {"sourceType": "PUBMED", "citationId": str(30000000 + (n + i) % 5000000)},
+                    }
+                    for i in range(4)
+                ]
+                data["mp" + key[1:]] = {"nodes": [{
+                    "id": n % 10000,
+                    "name": str(name),
+                    "description": "",
+                    "link": f"/molecular-profiles/{n % 10000}",
+                    "variants": [{"id": n % 10000, "name": str(name).split(" ", 1)[-1], "variantTypes": [{"name": "Missense Variant"}]}],
+                    "evidenceItems": {"totalCount": len(evidence), "nodes": evidence},
+                }]}
+            return 200, "application/json", {"data": data}
+        return 200, "application/json", {"data": {}}
+
+    # ==================== ClinicalTrials.gov ====================
+
+    @staticmethod
+    def _study(nct_id: str, detail: bool) -> Dict[str, Any]:
+        n = _seed(nct_id)
+        protocol = {
+            "identificationModule": {"nctId": nct_id, "briefTitle": f"Synthetic targeted therapy trial {nct_id}"},
+            "statusModule": {
+                "overallStatus": ("RECRUITING", "NOT_YET_RECRUITING", "ACTIVE_NOT_RECRUITING")[n % 3],
+                "startDateStruct": {"date": f"{2019 + n % 6}-01"},
+                "lastUpdatePostDateStruct": {"date": f"2026-0{1 + n % 9}-15"},
+            },
+            "designModule": {"phases": [("PHASE1", "PHASE2", "PHASE3")[n % 3]], "enrollmentInfo": {"count": 40 + n % 400}},
+            "conditionsModule": {"conditions": ["Colorectal Cancer", "Non-small Cell Lung Cancer"][: 1 + n % 2]},
+            "armsInterventionsModule": {"interventions": [{"name": ("Sotorasib", "Adagrasib", "Osimertinib")[n % 3], "type": "DRUG"}]},
+            "contactsLocationsModule": {"locations": [{"facility": "Synthetic Cancer Hospital", "city": "Beijing", "country": "China"}]},
+            "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Synthetic Sponsor"}},
+        }
+        if detail:
+            protocol["identificationModule"]["officialTitle"] = f"A Phase {1 + n % 3} Study of Synthetic Therapy ({nct_id})"
+            protocol["eligibilityModule"] = {
+                "eligibilityCriteria": "Inclusion Criteria:\n* Histologically confirmed advanced solid tumour\n* ECOG 0-1\n\n"
+                                       "Exclusion Criteria:\n* Active brain metastases\n* Prior therapy with the study drug"
+            }
+        return {"protocolSection": protocol}
+
+    def _ctgov(self, params: Dict[str, str]) -> Tuple[int, str, Any]:
+        if params.get("filter.ids"):
+            ids = params["filter.ids"].split(",")
+            return 200, "application/json", {"studies": [self._study(i, detail=True) for i in ids]}
+
+        query = json.dumps({k: v for k, v in params.items() if k.startswith("query.")}, sort_keys=True)
+        base = _seed(query) % 9000000
+        all_ids = [f"NCT0{base + i * 13:07d}" for i in range(self.trials_per_query)]
+        offset = int(params.get("pageToken") or 0)
+        size = int(params.get("pageSize", 10))
+        page = all_ids[offset:offset + size]
+        body: Dict[str, Any] = {"studies": [self._study(i, detail=False) for i in page]}
+        if offset + size < len(all_ids):
+            body["nextPageToken"] = str(offset + size)
+        return 200, "application/json", body
+
+    # ==================== 服务 ====================
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, str, Any]:
+        parsed = urlparse(path)
+        service, _, rest = parsed.path.lstrip("/").partition("/")
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        with self._lock:
+            self.counts[service] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if service == "ncbi" and rest == "esearch.fcgi":
+            return self._esearch(params)
+        if service == "ncbi" and rest == "efetch.fcgi":
+            return self._efetch(params)
+        if service == "civic" and method == "POST":
+            return self._civic(json.loads(body or b"{}"))
+        if service == "ctgov" and not rest:
+            return self._ctgov(params)
+        return 404, "application/json", {"error": {"code": "NOT_FOUND", "message": "offline stand-in"}}
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+    def __enter__(self) -> "MockUpstreams":
+        mock = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _respond(self, method: str):
+                length = int(self.headers.get("Content-Length", 0))
+                status, content_type, payload = mock.handle(method, self.path, self.rfile.read(length) if length else b"")
+                body = (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -3,14 +3,16 @@
 """
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-
-# 加载环境变量 (override=True 确保.env文件覆盖系统环境变量)
-load_dotenv(override=True)
 
 # 项目根目录
 BASE_DIR = Path(__file__).parent.parent.resolve()
 
+# 加载环境变量 (override=True 确保.env文件覆盖系统环境变量)
+# 下方常量在导入时读取环境变量，因此加载必须留在模块顶部；无 .env 时跳过 python-dotenv 的导入
+if (BASE_DIR / ".env").is_file():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / ".env", override=True)
+
 # ==================== API 配置 ====================
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-3-pro-preview")
@@ -22,19 +24,51 @@ PROMPTS_DIR = BASE_DIR / "config" / "prompts"
 LOGS_DIR = BASE_DIR / "logs"
 DATA_DIR = BASE_DIR / "data"
 
-# 确保关键目录存在
-REPORTS_DIR.mkdir(exist_ok=True)
-LOGS_DIR.mkdir(exist_ok=True)
-DATA_DIR.mkdir(exist_ok=True)
-
 # ==================== API 工具配置 ====================
 # NCBI (PubMed + ClinVar) - API Key 提高限额至 10次/秒
 NCBI_API_KEY = os.getenv("NCBI_API_KEY", "cc2f31026e714a0133f5d535437a486b7907")
 NCBI_EMAIL = os.getenv("NCBI_EMAIL", "mtb-workflow@example.com")
 
+# cBioPortal：多研究并发拉取（仍受客户端全局限速约束）与 (基因, 研究) 频率表磁盘缓存
+CBIOPORTAL_MAX_WORKERS = int(os.getenv("CBIOPORTAL_MAX_WORKERS", "4"))
+CBIOPORTAL_CACHE_DIR = DATA_DIR / "cache" / "cbioportal"
+CBIOPORTAL_CACHE_TTL_DAYS = float(os.getenv("CBIOPORTAL_CACHE_TTL_DAYS", "30"))  # <=0 关闭磁盘缓存
+
+# GDC：相互独立的子查询并发发出；按基因归约后的结果（病例分布 / 氨基酸变化计数）磁盘缓存
+GDC_MAX_WORKERS = int(os.getenv("GDC_MAX_WORKERS", "3"))
+GDC_CACHE_DIR = DATA_DIR / "cache" / "gdc"
+GDC_CACHE_TTL_DAYS = float(os.getenv("GDC_CACHE_TTL_DAYS", "30"))  # <=0 关闭磁盘缓存
+
+# CIViC：多变异合并为一次别名化 GraphQL 请求，每个请求最多的别名数（复杂度上限）
+CIVIC_BATCH_MAX_ALIASES = int(os.getenv("CIVIC_BATCH_MAX_ALIASES", "8"))
+
+# RxNorm：药物名 → RxCUI 并发解析（持久化缓存），相互作用按 RxCUI 对缓存
+RXNORM_MAX_WORKERS = int(os.getenv("RXNORM_MAX_WORKERS", "4"))
+RXNORM_CACHE_DIR = DATA_DIR / "cache" / "rxnorm"
+RXNORM_CACHE_TTL_DAYS = float(os.getenv("RXNORM_CACHE_TTL_DAYS", "30"))  # <=0 关闭磁盘缓存
+
+# ClinicalTrials.gov：nextPageToken 分页 + 两级拉取（先摘要，再只取入围试验的入组标准），本地试验索引
+CLINICALTRIALS_PAGE_SIZE = int(os.getenv("CLINICALTRIALS_PAGE_SIZE", "50"))
+CLINICALTRIALS_INDEX_PATH = Path(os.getenv("CLINICALTRIALS_INDEX_PATH", str(DATA_DIR / "cache" / "clinicaltrials" / "trials.sqlite")))
+CLINICALTRIALS_QUERY_TTL_HOURS = float(os.getenv("CLINICALTRIALS_QUERY_TTL_HOURS", "24"))  # 相同查询在此时间内直接本地应答；<=0 每次联网
+
+# FDA 说明书本地索引（openFDA 批量标签导入的 SQLite/FTS5；文件存在时优先查本地）
+FDA_LABEL_INDEX_PATH = Path(os.getenv("FDA_LABEL_INDEX_PATH", str(DATA_DIR / "fda" / "labels.sqlite")))
+FDA_LABEL_OFFLINE_ONLY = os.getenv("FDA_LABEL_OFFLINE_ONLY", "false").lower() == "true"  # 本地未命中时不回退 openFDA
+
 # OncoKB Token (如已申请)
 ONCOKB_API_TOKEN = os.getenv("ONCOKB_API_TOKEN", "")
 
+# 上游熔断器（所有 api_clients 共享，按上游服务独立计数）
+# 窗口内请求数 >= 最小请求数且失败率（含慢调用）>= 阈值时熔断，熔断期内工具直接返回"服务不可用"；
+# 冷却后放行一个探测请求（半开），成功则恢复
+UPSTREAM_BREAKER_ENABLED = os.getenv("UPSTREAM_BREAKER_ENABLED", "true").lower() == "true"
+UPSTREAM_BREAKER_WINDOW_SECONDS = float(os.getenv("UPSTREAM_BREAKER_WINDOW_SECONDS", "60"))
+UPSTREAM_BREAKER_MIN_REQUESTS = int(os.getenv("UPSTREAM_BREAKER_MIN_REQUESTS", "4"))
+UPSTREAM_BREAKER_FAILURE_RATE = float(os.getenv("UPSTREAM_BREAKER_FAILURE_RATE", "0.5"))
+UPSTREAM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("UPSTREAM_BREAKER_SLOW_CALL_SECONDS", "20"))
+UPSTREAM_BREAKER_OPEN_SECONDS = float(os.getenv("UPSTREAM_BREAKER_OPEN_SECONDS", "30"))
+
 # ==================== RAG 配置 ====================
 NCCN_PDF_DIR = BASE_DIR / os.getenv("NCCN_PDF_DIR", "NCCN_English")
 # 索引存储在用户目录，避免被 git clean 删除
@@ -83,6 +117,116 @@ MAX_TOKENS_CHAIR = 65536       # anthropic/claude-opus-4-6 (128k)
 ORCHESTRATOR_REASONING_EFFORT = os.getenv("ORCHESTRATOR_REASONING_EFFORT", "high")
 SUBGRAPH_REASONING_EFFORT = os.getenv("SUBGRAPH_REASONING_EFFORT", "high")
 
+# ==================== 按调用点的 LLM 预算 ====================
+# 每个调用点: 最大输出 token / reasoning effort ("" 不发送) / 超时秒数 / 自适应放宽上限
+# 未列出的调用点沿用上方按模型的 MAX_TOKENS_* 与 *_REASONING_EFFORT
+# 可用 LLM_CALL_SITE_BUDGETS_OVERRIDE='{"report": {"max_tokens": 49152}}' 覆盖
+LLM_CALL_SITE_BUDGETS = {
+    "research_turn":         {"max_tokens": 16384, "reasoning_effort": SUBGRAPH_REASONING_EFFORT, "timeout": AGENT_TIMEOUT, "max_tokens_ceiling": MAX_TOKENS_SUBGRAPH},
+    "entity_extraction":     {"max_tokens": 8192,  "reasoning_effort": "",    "timeout": 60,  "max_tokens_ceiling": 32768},
+    "plan":                  {"max_tokens": 16384, "reasoning_effort": ORCHESTRATOR_REASONING_EFFORT, "timeout": AGENT_TIMEOUT, "max_tokens_ceiling": MAX_TOKENS_ORCHESTRATOR},
+    "convergence_eval":      {"max_tokens": 8192,  "reasoning_effort": "medium", "timeout": 180, "max_tokens_ceiling": 32768},
+    "report":                {"max_tokens": 32768, "reasoning_effort": "medium", "timeout": AGENT_TIMEOUT, "max_tokens_ceiling": MAX_TOKENS_MAIN},
+    "chair":                 {"max_tokens": MAX_TOKENS_CHAIR, "reasoning_effort": ORCHESTRATOR_REASONING_EFFORT, "timeout": AGENT_TIMEOUT, "max_tokens_ceiling": MAX_TOKENS_CHAIR},
+    "pubmed_query_build":    {"max_tokens": 1024,  "reasoning_effort": "low", "timeout": 60,  "max_tokens_ceiling": 4096},
+    "pubmed_relevance":      {"max_tokens": 8192,  "reasoning_effort": "low", "timeout": 60,  "max_tokens_ceiling": 32768},
+    "pageindex_tree_search": {"max_tokens": 4096,  "reasoning_effort": "low", "timeout": 120, "max_tokens_ceiling": 16384},
+}
+LLM_CALL_SITE_BUDGETS_OVERRIDE = os.getenv("LLM_CALL_SITE_BUDGETS_OVERRIDE", "")
+# finish_reason=length 时按 2 倍放宽 max_tokens（不超过上限）重试
+LLM_BUDGET_ADAPTIVE = os.getenv("LLM_BUDGET_ADAPTIVE", "true").lower() == "true"
+LLM_BUDGET_MAX_WIDENINGS = int(os.getenv("LLM_BUDGET_MAX_WIDENINGS", "2"))
+
+# ==================== LLM 对冲请求（长尾延迟） ====================
+# 幂等调用点的请求超过该 (模型, 调用点) 历史 p95 仍未返回时，发出一份相同请求，先返回者胜出
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_CALL_SITES = [
+    s.strip() for s in os.getenv(
+        "LLM_HEDGE_CALL_SITES",
+        "research_turn,entity_extraction,convergence_eval,pubmed_query_build,pubmed_relevance,pageindex_tree_search",
+    ).split(",") if s.strip()
+]
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "8"))        # 样本不足时用初始延迟
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "90"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "5"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "180"))
+# 对冲请求只使用速率限制窗口内的余量：窗口内请求数 < 上限 - 预留 时才发出
+LLM_HEDGE_RATE_RESERVE = int(os.getenv("LLM_HEDGE_RATE_RESERVE", "5"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "256"))             # 每个直方图保留的最近样本数
+
+# ==================== 运行录制 / 回放 ====================
+# record: 把本次运行的全部 LLM 与外部 HTTP 交换写入 {run_folder}/cassette.jsonl.gz（或 CASSETTE_PATH）
+# replay: 按请求指纹从 CASSETTE_PATH 回放，不访问网络，仅计时本地计算
+# 录制与回放应使用相同的本地缓存状态（建议 *_CACHE_TTL_DAYS=0），否则命中缓存的请求不会出现在录像中
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()     # off | record | replay
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "")
+# 回放时精确指纹未命中，是否再忽略请求体中的独立短数字（计数）匹配；默认关闭，命中均记录警告
+CASSETTE_LOOSE_MATCH = os.getenv("CASSETTE_LOOSE_MATCH", "false").lower() == "true"
+
+# ==================== 运行追踪（Chrome trace / Perfetto） ====================
+# 节点 / 研究方向 / LLM 请求 / 工具调用 / 缓存命中 / 证据图合并与检查点的 span，
+# 运行结束写入 {run_folder}/trace.json（chrome://tracing 或 ui.perfetto.dev 打开）
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", "200000"))   # 超出后丢弃新事件
+# 可选：OTLP/HTTP JSON 端点（如本地 collector 的 http://localhost:4318/v1/traces），留空不导出
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+
+# ==================== Token 用量账本与阶段预算 ====================
+# 每次 LLM 调用按 (阶段, 迭代, Agent, 方向, 调用点, 模型) 记账，运行结束写入 {run_folder}/usage_ledger.jsonl
+# 查看: python -m src.utils.usage_ledger reports/<运行目录> --by phase agent
+# 单价（美元 / 百万 token，估算用）；OpenRouter 响应带 usage.cost 时以其为准
+MODEL_PRICING = {
+    "google/gemini-3-pro-preview": {"prompt": 2.0, "cached_prompt": 0.2, "completion": 12.0},
+    "google/gemini-3-flash-preview": {"prompt": 0.5, "cached_prompt": 0.05, "completion": 3.0},
+}
+# 可用 MODEL_PRICING_OVERRIDE='{"openai/gpt-5.2": {"prompt": 1.75, "cached_prompt": 0.175, "completion": 14}}' 补充
+MODEL_PRICING_OVERRIDE = os.getenv("MODEL_PRICING_OVERRIDE", "")
+# 阶段软预算（prompt + completion token），如 PHASE_TOKEN_BUDGETS='{"phase1": 4000000, "phase2a": 3000000}'；
+# 阶段累计超出后: reasoning effort 降一档、研究方向工具轮数减半（最少 1 轮）。留空不限制
+PHASE_TOKEN_BUDGETS = os.getenv("PHASE_TOKEN_BUDGETS", "")
+
+# ==================== 服务模式（python main.py serve） ====================
+# 常驻进程：编译后的工作流、RAG 索引、缓存与连接池跨病例复用；病例经 SQLite 任务队列排队，
+# 多个病例并发执行，共享全局 LLM 速率限制与上游熔断
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8765"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "2"))          # 同时执行的病例数
+SERVICE_QUEUE_PATH = Path(os.getenv("SERVICE_QUEUE_PATH", str(DATA_DIR / "service" / "jobs.sqlite")))
+# 任务最多执行次数：服务重启时已执行满该次数仍未结束的任务标记失败，不再重新排队（避免反复拖垮进程的病例无限重试）
+SERVICE_MAX_ATTEMPTS = int(os.getenv("SERVICE_MAX_ATTEMPTS", "3"))
+# 启动时预热的 PageIndex 癌种（逗号分隔，留空不预热）；多模态图片 RAG 加载 ColQwen 较慢，默认不预热
+SERVICE_WARM_PAGEINDEX = os.getenv("SERVICE_WARM_PAGEINDEX", "结肠癌")
+SERVICE_WARM_IMAGE_RAG = os.getenv("SERVICE_WARM_IMAGE_RAG", "false").lower() == "true"
+
+# ==================== 批处理（python main.py batch <目录>） ====================
+# 进程池并发执行目录下的全部病例；按癌种 / 驱动基因排序，使同癌种病例相邻以复用 NCCN 索引、试验查询与磁盘缓存
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "3"))              # 工作进程数
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "1"))      # 单病例失败（异常 / 未生成报告 / 进程崩溃）后的重试次数
+# 跨进程共享速率限制窗口的目录（OpenRouter、cBioPortal）；批处理未设置时自动使用 data/cache/ratelimit
+RATE_LIMIT_SHARED_DIR = os.getenv("RATE_LIMIT_SHARED_DIR", "")
+
+# ==================== 实体提取批量配置 ====================
+# 多条 finding 打包进一次 LLM 请求；预算只计 finding 载荷（系统提示与实体索引每批共享一次）
+ENTITY_EXTRACTION_BATCH_TOKENS = int(os.getenv("ENTITY_EXTRACTION_BATCH_TOKENS", "12000"))
+ENTITY_EXTRACTION_BATCH_MAX_ITEMS = int(os.getenv("ENTITY_EXTRACTION_BATCH_MAX_ITEMS", "8"))
+# 提取提示中"已有实体"只列与 finding 相关的候选实体（词项/别名匹配 + 类型兼容），token 上限
+ENTITY_INDEX_MAX_TOKENS = int(os.getenv("ENTITY_INDEX_MAX_TOKENS", "1500"))
+# 调试：每次更新证据图时对比过滤索引与全量索引的复用实体召回（需构建全量索引，默认关闭）
+ENTITY_INDEX_QUALITY_LOG = os.getenv("ENTITY_INDEX_QUALITY_LOG", "false").lower() == "true"
+# 研究提示中单方向锚点子图上下文的 token 上限（按相关性保留实体与关系）
+DIRECTION_CONTEXT_MAX_TOKENS = int(os.getenv("DIRECTION_CONTEXT_MAX_TOKENS", "4000"))
+
+# ==================== 工具结果压缩配置 ====================
+# 多轮工具调用中，工具消息总量超出预算时，较早轮次的结果替换为结构化摘要（完整结果保留在侧存储）
+# 设为 0 关闭压缩
+TOOL_RESULT_CONTEXT_BUDGET_TOKENS = int(os.getenv("TOOL_RESULT_CONTEXT_BUDGET_TOKENS", "24000"))
+TOOL_RESULT_DIGEST_MAX_CHARS = int(os.getenv("TOOL_RESULT_DIGEST_MAX_CHARS", "1200"))
+
+# ==================== Prompt 前缀缓存配置 ====================
+# 请求按 "系统提示 → 病例上下文 → 可变部分" 组织，稳定前缀加 cache_control 提示（OpenRouter 透传给上游）
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+
 # ==================== DeepEvidence 收敛配置 ====================
 MAX_PHASE1_ITERATIONS = int(os.getenv("MAX_PHASE1_ITERATIONS", "3"))    # Phase 1: 轻量 BFRS/DFRS, 信息提取有界
 MAX_PHASE2A_ITERATIONS = int(os.getenv("MAX_PHASE2A_ITERATIONS", "7"))  # Phase 2a: 完整 BFRS/DFRS, 开放式治疗探索
@@ -156,6 +300,15 @@ NCCN_IMAGE_VECTOR_DIR = Path(os.getenv(
     r"C:\Users\Windows11\Desktop\image_vector_store"
 ))
 COLPALI_MODEL = os.getenv("COLPALI_MODEL", "vidore/colqwen2-v1.0")
+# 推理设备: "auto"（有 GPU 用 cuda，否则 cpu）/ "cuda" / "cpu"
+NCCN_IMAGE_DEVICE = os.getenv("NCCN_IMAGE_DEVICE", "auto")
+
+# CPU 检索路径：页面多向量导出为内存映射 NumPy 存储（索引目录下 mmap_store/）
+# 存在时优先使用，不再加载 byaldi 内存索引
+NCCN_IMAGE_USE_MMAP_STORE = os.getenv("NCCN_IMAGE_USE_MMAP_STORE", "true").lower() == "true"
+NCCN_IMAGE_STORE_DTYPE = os.getenv("NCCN_IMAGE_STORE_DTYPE", "float16")  # float16 / int8
+NCCN_IMAGE_MAXSIM_BLOCK_TOKENS = int(os.getenv("NCCN_IMAGE_MAXSIM_BLOCK_TOKENS", "65536"))
+NCCN_IMAGE_QUERY_CACHE_SIZE = int(os.getenv("NCCN_IMAGE_QUERY_CACHE_SIZE", "512"))  # 查询嵌入 LRU 条目数
 
 # 多模态 LLM 读图配置（Image RAG 第二阶段：提取页面图片后由多模态 LLM 分析）
 NCCN_IMAGE_READER_MODEL = os.getenv("NCCN_IMAGE_READER_MODEL", ORCHESTRATOR_MODEL)
@@ -168,7 +321,7 @@ NCCN_IMAGE_DEFAULT_INDEX = os.getenv("NCCN_IMAGE_DEFAULT_INDEX", "nccn_colon")
 # ==================== PageIndex RAG 配置 ====================
 NCCN_PAGEINDEX_DIR = BASE_DIR / "data" / "pageindex"
 NCCN_PAGEINDEX_TREE_SEARCH_MODEL = SUBGRAPH_MODEL
-NCCN_PAGEINDEX_REASONING_EFFORT = SUBGRAPH_REASONING_EFFORT
+# 树搜索的 max_tokens / reasoning effort 见 LLM_CALL_SITE_BUDGETS["pageindex_tree_search"]
 
 
 def validate_config() -> bool:
@@ -189,6 +342,12 @@ def validate_config() -> bool:
     return True
 
 
+def ensure_runtime_dirs() -> None:
+    """创建报告 / 日志 / 数据目录（由入口显式调用，导入配置不产生文件系统副作用）"""
+    for directory in (REPORTS_DIR, LOGS_DIR, DATA_DIR):
+        directory.mkdir(exist_ok=True)
+
+
 def load_prompt(filename: str) -> str:
     """
     加载提示词文件
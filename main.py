@@ -3,6 +3,8 @@ MTB 多智能体工作流系统 - 主入口
 
 使用方法:
     python main.py <病例PDF文件路径>
+    python main.py serve [--host HOST] [--port PORT] [--workers N]   # 常驻服务模式
+    python main.py batch <病例目录> [--workers N] [--retries N]       # 批处理
 
 示例:
     python main.py tests/fixtures/sample_case.pdf
@@ -14,15 +16,10 @@ from pathlib import Path
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent))
 
-from dotenv import load_dotenv
-
-# 加载环境变量
-load_dotenv()
-
-from config.settings import validate_config, REPORTS_DIR
-from src.utils.logger import mtb_logger as logger
+# .env 由 config.settings 在导入时加载
+from config.settings import validate_config, ensure_runtime_dirs, REPORTS_DIR
+from src.utils.logger import mtb_logger as logger, setup_logger
 from src.utils.file_handler import read_case_file
-from src.graph.state_graph import run_mtb_workflow
 
 
 def main(case_file_path: str):
@@ -59,6 +56,9 @@ def main(case_file_path: str):
         print(f"\n[ERROR] 读取文件失败: {e}")
         sys.exit(1)
 
+    # 工作流依赖（LangGraph / LangChain）导入较慢，--help 与配置错误时不加载
+    from src.graph.state_graph import run_mtb_workflow
+
     # 执行工作流
     print("\n" + "=" * 60)
     print("开始处理病例...")
@@ -98,6 +98,12 @@ def main(case_file_path: str):
             if final_state.get("parsing_errors"):
                 print(f"[WARN] 解析警告: {final_state['parsing_errors']}")
 
+            # 上游熔断
+            for health in final_state.get("upstream_health", {}).values():
+                if health["trips"] or health["rejected"]:
+                    print(f"[WARN] {health['display_name']} 熔断 {health['trips']} 次，"
+                          f"拒绝 {health['rejected']} 次请求（详见 upstream_health.json）")
+
             print("\n提示: 使用浏览器打开 HTML 文件查看完整报告")
 
         else:
@@ -121,10 +127,21 @@ MTB 多智能体工作流系统
 
 使用方法:
     python main.py <病例PDF文件路径>
+    python main.py serve [--host HOST] [--port PORT] [--workers N]
+    python main.py batch <病例目录> [--workers N] [--retries N] [--output 汇总.json]
 
 示例:
     python main.py tests/fixtures/sample_case.pdf
 
+服务模式:
+    常驻进程预热工作流与 RAG 索引，病例经 HTTP 提交到任务队列并发执行
+    curl -X POST localhost:8765/jobs -d '{"case_path": "tests/fixtures/sample_case.pdf"}'
+    curl -N 'localhost:8765/jobs/1/events?stream=1'
+
+批处理:
+    目录下的 .pdf / .txt 病例按癌种分组后在进程池中并发执行，失败自动重试，
+    工作进程共享磁盘缓存与速率限制；汇总吞吐与延迟写入 reports/batch_<时间戳>/
+
 输入格式:
     仅支持 PDF 格式的病例报告
 
@@ -150,4 +167,19 @@ if __name__ == "__main__":
         print_usage()
         sys.exit(0)
 
+    ensure_runtime_dirs()
+    setup_logger()
+
+    if case_path in ("serve", "batch"):
+        try:
+            validate_config()
+        except Exception as e:
+            print(f"\n[ERROR] 配置错误: {e}")
+            sys.exit(1)
+        if case_path == "serve":
+            from src.service.server import main as mode_main
+        else:
+            from src.service.batch import main as mode_main
+        sys.exit(mode_main(sys.argv[2:]))
+
     main(case_path)
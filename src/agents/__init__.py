@@ -1,12 +1,17 @@
 """
 Agent 系统
 """
-from src.agents.base_agent import BaseAgent
-from src.agents.pathologist import PathologistAgent
-from src.agents.geneticist import GeneticistAgent
-from src.agents.recruiter import RecruiterAgent
-from src.agents.oncologist import OncologistAgent
-from src.agents.chair import ChairAgent
+from src.utils.lazy_import import lazy_exports
+
+# 按需导入：导入 base_agent 时不再连带加载全部 Agent 及其工具
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "BaseAgent": "src.agents.base_agent",
+    "PathologistAgent": "src.agents.pathologist",
+    "GeneticistAgent": "src.agents.geneticist",
+    "RecruiterAgent": "src.agents.recruiter",
+    "OncologistAgent": "src.agents.oncologist",
+    "ChairAgent": "src.agents.chair",
+})
 
 __all__ = [
     "BaseAgent",
@@ -33,8 +33,18 @@ from config.settings import (
     MAX_TOKENS_SUBGRAPH,
     MAX_TOKENS_ORCHESTRATOR,
     MAX_TOKENS_CHAIR,
+    TOOL_RESULT_CONTEXT_BUDGET_TOKENS,
+    TOOL_RESULT_DIGEST_MAX_CHARS,
+    PROMPT_CACHE_ENABLED,
 )
 from src.utils.logger import mtb_logger as logger, log_tool_call
+from src.utils.tool_result_compaction import compact_tool_messages
+from src.utils.llm_budget import CallBudget, get_budget, run_with_budget
+from src.utils.llm_hedging import hedged_call
+from src.utils.cassette import replaying
+from src.utils.shared_rate_limiter import shared_window
+from src.utils.tracing import span
+from src.utils.usage_ledger import usage_tags
 
 
 @dataclass
@@ -120,6 +130,10 @@ class ReferenceManager:
         return "\n".join(lines)
 
 
+# 消息级标记：属于可缓存的稳定前缀（发送前移除）
+CACHE_PREFIX_FLAG = "_cache_prefix"
+
+
 class BaseAgent:
     """
     Agent 基类
@@ -134,6 +148,9 @@ class BaseAgent:
     _RATE_LIMIT_WINDOW = 10  # 时间窗口：10秒
     _RATE_LIMIT_MAX_REQUESTS = 20  # 窗口内最大请求数：10次（应对Google上游限制）
 
+    # 默认 LLM 调用点（预算表 LLM_CALL_SITE_BUDGETS 的键；未登记时按模型选择预算）
+    default_call_site = "default"
+
     def __init__(
         self,
         role: str,
@@ -171,6 +188,12 @@ class BaseAgent:
         # 引用管理器（每次 invoke 重置）
         self.reference_manager = ReferenceManager()
 
+        # 当前 invoke 的调用点（决定 max_tokens / reasoning effort / 超时）
+        self._active_call_site = self.default_call_site
+
+        # 输入 token 统计（累计，含前缀缓存命中）
+        self.usage_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
     def _build_system_prompt(self, prompt_file: str) -> str:
         """构建完整的系统提示词"""
         global_principles = load_prompt(GLOBAL_PRINCIPLES_FILE)
@@ -185,8 +208,14 @@ class BaseAgent:
     def _check_rate_limit(cls):
         """
         检查OpenRouter速率限制（10秒内最多20次请求）
-        如果达到限制，阻塞等待直到有空闲配额
+        如果达到限制，阻塞等待直到有空闲配额（回放录像时跳过）
         """
+        if replaying():
+            return
+        shared = shared_window("openrouter", cls._RATE_LIMIT_MAX_REQUESTS, cls._RATE_LIMIT_WINDOW)
+        if shared is not None:  # 批处理多进程：共享同一窗口
+            shared.acquire("OpenRouter")
+            return
         while True:  # 使用循环代替递归，避免锁问题
             wait_time = 0
             with cls._rate_limiter_lock:
@@ -222,27 +251,29 @@ class BaseAgent:
                 time.sleep(wait_time)
                 # 继续循环，重新检查
 
-    def _call_api(self, messages: List[Dict[str, Any]], include_tools: bool = False) -> Dict[str, Any]:
+    @classmethod
+    def _try_acquire_rate_slot(cls, reserve: int = 0) -> bool:
         """
-        调用 OpenRouter API
+        非阻塞地占用一个速率限制配额（对冲请求使用）
 
-        Args:
-            messages: 消息列表
-            include_tools: 是否包含工具定义
-
-        Returns:
-            API 响应 JSON
+        窗口内请求数 < 上限 - reserve 时记录时间戳并返回 True，否则返回 False，
+        预留的配额留给主请求。
         """
-        logger.debug(f"[{self.role}] 调用 API，消息数: {len(messages)}, 工具: {include_tools}")
-
-        # ========== 全局速率限制检查 ==========
-        self._check_rate_limit()
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-
+        shared = shared_window("openrouter", cls._RATE_LIMIT_MAX_REQUESTS, cls._RATE_LIMIT_WINDOW)
+        if shared is not None:
+            return shared.try_acquire(reserve) == 0
+        with cls._rate_limiter_lock:
+            current_time = time.time()
+            cutoff_time = current_time - cls._RATE_LIMIT_WINDOW
+            while cls._request_timestamps and cls._request_timestamps[0] < cutoff_time:
+                cls._request_timestamps.popleft()
+            if len(cls._request_timestamps) >= cls._RATE_LIMIT_MAX_REQUESTS - reserve:
+                return False
+            cls._request_timestamps.append(current_time)
+            return True
+
+    def _legacy_budget(self) -> CallBudget:
+        """未登记调用点的预算：按模型选择 max_tokens 与 reasoning effort"""
         # 根据模型选择 max_tokens（max output tokens）
         if self.model == CHAIR_MODEL:
             max_tokens = MAX_TOKENS_CHAIR
@@ -253,52 +284,98 @@ class BaseAgent:
         else:
             max_tokens = MAX_TOKENS_MAIN
 
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": self.temperature,
-            "max_tokens": max_tokens,
-        }
-
         # 根据模型选择 reasoning effort（Pro → high, Flash → medium）
         reasoning_effort = ""
         if self.model == SUBGRAPH_MODEL:
             reasoning_effort = SUBGRAPH_REASONING_EFFORT
         elif self.model in (ORCHESTRATOR_MODEL, CONVERGENCE_JUDGE_MODEL, CHAIR_MODEL):
             reasoning_effort = ORCHESTRATOR_REASONING_EFFORT
-        if reasoning_effort:
-            payload["reasoning"] = {"effort": reasoning_effort}
+
+        return CallBudget(
+            site=self.default_call_site,
+            max_tokens=max_tokens,
+            reasoning_effort=reasoning_effort,
+            timeout=AGENT_TIMEOUT,
+            max_tokens_ceiling=max_tokens,
+        )
+
+    def _call_api(self, messages: List[Dict[str, Any]], include_tools: bool = False) -> Dict[str, Any]:
+        """
+        调用 OpenRouter API
+
+        max_tokens / reasoning effort / 超时取自当前调用点预算（见 invoke 的 call_site），
+        finish_reason=length 时按预算表自适应放宽重试。
+
+        Args:
+            messages: 消息列表
+            include_tools: 是否包含工具定义
+
+        Returns:
+            API 响应 JSON
+        """
+        budget = get_budget(self._active_call_site, fallback=self._legacy_budget())
+        logger.debug(
+            f"[{self.role}] 调用 API，消息数: {len(messages)}, 工具: {include_tools}, "
+            f"调用点: {budget.site} (max_tokens={budget.max_tokens}, effort={budget.reasoning_effort or '-'})"
+        )
+
+        payload = {
+            "model": self.model,
+            "messages": self._apply_cache_control(messages),
+            "temperature": self.temperature,
+            "usage": {"include": True},
+        }
 
         # 如果有工具且模型支持，添加工具定义
         if include_tools and self.tools:
             payload["tools"] = self._get_tools_schema()
             payload["tool_choice"] = "auto"
 
-        # 重试逻辑（网络错误、API 错误都重试）
+        with usage_tags(agent=self.role, model=self.model):
+            return run_with_budget(budget, lambda b: self._post_completion(b.apply(dict(payload)), b.timeout))
+
+    def _post_completion(self, payload: Dict[str, Any], timeout: int) -> Dict[str, Any]:
+        """发送单次 chat/completions 请求（含速率限制与网络/429 重试）"""
+        # ========== 全局速率限制检查 ==========
+        with span("rate_limit_wait", "rate_limit", agent=self.role):
+            self._check_rate_limit()
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+        def send_once() -> Dict[str, Any]:
+            response = requests.post(
+                url=self.api_url,
+                headers=headers,
+                data=json.dumps(payload, ensure_ascii=False),
+                timeout=timeout
+            )
+
+            # 检查 HTTP 状态
+            if response.status_code != 200:
+                error_detail = response.text
+                raise Exception(f"HTTP {response.status_code}: {error_detail[:200]}")
+
+            result = response.json()
+
+            # 检查 API 错误响应（HTTP 200 但返回错误）
+            if "error" in result:
+                error_msg = result.get("error", {})
+                error_code = error_msg.get("code", "unknown") if isinstance(error_msg, dict) else "unknown"
+                raise Exception(f"API error (code={error_code}): {error_msg}")
+            return result
+
+        # 重试逻辑（网络错误、API 错误都重试）；幂等调用点停滞时对冲
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = requests.post(
-                    url=self.api_url,
-                    headers=headers,
-                    data=json.dumps(payload, ensure_ascii=False),
-                    timeout=AGENT_TIMEOUT
-                )
-
-                # 检查 HTTP 状态
-                if response.status_code != 200:
-                    error_detail = response.text
-                    raise Exception(f"HTTP {response.status_code}: {error_detail[:200]}")
-
-                result = response.json()
-
-                # 检查 API 错误响应（HTTP 200 但返回错误）
-                if "error" in result:
-                    error_msg = result.get("error", {})
-                    error_code = error_msg.get("code", "unknown") if isinstance(error_msg, dict) else "unknown"
-                    raise Exception(f"API error (code={error_code}): {error_msg}")
+                with span(f"attempt {attempt + 1}", "llm_attempt", agent=self.role, model=self.model):
+                    result = hedged_call(self._active_call_site, self.model, send_once)
 
                 logger.debug(f"[{self.role}] API 响应成功")
+                self._record_usage(result)
                 return result
 
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
@@ -332,7 +409,68 @@ class BaseAgent:
                     logger.error(f"[{self.role}] API 错误，重试已用尽: {e}")
                     raise
 
-    def invoke(self, user_message: str, context: Optional[Dict[str, Any]] = None, max_tool_iterations: int = 5) -> Dict[str, Any]:
+    def _apply_cache_control(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        生成发送用消息列表：稳定前缀消息的最后一个文本块加 cache_control 提示
+
+        前缀消息（系统提示、病例上下文）在同一 Agent 的多次调用间逐字节不变，
+        支持前缀缓存的上游（Anthropic / Gemini，经 OpenRouter 透传）对其按缓存价计费。
+        原消息列表不修改。
+        """
+        outgoing = []
+        for msg in messages:
+            if CACHE_PREFIX_FLAG not in msg:
+                outgoing.append(msg)
+                continue
+            msg = {k: v for k, v in msg.items() if k != CACHE_PREFIX_FLAG}
+            if PROMPT_CACHE_ENABLED and isinstance(msg.get("content"), str) and msg["content"]:
+                msg["content"] = [
+                    {"type": "text", "text": msg["content"], "cache_control": {"type": "ephemeral"}}
+                ]
+            outgoing.append(msg)
+        return outgoing
+
+    def _record_usage(self, result: Dict[str, Any]) -> None:
+        """累计响应 usage 中的输入 / 缓存命中 / 输出 token"""
+        usage = result.get("usage") or {}
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        self.usage_stats["requests"] += 1
+        self.usage_stats["prompt_tokens"] += prompt_tokens
+        self.usage_stats["cached_tokens"] += cached_tokens
+        self.usage_stats["completion_tokens"] += usage.get("completion_tokens") or 0
+        logger.debug(
+            f"[{self.role}] usage: prompt={prompt_tokens} (cached={cached_tokens}, "
+            f"uncached={prompt_tokens - cached_tokens}), completion={usage.get('completion_tokens', 0)}"
+        )
+
+    def _build_messages(
+        self,
+        user_message: str,
+        context: Optional[Dict[str, Any]] = None,
+        case_context: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        组织请求消息：稳定前缀（系统提示 → 病例上下文）在前，可变任务在后
+
+        工具 schema 由 payload 的 tools 字段携带，顺序固定，也属于稳定前缀。
+        """
+        messages = [{"role": "system", "content": self.system_prompt, CACHE_PREFIX_FLAG: True}]
+        if case_context:
+            messages.append({"role": "user", "content": f"## 病例背景\n{case_context}", CACHE_PREFIX_FLAG: True})
+        messages.append({"role": "user", "content": self._format_user_message(user_message, context)})
+        return messages
+
+    def invoke(
+        self,
+        user_message: str,
+        context: Optional[Dict[str, Any]] = None,
+        max_tool_iterations: int = 5,
+        case_context: Optional[str] = None,
+        call_site: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         调用 Agent
 
@@ -340,6 +478,8 @@ class BaseAgent:
             user_message: 用户消息/任务描述
             context: 额外上下文信息（如 structured_case）
             max_tool_iterations: 最大工具调用轮次（默认 5）
+            case_context: 病例上下文（同一病例多次调用不变，作为可缓存前缀放在任务之前）
+            call_site: LLM 调用点（缺省为 default_call_site），本次 invoke 的所有轮次共用其预算
 
         Returns:
             包含 output 和 references 的字典
@@ -350,12 +490,10 @@ class BaseAgent:
         # 重置工具调用历史和引用管理器
         self.tool_call_history = []
         self.reference_manager = ReferenceManager()
+        self._active_call_site = call_site or self.default_call_site
 
         # 准备消息
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": self._format_user_message(user_message, context)}
-        ]
+        messages = self._build_messages(user_message, context, case_context)
 
         # 调用 API（尝试带工具）
         try:
@@ -460,6 +598,7 @@ class BaseAgent:
         # 注意：不要将 reasoning_details 回传给 API，Gemini 的 thinking tokens 带签名，
         # 回传会导致 "Thought signature is not valid" 错误。
         # reasoning 内容已在下方通过 _extract_reasoning_text() 提取用于内部记录。
+        round_start = len(messages)
         messages.append(assistant_msg)
 
         # 获取 LLM 的推理内容（优先从 reasoning_details 提取）
@@ -487,7 +626,8 @@ class BaseAgent:
             # 查找并执行工具
             if tool_name in self.tool_registry:
                 tool = self.tool_registry[tool_name]
-                tool_result = tool.invoke(**tool_args)
+                with span(tool_name, "tool", agent=self.role):
+                    tool_result = tool.invoke(**tool_args)
             else:
                 tool_result = f"错误：未找到工具 '{tool_name}'"
                 log_tool_call(self.role, tool_name, query_display, False, 0)
@@ -552,6 +692,16 @@ class BaseAgent:
             messages.append({"role": "user", "content": image_content})
             logger.info(f"[{self.role}] 已注入 {len(pending_images)} 张 NCCN 指南页面图片到对话")
 
+        # 较早轮次的工具结果超出预算时压缩为摘要，保持每轮输入规模基本平稳
+        saved = compact_tool_messages(
+            messages,
+            budget_tokens=TOOL_RESULT_CONTEXT_BUDGET_TOKENS,
+            protect_from=round_start,
+            digest_max_chars=TOOL_RESULT_DIGEST_MAX_CHARS,
+        )
+        if saved:
+            logger.info(f"[{self.role}] 工具结果压缩: 节省约 {saved} tokens (轮次 {iteration})")
+
         # 继续生成响应（保持工具可用，以支持多轮调用）
         next_result = self._call_api(messages, include_tools=bool(self.tools))
 
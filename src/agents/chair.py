@@ -20,6 +20,8 @@ class ChairAgent(BaseAgent):
     负责仲裁冲突（安全优先）和确保引用完整性。
     """
 
+    default_call_site = "chair"
+
     def __init__(self):
         tools = [
             NCCNTool(),
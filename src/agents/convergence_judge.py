@@ -49,6 +49,8 @@ class ConvergenceJudgeAgent(BaseAgent):
     作为第三步质量关口，评估研究是否真正充分。
     """
 
+    default_call_site = "convergence_eval"
+
     def __init__(self):
         super().__init__(
             role="ConvergenceJudge",
@@ -52,7 +52,7 @@ class GeneticistAgent(BaseAgent):
 **分析任务**:
 1. 首先从病历中提取分子变异信息（基因、突变位点、VAF、变异类型等）
 2. 提取免疫标志物信息（MSI状态、TMB、PD-L1等）
-3. 使用 search_civic 查询每个主要变异的证据等级和治疗意义
+3. 使用 search_civic 查询每个主要变异的证据等级和治疗意义（多个变异通过 variants 参数一次查询）
 4. 使用 search_clinvar 检查致病性（特别关注是否有胚系突变风险）
 5. 使用 search_gdc 查询突变频率（基于 TCGA/ICGC 数据）
 6. 使用 search_pubmed 寻找相关临床证据
@@ -71,6 +71,8 @@ class PlanAgent(BaseAgent):
     3. 设置目标模块映射和完成标准
     """
 
+    default_call_site = "plan"
+
     def __init__(self):
         """初始化 PlanAgent，使用 ORCHESTRATOR_MODEL"""
         super().__init__(
@@ -398,7 +400,7 @@ class PlanAgent(BaseAgent):
         )
 
         # 调用 LLM 进行评估
-        result = self.invoke(eval_prompt)
+        result = self.invoke(eval_prompt, call_site="convergence_eval")
         output = result.get("output", "")
 
         # 解析评估结果
@@ -806,12 +808,14 @@ class PlanAgent(BaseAgent):
     def _build_direction_subgraph_context(
         self,
         direction: ResearchDirection,
-        graph
+        graph,
+        subgraph: Optional[Dict[str, Any]] = None
     ) -> str:
         """为单个方向生成锚点+子图上下文（含锚点实体的 observation 文本）
 
         与 ResearchMixin 的 _build_direction_anchor_context() 类似，
         但额外包含 hop_distance=0 锚点实体的 observation 原文，供收敛评估验证。
+        subgraph 为调用方批量预取的子图，缺省时单独检索。
         """
         entity_ids = direction.entity_ids
         if not entity_ids:
@@ -819,11 +823,12 @@ class PlanAgent(BaseAgent):
 
         logger.info(f"[PLAN_SUBGRAPH] 方向 {direction.id}: 锚点数={len(entity_ids)}")
 
-        subgraph = graph.retrieve_subgraph(
-            anchor_ids=entity_ids,
-            max_hops=2,
-            include_observations=True
-        )
+        if subgraph is None:
+            subgraph = graph.retrieve_subgraphs(
+                {direction.id: entity_ids},
+                max_hops=2,
+                include_observations=True
+            )[direction.id]
 
         entities = subgraph.get('entities', [])
         edges = subgraph.get('edges', [])
@@ -831,9 +836,8 @@ class PlanAgent(BaseAgent):
         logger.info(f"[PLAN_SUBGRAPH] 方向 {direction.id}: entities={len(entities)}, edges={len(edges)}")
 
         # 日志：hop 分布
-        hop_map = subgraph.get('hop_map', {})
         hop_dist = {}
-        for _, hop in hop_map.items():
+        for hop in (e.get('hop_distance', -1) for e in entities):
             hop_dist[hop] = hop_dist.get(hop, 0) + 1
         logger.debug(f"[PLAN_SUBGRAPH] 方向 {direction.id}: hop分布={hop_dist}")
 
@@ -895,13 +899,25 @@ class PlanAgent(BaseAgent):
         if deep_by_direction is None:
             deep_by_direction = {}
 
+        # 所有相关方向的子图一次批量检索
+        subgraphs = graph.retrieve_subgraphs(
+            {
+                d.id: d.entity_ids for d in plan.directions
+                if d.id in relevant_direction_ids and d.entity_ids
+            },
+            max_hops=2,
+            include_observations=True
+        )
+
         sections = []
         for direction in plan.directions:
             if direction.id not in relevant_direction_ids:
                 continue
 
             # 使用锚点+子图方案（替换原来的 get_direction_evidence_summary）
-            subgraph_context = self._build_direction_subgraph_context(direction, graph)
+            subgraph_context = self._build_direction_subgraph_context(
+                direction, graph, subgraph=subgraphs.get(direction.id)
+            )
             sections.append(subgraph_context)
             sections.append("")
 
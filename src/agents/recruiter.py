@@ -58,7 +58,8 @@ class RecruiterAgent(BaseAgent):
    - 器官功能（ECOG PS、eGFR、肝功能、血象等）
    - 合并症
 
-2. 使用 search_clinical_trials 搜索匹配的临床试验（优先中国招募中的试验）
+2. 使用 search_clinical_trials 搜索匹配的临床试验（优先中国招募中的试验，返回摘要），
+   筛出入围试验后以 nct_ids 参数查看其入组标准全文
 
 3. 使用 search_nccn 确认指南推荐的试验策略
 
@@ -16,9 +16,15 @@ from src.models.evidence_graph import (
     EvidenceGrade,
     EvidenceType,
     Predicate,
+    estimate_tokens,
     load_evidence_graph
 )
-from src.models.entity_extractors import extract_entities_from_finding
+from src.models.entity_extractors import (
+    dedupe_batch_entities,
+    extract_entities_batch,
+    extract_entities_from_finding,
+    make_entity_index_selector,
+)
 from src.tools.graph_query_tool import GraphQueryTool
 from src.models.research_plan import (
     ResearchPlan,
@@ -28,6 +34,8 @@ from src.models.research_plan import (
     load_research_plan
 )
 from src.utils.logger import mtb_logger as logger, log_separator
+from src.utils.tracing import span
+from src.utils.usage_ledger import guard_tool_rounds, usage_tags
 
 if TYPE_CHECKING:
     from src.agents.base_agent import BaseAgent
@@ -159,10 +167,12 @@ class ResearchMixin:
                 graph=graph,
                 iteration=iteration,
                 max_iterations=max_iterations,
-                case_context=case_context,
                 phase_context=phase_context
             )
-            result = self.invoke(prompt, max_tool_iterations=max_tool_rounds)  # type: ignore
+            # 病例上下文作为可缓存前缀单独传入（各方向、各轮次逐字节相同）
+            result = self.invoke(  # type: ignore
+                prompt, max_tool_iterations=max_tool_rounds, case_context=case_context, call_site="research_turn"
+            )
 
             # 捕获工具调用报告
             tool_report = self.get_tool_call_report()  # type: ignore
@@ -201,24 +211,38 @@ class ResearchMixin:
             # 立即实体提取 → 后续方向可查到本方向新发现
             if parsed_findings:
                 nonlocal plan
-                entity_ids, plan, extraction = self._update_evidence_graph(
-                    graph=graph, findings=parsed_findings,
-                    agent_role=agent_role, iteration=iteration, mode=mode, plan=plan
-                )
+                with span("update_evidence_graph", "graph", agent=agent_role, findings=len(parsed_findings)):
+                    entity_ids, plan, extraction = self._update_evidence_graph(
+                        graph=graph, findings=parsed_findings,
+                        agent_role=agent_role, iteration=iteration, mode=mode, plan=plan
+                    )
                 all_new_entity_ids.extend(entity_ids)
                 all_extraction_details.extend(extraction)
                 logger.info(f"[{agent_role}] {phase_label} {d_id}: {len(entity_ids)} 新实体入图")
 
-        # BFRS 方向：逐方向执行，每方向 3 轮
+        # 预取全部方向的锚点子图：一次多源遍历，后续逐方向构建提示时命中缓存，
+        # 前序方向入图的新实体只使其触及的子图失效
+        for prefetch_dirs, prefetch_mode in ((bfrs_directions, "bfrs"), (dfrs_directions, "dfrs")):
+            anchor_sets = {d.get('id', str(i)): d['entity_ids'] for i, d in enumerate(prefetch_dirs) if d.get('entity_ids')}
+            if anchor_sets:
+                graph.retrieve_subgraphs(anchor_sets, max_hops=3 if prefetch_mode == "dfrs" else 2, include_observations=False)
+
+        # BFRS 方向：逐方向执行，每方向 3 轮；DFRS 方向每方向 5 轮（阶段超出 token 软预算时减半）
         for direction in bfrs_directions:
-            _process_direction(direction, "bfrs", "BFRS", ResearchMode.BREADTH_FIRST, max_tool_rounds=3)
+            d_id = direction.get('id', '?')
+            with span(f"direction {d_id}", "research", agent=agent_role, mode="bfrs", iteration=iteration), \
+                    usage_tags(agent=agent_role, iteration=iteration + 1, direction=d_id):
+                _process_direction(direction, "bfrs", "BFRS", ResearchMode.BREADTH_FIRST, max_tool_rounds=guard_tool_rounds(3))
 
-        # DFRS 方向：逐方向执行，每方向 5 轮
         for direction in dfrs_directions:
-            _process_direction(direction, "dfrs", "DFRS", ResearchMode.DEPTH_FIRST, max_tool_rounds=5)
+            d_id = direction.get('id', '?')
+            with span(f"direction {d_id}", "research", agent=agent_role, mode="dfrs", iteration=iteration), \
+                    usage_tags(agent=agent_role, iteration=iteration + 1, direction=d_id):
+                _process_direction(direction, "dfrs", "DFRS", ResearchMode.DEPTH_FIRST, max_tool_rounds=guard_tool_rounds(5))
 
         # 增强结果日志
         logger.info(f"[{agent_role}] 迭代完成:")
+        logger.debug(f"[{agent_role}]   子图缓存: {graph.subgraph_cache_stats()}, 图查询缓存: {graph_tool.cache_stats()}")
         logger.info(f"[{agent_role}]   发现数: {len(all_findings)}")
         logger.info(f"[{agent_role}]   新实体: {len(all_new_entity_ids)}")
         if all_direction_updates:
@@ -269,7 +293,7 @@ class ResearchMixin:
         graph: EvidenceGraph,
         mode: str = "bfrs"
     ) -> str:
-        """为每个方向构建锚节点上下文（含实体+关系边，无截断）
+        """为每个方向构建锚节点上下文（含实体+关系边，超出 DIRECTION_CONTEXT_MAX_TOKENS 时按相关性截断）
 
         Args:
             directions: 方向列表
@@ -278,8 +302,15 @@ class ResearchMixin:
         """
         max_hops = 3 if mode == "dfrs" else 2
 
+        # 所有方向一次批量检索（命中缓存的方向不再遍历）
+        subgraphs = graph.retrieve_subgraphs(
+            {d.get('id', str(i)): d['entity_ids'] for i, d in enumerate(directions) if d.get('entity_ids')},
+            max_hops=max_hops,
+            include_observations=False,
+        )
+
         sections = []
-        for d in directions:
+        for i, d in enumerate(directions):
             entity_ids = d.get('entity_ids', [])
             dir_id = d.get('id', '?')
             topic = d.get('topic', '未命名')
@@ -290,11 +321,7 @@ class ResearchMixin:
 
             logger.info(f"[SUBGRAPH] 方向 {dir_id}: 锚点数={len(entity_ids)}, max_hops={max_hops}, mode={mode}")
 
-            subgraph = graph.retrieve_subgraph(
-                anchor_ids=entity_ids,
-                max_hops=max_hops,
-                include_observations=False
-            )
+            subgraph = subgraphs[d.get('id', str(i))]
 
             entities = subgraph.get('entities', [])
             edges = subgraph.get('edges', [])
@@ -302,9 +329,8 @@ class ResearchMixin:
             logger.info(f"[SUBGRAPH] 方向 {dir_id}: 扩展结果 entities={len(entities)}, edges={len(edges)}")
 
             # 日志：hop 分布
-            hop_map = subgraph.get('hop_map', {})
             hop_dist = {}
-            for _, hop in hop_map.items():
+            for hop in (e.get('hop_distance', -1) for e in entities):
                 hop_dist[hop] = hop_dist.get(hop, 0) + 1
             logger.debug(f"[SUBGRAPH] 方向 {dir_id}: hop分布={hop_dist}")
 
@@ -312,24 +338,17 @@ class ResearchMixin:
                 sections.append(f"### {dir_id} ({topic})\n尚无已知实体")
                 continue
 
-            # 实体行: 全量，含等级
-            entity_strs = [
-                f"{e['canonical_id']}({e['observation_count']}obs"
-                + (f",{e['best_grade']}" if e.get('best_grade') else "")
-                + ")"
-                for e in entities
-            ]
+            # 超出 token 上限时按相关性保留实体（锚点优先），只保留两端都在的关系
+            entities, edges = self._select_context_entities(d, graph, entities, edges)
+
+            # 实体行: 含等级
+            entity_strs = [self._context_entity_str(e) for e in entities]
             entity_line = f"实体 ({len(entities)}): {', '.join(entity_strs)}"
 
-            # 关系边行: 全量，含 confidence
+            # 关系边行: 含 confidence
             dir_lines = [f"### {dir_id} ({topic})", entity_line]
             if edges:
-                edge_strs = []
-                for e in edges:
-                    conf = f" ({e['confidence']:.2f})" if e.get('confidence') else ""
-                    edge_strs.append(
-                        f"  {e['source_id']} → {e['predicate']} → {e['target_id']}{conf}"
-                    )
+                edge_strs = [self._context_edge_str(e) for e in edges]
                 dir_lines.append(f"关系 ({len(edges)}):")
                 dir_lines.extend(edge_strs)
 
@@ -337,6 +356,86 @@ class ResearchMixin:
 
         return "\n\n".join(sections) if sections else "尚无已知实体信息"
 
+    @staticmethod
+    def _context_entity_str(e: Dict[str, Any]) -> str:
+        return (
+            f"{e['canonical_id']}({e['observation_count']}obs"
+            + (f",{e['best_grade']}" if e.get('best_grade') else "")
+            + ")"
+        )
+
+    @staticmethod
+    def _context_edge_str(e: Dict[str, Any]) -> str:
+        conf = f" ({e['confidence']:.2f})" if e.get('confidence') else ""
+        return f"  {e['source_id']} → {e['predicate']} → {e['target_id']}{conf}"
+
+    def _select_context_entities(
+        self,
+        direction: Dict[str, Any],
+        graph: EvidenceGraph,
+        entities: List[Dict[str, Any]],
+        edges: List[Dict[str, Any]],
+        max_tokens: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        在 token 上限内选择方向上下文的实体和关系
+
+        排序: 锚点 (hop 0) → 与方向主题/查询词的相关性 → hop 距离（未连通到
+        锚点的实体 hop_distance=-1，排在最后）→ 观察数。未超上限时原样返回。
+        """
+        if max_tokens is None:
+            from config.settings import DIRECTION_CONTEXT_MAX_TOKENS
+            max_tokens = DIRECTION_CONTEXT_MAX_TOKENS
+        entity_cost = {e['canonical_id']: estimate_tokens(self._context_entity_str(e)) for e in entities}
+        edge_costs = [estimate_tokens(self._context_edge_str(e)) for e in edges]
+        if sum(entity_cost.values()) + sum(edge_costs) <= max_tokens:
+            return entities, edges
+
+        query = " ".join([direction.get('topic', '')] + list(direction.get('queries', [])))
+        scores = graph.score_entities(query, candidate_ids=entity_cost.keys())
+        def rank_key(e: Dict[str, Any]):
+            hop = e.get('hop_distance', -1)
+            return (
+                hop != 0,
+                -scores.get(e['canonical_id'], 0.0),
+                # hop_distance=-1 表示未连通到锚点，排在所有可达实体之后
+                (hop == -1, hop),
+                -e.get('observation_count', 0),
+            )
+
+        ranked = sorted(entities, key=rank_key)
+
+        edges_by_entity: Dict[str, List[int]] = {}
+        for i, e in enumerate(edges):
+            edges_by_entity.setdefault(e['source_id'], []).append(i)
+            edges_by_entity.setdefault(e['target_id'], []).append(i)
+
+        kept: List[Dict[str, Any]] = []
+        kept_ids: set = set()
+        kept_edges: set = set()
+        used = 0
+        for e in ranked:
+            cid = e['canonical_id']
+            new_edges = [
+                i for i in edges_by_entity.get(cid, [])
+                if i not in kept_edges
+                and (edges[i]['source_id'] in kept_ids or edges[i]['target_id'] in kept_ids
+                     or edges[i]['source_id'] == edges[i]['target_id'])
+            ]
+            cost = entity_cost[cid] + sum(edge_costs[i] for i in new_edges)
+            if kept and used + cost > max_tokens:
+                continue
+            kept.append(e)
+            kept_ids.add(cid)
+            kept_edges.update(new_edges)
+            used += cost
+
+        logger.info(
+            f"[SUBGRAPH] 方向 {direction.get('id', '?')}: 上下文截断 entities {len(entities)}→{len(kept)}, "
+            f"edges {len(edges)}→{len(kept_edges)} (≤{max_tokens} tokens)"
+        )
+        return kept, [edges[i] for i in sorted(kept_edges)]
+
     def _build_other_directions_summary(
         self,
         current_direction_id: str,
@@ -362,7 +461,6 @@ class ResearchMixin:
         graph: EvidenceGraph,
         iteration: int,
         max_iterations: int,
-        case_context: str,
         phase_context: Optional[Dict[str, Any]] = None
     ) -> str:
         """
@@ -375,7 +473,8 @@ class ResearchMixin:
             graph: 当前证据图
             iteration: 当前迭代轮次
             max_iterations: 最大迭代次数
-            case_context: 病例上下文
+
+        病例上下文不内嵌在此提示中，由 invoke(case_context=...) 作为可缓存前缀单独发送。
         """
         agent_role = getattr(self, 'role', 'Agent')
         dir_id = direction.get('id', '?')
@@ -494,7 +593,7 @@ class ResearchMixin:
 如果返回 "Not found"，说明图中尚无此信息 → 转用外部工具搜索。
 
 ### 病例背景
-{case_context}
+见对话开头的「病例背景」。
 
 {guide}
 
@@ -662,6 +761,49 @@ class ResearchMixin:
             return ResearchMixin.EVIDENCE_TYPE_ALIASES[lower]
         return "literature"  # fallback
 
+    @staticmethod
+    def _extract_single_finding(finding, agent_role: str, iteration: int, index_selector):
+        """单条 finding 提取（批量提取失败时的回退），失败返回 None"""
+        try:
+            return extract_entities_from_finding(
+                finding=finding,
+                source_agent=agent_role,
+                source_tool=finding.get("source_tool", "unknown"),
+                iteration=iteration,
+                existing_entities=index_selector
+            )
+        except Exception as e:
+            logger.warning(f"[{agent_role}] Entity extraction failed for {finding.get('source_tool', 'unknown')}: {e}")
+            return None
+
+    @staticmethod
+    def _log_entity_index_quality(graph, index_selector, findings, results, agent_role: str) -> None:
+        """
+        记录过滤实体索引的去重质量：LLM 复用的已有实体中，有多少出现在过滤索引里
+
+        须在提取结果写入图之前调用（此时图中实体即为提取时的"已有实体"）。
+        统计需构建全量实体索引，仅在 ENTITY_INDEX_QUALITY_LOG 开启时执行。
+        """
+        from config.settings import ENTITY_INDEX_QUALITY_LOG
+        if not ENTITY_INDEX_QUALITY_LOG:
+            return
+        llm_findings = [f for f, r in zip(findings, results) if r.method == "llm"]
+        if not llm_findings or not graph.entities:
+            return
+        referenced = []
+        for result in results:
+            if result.method != "llm":
+                continue
+            for extracted in result.entities:
+                entity = graph.get_entity(extracted.canonical_id) or graph.find_entity_by_name(extracted.name)
+                if entity:
+                    referenced.append(entity.canonical_id)
+        stats = graph.entity_index_stats(index_selector(llm_findings), referenced)
+        logger.info(
+            f"[{agent_role}] 实体索引: {stats['filtered_tokens']}/{stats['full_tokens']} tokens, "
+            f"复用实体召回 {stats['recalled']}/{stats['referenced']} ({stats['recall']:.0%})"
+        )
+
     def _update_evidence_graph(
         self,
         graph: EvidenceGraph,
@@ -675,7 +817,8 @@ class ResearchMixin:
         更新证据图并同步更新研究计划中的方向证据关联
 
         DeepEvidence Style 实体提取策略:
-        - 使用 LLM 将 finding 分解为 Entity + Edge + Observation
+        - 结构化来源 (CIViC/ClinVar/ClinicalTrials/FDA/GDC) 走规则快速路径
+        - 其余使用 LLM 将 finding 分解为 Entity + Edge + Observation（按 token 预算批量打包）
         - 实体通过 canonical_id 合并（不创建重复）
         - Observation 附加到 Entity 和 Edge
 
@@ -684,12 +827,45 @@ class ResearchMixin:
         """
         new_entity_ids = []
         extraction_details = []
-        existing_entities = graph.get_entity_index()
 
+        # 归一化 evidence_type
         for finding in findings:
-            # 归一化 evidence_type
             if "evidence_type" in finding:
                 finding["evidence_type"] = self._normalize_evidence_type(finding["evidence_type"])
+
+        # 未提供结构化实体的 findings 一次性批量提取（规则快速路径 + 打包 LLM 请求）
+        # 提示中只嵌入与待提取 findings 相关的已有实体（而非全量实体索引）
+        llm_findings = [f for f in findings if not f.get("entities")]
+        batch_results = {}
+        if llm_findings:
+            index_selector = make_entity_index_selector(graph)
+            try:
+                extracted = extract_entities_batch(
+                    findings=llm_findings,
+                    source_agent=agent_role,
+                    iteration=iteration,
+                    existing_entities=index_selector
+                )
+            except Exception as e:
+                # 批量失败时逐条提取，单条失败只丢弃该条
+                logger.warning(f"[{agent_role}] Batch entity extraction failed, falling back per finding: {e}")
+                extracted = [
+                    self._extract_single_finding(f, agent_role, iteration, index_selector) for f in llm_findings
+                ]
+            done = [(f, r) for f, r in zip(llm_findings, extracted) if r is not None]
+            try:
+                self._log_entity_index_quality(
+                    graph, index_selector, [f for f, _ in done], [r for _, r in done], agent_role
+                )
+            except Exception as e:
+                logger.debug(f"[{agent_role}] 实体索引质量统计失败: {e}")
+            # 同批 findings 提取时看不到彼此新建的实体，写图前按名称 / 别名合并
+            merged = dedupe_batch_entities([r for _, r in done])
+            if merged:
+                logger.debug(f"[{agent_role}] 批内合并重复实体 {merged} 个")
+            batch_results = {id(f): r for f, r in done}
+
+        for finding in findings:
             source_tool = finding.get("source_tool", "unknown")
             finding_new_entities = []
             finding_entity_ids = set()  # 追踪本 finding 引用的所有实体（用于方向关联）
@@ -881,17 +1057,9 @@ class ResearchMixin:
                 })
                 continue
 
-            # ========== LLM 实体提取 (fallback) ==========
-            try:
-                extraction_result = extract_entities_from_finding(
-                    finding=finding,
-                    source_agent=agent_role,
-                    source_tool=source_tool,
-                    iteration=iteration,
-                    existing_entities=existing_entities
-                )
-            except Exception as e:
-                logger.warning(f"[{agent_role}] Entity extraction failed: {e}")
+            # ========== 规则快速路径 / LLM 实体提取 (fallback) ==========
+            extraction_result = batch_results.get(id(finding))
+            if extraction_result is None:
                 continue
 
             # ========== 处理提取的实体 ==========
@@ -983,14 +1151,12 @@ class ResearchMixin:
                     for entity_id in finding_entity_ids:
                         direction.add_entity_id(entity_id)
 
-            # 更新实体索引，让后续 finding 的 LLM 提取看到新增实体
-            existing_entities = graph.get_entity_index()
-
             # ========== 记录 per-finding 提取详情 ==========
             finding_summary = finding.get("statement", finding.get("title", ""))
             extraction_details.append({
                 "source_tool": source_tool,
                 "direction_id": direction_id or "",
+                "extraction_method": extraction_result.method,
                 "finding_summary": finding_summary,
                 "new_entities": finding_new_entities,
                 "new_observations": finding_new_obs,
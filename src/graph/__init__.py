@@ -1,22 +1,28 @@
 """
 LangGraph 工作流
 """
-from src.graph.state_graph import create_mtb_workflow, run_mtb_workflow
-from src.graph.nodes import (
-    pdf_parser_node,
-    pathologist_node,
-    geneticist_node,
-    recruiter_node,
-    oncologist_node,
-    chair_node,
-    format_verification_node,
-    webpage_generator_node
-)
-from src.graph.mtb_subgraph import create_mtb_subgraph
-from src.graph.edges import should_retry_chair
+from src.utils.lazy_import import lazy_exports
+
+# 按需导入：导入 src.graph 下的单个模块时不再连带编译整个工作流依赖
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "create_mtb_workflow": "src.graph.state_graph",
+    "get_mtb_workflow": "src.graph.state_graph",
+    "run_mtb_workflow": "src.graph.state_graph",
+    "create_mtb_subgraph": "src.graph.mtb_subgraph",
+    "pdf_parser_node": "src.graph.nodes",
+    "pathologist_node": "src.graph.nodes",
+    "geneticist_node": "src.graph.nodes",
+    "recruiter_node": "src.graph.nodes",
+    "oncologist_node": "src.graph.nodes",
+    "chair_node": "src.graph.nodes",
+    "format_verification_node": "src.graph.nodes",
+    "webpage_generator_node": "src.graph.nodes",
+    "should_retry_chair": "src.graph.edges",
+})
 
 __all__ = [
     "create_mtb_workflow",
+    "get_mtb_workflow",
     "run_mtb_workflow",
     "create_mtb_subgraph",
     "pdf_parser_node",
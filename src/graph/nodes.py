@@ -35,7 +35,15 @@ def _create_run_folder(patient_id: str = "unknown") -> Path:
     safe_patient_id = re.sub(r'[^\w\-]', '_', patient_id)[:50]
     folder_name = f"{timestamp}_{safe_patient_id}"
     run_folder = REPORTS_DIR / folder_name
-    run_folder.mkdir(parents=True, exist_ok=True)
+    # 服务模式下并发病例可能在同一秒创建同名文件夹，追加序号区分
+    suffix = 1
+    while True:
+        try:
+            run_folder.mkdir(parents=True)
+            break
+        except FileExistsError:
+            suffix += 1
+            run_folder = REPORTS_DIR / f"{folder_name}_{suffix}"
     logger.info(f"[RUN_FOLDER] 创建报告文件夹: {run_folder}")
     return run_folder
 
@@ -127,8 +135,13 @@ def plan_agent_node(state: MtbState) -> Dict[str, Any]:
     evidence_graph = create_evidence_graph()
 
     # 生成 run_id（用于跟踪和 Neo4j 同步）
+    # 有运行文件夹时沿用其名称（含并发去重序号），保证 run_id 唯一
     patient_id = _extract_patient_id(raw_pdf_text)
-    run_id = f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{patient_id}"
+    run_folder = state.get("run_folder")
+    if run_folder:
+        run_id = f"run_{Path(run_folder).name}"
+    else:
+        run_id = f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{patient_id}"
     logger.info(f"[PLAN_AGENT] 生成 run_id: {run_id}")
 
     # 打印输出摘要
@@ -1463,7 +1463,7 @@ def generate_phase1_reports(state: MtbState) -> Dict[str, Any]:
 ```
 
 ## 病例背景
-{raw_pdf_text}
+见对话开头的「病例背景」。
 
 ## 已收集的研究证据（共 {observation_count} 条）
 {evidence_summary}
@@ -1489,7 +1489,10 @@ def generate_phase1_reports(state: MtbState) -> Dict[str, Any]:
         try:
             # 实例化 Agent 并调用
             agent = agent_class()
-            response = agent.invoke(report_prompt, context={"phase_context": phase_context})
+            response = agent.invoke(
+                report_prompt, context={"phase_context": phase_context},
+                case_context=raw_pdf_text, call_site="report"
+            )
 
             if response and response.get("output"):
                 report = response["output"]
@@ -1610,7 +1613,7 @@ def _generate_phase_reports(state: MtbState, agent_configs: list, phase_tag: str
 ```
 
 ## 病例背景
-{raw_pdf_text}
+见对话开头的「病例背景」。
 
 ## 上游专家报告
 {upstream_text}
@@ -1637,7 +1640,10 @@ def _generate_phase_reports(state: MtbState, agent_configs: list, phase_tag: str
 
         try:
             agent = agent_class()
-            response = agent.invoke(report_prompt, context={"phase_context": phase_context})
+            response = agent.invoke(
+                report_prompt, context={"phase_context": phase_context},
+                case_context=raw_pdf_text, call_site="report"
+            )
 
             if response and response.get("output"):
                 report = response["output"]
@@ -11,9 +11,13 @@ DeepEvidence 架构：
 5. 格式验证（失败时回到 chair 重试）
 6. HTML 生成
 """
+import threading
+from typing import Any, List, Optional
+
 from langgraph.graph import StateGraph, END
 
 from src.models.state import MtbState
+from src.utils.logger import mtb_logger as logger
 from src.graph.nodes import (
     pdf_parser_node,
     plan_agent_node,
@@ -123,12 +127,27 @@ def create_mtb_workflow():
     return workflow.compile()
 
 
-def run_mtb_workflow(input_text: str) -> MtbState:
+_compiled_workflow = None
+_workflow_lock = threading.Lock()
+
+
+def get_mtb_workflow():
+    """进程内共享的编译后工作流（无检查点，状态随 invoke 传入，可并发执行多个病例）"""
+    global _compiled_workflow
+    if _compiled_workflow is None:
+        with _workflow_lock:
+            if _compiled_workflow is None:
+                _compiled_workflow = create_mtb_workflow()
+    return _compiled_workflow
+
+
+def run_mtb_workflow(input_text: str, callbacks: Optional[List[Any]] = None) -> MtbState:
     """
     运行 MTB 工作流
 
     Args:
         input_text: 原始病历文本
+        callbacks: 额外的 LangGraph 回调（服务模式用于推送节点进度）
 
     Returns:
         最终状态
@@ -139,21 +158,104 @@ def run_mtb_workflow(input_text: str) -> MtbState:
     # 创建初始状态
     initial_state = create_initial_state(input_text)
 
-    # 创建工作流
-    workflow = create_mtb_workflow()
+    # 获取工作流（首次调用时编译）
+    workflow = get_mtb_workflow()
 
     # 记录开始时间
     start_time = time.time()
 
-    # 执行工作流
-    final_state = workflow.invoke(initial_state)
+    # 执行工作流（CASSETTE_MODE=record/replay 时录制或回放全部外部 HTTP 交换）
+    # 用量账本与遥测按运行隔离：服务 / 批处理中多个病例共用进程，报告只统计本次运行的调用
+    from src.tools.api_clients.circuit_breaker import run_upstream_stats
+    from src.utils.cassette import open_configured_cassette
+    from src.utils.llm_budget import run_budget_telemetry
+    from src.utils.llm_hedging import run_latency_registry
+    from src.utils.tracing import run_trace
+    from src.utils.usage_ledger import run_ledger
+    with run_trace("workflow") as trace, run_ledger() as ledger, run_budget_telemetry() as budget_telemetry, \
+            run_latency_registry() as latency_registry, run_upstream_stats() as upstream_stats, \
+            open_configured_cassette() as cassette:
+        handlers = ([trace.graph_callback()] if trace is not None else []) + list(callbacks or [])
+        final_state = workflow.invoke(initial_state, config={"callbacks": handlers} if handlers else None)
 
     # 记录执行时间
     final_state["execution_time"] = time.time() - start_time
 
+    if trace is not None:
+        _export_trace(trace, final_state)
+
+    if cassette is not None:
+        if cassette.mode == "record":
+            cassette.save_for_run(final_state.get("run_folder"))
+        final_state["cassette"] = cassette.summary()
+        summary = final_state["cassette"]
+        logger.info(
+            f"[Cassette] {summary['exchanges']} 条交换，录制时网络耗时 {summary['recorded_network_seconds']}s，"
+            f"本次执行 {final_state['execution_time']:.2f}s"
+            + (f"（精确命中 {summary['hits']} / 宽松命中 {summary['loose_hits']} / 未命中 {summary['misses']}）"
+               if cassette.mode == "replay" else "")
+        )
+
+    _export_usage(ledger, final_state)
+
+    # 按调用点的 LLM 用量（用于调整 LLM_CALL_SITE_BUDGETS）
+    final_state["llm_budget_telemetry"] = budget_telemetry.summary()
+    telemetry_table = budget_telemetry.format_summary()
+    if telemetry_table:
+        logger.info(f"[LLMBudget] 调用点用量:\n{telemetry_table}")
+
+    # 上游熔断状态与耗时（写入运行目录）
+    from src.tools.api_clients.circuit_breaker import breaker_report, format_breaker_report
+    final_state["upstream_health"] = breaker_report(upstream_stats)
+    breaker_table = format_breaker_report(final_state["upstream_health"])
+    if breaker_table:
+        logger.info(f"[CircuitBreaker] 上游状态:\n{breaker_table}")
+    if final_state.get("run_folder"):
+        import json
+        from pathlib import Path
+        health_path = Path(final_state["run_folder"]) / "upstream_health.json"
+        health_path.write_text(json.dumps(final_state["upstream_health"], ensure_ascii=False, indent=2), encoding="utf-8")
+
+    # 按 (模型, 调用点) 的延迟分布与对冲次数（用于调整 LLM_HEDGE_*）
+    latency_table = latency_registry.format_summary()
+    if latency_table:
+        logger.info(f"[Hedge] 延迟分布:\n{latency_table}")
+
     return final_state
 
 
+def _export_trace(trace, final_state: MtbState) -> None:
+    """写出 {run_folder}/trace.json、可选 OTLP 导出，并记录按阶段的关键路径耗时"""
+    from pathlib import Path
+    from config.settings import TRACE_OTLP_ENDPOINT
+    from src.utils.tracing import format_phase_summary
+
+    trace.name = final_state.get("run_id") or trace.name
+    final_state["trace_summary"] = trace.phase_summary()
+    phase_table = format_phase_summary(final_state["trace_summary"])
+    if phase_table:
+        logger.info(f"[Trace] 阶段关键路径:\n{phase_table}")
+    if final_state.get("run_folder"):
+        trace_path = trace.export_chrome(Path(final_state["run_folder"]) / "trace.json")
+        logger.info(f"[Trace] 已写入 {trace_path}（chrome://tracing 或 ui.perfetto.dev 打开）")
+    if TRACE_OTLP_ENDPOINT:
+        trace.export_otlp(TRACE_OTLP_ENDPOINT)
+
+
+def _export_usage(ledger, final_state: MtbState) -> None:
+    """写出 {run_folder}/usage_ledger.jsonl，并记录按阶段的 token 与费用"""
+    from pathlib import Path
+    from src.utils.usage_ledger import LEDGER_FILENAME, format_summary
+
+    final_state["usage_summary"] = ledger.summary(by=("phase",))
+    usage_table = format_summary(final_state["usage_summary"])
+    if usage_table:
+        logger.info(f"[UsageLedger] 阶段用量:\n{usage_table}")
+    if final_state.get("run_folder"):
+        ledger_path = ledger.save(Path(final_state["run_folder"]) / LEDGER_FILENAME, run_id=final_state.get("run_id", ""))
+        logger.info(f"[UsageLedger] 已写入 {ledger_path}（python -m src.utils.usage_ledger {final_state['run_folder']} --by agent call_site）")
+
+
 if __name__ == "__main__":
     print("MTB 工作流模块加载成功")
     print("DeepEvidence 架构: PDF Parser → Plan Agent → Research Subgraph → Chair → Verify → HTML")
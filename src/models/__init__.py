@@ -15,6 +15,7 @@ from src.models.evidence_graph import (
 )
 from src.models.entity_extractors import (
     extract_entities_from_finding,
+    extract_entities_batch,
     ExtractionResult,
     ExtractedEntity,
     ExtractedEdge,
@@ -47,6 +48,7 @@ __all__ = [
     "load_evidence_graph",
     # Entity Extractors
     "extract_entities_from_finding",
+    "extract_entities_batch",
     "ExtractionResult",
     "ExtractedEntity",
     "ExtractedEdge",
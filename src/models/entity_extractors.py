@@ -8,7 +8,9 @@ Entity Extractors - 实体提取器 (DeepEvidence Style)
 
 核心逻辑：
 - 每个工具有专门的提取器
-- 提取器使用 LLM 识别实体和关系
+- 结构化来源 (CIViC / ClinVar / ClinicalTrials / FDA / GDC) 优先走规则快速路径，
+  直接把结构化字段映射为实体和边，不调用 LLM
+- 规则无法覆盖的自由文本回退到 LLM 识别实体和关系
 - 返回 ExtractionResult 包含所有提取内容
 """
 import json
@@ -17,7 +19,7 @@ import re
 import requests
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Union, Callable
 
 from src.models.evidence_graph import (
     EvidenceGraph,
@@ -29,8 +31,11 @@ from src.models.evidence_graph import (
     EvidenceGrade,
     CivicEvidenceType,
     EvidenceType,
+    estimate_tokens,
 )
 from src.utils.logger import mtb_logger as logger
+from src.utils.llm_budget import CallBudget, get_budget, run_with_budget
+from src.utils.llm_hedging import hedged_call
 
 
 # ============================================================
@@ -73,6 +78,138 @@ class ExtractionResult:
     conflicts: List[ExtractedConflict] = field(default_factory=list)  # 检测到的冲突
     source_tool: Optional[str] = None    # 来源工具
     raw_finding: Optional[Dict[str, Any]] = None  # 原始 finding
+    method: str = "llm"                  # 提取方式: rule (规则快速路径) / llm
+
+
+# 已有实体索引：固定文本，或按待提取 findings 惰性生成索引的函数
+EntityIndexSource = Union[str, Callable[[List[Dict[str, Any]]], str]]
+
+
+# ============================================================
+# 规则提取辅助
+# ============================================================
+
+# CIViC 证据等级 → 边置信度 (与 SYSTEM_PROMPT 规则 4 的区间一致)
+LEVEL_CONFIDENCE: Dict[str, float] = {"A": 0.95, "B": 0.9, "C": 0.85, "D": 0.75, "E": 0.7}
+
+# 氨基酸三字母 → 单字母 (ClinVar HGVS p. 记法转换)
+_AA3 = {
+    "ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C", "GLN": "Q", "GLU": "E",
+    "GLY": "G", "HIS": "H", "ILE": "I", "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F",
+    "PRO": "P", "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V", "TER": "*",
+}
+
+
+def _clean(value: Any) -> str:
+    """字段值转为去空白字符串 (None / 非字符串安全)"""
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _as_list(value: Any) -> List[Any]:
+    """把单值 / 逗号分隔字符串 / 列表统一为列表"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v]
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [value]
+
+
+def _pack_batches(
+    items: List[Tuple[str, Dict[str, Any], str]],
+    max_tokens: int,
+    max_items: int,
+) -> List[List[Tuple[str, Dict[str, Any], str]]]:
+    """按 token 预算与条数上限顺序装箱；超预算的单条 finding 独占一批"""
+    batches: List[List[Tuple[str, Dict[str, Any], str]]] = []
+    current: List[Tuple[str, Dict[str, Any], str]] = []
+    current_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(json.dumps(item[1], ensure_ascii=False, default=str))
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class _RuleResultBuilder:
+    """规则提取结果构建器：按 canonical_id 去重实体，边共享同一 observation"""
+
+    def __init__(self, source_tool: str):
+        self.source_tool = source_tool
+        self.entities: Dict[str, ExtractedEntity] = {}
+        self.edges: Dict[Tuple[str, str, Predicate], ExtractedEdge] = {}
+        self.best_grade: Optional[EvidenceGrade] = None
+
+    def add_entity(
+        self,
+        entity_type: EntityType,
+        name: str,
+        gene: Optional[str] = None,
+        aliases: Optional[List[str]] = None,
+    ) -> str:
+        """添加实体并返回 canonical_id (名称中的空白替换为下划线)"""
+        canonical_id = Entity.generate_canonical_id(entity_type, name, gene=gene)
+        canonical_id = re.sub(r"\s+", "_", canonical_id)
+        entity = self.entities.get(canonical_id)
+        if entity is None:
+            entity = ExtractedEntity(
+                canonical_id=canonical_id,
+                entity_type=entity_type,
+                name=Entity.normalize_name(name),
+            )
+            self.entities[canonical_id] = entity
+        for alias in aliases or []:
+            alias = Entity.normalize_name(str(alias))
+            if alias and alias != entity.name and alias not in entity.aliases:
+                entity.aliases.append(alias)
+        return canonical_id
+
+    def add_edge(self, source_id: str, target_id: str, predicate: Predicate, confidence: float) -> None:
+        """添加边，同一 (源, 目标, 谓词) 保留最高置信度"""
+        if source_id == target_id:
+            return
+        key = (source_id, target_id, predicate)
+        existing = self.edges.get(key)
+        if existing is None:
+            self.edges[key] = ExtractedEdge(
+                source_id=source_id, target_id=target_id,
+                predicate=predicate, confidence=confidence,
+            )
+        elif confidence > existing.confidence:
+            existing.confidence = confidence
+
+    def note_level(self, level: Any) -> float:
+        """记录证据等级 (保留最高级)，返回对应置信度"""
+        level_str = _clean(level).upper()
+        try:
+            grade = EvidenceGrade(level_str)
+        except ValueError:
+            return 0.8
+        if self.best_grade is None or grade.value < self.best_grade.value:
+            self.best_grade = grade
+        return LEVEL_CONFIDENCE[grade.value]
+
+    def build(self, observation: Observation, finding: Dict[str, Any]) -> ExtractionResult:
+        for entity in self.entities.values():
+            entity.observation = observation
+        for edge in self.edges.values():
+            edge.observation = observation
+        return ExtractionResult(
+            entities=list(self.entities.values()),
+            edges=list(self.edges.values()),
+            conflicts=[],
+            source_tool=self.source_tool,
+            raw_finding=finding,
+            method="rule",
+        )
 
 
 # ============================================================
@@ -185,7 +322,7 @@ class EntityExtractor:
         source_agent: str,
         source_tool: str,
         iteration: int,
-        existing_entities: str = ""
+        existing_entities: EntityIndexSource = ""
     ) -> ExtractionResult:
         """
         从 finding 提取实体、边和观察
@@ -195,11 +332,20 @@ class EntityExtractor:
             source_agent: 来源 Agent
             source_tool: 来源工具
             iteration: 迭代轮次
-            existing_entities: 已有实体索引（供 LLM 参考避免重复创建）
+            existing_entities: 已有实体索引（供 LLM 参考避免重复创建）；
+                可传入函数 (findings -> 索引文本)，仅在回退 LLM 时才求值
 
         Returns:
             ExtractionResult
         """
+        # 结构化数据走规则快速路径，无需 LLM
+        structured = self.extract_structured(finding, source_agent, source_tool, iteration)
+        if structured is not None:
+            return structured
+
+        if callable(existing_entities):
+            existing_entities = existing_entities([finding])
+
         # 构建用户提示
         user_prompt = self._build_prompt(finding, source_tool, existing_entities)
 
@@ -225,13 +371,12 @@ class EntityExtractor:
                 raw_finding=finding
             )
 
-    def _build_prompt(self, finding: Dict[str, Any], source_tool: str, existing_entities: str = "") -> str:
-        """构建用户提示"""
-        finding_str = json.dumps(finding, indent=2, ensure_ascii=False, default=str)
-
-        existing_section = ""
-        if existing_entities:
-            existing_section = f"""
+    @staticmethod
+    def _existing_section(existing_entities: str) -> str:
+        """已有实体提示段落"""
+        if not existing_entities:
+            return ""
+        return f"""
 ## 已有实体（必须复用，不要创建重复实体）
 以下是当前知识图谱中已有的实体。如果你要提取的实体与其中某个相同或等价（包括单复数、缩写、别名），
 **必须使用已有的 canonical_id**，不要新建。
@@ -239,6 +384,11 @@ class EntityExtractor:
 {existing_entities}
 """
 
+    def _build_prompt(self, finding: Dict[str, Any], source_tool: str, existing_entities: str = "") -> str:
+        """构建用户提示"""
+        finding_str = json.dumps(finding, indent=2, ensure_ascii=False, default=str)
+        existing_section = self._existing_section(existing_entities)
+
         return f"""## 来源工具
 {source_tool}
 {existing_section}
@@ -251,14 +401,15 @@ class EntityExtractor:
 输出 JSON 格式，确保所有实体名称大写。
 """
 
-    def _call_llm(self, user_prompt: str) -> str:
+    def _call_llm(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
         """调用 LLM"""
+        system_prompt = system_prompt or self.SYSTEM_PROMPT
         if self._llm_caller:
-            return self._llm_caller(self.SYSTEM_PROMPT, user_prompt)
+            return self._llm_caller(system_prompt, user_prompt)
 
-        return self._default_llm_call(user_prompt)
+        return self._default_llm_call(user_prompt, system_prompt)
 
-    def _default_llm_call(self, user_prompt: str) -> str:
+    def _default_llm_call(self, user_prompt: str, system_prompt: Optional[str] = None) -> str:
         """默认的 OpenRouter LLM 调用"""
         # ========== 全局速率限制检查 ==========
         from src.agents.base_agent import BaseAgent
@@ -271,35 +422,45 @@ class EntityExtractor:
 
         # 使用 SUBGRAPH_MODEL
         try:
-            from config.settings import SUBGRAPH_MODEL, MAX_TOKENS_SUBGRAPH
+            from config.settings import SUBGRAPH_MODEL, PROMPT_CACHE_ENABLED, OPENROUTER_BASE_URL
             model_id = SUBGRAPH_MODEL or "google/gemini-3-flash-preview"
-            max_tokens = MAX_TOKENS_SUBGRAPH
         except ImportError:
             model_id = "google/gemini-3-flash-preview"
-            max_tokens = 65536
+            PROMPT_CACHE_ENABLED = False
+            OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+        # 提取系统提示跨调用不变，作为可缓存前缀
+        system_content: Any = system_prompt or self.SYSTEM_PROMPT
+        if PROMPT_CACHE_ENABLED:
+            system_content = [{"type": "text", "text": system_content, "cache_control": {"type": "ephemeral"}}]
+
+        payload = {
+            "model": model_id,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.2,
+        }
+
+        def send(budget: CallBudget) -> Dict[str, Any]:
+            response = requests.post(
+                OPENROUTER_BASE_URL,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json"
+                },
+                json=budget.apply(dict(payload)),
+                timeout=budget.timeout
+            )
+            response.raise_for_status()
+            return response.json()
 
+        budget = get_budget("entity_extraction")
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model_id,
-                        "messages": [
-                            {"role": "system", "content": self.SYSTEM_PROMPT},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "temperature": 0.2,
-                        "max_tokens": max_tokens,
-                    },
-                    timeout=60
-                )
-                response.raise_for_status()
-                data = response.json()
+                data = run_with_budget(budget, lambda b: hedged_call(b.site, model_id, lambda: send(b)))
                 return data.get("choices", [{}])[0].get("message", {}).get("content", "{}")
 
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
@@ -316,6 +477,170 @@ class EntityExtractor:
                     return "{}"
         return "{}"
 
+    # ---------- 批量 LLM 提取 ----------
+
+    BATCH_PROMPT_SUFFIX = """
+
+## 批量模式
+输入包含多条发现，每条带有唯一 id。对每条发现**独立**提取实体、关系和观察，输出:
+{
+  "results": [
+    {"id": "F1", "entities": [...], "edges": [...], "observation": "...", "conflicts": []}
+  ]
+}
+每个输入 id 必须在 results 中恰好出现一次；不同发现的实体和关系不要合并。
+"""
+
+    def extract_batch(
+        self,
+        items: List[Tuple[str, Dict[str, Any], str]],
+        source_agent: str,
+        iteration: int,
+        existing_entities: EntityIndexSource = "",
+        max_batch_tokens: Optional[int] = None,
+        max_batch_items: Optional[int] = None,
+    ) -> Dict[str, ExtractionResult]:
+        """
+        批量 LLM 提取：多条 finding 打包进一次请求
+
+        按 token 预算装箱，系统提示和已有实体索引每批只发送一次。
+        响应中缺失或无法解析的条目会二分重试，最终单条回退到 extract()。
+
+        Args:
+            items: (稳定 id, finding, source_tool) 列表
+            source_agent: 来源 Agent
+            iteration: 迭代轮次
+            existing_entities: 已有实体索引，或按本批 findings 生成索引的函数
+            max_batch_tokens: 每批 finding 载荷的 token 预算
+            max_batch_items: 每批最多 finding 数
+
+        Returns:
+            {id: ExtractionResult}
+        """
+        if max_batch_tokens is None or max_batch_items is None:
+            from config.settings import ENTITY_EXTRACTION_BATCH_TOKENS, ENTITY_EXTRACTION_BATCH_MAX_ITEMS
+            max_batch_tokens = max_batch_tokens or ENTITY_EXTRACTION_BATCH_TOKENS
+            max_batch_items = max_batch_items or ENTITY_EXTRACTION_BATCH_MAX_ITEMS
+
+        results: Dict[str, ExtractionResult] = {}
+        reachable = True
+        for batch in _pack_batches(items, max_batch_tokens, max_batch_items):
+            if reachable:
+                reachable = self._run_batch(batch, source_agent, iteration, existing_entities, results)
+            else:
+                self._fill_empty(batch, results)
+        return results
+
+    def _run_batch(
+        self,
+        batch: List[Tuple[str, Dict[str, Any], str]],
+        source_agent: str,
+        iteration: int,
+        existing_entities: EntityIndexSource,
+        results: Dict[str, ExtractionResult],
+    ) -> bool:
+        """
+        执行一批提取，缺失或无法解析的条目二分重试
+
+        LLM 调用本身失败（异常或空响应，_default_llm_call 重试用尽后返回 "{}"）
+        时不再二分：拆分只会在故障期间放大失败调用次数。此时本批及后续批次
+        均记为空结果。
+
+        Returns:
+            False 表示 LLM 不可达，调用方应停止后续批次
+        """
+        if len(batch) == 1:
+            fid, finding, source_tool = batch[0]
+            results[fid] = self.extract(finding, source_agent, source_tool, iteration, existing_entities)
+            return True
+
+        try:
+            index_text = existing_entities
+            if callable(index_text):
+                index_text = index_text([finding for _, finding, _ in batch])
+            response = self._call_llm(
+                self._build_batch_prompt(batch, index_text),
+                system_prompt=self.SYSTEM_PROMPT + self.BATCH_PROMPT_SUFFIX,
+            )
+        except Exception as e:
+            response = ""
+            logger.warning(f"[EntityExtractor] Batch LLM call failed ({len(batch)} findings): {e}")
+        if (response or "").strip() in ("", "{}"):
+            logger.warning(f"[EntityExtractor] Batch LLM unavailable, skipping {len(batch)} findings without re-splitting")
+            self._fill_empty(batch, results)
+            return False
+
+        parsed: Dict[str, Dict[str, Any]] = {}
+        try:
+            parsed = self._parse_batch_response(response)
+        except Exception as e:
+            logger.warning(f"[EntityExtractor] Batch response unparseable ({len(batch)} findings): {e}")
+
+        failed = []
+        for fid, finding, source_tool in batch:
+            entry = parsed.get(fid)
+            if entry is None:
+                failed.append((fid, finding, source_tool))
+                continue
+            results[fid] = self._parse_response(
+                response=json.dumps(entry, ensure_ascii=False),
+                finding=finding,
+                source_agent=source_agent,
+                source_tool=source_tool,
+                iteration=iteration,
+            )
+
+        if not failed:
+            return True
+        logger.debug(f"[EntityExtractor] Batch: {len(failed)}/{len(batch)} findings missing, re-splitting")
+        if len(failed) < len(batch):
+            return self._run_batch(failed, source_agent, iteration, existing_entities, results)
+        mid = len(batch) // 2
+        if not self._run_batch(batch[:mid], source_agent, iteration, existing_entities, results):
+            self._fill_empty(batch[mid:], results)
+            return False
+        return self._run_batch(batch[mid:], source_agent, iteration, existing_entities, results)
+
+    @staticmethod
+    def _fill_empty(batch: List[Tuple[str, Dict[str, Any], str]], results: Dict[str, ExtractionResult]) -> None:
+        """LLM 不可达时为整批记空结果（与单条提取失败时一致）"""
+        for fid, finding, source_tool in batch:
+            results[fid] = ExtractionResult(
+                entities=[], edges=[], conflicts=[], source_tool=source_tool, raw_finding=finding
+            )
+
+    def _build_batch_prompt(self, batch: List[Tuple[str, Dict[str, Any], str]], existing_entities: str = "") -> str:
+        """构建批量用户提示"""
+        payload = [
+            {"id": fid, "source_tool": source_tool, "finding": finding}
+            for fid, finding, source_tool in batch
+        ]
+        payload_str = json.dumps(payload, indent=2, ensure_ascii=False, default=str)
+
+        return f"""{self._existing_section(existing_entities)}
+## 发现数据 ({len(batch)} 条)
+```json
+{payload_str}
+```
+
+请对每条发现分别分解为实体(entities)、关系(edges)和观察(observation)。
+输出 JSON 格式 {{"results": [...]}}，每条结果带对应 id，确保所有实体名称大写。
+"""
+
+    @staticmethod
+    def _parse_batch_response(response: str) -> Dict[str, Dict[str, Any]]:
+        """解析批量响应为 {id: 单条结果}"""
+        json_match = re.search(r'[\{\[][\s\S]*[\}\]]', response or "")
+        if not json_match:
+            return {}
+        data = json.loads(json_match.group(0))
+        entries = data.get("results", []) if isinstance(data, dict) else data
+        parsed = {}
+        for entry in entries or []:
+            if isinstance(entry, dict) and entry.get("id"):
+                parsed[str(entry["id"])] = entry
+        return parsed
+
     def _parse_response(
         self,
         response: str,
@@ -357,27 +682,14 @@ class EntityExtractor:
         # 一个 finding 只生成一个共享的 observation（修复重复创建 bug）
         shared_obs = None
         if observation_text:
-            # 解析 evidence_type
-            et_raw = finding.get("evidence_type")
-            et = None
-            if et_raw:
-                try:
-                    et = EvidenceType(et_raw.lower().strip())
-                except ValueError:
-                    pass
-            shared_obs = Observation(
-                id=Observation.generate_id(source_tool),
+            shared_obs = self._build_observation(
+                finding=finding,
                 statement=observation_text,
                 source_agent=source_agent,
                 source_tool=source_tool,
+                iteration=iteration,
                 provenance=provenance,
                 source_url=source_url,
-                evidence_grade=self._extract_grade(finding),
-                civic_type=self._extract_civic_type(finding),
-                evidence_type=et,
-                l_tier=finding.get("l_tier"),
-                l_tier_reasoning=finding.get("l_tier_reasoning"),
-                iteration=iteration,
             )
 
         # 解析实体 - 所有实体共享同一个 observation
@@ -460,6 +772,119 @@ class EntityExtractor:
             raw_finding=finding
         )
 
+    def _build_observation(
+        self,
+        finding: Dict[str, Any],
+        statement: str,
+        source_agent: str,
+        source_tool: str,
+        iteration: int,
+        provenance: Optional[str] = None,
+        source_url: Optional[str] = None,
+        grade: Optional[EvidenceGrade] = None,
+    ) -> Observation:
+        """构建 finding 的共享 observation"""
+        # 解析 evidence_type
+        et_raw = finding.get("evidence_type")
+        et = None
+        if et_raw:
+            try:
+                et = EvidenceType(et_raw.lower().strip())
+            except ValueError:
+                pass
+        return Observation(
+            id=Observation.generate_id(source_tool),
+            statement=statement,
+            source_agent=source_agent,
+            source_tool=source_tool,
+            provenance=provenance if provenance is not None else self._extract_provenance(finding),
+            source_url=source_url if source_url is not None else self._extract_source_url(finding),
+            evidence_grade=grade or self._extract_grade(finding),
+            civic_type=self._extract_civic_type(finding),
+            evidence_type=et,
+            l_tier=finding.get("l_tier"),
+            l_tier_reasoning=finding.get("l_tier_reasoning"),
+            iteration=iteration,
+        )
+
+    # ---------- 规则快速路径 ----------
+
+    def extract_structured(
+        self,
+        finding: Dict[str, Any],
+        source_agent: str,
+        source_tool: str,
+        iteration: int,
+    ) -> Optional[ExtractionResult]:
+        """
+        规则快速路径：直接把结构化字段映射为实体/边/观察
+
+        Returns:
+            ExtractionResult (method="rule")；finding 缺少结构化字段时返回 None，
+            由调用方回退到 LLM 提取
+        """
+        builder = _RuleResultBuilder(source_tool)
+        try:
+            matched = self._rule_extract(finding, builder)
+        except Exception as e:
+            logger.debug(f"[EntityExtractor] Rule extraction error ({source_tool}): {e}")
+            return None
+        if not matched or not builder.entities:
+            return None
+
+        statement = (
+            finding.get("content")
+            or finding.get("statement")
+            or self._rule_statement(finding)
+        )
+        obs = self._build_observation(
+            finding=finding,
+            statement=statement,
+            source_agent=source_agent,
+            source_tool=source_tool,
+            iteration=iteration,
+            provenance=self._rule_provenance(finding),
+            grade=builder.best_grade,
+        )
+        result = builder.build(obs, finding)
+        logger.debug(
+            f"[EntityExtractor] Rule-based: {len(result.entities)} entities, "
+            f"{len(result.edges)} edges from {source_tool}"
+        )
+        return result
+
+    def _rule_extract(self, finding: Dict[str, Any], builder: "_RuleResultBuilder") -> bool:
+        """子类实现：向 builder 写入实体和边，返回是否命中结构化规则"""
+        return False
+
+    def _rule_statement(self, finding: Dict[str, Any]) -> str:
+        """finding 无 content 时由结构化字段合成观察陈述"""
+        return finding.get("title") or finding.get("brief_title") or json.dumps(
+            finding, ensure_ascii=False, default=str
+        )[:300]
+
+    def _rule_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
+        """规则路径的来源标识，默认同 LLM 路径"""
+        return self._extract_provenance(finding)
+
+    @staticmethod
+    def _add_subject(finding: Dict[str, Any], builder: "_RuleResultBuilder") -> Optional[str]:
+        """
+        添加 finding 的基因/变异主体，返回主体 canonical_id
+
+        有变异时返回变异 ID 并连接 VARIANT member_of GENE。
+        """
+        gene = _clean(finding.get("gene") or finding.get("gene_name"))
+        variant = _clean(finding.get("variant"))
+        if not gene:
+            return None
+        gene_id = builder.add_entity(EntityType.GENE, gene)
+        if not variant or variant.upper() == gene.upper():
+            return gene_id
+        variant_id = builder.add_entity(EntityType.VARIANT, variant, gene=gene)
+        builder.add_edge(variant_id, gene_id, Predicate.MEMBER_OF, 0.99)
+        return variant_id
+
     def _extract_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
         """提取来源追踪标识"""
         if finding.get("pmid"):
@@ -550,6 +975,131 @@ CIViC 数据包含 therapeutic, diagnostic, prognostic 等证据类型。
 - clinical_significance 字段决定关系类型
 """
 
+    # clinical_significance → 谓词
+    SIGNIFICANCE_PREDICATES: Dict[str, Predicate] = {
+        "SENSITIVITYRESPONSE": Predicate.SENSITIZES,
+        "SENSITIVITY": Predicate.SENSITIZES,
+        "RESPONSE": Predicate.SENSITIZES,
+        "RESISTANCE": Predicate.CAUSES_RESISTANCE,
+        "REDUCED_SENSITIVITY": Predicate.CAUSES_RESISTANCE,
+    }
+
+    def _rule_extract(self, finding: Dict[str, Any], builder: "_RuleResultBuilder") -> bool:
+        items = self._collect_evidence_items(finding)
+        if not items:
+            return False
+        subject_id = self._add_subject(finding, builder)
+        if not subject_id:
+            return False
+
+        for item, evidence_type in items:
+            confidence = builder.note_level(item.get("evidence_level"))
+            # 证据方向为 DOES_NOT_SUPPORT 时不断言具体关系
+            refuted = _clean(item.get("evidence_direction")).upper() == "DOES_NOT_SUPPORT"
+            disease = _clean(item.get("disease"))
+            disease_id = builder.add_entity(EntityType.DISEASE, disease) if disease else None
+
+            if evidence_type == "PREDICTIVE":
+                significance = _clean(item.get("clinical_significance")).upper().replace(" ", "_")
+                predicate = self.SIGNIFICANCE_PREDICATES.get(significance, Predicate.ASSOCIATED_WITH)
+                if refuted:
+                    predicate, confidence = Predicate.ASSOCIATED_WITH, min(confidence, 0.6)
+                for drug in _as_list(item.get("drugs") or item.get("drug")):
+                    drug_id = builder.add_entity(EntityType.DRUG, _clean(drug))
+                    builder.add_edge(subject_id, drug_id, predicate, confidence)
+                if disease_id:
+                    builder.add_edge(subject_id, disease_id, Predicate.ASSOCIATED_WITH, confidence)
+            elif disease_id:
+                predicate = Predicate.ASSOCIATED_WITH if refuted else Predicate.BIOMARKER_FOR
+                builder.add_edge(subject_id, disease_id, predicate, confidence)
+        return True
+
+    @staticmethod
+    def _collect_evidence_items(finding: Dict[str, Any]) -> List[Tuple[Dict[str, Any], str]]:
+        """
+        收集 CIViC 证据条目及其类型
+
+        兼容 CIViCClient 返回的 evidence_items / therapeutic / top_therapeutic_evidence，
+        以及 agent 直接在 finding 上给出 clinical_significance 的扁平形式。
+        """
+        items: List[Tuple[Dict[str, Any], str]] = []
+        groups = {"therapeutic": "PREDICTIVE", "diagnostic": "DIAGNOSTIC", "prognostic": "PROGNOSTIC"}
+        evidence = finding.get("evidence_items")
+        sources = [finding]
+        if isinstance(evidence, dict):
+            sources.append(evidence)
+        for source in sources:
+            for key, etype in groups.items():
+                for item in source.get(key, []) or []:
+                    if isinstance(item, dict):
+                        items.append((item, etype))
+        for item in finding.get("top_therapeutic_evidence", []) or []:
+            if isinstance(item, dict):
+                items.append((item, "PREDICTIVE"))
+        if not items and finding.get("clinical_significance"):
+            civic_type = _clean(finding.get("civic_type")).upper()
+            flat = dict(finding)
+            flat.setdefault("evidence_level", finding.get("grade"))
+            items.append((flat, civic_type if civic_type in ("DIAGNOSTIC", "PROGNOSTIC") else "PREDICTIVE"))
+        return items
+
+    def _rule_statement(self, finding: Dict[str, Any]) -> str:
+        subject = " ".join(p for p in (_clean(finding.get("gene")), _clean(finding.get("variant"))) if p)
+        parts = []
+        for item, etype in self._collect_evidence_items(finding)[:5]:
+            drugs = "+".join(_clean(d) for d in _as_list(item.get("drugs") or item.get("drug")))
+            target = drugs or _clean(item.get("disease"))
+            parts.append(f"{etype.lower()} {_clean(item.get('clinical_significance'))} {target} (Level {_clean(item.get('evidence_level'))})")
+        return f"{subject}: " + "; ".join(parts) + " [CIViC]"
+
+    def _rule_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
+        match = re.search(r'/molecular-profiles/(\d+)', _clean(finding.get("civic_url")))
+        if match:
+            return f"CIViC:MP{match.group(1)}"
+        return self._extract_provenance(finding)
+
+
+class ClinVarEntityExtractor(EntityExtractor):
+    """ClinVar 数据专用提取器"""
+
+    def _rule_extract(self, finding: Dict[str, Any], builder: "_RuleResultBuilder") -> bool:
+        classification = _clean(finding.get("classification") or finding.get("clinical_significance"))
+        if not classification and not finding.get("variation_id"):
+            return False
+        finding = dict(finding)
+        if not finding.get("variant"):
+            finding["variant"] = self._protein_change(_clean(finding.get("variation_name")))
+        subject_id = self._add_subject(finding, builder)
+        if not subject_id:
+            return False
+        disease = _clean(finding.get("disease") or finding.get("condition"))
+        if disease:
+            disease_id = builder.add_entity(EntityType.DISEASE, disease)
+            builder.add_edge(subject_id, disease_id, Predicate.ASSOCIATED_WITH, 0.85)
+        return True
+
+    @staticmethod
+    def _protein_change(variation_name: str) -> str:
+        """从 HGVS 名称提取单字母蛋白改变: ...(p.Leu858Arg) → L858R"""
+        match = re.search(r'p\.([A-Z][a-z]{2})(\d+)([A-Z][a-z]{2}|=|\*)', variation_name)
+        if not match:
+            return ""
+        ref, pos, alt = match.groups()
+        ref1 = _AA3.get(ref.upper(), "")
+        alt1 = _AA3.get(alt.upper(), alt)
+        return f"{ref1}{pos}{alt1}" if ref1 else ""
+
+    def _rule_statement(self, finding: Dict[str, Any]) -> str:
+        name = _clean(finding.get("variation_name")) or f"{_clean(finding.get('gene'))} {_clean(finding.get('variant'))}"
+        classification = _clean(finding.get("classification") or finding.get("clinical_significance"))
+        review = _clean(finding.get("review_status"))
+        return f"{name}: ClinVar {classification}" + (f" ({review})" if review else "")
+
+    def _rule_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
+        if finding.get("variation_id"):
+            return f"ClinVar:{finding['variation_id']}"
+        return self._extract_provenance(finding) or "ClinVar"
+
 
 class ClinicalTrialsEntityExtractor(EntityExtractor):
     """ClinicalTrials.gov 数据专用提取器"""
@@ -569,6 +1119,57 @@ class ClinicalTrialsEntityExtractor(EntityExtractor):
 - TRIAL includes_arm REGIMEN
 """
 
+    # 视为药物的干预类型 (其他如 PROCEDURE / RADIATION / BEHAVIORAL 不建药物实体)
+    DRUG_INTERVENTION_TYPES = {"DRUG", "BIOLOGICAL", "COMBINATION_PRODUCT", "GENETIC", ""}
+
+    def _rule_extract(self, finding: Dict[str, Any], builder: "_RuleResultBuilder") -> bool:
+        nct_id = self._nct_id(finding)
+        drugs = self._drug_names(finding)
+        conditions = [_clean(c) for c in _as_list(finding.get("conditions") or finding.get("disease"))]
+        if not nct_id or not (drugs or conditions):
+            return False
+
+        trial_id = builder.add_entity(EntityType.TRIAL, nct_id)
+        for drug in drugs:
+            drug_id = builder.add_entity(EntityType.DRUG, drug)
+            builder.add_edge(trial_id, drug_id, Predicate.EVALUATES, 0.95)
+        for condition in conditions:
+            disease_id = builder.add_entity(EntityType.DISEASE, condition)
+            builder.add_edge(trial_id, disease_id, Predicate.ASSOCIATED_WITH, 0.95)
+
+        subject_id = self._add_subject(finding, builder)
+        if subject_id:
+            builder.add_edge(subject_id, trial_id, Predicate.ASSOCIATED_WITH, 0.85)
+        return True
+
+    @staticmethod
+    def _nct_id(finding: Dict[str, Any]) -> str:
+        nct = _clean(finding.get("nct_id")).upper()
+        if nct.startswith("NCT:"):
+            nct = nct[4:]
+        if nct and not nct.startswith("NCT"):
+            nct = f"NCT{nct}"
+        return nct
+
+    def _drug_names(self, finding: Dict[str, Any]) -> List[str]:
+        names = []
+        for intr in _as_list(finding.get("interventions")):
+            if isinstance(intr, dict):
+                if _clean(intr.get("type")).upper() in self.DRUG_INTERVENTION_TYPES:
+                    names.append(_clean(intr.get("name")))
+            else:
+                names.append(_clean(intr))
+        names.extend(_clean(d) for d in _as_list(finding.get("drugs") or finding.get("drug")))
+        return [n for n in dict.fromkeys(names) if n]
+
+    def _rule_statement(self, finding: Dict[str, Any]) -> str:
+        title = _clean(finding.get("brief_title") or finding.get("title"))
+        meta = ", ".join(p for p in (_clean(finding.get("phase")), _clean(finding.get("status"))) if p)
+        return f"{title} ({meta}) [NCT:{self._nct_id(finding)}]" if meta else f"{title} [NCT:{self._nct_id(finding)}]"
+
+    def _rule_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
+        return f"NCT:{self._nct_id(finding)}"
+
 
 class PubMedEntityExtractor(EntityExtractor):
     """PubMed 数据专用提取器"""
@@ -603,6 +1204,64 @@ FDA 药物标签数据包含:
 - DRUG contraindicated_for CONDITION (禁忌症)
 """
 
+    def _rule_extract(self, finding: Dict[str, Any], builder: "_RuleResultBuilder") -> bool:
+        # 适应症为自由文本时交给 LLM；仅在疾病以结构化字段给出时走规则
+        drug = _clean(finding.get("generic_name") or finding.get("drug_name") or finding.get("drug"))
+        diseases = [_clean(d) for d in _as_list(finding.get("disease") or finding.get("diseases"))]
+        contraindicated = [_clean(c) for c in _as_list(finding.get("contraindicated_for"))]
+        if not drug or not (diseases or contraindicated):
+            return False
+
+        brand = _clean(finding.get("brand_name"))
+        drug_id = builder.add_entity(EntityType.DRUG, drug, aliases=[brand] if brand else None)
+        for disease in diseases:
+            disease_id = builder.add_entity(EntityType.DISEASE, disease)
+            builder.add_edge(drug_id, disease_id, Predicate.TREATS, 0.99)
+        for condition in contraindicated:
+            condition_id = builder.add_entity(EntityType.DISEASE, condition)
+            builder.add_edge(drug_id, condition_id, Predicate.CONTRAINDICATED_FOR, 0.95)
+
+        subject_id = self._add_subject(finding, builder)
+        if subject_id:
+            builder.add_edge(subject_id, drug_id, Predicate.BIOMARKER_FOR, 0.95)
+        return True
+
+    def _rule_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
+        drug = _clean(finding.get("generic_name") or finding.get("drug_name") or finding.get("drug"))
+        return f"FDA:{drug.upper()}" if drug else "FDA"
+
+
+class GDCEntityExtractor(EntityExtractor):
+    """GDC / cBioPortal 突变频率数据专用提取器"""
+
+    # 出现任一字段即视为结构化频率数据
+    FREQUENCY_FIELDS = ("frequency_percentage", "variant_count", "total_mutations", "mutation_frequency", "frequency")
+
+    def _rule_extract(self, finding: Dict[str, Any], builder: "_RuleResultBuilder") -> bool:
+        if not any(finding.get(f) not in (None, "") for f in self.FREQUENCY_FIELDS):
+            return False
+        subject_id = self._add_subject(finding, builder)
+        if not subject_id:
+            return False
+        for disease in _as_list(finding.get("disease") or finding.get("cancer_type")):
+            disease_id = builder.add_entity(EntityType.DISEASE, _clean(disease))
+            builder.add_edge(subject_id, disease_id, Predicate.ASSOCIATED_WITH, 0.9)
+        return True
+
+    def _rule_statement(self, finding: Dict[str, Any]) -> str:
+        subject = " ".join(p for p in (_clean(finding.get("gene")), _clean(finding.get("variant"))) if p)
+        freq = finding.get("frequency_percentage", finding.get("mutation_frequency", finding.get("frequency")))
+        cancer = _clean(finding.get("disease") or finding.get("cancer_type"))
+        text = f"{subject} mutation frequency {freq}%" if freq not in (None, "") else f"{subject} mutation count {finding.get('variant_count', finding.get('total_mutations'))}"
+        return text + (f" in {cancer}" if cancer else "") + " [GDC]"
+
+    def _rule_provenance(self, finding: Dict[str, Any]) -> Optional[str]:
+        match = re.search(r'/genes/([A-Z0-9_]+)', _clean(finding.get("gdc_url")))
+        if match:
+            return f"GDC:{match.group(1)}"
+        gene = _clean(finding.get("gene"))
+        return f"GDC:{gene.upper()}" if gene else "GDC"
+
 
 class NCCNEntityExtractor(EntityExtractor):
     """NCCN 指南数据专用提取器"""
@@ -638,16 +1297,21 @@ ENTITY_EXTRACTOR_MAP: Dict[str, EntityExtractor] = {
 
     # FDA
     "search_fda_label": FDALabelEntityExtractor(),
+    "search_fda_labels": FDALabelEntityExtractor(),
 
     # NCCN
     "search_nccn": NCCNEntityExtractor(),
     "query_nccn": NCCNEntityExtractor(),
 
+    # ClinVar
+    "search_clinvar": ClinVarEntityExtractor(),
+
+    # 突变频率
+    "search_gdc": GDCEntityExtractor(),
+    "search_cbioportal": GDCEntityExtractor(),  # 向后兼容
+    "get_mutation_frequency": GDCEntityExtractor(),
+
     # 其他工具使用默认提取器
-    "search_clinvar": EntityExtractor(),
-    "search_gdc": EntityExtractor(),
-    "search_cbioportal": EntityExtractor(),  # 向后兼容
-    "get_mutation_frequency": EntityExtractor(),
     "check_interaction": EntityExtractor(),
 }
 
@@ -671,18 +1335,20 @@ def extract_entities_from_finding(
     source_tool: str,
     iteration: int,
     llm_caller=None,
-    existing_entities: str = ""
+    existing_entities: EntityIndexSource = ""
 ) -> ExtractionResult:
     """
     从 finding 提取实体和关系的便捷函数
 
+    结构化来源优先走规则快速路径（result.method == "rule"），否则调用 LLM。
+
     Args:
         finding: 工具返回的发现数据
         source_agent: 来源 Agent
         source_tool: 来源工具
         iteration: 迭代轮次
         llm_caller: 可选的 LLM 调用函数
-        existing_entities: 已有实体索引（供 LLM 参考避免重复创建）
+        existing_entities: 已有实体索引（供 LLM 参考避免重复创建），可为惰性求值函数 (findings -> 索引文本)
 
     Returns:
         ExtractionResult
@@ -700,6 +1366,149 @@ def extract_entities_from_finding(
     )
 
 
+def extract_entities_batch(
+    findings: List[Dict[str, Any]],
+    source_agent: str,
+    iteration: int,
+    llm_caller=None,
+    existing_entities: EntityIndexSource = "",
+    max_batch_tokens: Optional[int] = None,
+    max_batch_items: Optional[int] = None,
+) -> List[ExtractionResult]:
+    """
+    批量提取多条 finding 的实体和关系
+
+    结构化 finding 走规则快速路径；其余按提取器分组，打包成少量 LLM 请求。
+    finding 的稳定 id 为其在输入中的位置 (F1, F2, ...)。
+
+    Args:
+        findings: finding 列表（source_tool 取自 finding["source_tool"]）
+        source_agent: 来源 Agent
+        iteration: 迭代轮次
+        llm_caller: 可选的 LLM 调用函数
+        existing_entities: 已有实体索引，可为惰性求值函数 (findings -> 索引文本，每个 LLM 批次求值)
+        max_batch_tokens: 每批 finding 载荷 token 预算（默认 ENTITY_EXTRACTION_BATCH_TOKENS）
+        max_batch_items: 每批最多 finding 数（默认 ENTITY_EXTRACTION_BATCH_MAX_ITEMS）
+
+    Returns:
+        与 findings 一一对应的 ExtractionResult 列表
+    """
+    results: Dict[str, ExtractionResult] = {}
+    groups: Dict[type, Tuple[EntityExtractor, List[Tuple[str, Dict[str, Any], str]]]] = {}
+
+    for i, finding in enumerate(findings):
+        fid = f"F{i + 1}"
+        source_tool = finding.get("source_tool", "unknown")
+        extractor = get_extractor(source_tool)
+        structured = extractor.extract_structured(finding, source_agent, source_tool, iteration)
+        if structured is not None:
+            results[fid] = structured
+            continue
+        groups.setdefault(type(extractor), (extractor, []))[1].append((fid, finding, source_tool))
+
+    if groups:
+        for extractor, items in groups.values():
+            if llm_caller:
+                extractor._llm_caller = llm_caller
+            results.update(extractor.extract_batch(
+                items, source_agent, iteration, existing_entities,
+                max_batch_tokens=max_batch_tokens, max_batch_items=max_batch_items,
+            ))
+
+    llm_count = sum(len(items) for _, items in groups.values())
+    logger.debug(f"[EntityExtractor] Batch: {len(findings)} findings, {len(findings) - llm_count} rule-based, {llm_count} via LLM")
+
+    return [
+        results.get(f"F{i + 1}") or ExtractionResult(
+            entities=[], edges=[], conflicts=[],
+            source_tool=finding.get("source_tool", "unknown"), raw_finding=finding,
+        )
+        for i, finding in enumerate(findings)
+    ]
+
+
+def dedupe_batch_entities(results: List[ExtractionResult]) -> int:
+    """
+    合并同一批次内不同 finding 提取出的同一实体
+
+    批量提取时每条 finding 只看到提取前的已有实体索引，无法复用同批前面 finding 新建的实体；
+    同类型实体的名称 / 别名相交时改写为批内首次出现的 canonical_id（边端点同步改写），
+    写图时由 get_or_create_entity 合并别名。
+
+    Returns:
+        被改写的实体数
+    """
+    first_seen: Dict[Tuple[EntityType, str], str] = {}
+    merged = 0
+    for result in results:
+        remap: Dict[str, str] = {}
+        for entity in result.entities:
+            labels = list(dict.fromkeys(
+                Entity.normalize_name(label) for label in [entity.name] + entity.aliases if label and label.strip()
+            ))
+            target = next(
+                (first_seen[(entity.entity_type, label)] for label in labels if (entity.entity_type, label) in first_seen),
+                None,
+            )
+            if target and target != entity.canonical_id:
+                remap[entity.canonical_id] = target
+                entity.canonical_id = target
+                # 被合并实体的名称保留为别名（边可能按名称引用）
+                entity.aliases = labels
+                merged += 1
+            for label in labels:
+                first_seen.setdefault((entity.entity_type, label), entity.canonical_id)
+        for edge in result.edges:
+            edge.source_id = remap.get(edge.source_id, edge.source_id)
+            edge.target_id = remap.get(edge.target_id, edge.target_id)
+    return merged
+
+
+# finding 结构化字段 → 优先实体类型 (相关实体检索的类型兼容加权)
+_FIELD_ENTITY_TYPES: Dict[str, Tuple[EntityType, ...]] = {
+    "gene": (EntityType.GENE, EntityType.VARIANT),
+    "variant": (EntityType.VARIANT,),
+    "drug": (EntityType.DRUG, EntityType.REGIMEN),
+    "drugs": (EntityType.DRUG, EntityType.REGIMEN),
+    "disease": (EntityType.DISEASE,),
+    "nct_id": (EntityType.TRIAL,),
+    "pmid": (EntityType.PAPER,),
+}
+
+
+def finding_query_text(findings: List[Dict[str, Any]]) -> str:
+    """拼接 findings 中的文本字段作为相关实体检索查询"""
+    parts: List[str] = []
+    for finding in findings:
+        for key, value in finding.items():
+            if key in ("entities", "relationships", "url", "source_url", "l_tier_reasoning"):
+                continue
+            if isinstance(value, (str, int, float)):
+                parts.append(str(value))
+            elif isinstance(value, list):
+                parts.extend(str(v) for v in value if isinstance(v, (str, int, float)))
+    return " ".join(parts)
+
+
+def make_entity_index_selector(graph: EvidenceGraph, max_tokens: Optional[int] = None) -> Callable[[List[Dict[str, Any]]], str]:
+    """
+    构建相关实体索引选择器，替代在提示中嵌入全量 get_entity_index()
+
+    Args:
+        graph: 证据图
+        max_tokens: 索引 token 上限 (默认 ENTITY_INDEX_MAX_TOKENS)
+
+    Returns:
+        函数 findings -> 与这些 findings 相关的实体索引文本
+    """
+    def select(findings: List[Dict[str, Any]]) -> str:
+        preferred = {t for f in findings for k, types in _FIELD_ENTITY_TYPES.items() if f.get(k) for t in types}
+        return graph.get_relevant_entity_index(
+            finding_query_text(findings), preferred_types=preferred, max_tokens=max_tokens
+        )
+    return select
+
+
 # ============================================================
 # 测试
 # ============================================================
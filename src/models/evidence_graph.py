@@ -14,10 +14,13 @@ Evidence Graph 数据结构 (DeepEvidence Style)
 - 同一概念不允许创建新实体，必须合并
 - ID格式: {source}_{uuid8}
 """
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
-from typing import Dict, List, Any, Optional, Set, Tuple
+from typing import Dict, List, Any, Optional, Set, Tuple, Iterable
 from enum import Enum
 from datetime import datetime
+import math
+import re
 import uuid
 
 
@@ -115,6 +118,30 @@ class EvidenceType(str, Enum):
     LITERATURE = "literature"              # 综合文献证据 (综述/meta分析)
 
 
+# ==================== 文本工具 ====================
+
+# 检索时忽略的词项：实体类型前缀与常见英文虚词
+_STOP_TERMS = {
+    "GENE", "VARIANT", "DRUG", "DISEASE", "PATHWAY", "BIOMARKER", "PAPER", "TRIAL",
+    "GUIDELINE", "REGIMEN", "FINDING", "THE", "AND", "OR", "OF", "IN", "TO", "FOR",
+    "WITH", "ON", "BY", "AN", "AS", "IS", "ARE", "WAS", "AT", "FROM", "THAT", "THIS",
+    "PATIENTS", "PATIENT", "CANCER", "MUTATION", "MUTATIONS", "THERAPY", "TREATMENT",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    """大写化并切分为检索词项 (保留 PD-L1 / T790M 等内部连字符)"""
+    if not text:
+        return []
+    tokens = re.findall(r"[A-Z0-9\u4e00-\u9fff](?:[A-Z0-9\u4e00-\u9fff\-\.]*[A-Z0-9\u4e00-\u9fff])?", str(text).upper())
+    return [t for t in tokens if len(t) > 1 and t not in _STOP_TERMS]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略 token 估算 (约 3 字符/token，偏保守)"""
+    return len(text) // 3 + 1
+
+
 # ==================== 核心数据类 ====================
 
 @dataclass
@@ -373,6 +400,31 @@ class Edge:
 
 # ==================== 证据图 ====================
 
+# ==================== 子图检索辅助 ====================
+
+@dataclass
+class _AdjacencySnapshot:
+    """
+    CSR 风格邻接快照 (按图版本构建)
+
+    节点 i 的邻接位于 [indptr[i], indptr[i+1])，neighbors / edge_ids 为平行数组。
+    """
+    version: int
+    node_ids: List[str]
+    node_pos: Dict[str, int]
+    indptr: List[int]
+    neighbors: List[int]
+    edge_ids: List[str]
+
+
+@dataclass
+class _SubgraphCacheEntry:
+    """子图缓存条目：watch 为遍历触及的实体，变更不触及它们时缓存仍有效"""
+    version: int
+    watch: Set[str]
+    result: Dict[str, Any]
+
+
 class EvidenceGraph:
     """
     证据图 - 实体中心的知识图谱
@@ -384,11 +436,35 @@ class EvidenceGraph:
     - 支持冲突检测和标记
     """
 
+    # 相关实体索引缓存条数 (每个图版本)
+    RELEVANT_INDEX_CACHE_SIZE = 256
+    # 子图检索缓存条数
+    SUBGRAPH_CACHE_SIZE = 256
+    # 变更日志长度（用于子图缓存的增量失效；超出后旧缓存整体失效）
+    MUTATION_LOG_SIZE = 4096
+
     def __init__(self):
         self.entities: Dict[str, Entity] = {}    # canonical_id -> Entity
         self.edges: Dict[str, Edge] = {}         # edge_id -> Edge
         self._edge_index: Dict[str, Set[str]] = {}  # entity_canonical_id -> edge_ids
         self._name_index: Dict[str, str] = {}    # normalized_name -> canonical_id (用于模糊匹配)
+        self._version: int = 0                   # 变更计数，供派生缓存失效
+        self._term_index: Optional[Tuple[int, Dict[str, Set[str]]]] = None  # (version, term -> canonical_ids)
+        self._relevant_cache: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._mutation_log: deque = deque(maxlen=self.MUTATION_LOG_SIZE)  # (version, 受影响 canonical_ids)
+        self._adjacency: Optional["_AdjacencySnapshot"] = None
+        self._subgraph_cache: "OrderedDict[Tuple, _SubgraphCacheEntry]" = OrderedDict()
+        self._subgraph_stats: Dict[str, int] = {"hits": 0, "misses": 0, "revalidated": 0}
+
+    @property
+    def version(self) -> int:
+        """图版本号：实体/边/观察/别名变更时递增"""
+        return self._version
+
+    def _touch(self, *canonical_ids: str) -> None:
+        """标记图已变更，并记录受影响的实体（供子图缓存增量失效）"""
+        self._version += 1
+        self._mutation_log.append((self._version, canonical_ids))
 
     # ==================== 实体操作 ====================
 
@@ -423,8 +499,7 @@ class EvidenceGraph:
             entity = self.entities[canonical_id]
             # 添加可能的新别名
             if aliases:
-                for alias in aliases:
-                    entity.add_alias(alias)
+                self._add_aliases(entity, aliases)
             return entity
 
         # 2. 通过规范化名称查找 (模糊匹配)
@@ -433,8 +508,7 @@ class EvidenceGraph:
             if existing_canonical_id in self.entities:
                 entity = self.entities[existing_canonical_id]
                 if aliases:
-                    for alias in aliases:
-                        entity.add_alias(alias)
+                    self._add_aliases(entity, aliases)
                 return entity
 
         # 3. 创建新实体
@@ -455,8 +529,17 @@ class EvidenceGraph:
             if alias not in self._name_index:
                 self._name_index[alias] = canonical_id
 
+        self._touch(canonical_id)
         return entity
 
+    def _add_aliases(self, entity: Entity, aliases: List[str]) -> None:
+        """向已有实体追加别名，有新增时递增版本"""
+        before = len(entity.aliases)
+        for alias in aliases:
+            entity.add_alias(alias)
+        if len(entity.aliases) != before:
+            self._touch(entity.canonical_id)
+
     def add_observation_to_entity(
         self,
         canonical_id: str,
@@ -476,6 +559,7 @@ class EvidenceGraph:
             return False
 
         self.entities[canonical_id].add_observation(observation)
+        self._touch(canonical_id)
         return True
 
     def find_entity_by_name(
@@ -533,6 +617,166 @@ class EvidenceGraph:
             lines.append(f"- {entity.canonical_id}: {entity.name}{aliases_str}")
         return "\n".join(lines)
 
+    # ==================== 相关实体检索 ====================
+
+    @staticmethod
+    def _entity_index_line(entity: Entity) -> str:
+        """实体索引行 (与 get_entity_index 格式一致)"""
+        aliases_str = f" (别名: {', '.join(entity.aliases)})" if entity.aliases else ""
+        return f"- {entity.canonical_id}: {entity.name}{aliases_str}"
+
+    def _get_term_index(self) -> Dict[str, Set[str]]:
+        """词项倒排索引 (名称/别名/canonical_id 词项 -> canonical_id)，按版本缓存"""
+        if self._term_index is not None and self._term_index[0] == self._version:
+            return self._term_index[1]
+        index: Dict[str, Set[str]] = {}
+        for cid, entity in self.entities.items():
+            terms = set(_tokenize(cid))
+            terms.update(_tokenize(entity.name))
+            for alias in entity.aliases:
+                terms.update(_tokenize(alias))
+            for term in terms:
+                index.setdefault(term, set()).add(cid)
+        self._term_index = (self._version, index)
+        return index
+
+    def score_entities(
+        self,
+        query: str,
+        candidate_ids: Optional[Iterable[str]] = None,
+        preferred_types: Optional[Iterable[EntityType]] = None,
+    ) -> Dict[str, float]:
+        """
+        按词项/别名匹配为实体打相关性分
+
+        - 词项命中按 IDF 加权（罕见词项权重高，泛化词项权重低）
+        - 名称或别名整体出现在查询中额外加分
+        - preferred_types 中的类型加权 (类型兼容)
+
+        Args:
+            query: 查询文本 (finding 内容 / 方向主题与查询词)
+            candidate_ids: 限定候选实体 (None 表示全图)
+            preferred_types: 优先实体类型
+
+        Returns:
+            {canonical_id: score}，仅含 score > 0 的实体
+        """
+        query_terms = set(_tokenize(query))
+        if not query_terms or not self.entities:
+            return {}
+        term_index = self._get_term_index()
+        candidates = set(candidate_ids) if candidate_ids is not None else None
+        preferred = set(preferred_types or [])
+        total = len(self.entities)
+        padded_query = f" {' '.join(_tokenize(query))} "
+
+        scores: Dict[str, float] = {}
+        for term in query_terms:
+            cids = term_index.get(term)
+            if not cids:
+                continue
+            idf = math.log(1 + total / len(cids))
+            for cid in cids:
+                if candidates is None or cid in candidates:
+                    scores[cid] = scores.get(cid, 0.0) + idf
+
+        for cid in list(scores):
+            entity = self.entities[cid]
+            for label in [entity.name] + entity.aliases:
+                label_terms = _tokenize(label)
+                if label_terms and f" {' '.join(label_terms)} " in padded_query:
+                    scores[cid] += 3.0
+                    break
+            if entity.entity_type in preferred:
+                scores[cid] *= 1.5
+        return scores
+
+    def get_relevant_entity_ids(
+        self,
+        query: str,
+        preferred_types: Optional[Iterable[EntityType]] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """按相关性降序返回候选实体 canonical_id"""
+        scores = self.score_entities(query, preferred_types=preferred_types)
+        ranked = sorted(
+            scores,
+            key=lambda cid: (-scores[cid], -len(self.entities[cid].observations), cid),
+        )
+        return ranked[:limit] if limit else ranked
+
+    def get_relevant_entity_index(
+        self,
+        query: str,
+        preferred_types: Optional[Iterable[EntityType]] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        生成与查询相关的实体索引（get_entity_index 的过滤版本）
+
+        只保留与 finding / 方向词项或别名匹配的候选实体，按相关性排序并在
+        token 上限内截断。结果按 (图版本, 查询, 类型, 上限) 缓存。
+
+        Args:
+            query: 查询文本
+            preferred_types: 优先实体类型
+            max_tokens: token 上限 (默认 ENTITY_INDEX_MAX_TOKENS)
+
+        Returns:
+            实体索引文本（无相关实体时为空字符串）
+        """
+        if max_tokens is None:
+            from config.settings import ENTITY_INDEX_MAX_TOKENS
+            max_tokens = ENTITY_INDEX_MAX_TOKENS
+        type_key = tuple(sorted(t.value for t in (preferred_types or [])))
+        key = (self._version, " ".join(sorted(set(_tokenize(query)))), type_key, max_tokens)
+        cached = self._relevant_cache.get(key)
+        if cached is not None:
+            self._relevant_cache.move_to_end(key)
+            return cached
+
+        lines = []
+        used = 0
+        for cid in self.get_relevant_entity_ids(query, preferred_types=preferred_types):
+            line = self._entity_index_line(self.entities[cid])
+            cost = estimate_tokens(line)
+            if used + cost > max_tokens:
+                break
+            lines.append(line)
+            used += cost
+        result = "\n".join(lines)
+
+        self._relevant_cache[key] = result
+        while len(self._relevant_cache) > self.RELEVANT_INDEX_CACHE_SIZE:
+            self._relevant_cache.popitem(last=False)
+        return result
+
+    def entity_index_stats(self, filtered_index: str, referenced_ids: Iterable[str]) -> Dict[str, Any]:
+        """
+        对比过滤索引与全量索引 (去重质量评估)
+
+        referenced_ids 为提取结果中引用的已有实体：全量索引下召回率恒为 1，
+        过滤索引的召回率衡量漏给 LLM 的复用候选。
+
+        Args:
+            filtered_index: get_relevant_entity_index 生成的索引文本
+            referenced_ids: 提取结果引用的已有实体 canonical_id
+
+        Returns:
+            {full_tokens, filtered_tokens, referenced, recalled, recall}
+        """
+        filtered = filtered_index
+        shown = {line[2:].split(": ", 1)[0] for line in filtered.splitlines() if line.startswith("- ")}
+        referenced = [cid for cid in dict.fromkeys(referenced_ids) if cid in self.entities]
+        recalled = [cid for cid in referenced if cid in shown]
+        return {
+            "full_tokens": estimate_tokens(self.get_entity_index()),
+            "filtered_tokens": estimate_tokens(filtered) if filtered else 0,
+            "referenced": len(referenced),
+            "recalled": len(recalled),
+            "recall": len(recalled) / len(referenced) if referenced else 1.0,
+        }
+
     def get_direction_evidence_summary(self, entity_ids: List[str]) -> str:
         """
         生成指定方向的证据摘要（供 PlanAgent 评估时参考）
@@ -621,6 +865,7 @@ class EvidenceGraph:
             existing_edge.confidence = max(existing_edge.confidence, confidence)
             if conflict_group:
                 existing_edge.conflict_group = conflict_group
+            self._touch(source_id, target_id)
             return existing_edge.id
 
         # 创建新边
@@ -637,6 +882,7 @@ class EvidenceGraph:
         self.edges[edge.id] = edge
         self._edge_index[source_id].add(edge.id)
         self._edge_index[target_id].add(edge.id)
+        self._touch(source_id, target_id)
 
         return edge.id
 
@@ -759,10 +1005,10 @@ class EvidenceGraph:
         visited: Set[str] = {entity_id}
         hop_map: Dict[str, int] = {entity_id: 0}
         collected_edges: Dict[str, Edge] = {}  # edge_id -> Edge (dedup)
-        queue: List[Tuple[str, int]] = [(entity_id, 0)]
+        queue: deque = deque([(entity_id, 0)])
 
         while queue:
-            current_id, current_hop = queue.pop(0)
+            current_id, current_hop = queue.popleft()
 
             if current_hop >= max_hops:
                 continue
@@ -868,10 +1114,20 @@ class EvidenceGraph:
             if len(all_entity_ids) >= max_entities:
                 break
 
-        # Build serializable result
+        return self._serialize_subgraph(all_entity_ids, all_hop_map, all_edges.values(), include_observations)
+
+    def _serialize_subgraph(
+        self,
+        entity_ids: Iterable[str],
+        hop_map: Dict[str, int],
+        edges: Iterable[Edge],
+        include_observations: bool,
+    ) -> Dict[str, Any]:
+        """子图序列化 (retrieve_subgraph / retrieve_subgraphs 共用)"""
+        all_hop_map = hop_map
         entities_out = []
         total_observations = 0
-        for eid in all_entity_ids:
+        for eid in entity_ids:
             entity = self.entities.get(eid)
             if not entity:
                 continue
@@ -905,7 +1161,7 @@ class EvidenceGraph:
             entities_out.append(entry)
 
         edges_out = []
-        for edge in all_edges.values():
+        for edge in edges:
             obs_count = len(edge.observations)
             total_observations += obs_count
 
@@ -939,6 +1195,199 @@ class EvidenceGraph:
             },
         }
 
+    # ==================== 批量子图检索 ====================
+
+    def _get_adjacency(self) -> _AdjacencySnapshot:
+        """获取 CSR 邻接快照，图版本变化后重建"""
+        if self._adjacency is not None and self._adjacency.version == self._version:
+            return self._adjacency
+        node_ids = list(self.entities)
+        node_pos = {cid: i for i, cid in enumerate(node_ids)}
+        indptr = [0]
+        neighbors: List[int] = []
+        edge_ids: List[str] = []
+        for cid in node_ids:
+            for edge_id in sorted(self._edge_index.get(cid, ())):
+                edge = self.edges.get(edge_id)
+                if not edge:
+                    continue
+                other = edge.target_id if edge.source_id == cid else edge.source_id
+                pos = node_pos.get(other)
+                if pos is None:
+                    continue
+                neighbors.append(pos)
+                edge_ids.append(edge_id)
+            indptr.append(len(neighbors))
+        self._adjacency = _AdjacencySnapshot(self._version, node_ids, node_pos, indptr, neighbors, edge_ids)
+        return self._adjacency
+
+    def _subgraph_entry_valid(self, entry: _SubgraphCacheEntry) -> bool:
+        """增量失效检查：entry 之后的变更若未触及其 watch 集合，则刷新版本继续使用"""
+        if entry.version == self._version:
+            return True
+        log = self._mutation_log
+        if not log or log[0][0] > entry.version + 1:
+            return False  # 变更日志已截断，无法判定
+        for version, touched in reversed(log):
+            if version <= entry.version:
+                break
+            if any(cid in entry.watch for cid in touched):
+                return False
+        entry.version = self._version
+        self._subgraph_stats["revalidated"] += 1
+        return True
+
+    def retrieve_subgraphs(
+        self,
+        anchor_sets: Dict[str, List[str]],
+        max_hops: int = 2,
+        max_entities: int = 100,
+        predicate_filter: Optional[List[Predicate]] = None,
+        entity_type_filter: Optional[List[EntityType]] = None,
+        include_observations: bool = True,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        批量子图检索：多个方向的锚点集合一次多源遍历完成
+
+        在 CSR 邻接快照上做按层同步的多源 BFS，每个节点携带"已到达的方向"位掩码，
+        所有方向共享同一次遍历；hop 为节点到该方向最近锚点的距离。
+        结果按 (锚点集合, hops, 上限, 过滤条件) 缓存，图变更只使触及已遍历实体的条目失效。
+
+        Args:
+            anchor_sets: {方向 key: 锚点 canonical_id 列表}
+            max_hops / max_entities / predicate_filter / entity_type_filter / include_observations:
+                同 retrieve_subgraph（max_entities 为每个方向的上限）
+
+        Returns:
+            {方向 key: 与 retrieve_subgraph 相同结构的子图}
+        """
+        filter_key = (
+            max_hops,
+            max_entities,
+            tuple(sorted(p.value for p in predicate_filter)) if predicate_filter else None,
+            tuple(sorted(t.value for t in entity_type_filter)) if entity_type_filter else None,
+            include_observations,
+        )
+        results: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[frozenset, List[str]] = {}
+        for key, anchors in anchor_sets.items():
+            anchor_key = frozenset(anchors or [])
+            cache_key = (anchor_key,) + filter_key
+            entry = self._subgraph_cache.get(cache_key)
+            if entry is not None and self._subgraph_entry_valid(entry):
+                self._subgraph_cache.move_to_end(cache_key)
+                self._subgraph_stats["hits"] += 1
+                results[key] = entry.result
+            else:
+                pending.setdefault(anchor_key, []).append(key)
+
+        self._subgraph_stats["misses"] += len(pending)
+        anchor_groups = list(pending)
+        traversals = self._multi_source_bfs(
+            anchor_groups, max_hops, max_entities,
+            set(predicate_filter) if predicate_filter else None,
+            set(entity_type_filter) if entity_type_filter else None,
+        )
+        for anchor_key, (hop_map, edge_ids) in zip(anchor_groups, traversals):
+            result = self._serialize_subgraph(
+                hop_map.keys(), hop_map, (self.edges[eid] for eid in edge_ids), include_observations
+            )
+            cache_key = (anchor_key,) + filter_key
+            self._subgraph_cache[cache_key] = _SubgraphCacheEntry(
+                version=self._version, watch=set(hop_map) | set(anchor_key), result=result
+            )
+            for key in pending[anchor_key]:
+                results[key] = result
+        while len(self._subgraph_cache) > self.SUBGRAPH_CACHE_SIZE:
+            self._subgraph_cache.popitem(last=False)
+        # 顶层列表返回副本，调用方截断/重排不影响缓存
+        return {
+            key: dict(result, entities=list(result["entities"]), edges=list(result["edges"]))
+            for key, result in results.items()
+        }
+
+    def _multi_source_bfs(
+        self,
+        anchor_groups: List[frozenset],
+        max_hops: int,
+        max_entities: int,
+        predicate_filter: Optional[Set[Predicate]],
+        entity_type_filter: Optional[Set[EntityType]],
+    ) -> List[Tuple[Dict[str, int], List[str]]]:
+        """
+        位掩码多源 BFS：bit g 表示第 g 个锚点集合
+
+        Returns:
+            与 anchor_groups 对应的 (hop_map, edge_ids) 列表
+        """
+        if not anchor_groups:
+            return []
+        adj = self._get_adjacency()
+        n_groups = len(anchor_groups)
+        hop_maps: List[Dict[str, int]] = [{} for _ in range(n_groups)]
+        edge_sets: List[Dict[str, None]] = [{} for _ in range(n_groups)]  # 保序去重
+        reached: Dict[int, int] = {}     # 节点 -> 已到达的方向掩码
+        frontier: Dict[int, int] = {}    # 当前层节点 -> 本层新到达的方向掩码
+        saturated = 0                    # 已达 max_entities 的方向掩码
+
+        for g, anchors in enumerate(anchor_groups):
+            bit = 1 << g
+            for cid in sorted(anchors):
+                pos = adj.node_pos.get(cid)
+                if pos is None or reached.get(pos, 0) & bit:
+                    continue
+                if len(hop_maps[g]) >= max_entities:
+                    saturated |= bit
+                    break
+                reached[pos] = reached.get(pos, 0) | bit
+                frontier[pos] = frontier.get(pos, 0) | bit
+                hop_maps[g][cid] = 0
+
+        allowed = None
+        if entity_type_filter:
+            allowed = [self.entities[cid].entity_type in entity_type_filter for cid in adj.node_ids]
+
+        for hop in range(max_hops):
+            if not frontier:
+                break
+            next_frontier: Dict[int, int] = {}
+            for node in sorted(frontier):
+                active = frontier[node] & ~saturated
+                if not active:
+                    continue
+                for k in range(adj.indptr[node], adj.indptr[node + 1]):
+                    edge_id = adj.edge_ids[k]
+                    if predicate_filter and self.edges[edge_id].predicate not in predicate_filter:
+                        continue
+                    nbr = adj.neighbors[k]
+                    if allowed is not None and not allowed[nbr]:
+                        continue
+                    mask = active & ~saturated
+                    if not mask:
+                        break
+                    new_bits = mask & ~reached.get(nbr, 0)
+                    nbr_id = adj.node_ids[nbr]
+                    bits = mask
+                    while bits:
+                        low = bits & -bits
+                        g = low.bit_length() - 1
+                        bits ^= low
+                        edge_sets[g][edge_id] = None
+                        if new_bits & low:
+                            hop_maps[g][nbr_id] = hop + 1
+                            if len(hop_maps[g]) >= max_entities:
+                                saturated |= low
+                    if new_bits:
+                        reached[nbr] = reached.get(nbr, 0) | new_bits
+                        next_frontier[nbr] = next_frontier.get(nbr, 0) | new_bits
+            frontier = next_frontier
+
+        return [(hop_maps[g], list(edge_sets[g])) for g in range(n_groups)]
+
+    def subgraph_cache_stats(self) -> Dict[str, int]:
+        """子图缓存统计: hits / misses / revalidated (增量校验后复用) / size"""
+        return dict(self._subgraph_stats, size=len(self._subgraph_cache))
+
     def search_entities(
         self,
         query: str,
@@ -1176,10 +1625,15 @@ class EvidenceGraph:
             成功标记的边数量
         """
         count = 0
+        touched = []
         for edge_id in edge_ids:
             if edge_id in self.edges:
-                self.edges[edge_id].conflict_group = group_id
+                edge = self.edges[edge_id]
+                edge.conflict_group = group_id
+                touched.extend((edge.source_id, edge.target_id))
                 count += 1
+        if count:
+            self._touch(*touched)
         return count
 
     def get_conflicts(self) -> List[Dict[str, Any]]:
@@ -4,9 +4,12 @@ LangGraph 状态定义
 from typing import TypedDict, Dict, List, Any, Annotated
 from typing_extensions import NotRequired
 
+from src.utils.tracing import traced
+
 
 # ==================== 并发更新合并函数 ====================
 
+@traced("merge_evidence_graphs", "graph")
 def merge_evidence_graphs(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
     """
     合并两个证据图（用于并行 Agent 更新）
@@ -218,6 +221,8 @@ class MtbState(TypedDict):
     # ==================== 元数据 ====================
     workflow_errors: NotRequired[List[str]]  # 工作流错误列表
     execution_time: NotRequired[float]  # 执行时间（秒）
+    llm_budget_telemetry: NotRequired[Dict[str, Dict[str, Any]]]  # 按 LLM 调用点的实际用量统计
+    upstream_health: NotRequired[Dict[str, Dict[str, Any]]]  # 各上游熔断状态、请求/失败/拒绝次数与延迟
 
     # ==================== DeepEvidence 研究循环 ====================
     # 研究计划（PlanAgent 生成）
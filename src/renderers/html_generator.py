@@ -480,6 +480,7 @@ class HtmlReportGenerator:
             filename = "13_final_report.html"
         else:
             output_dir = REPORTS_DIR
+            output_dir.mkdir(parents=True, exist_ok=True)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             safe_patient_id = (context.get("patient_id") or "Unknown").replace("/", "_").replace("\\", "_")
             filename = f"MTB_Report_{safe_patient_id}_{timestamp}.html"
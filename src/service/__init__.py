@@ -0,0 +1,11 @@
+"""
+多病例执行：常驻服务模式（HTTP API + SQLite 任务队列）与批处理（进程池）
+"""
+from src.service.job_queue import JobQueue
+from src.service.server import MtbService, create_server
+
+__all__ = [
+    "JobQueue",
+    "MtbService",
+    "create_server",
+]
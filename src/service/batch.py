@@ -0,0 +1,310 @@
+"""
+多病例批处理：进程池隔离 + 共享磁盘缓存
+
+    python main.py batch <病例目录> [--workers 3] [--retries 1] [--output 报告.json]
+
+- 每个病例在独立工作进程中运行（spawn），单病例异常或进程崩溃不影响其他病例，失败后重试
+- 工作进程共享磁盘缓存（cBioPortal / GDC / RxNorm 文件缓存、试验索引与 FDA 说明书索引）
+  与跨进程速率限制窗口（RATE_LIMIT_SHARED_DIR），整批请求不超过单进程的上游配额
+- 调度按 (癌种, 驱动基因) 排序：同癌种病例相邻执行，NCCN 索引、试验查询与基因缓存保持热
+- 结束后输出吞吐与延迟汇总，并写入 reports/batch_<时间戳>/batch_report.json
+- 工作进程复用执行多个病例：用量、调用点遥测与上游状态由 run_mtb_workflow 按运行隔离，
+  日志写入各进程自己的 logs/mtb_batch_worker_<pid>.log
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.settings import BATCH_MAX_RETRIES, BATCH_WORKERS, DATA_DIR, REPORTS_DIR
+from src.utils.logger import mtb_logger as logger, setup_logger
+
+CASE_SUFFIXES = (".pdf", ".txt")
+
+# 癌种归并（同组共享 NCCN 指南与试验查询）；按顺序匹配，先匹配更具体的
+_CANCER_GROUPS = (
+    ("小细胞肺癌", r"(?<!非)小细胞肺癌|SCLC"),
+    ("非小细胞肺癌", r"非小细胞肺癌|NSCLC|肺腺癌|肺鳞癌|肺癌"),
+    ("小肠腺癌", r"小肠腺癌|十二指肠腺癌|空肠|回肠腺癌"),
+    ("结直肠癌", r"结直肠|结肠|直肠|乙状结肠|CRC"),
+    ("胃癌", r"胃癌|胃腺癌|胃食管结合部"),
+    ("乳腺癌", r"乳腺癌"),
+    ("胰腺癌", r"胰腺癌"),
+    ("肝癌", r"肝癌|肝细胞癌|胆管癌"),
+    ("卵巢癌", r"卵巢癌"),
+    ("前列腺癌", r"前列腺癌"),
+)
+_DRIVER_GENES = re.compile(
+    r"\b(KRAS|NRAS|BRAF|EGFR|ALK|ROS1|HER2|ERBB2|MET|RET|NTRK[123]?|PIK3CA|BRCA[12]|MSI-H|dMMR|TMB-H)\b",
+    re.IGNORECASE,
+)
+
+_worker_log_ready = False  # 工作进程内是否已开启文件日志
+
+
+def read_case(path: Path) -> str:
+    """PDF 走 read_case_file；.txt 直接读取（已提取的病历文本）"""
+    if path.suffix.lower() == ".txt":
+        return path.read_text(encoding="utf-8")
+    from src.utils.file_handler import read_case_file
+    return read_case_file(str(path))
+
+
+def case_profile(text: str) -> Tuple[str, Tuple[str, ...]]:
+    """病历 → (癌种组, 驱动基因)；只看开头部分（诊断通常在前）"""
+    head = text[:4000]
+    cancer = next((name for name, pattern in _CANCER_GROUPS if re.search(pattern, head, re.IGNORECASE)), "其他")
+    genes = tuple(sorted({g.upper() for g in _DRIVER_GENES.findall(head)}))
+    return cancer, genes
+
+
+def schedule(cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同癌种相邻、组内同驱动基因相邻；病例多的癌种先跑（缓存预热收益最大）"""
+    group_sizes: Dict[str, int] = {}
+    for case in cases:
+        group_sizes[case["cancer"]] = group_sizes.get(case["cancer"], 0) + 1
+    return sorted(cases, key=lambda c: (-group_sizes[c["cancer"]], c["cancer"], c["genes"], c["name"]))
+
+
+def worker_log_file(pid: Optional[int] = None) -> str:
+    """工作进程的日志文件名（logs/ 下）"""
+    return f"mtb_batch_worker_{pid or os.getpid()}.log"
+
+
+def run_case(path: str) -> Dict[str, Any]:
+    """工作进程内执行一个病例；异常转成失败结果返回（进程崩溃由父进程处理）"""
+    global _worker_log_ready
+    from src.graph.state_graph import run_mtb_workflow
+
+    if not _worker_log_ready:
+        # spawn 启动的工作进程只继承导入时的控制台日志，首个病例前开启文件日志；
+        # 轮转文件不能跨进程共享，每个工作进程写各自的文件
+        _worker_log_ready = True
+        setup_logger(log_file=worker_log_file())
+
+    start = time.time()
+    try:
+        final_state = run_mtb_workflow(read_case(Path(path)))
+    except Exception as e:
+        logger.exception(f"[Batch] {path} 执行失败: {e}")
+        return {"ok": False, "error": f"{type(e).__name__}: {e}", "seconds": round(time.time() - start, 2)}
+
+    usage = (final_state.get("usage_summary") or {}).get("total", {})
+    return {
+        "ok": bool(final_state.get("output_path")),
+        "error": "" if final_state.get("output_path") else
+                 "; ".join(map(str, final_state.get("workflow_errors") or [])) or "未生成报告",
+        "seconds": round(time.time() - start, 2),
+        "run_folder": final_state.get("run_folder", ""),
+        "output_path": final_state.get("output_path", ""),
+        "is_compliant": bool(final_state.get("is_compliant")),
+        "llm_calls": usage.get("calls", 0),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "cached_tokens": usage.get("cached_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cost_usd": usage.get("cost_usd", 0.0),
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 2)
+
+
+def summarize(results: List[Dict[str, Any]], wall_seconds: float, workers: int) -> Dict[str, Any]:
+    """整批吞吐 / 延迟 / 用量汇总（按癌种分组）"""
+    def block(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        done = [r for r in rows if r["status"] == "succeeded"]
+        latencies = [r["seconds"] for r in done]
+        return {
+            "cases": len(rows),
+            "succeeded": len(done),
+            "failed": len(rows) - len(done),
+            "retries": sum(max(r["attempts"] - 1, 0) for r in rows),
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p90": _percentile(latencies, 0.9),
+            "latency_max": max(latencies, default=0.0),
+            "llm_calls": sum(r.get("llm_calls", 0) for r in rows),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in rows),
+            "cached_tokens": sum(r.get("cached_tokens", 0) for r in rows),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in rows),
+            "cost_usd": round(sum(r.get("cost_usd", 0.0) for r in rows), 4),
+        }
+
+    total = block(results)
+    total.update({
+        "workers": workers,
+        "wall_seconds": round(wall_seconds, 2),
+        "cases_per_hour": round(total["succeeded"] * 3600 / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+    })
+    groups = {}
+    for cancer in dict.fromkeys(r["cancer"] for r in results):
+        groups[cancer] = block([r for r in results if r["cancer"] == cancer])
+    return {"total": total, "by_cancer": groups, "cases": results}
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    t = summary["total"]
+    lines = [
+        f"病例 {t['cases']}（成功 {t['succeeded']} / 失败 {t['failed']} / 重试 {t['retries']}），"
+        f"{t['workers']} 进程，总耗时 {t['wall_seconds']:.1f}s，吞吐 {t['cases_per_hour']:.1f} 例/小时",
+        f"单例延迟 p50 {t['latency_p50']:.1f}s / p90 {t['latency_p90']:.1f}s / max {t['latency_max']:.1f}s，"
+        f"LLM {t['llm_calls']} 次，prompt {t['prompt_tokens']}（缓存命中 {t['cached_tokens']}），"
+        f"completion {t['completion_tokens']}，费用 ${t['cost_usd']:.4f}",
+        "癌种 | 病例 | 成功 | 重试 | p50(s) | p90(s) | prompt | 缓存命中 | 费用($)",
+    ]
+    for cancer, g in summary["by_cancer"].items():
+        lines.append(
+            f"{cancer} | {g['cases']} | {g['succeeded']} | {g['retries']} | {g['latency_p50']:.1f} | "
+            f"{g['latency_p90']:.1f} | {g['prompt_tokens']} | {g['cached_tokens']} | {g['cost_usd']:.4f}"
+        )
+    return "\n".join(lines)
+
+
+def discover_cases(case_dir: Path) -> List[Dict[str, Any]]:
+    """目录下的 .pdf / .txt 病例及其调度画像（读不出文本的病例记为失败，不进入进程池）"""
+    cases = []
+    for path in sorted(p for p in Path(case_dir).iterdir() if p.suffix.lower() in CASE_SUFFIXES):
+        case = {"name": path.name, "path": str(path), "cancer": "其他", "genes": (), "attempts": 0}
+        try:
+            case["cancer"], case["genes"] = case_profile(read_case(path))
+        except Exception as e:
+            case.update(status="failed", error=f"读取失败: {e}", seconds=0.0)
+        cases.append(case)
+    return cases
+
+
+def run_batch(
+    cases: List[Dict[str, Any]],
+    workers: int = BATCH_WORKERS,
+    max_retries: int = BATCH_MAX_RETRIES,
+    runner: Callable[[str], Dict[str, Any]] = run_case,
+) -> List[Dict[str, Any]]:
+    """
+    按调度顺序在进程池中执行病例
+
+    单病例失败（异常 / 未生成报告）在重试次数内重新排到队尾；工作进程崩溃导致进程池
+    损坏时重建进程池，崩溃时仍在执行的病例各计一次尝试。
+
+    Returns:
+        每个病例的结果（含 status / attempts / seconds / 用量）
+    """
+    pending = [c for c in schedule(cases) if c.get("status") != "failed"]
+    finished = [c for c in cases if c.get("status") == "failed"]
+    context = multiprocessing.get_context("spawn")
+    batch_start = time.time()
+
+    while pending:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            running = {}
+            broken = False
+            while (pending or running) and not broken:
+                while pending and len(running) < workers:
+                    case = pending.pop(0)
+                    case["attempts"] += 1
+                    case.setdefault("queue_wait_seconds", round(time.time() - batch_start, 2))
+                    try:
+                        running[pool.submit(runner, case["path"])] = case
+                    except BrokenProcessPool:
+                        case["attempts"] -= 1
+                        pending.insert(0, case)
+                        broken = True
+                        break
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    case = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        result = {"ok": False, "error": "工作进程崩溃", "seconds": 0.0}
+                    except Exception as e:
+                        result = {"ok": False, "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                    ok = result.pop("ok")
+                    case.update(result)
+                    if ok:
+                        case["status"] = "succeeded"
+                        finished.append(case)
+                        logger.info(f"[Batch] {case['name']} 完成 ({case['seconds']}s, 第 {case['attempts']} 次)")
+                    elif case["attempts"] <= max_retries:
+                        logger.warning(f"[Batch] {case['name']} 失败，稍后重试: {case['error']}")
+                        pending.append(case)
+                    else:
+                        case["status"] = "failed"
+                        finished.append(case)
+                        logger.error(f"[Batch] {case['name']} 失败（已尝试 {case['attempts']} 次）: {case['error']}")
+            if broken:
+                logger.warning(f"[Batch] 进程池损坏，重建后继续（剩余 {len(pending) + len(running)} 例）")
+                for case in running.values():
+                    if case["attempts"] <= max_retries:
+                        pending.append(case)
+                    else:
+                        case.update(status="failed", error="工作进程崩溃")
+                        finished.append(case)
+
+    order = {c["path"]: i for i, c in enumerate(cases)}
+    return sorted(finished, key=lambda c: order[c["path"]])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="多病例批处理（进程池）")
+    parser.add_argument("case_dir", help="病例目录（.pdf / .txt）")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="工作进程数")
+    parser.add_argument("--retries", type=int, default=BATCH_MAX_RETRIES, help="单病例失败后的重试次数")
+    parser.add_argument("--output", help="汇总 JSON 路径（默认 reports/batch_<时间戳>/batch_report.json）")
+    args = parser.parse_args(argv)
+
+    case_dir = Path(args.case_dir)
+    if not case_dir.is_dir():
+        print(f"[ERROR] 目录不存在: {case_dir}")
+        return 1
+    cases = discover_cases(case_dir)
+    if not cases:
+        print(f"[ERROR] 目录中没有 .pdf / .txt 病例: {case_dir}")
+        return 1
+
+    # 工作进程以 spawn 启动并重新读取配置：未显式配置时为本批次启用跨进程限速
+    if not os.getenv("RATE_LIMIT_SHARED_DIR"):
+        os.environ["RATE_LIMIT_SHARED_DIR"] = str(DATA_DIR / "cache" / "ratelimit")
+
+    order = ", ".join(f"{c['name']}({c['cancer']})" for c in schedule(cases))
+    logger.info(f"[Batch] {len(cases)} 例，{args.workers} 进程，调度顺序: {order}")
+    print(f"批处理 {len(cases)} 例，{args.workers} 个工作进程...")
+
+    start = time.time()
+    results = run_batch(cases, workers=args.workers, max_retries=args.retries)
+    summary = summarize(results, time.time() - start, args.workers)
+
+    output = Path(args.output) if args.output else \
+        REPORTS_DIR / f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}" / "batch_report.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    table = format_summary(summary)
+    logger.info(f"[Batch] 汇总:\n{table}")
+    print("\n" + table)
+    print(f"\n汇总已写入: {output}")
+    for case in results:
+        if case["status"] != "succeeded":
+            print(f"[FAIL] {case['name']}: {case.get('error', '')}")
+    return 0 if summary["total"]["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    from config.settings import ensure_runtime_dirs
+    from src.utils.logger import setup_logger
+
+    ensure_runtime_dirs()
+    setup_logger()
+    raise SystemExit(main())
@@ -0,0 +1,193 @@
+"""
+病例任务队列（SQLite）
+
+服务模式下病例先入队再由工作线程领取执行；队列与进度事件落盘，服务重启后
+未完成的任务重新排队（执行次数达到 SERVICE_MAX_ATTEMPTS 的标记失败），已完成任务的结果与事件仍可查询。
+
+    jobs:   任务（状态 queued → running → succeeded / failed，或排队中被取消 cancelled）
+    events: 每个任务按序号递增的进度事件（节点开始 / 结束、完成、失败）
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config.settings import SERVICE_MAX_ATTEMPTS, SERVICE_QUEUE_PATH
+from src.utils.logger import mtb_logger as logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    label TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    input_text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id);
+CREATE TABLE IF NOT EXISTS events (
+    job_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+_JOB_COLUMNS = "id, label, source, status, attempts, created_at, started_at, finished_at, result, error"
+
+
+class JobQueue:
+    """持久化任务队列（单连接 + 锁，多工作线程共享）"""
+
+    def __init__(self, path: Path = SERVICE_QUEUE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ==================== 任务 ====================
+
+    def submit(self, input_text: str, label: str = "", source: str = "") -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (label, source, input_text, created_at) VALUES (?, ?, ?, ?)",
+                (label, source, input_text, time.time()),
+            )
+            job_id = cursor.lastrowid
+        self.add_event(job_id, "queued", label=label)
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """领取最早排队的任务并置为 running；无任务返回 None（含 input_text）"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+            job = self._conn.execute(
+                f"SELECT {_JOB_COLUMNS}, input_text FROM jobs WHERE id = ?", (row["id"],)
+            ).fetchone()
+        return self._job_dict(job)
+
+    def finish(self, job_id: int, result: Dict[str, Any]) -> None:
+        self._close_job(job_id, "succeeded", result=json.dumps(result, ensure_ascii=False))
+        self.add_event(job_id, "succeeded", **result)
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._close_job(job_id, "failed", error=error)
+        self.add_event(job_id, "failed", error=error)
+
+    def cancel(self, job_id: int) -> bool:
+        """取消排队中的任务；已开始或已结束的任务返回 False"""
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            ).rowcount
+        if updated:
+            self.add_event(job_id, "cancelled")
+        return bool(updated)
+
+    def requeue_interrupted(self, max_attempts: int = SERVICE_MAX_ATTEMPTS) -> int:
+        """
+        服务重启时处理上次未执行完的 running 任务
+
+        执行次数未达 max_attempts 的重新排队，已达上限的标记失败。
+
+        Returns:
+            重新排队的任务数
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, attempts FROM jobs WHERE status = 'running'").fetchall()
+            requeued = [r["id"] for r in rows if r["attempts"] < max_attempts]
+            exhausted = [r["id"] for r in rows if r["attempts"] >= max_attempts]
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE id = ?", [(i,) for i in requeued]
+            )
+        for job_id in requeued:
+            self.add_event(job_id, "requeued", reason="服务重启")
+        for job_id in exhausted:
+            self.fail(job_id, f"执行 {max_attempts} 次均被服务重启中断，不再重试")
+        if requeued:
+            logger.warning(f"[JobQueue] {len(requeued)} 个中断任务重新排队: {requeued}")
+        if exhausted:
+            logger.error(f"[JobQueue] {len(exhausted)} 个任务达到最多执行次数 {max_attempts}，标记失败: {exhausted}")
+        return len(requeued)
+
+    def _close_job(self, job_id: int, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                (status, time.time(), result, error, job_id),
+            )
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job_dict(row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = f"SELECT {_JOB_COLUMNS} FROM jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,)).fetchall()
+        return [self._job_dict(r) for r in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    @staticmethod
+    def _job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        if job.get("result"):
+            job["result"] = json.loads(job["result"])
+        return job
+
+    # ==================== 进度事件 ====================
+
+    def add_event(self, job_id: int, kind: str, **data: Any) -> int:
+        with self._lock, self._conn:
+            seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO events (job_id, seq, ts, kind, data) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, time.time(), kind, json.dumps(data, ensure_ascii=False, default=str)),
+            )
+        return seq
+
+    def events(self, job_id: int, after: int = 0) -> List[Dict[str, Any]]:
+        """序号大于 after 的事件（按序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, ts, kind, data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [{"seq": r["seq"], "ts": r["ts"], "kind": r["kind"], **json.loads(r["data"])} for r in rows]
@@ -0,0 +1,371 @@
+"""
+MTB 常驻服务：本地 HTTP API + SQLite 任务队列
+
+单次 CLI 每个病例都要重新编译工作流、加载 PageIndex 树与 PDF、建立 HTTP 会话与缓存；
+服务模式下这些在进程内只做一次，多个病例由工作线程并发执行，共享:
+    - BaseAgent 的全局 OpenRouter 速率限制（类级滑动窗口）与各 API 客户端的限速
+    - 上游熔断器、本地试验索引 / FDA 说明书索引、PubMed 与 RAG 单例
+吞吐由上游配额而非启动开销决定。
+
+接口:
+    GET    /health                    预热耗时、工作线程数、各状态任务数
+    POST   /jobs                      {"case_text": "..."} 或 {"case_path": "病例.pdf"}，可选 "label" → 202 {"job_id": N}
+    GET    /jobs[?status=queued]      任务列表
+    GET    /jobs/<id>                 任务状态与结果（报告路径、运行目录、用量汇总）
+    GET    /jobs/<id>/events[?after=N]           进度事件（JSON）
+    GET    /jobs/<id>/events?stream=1            进度事件（Server-Sent Events，任务结束后关闭）
+    DELETE /jobs/<id>                 取消排队中的任务
+
+用法:
+    python main.py serve [--host 127.0.0.1] [--port 8765] [--workers 2]
+    curl -X POST localhost:8765/jobs -d '{"case_path": "tests/fixtures/sample_case.pdf"}'
+    curl -N 'localhost:8765/jobs/1/events?stream=1'
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from config.settings import (
+    CASSETTE_MODE,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    SERVICE_WARM_IMAGE_RAG,
+    SERVICE_WARM_PAGEINDEX,
+    SERVICE_WORKERS,
+)
+from src.service.job_queue import TERMINAL_STATUSES, JobQueue
+from src.utils.logger import mtb_logger as logger
+
+_STREAM_POLL_SECONDS = 1.0
+
+
+def progress_callback(queue: JobQueue, job_id: int):
+    """LangGraph 回调：节点（含子图内节点）开始 / 结束写入任务进度事件"""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class _ProgressHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._lock = threading.Lock()
+            self._nodes: Dict[Any, tuple] = {}     # run_id → (节点名, 开始时间)
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+            name = kwargs.get("name")
+            if not name or name.startswith("__") or name != (metadata or {}).get("langgraph_node") \
+                    or not any(tag.startswith("graph:step:") for tag in tags or []):
+                return
+            with self._lock:
+                self._nodes[run_id] = (name, time.time())
+            queue.add_event(job_id, "node_start", node=name)
+
+        def _finish(self, run_id, error: Optional[BaseException] = None):
+            with self._lock:
+                node = self._nodes.pop(run_id, None)
+            if node is None:
+                return
+            name, start = node
+            data = {"node": name, "seconds": round(time.time() - start, 2)}
+            if error is not None:
+                data["error"] = f"{type(error).__name__}: {error}"
+            queue.add_event(job_id, "node_end", **data)
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._finish(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._finish(run_id, error)
+
+    return _ProgressHandler()
+
+
+class MtbService:
+    """预热共享资源，并由工作线程从队列领取病例执行"""
+
+    def __init__(self, queue: JobQueue, workers: int = SERVICE_WORKERS):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.warm_report: Dict[str, Any] = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # ==================== 预热 ====================
+
+    def warm_up(self) -> Dict[str, Any]:
+        """编译工作流并加载索引 / 单例；单项失败只记警告（执行时仍会按需加载）"""
+        from src.graph.state_graph import get_mtb_workflow
+
+        def pageindex():
+            from src.tools.rag.pageindex_rag import get_pageindex_rag
+            rag = get_pageindex_rag()
+            for cancer_type in filter(None, (c.strip() for c in SERVICE_WARM_PAGEINDEX.split(","))):
+                rag._load_index(cancer_type)
+
+        def local_indices():
+            from src.tools.api_clients.clinicaltrials_index import get_trial_index
+            from src.tools.api_clients.fda_label_index import get_fda_label_index
+            get_trial_index()
+            get_fda_label_index()
+
+        def pubmed():
+            from src.tools.smart_pubmed import get_smart_pubmed
+            get_smart_pubmed()
+
+        def image_rag():
+            from src.tools.rag.nccn_image_rag import get_nccn_image_rag
+            get_nccn_image_rag().load_index()
+
+        steps = [("workflow", get_mtb_workflow), ("pageindex", pageindex),
+                 ("local_indices", local_indices), ("pubmed", pubmed)]
+        if SERVICE_WARM_IMAGE_RAG:
+            steps.append(("image_rag", image_rag))
+
+        for name, step in steps:
+            start = time.time()
+            try:
+                step()
+                self.warm_report[name] = round(time.time() - start, 2)
+            except Exception as e:
+                logger.warning(f"[Service] 预热 {name} 失败（执行时按需加载）: {e}")
+                self.warm_report[name] = f"failed: {e}"
+        logger.info(f"[Service] 预热完成: {self.warm_report}")
+        return self.warm_report
+
+    # ==================== 工作线程 ====================
+
+    def start(self) -> None:
+        self.queue.requeue_interrupted()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"mtb-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"[Service] {self.workers} 个工作线程已启动")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """不再领取新任务，等待执行中的病例结束"""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, input_text: str, label: str = "", source: str = "") -> int:
+        job_id = self.queue.submit(input_text, label=label, source=source)
+        self._wake.set()
+        logger.info(f"[Service] 任务 #{job_id} 入队 ({label or source or '未命名'}, {len(input_text)} 字符)")
+        return job_id
+
+    def _worker_loop(self) -> None:
+        while not self._stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._wake.wait(_STREAM_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: Dict[str, Any]) -> None:
+        from src.graph.state_graph import run_mtb_workflow
+
+        job_id = job["id"]
+        self.queue.add_event(job_id, "started", worker=threading.current_thread().name, attempt=job["attempts"])
+        logger.info(f"[Service] 任务 #{job_id} 开始执行")
+        try:
+            final_state = run_mtb_workflow(job["input_text"], callbacks=[progress_callback(self.queue, job_id)])
+        except Exception as e:
+            logger.exception(f"[Service] 任务 #{job_id} 执行失败: {e}")
+            self.queue.fail(job_id, f"{type(e).__name__}: {e}")
+            return
+
+        result = {
+            "run_id": final_state.get("run_id", ""),
+            "run_folder": final_state.get("run_folder", ""),
+            "output_path": final_state.get("output_path", ""),
+            "is_compliant": bool(final_state.get("is_compliant")),
+            "execution_time": round(final_state.get("execution_time", 0.0), 2),
+            "usage": (final_state.get("usage_summary") or {}).get("total", {}),
+            "workflow_errors": final_state.get("workflow_errors") or [],
+        }
+        if result["output_path"]:
+            self.queue.finish(job_id, result)
+            logger.info(f"[Service] 任务 #{job_id} 完成 ({result['execution_time']}s): {result['output_path']}")
+        else:
+            self.queue.fail(job_id, "; ".join(map(str, result["workflow_errors"])) or "未生成报告")
+
+
+# ==================== HTTP ====================
+
+_JOB_PATH = re.compile(r"^/jobs/(\d+)(/events)?$")
+_MAX_LIST_LIMIT = 1000
+
+
+def _int_param(params: Dict[str, str], name: str, default: int, minimum: int, maximum: Optional[int] = None) -> int:
+    """解析整数查询参数；非整数或越界抛 ValueError（→ 400）"""
+    raw = params.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"参数 {name} 应为整数: {raw!r}") from None
+    if value < minimum or (maximum is not None and value > maximum):
+        upper = f"~{maximum}" if maximum is not None else " 以上"
+        raise ValueError(f"参数 {name} 超出范围（{minimum}{upper}）: {value}")
+    return value
+
+
+def make_handler(service: MtbService):
+    queue = service.queue
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(f"[Service] {self.address_string()} {format % args}")
+
+        def _send_json(self, status: int, body: Any) -> None:
+            data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("请求体应为 JSON 对象")
+            return body
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == "/health":
+                return self._send_json(HTTPStatus.OK, {
+                    "status": "ok", "workers": service.workers,
+                    "warm_up": service.warm_report, "jobs": queue.stats(),
+                })
+            if url.path == "/jobs":
+                try:
+                    limit = _int_param(params, "limit", 50, minimum=1, maximum=_MAX_LIST_LIMIT)
+                except ValueError as e:
+                    return self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+                return self._send_json(HTTPStatus.OK, queue.list_jobs(params.get("status"), limit))
+            match = _JOB_PATH.match(url.path)
+            if not match:
+                return self._send_json(HTTPStatus.NOT_FOUND, {"error": f"未知路径: {url.path}"})
+            job_id = int(match.group(1))
+            if queue.get(job_id) is None:
+                return self._send_json(HTTPStatus.NOT_FOUND, {"error": f"任务不存在: {job_id}"})
+            if not match.group(2):
+                return self._send_json(HTTPStatus.OK, queue.get(job_id))
+            try:
+                after = _int_param(params, "after", 0, minimum=0)
+            except ValueError as e:
+                return self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            if params.get("stream") or "text/event-stream" in (self.headers.get("Accept") or ""):
+                return self._stream_events(job_id, after)
+            return self._send_json(HTTPStatus.OK, queue.events(job_id, after))
+
+        def _stream_events(self, job_id: int, after: int) -> None:
+            """SSE：推送新事件直到任务结束（客户端断开即停止）"""
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while True:
+                    for event in queue.events(job_id, after):
+                        after = event["seq"]
+                        payload = json.dumps(event, ensure_ascii=False, default=str)
+                        self.wfile.write(f"id: {after}\nevent: {event['kind']}\ndata: {payload}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if queue.get(job_id)["status"] in TERMINAL_STATUSES and not queue.events(job_id, after):
+                        return
+                    time.sleep(_STREAM_POLL_SECONDS)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/jobs":
+                return self._send_json(HTTPStatus.NOT_FOUND, {"error": f"未知路径: {self.path}"})
+            try:
+                body = self._read_json()
+                if body.get("case_text"):
+                    text, source = str(body["case_text"]), ""
+                elif body.get("case_path"):
+                    from src.utils.file_handler import read_case_file
+                    text, source = read_case_file(body["case_path"]), str(body["case_path"])
+                else:
+                    raise ValueError("需要 case_text 或 case_path")
+            except (ValueError, OSError) as e:
+                return self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            job_id = service.submit(text, label=str(body.get("label", "")), source=source)
+            self._send_json(HTTPStatus.ACCEPTED, {"job_id": job_id, "status": "queued"})
+
+        def do_DELETE(self):
+            match = _JOB_PATH.match(urlparse(self.path).path)
+            if not match or match.group(2):
+                return self._send_json(HTTPStatus.NOT_FOUND, {"error": f"未知路径: {self.path}"})
+            job_id = int(match.group(1))
+            if queue.cancel(job_id):
+                return self._send_json(HTTPStatus.OK, {"job_id": job_id, "status": "cancelled"})
+            job = queue.get(job_id)
+            if job is None:
+                return self._send_json(HTTPStatus.NOT_FOUND, {"error": f"任务不存在: {job_id}"})
+            self._send_json(HTTPStatus.CONFLICT, {"error": f"任务状态为 {job['status']}，只能取消排队中的任务"})
+
+    return _Handler
+
+
+def create_server(service: MtbService, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="MTB 常驻服务（HTTP API + SQLite 任务队列）")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="同时执行的病例数")
+    parser.add_argument("--no-warm-up", action="store_true", help="跳过启动预热")
+    args = parser.parse_args(argv)
+
+    if CASSETTE_MODE != "off":
+        # 录像替换的是进程级 requests 发送函数，并发病例无法各自录制 / 回放
+        print("[ERROR] 服务模式不支持 CASSETTE_MODE，请用单次 CLI 录制 / 回放")
+        return 1
+
+    service = MtbService(JobQueue(), workers=args.workers)
+    if not args.no_warm_up:
+        service.warm_up()
+    service.start()
+    server = create_server(service, args.host, args.port)
+    logger.info(f"[Service] 监听 http://{args.host}:{args.port}（{args.workers} 个工作线程）")
+    print(f"MTB 服务已启动: http://{args.host}:{args.port}  (Ctrl+C 停止)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止：等待执行中的病例结束...")
+    finally:
+        server.server_close()
+        service.stop()
+        service.queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    from config.settings import ensure_runtime_dirs
+    from src.utils.logger import setup_logger
+
+    ensure_runtime_dirs()
+    setup_logger()
+    raise SystemExit(main())
@@ -1,16 +1,24 @@
 """
 工具库
 """
-from src.tools.base_tool import BaseTool
-from src.tools.molecular_tools import CIViCTool, ClinVarTool, GDCTool
-from src.tools.literature_tools import PubMedTool
-from src.tools.trial_tools import ClinicalTrialsTool
-from src.tools.guideline_tools import NCCNTool, FDALabelTool, RxNormTool
+from src.utils.lazy_import import lazy_exports
 
-# 保留旧名称作为别名（向后兼容）
-OncoKBTool = CIViCTool
-CosmicTool = GDCTool
-DrugBankTool = RxNormTool
+# 按需导入：导入单个工具 / API 客户端模块时不再连带加载全部工具
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "BaseTool": "src.tools.base_tool",
+    "CIViCTool": "src.tools.molecular_tools",
+    "ClinVarTool": "src.tools.molecular_tools",
+    "GDCTool": "src.tools.molecular_tools",
+    "PubMedTool": "src.tools.literature_tools",
+    "ClinicalTrialsTool": "src.tools.trial_tools",
+    "NCCNTool": "src.tools.guideline_tools",
+    "FDALabelTool": "src.tools.guideline_tools",
+    "RxNormTool": "src.tools.guideline_tools",
+    # 保留旧名称作为别名（向后兼容）
+    "OncoKBTool": "src.tools.molecular_tools:CIViCTool",
+    "CosmicTool": "src.tools.molecular_tools:GDCTool",
+    "DrugBankTool": "src.tools.guideline_tools:RxNormTool",
+})
 
 __all__ = [
     "BaseTool",
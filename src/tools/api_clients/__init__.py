@@ -3,13 +3,18 @@ API 客户端层
 
 提供对各医学数据库的访问接口
 """
-from src.tools.api_clients.ncbi_client import NCBIClient
-from src.tools.api_clients.clinicaltrials_client import ClinicalTrialsClient
-from src.tools.api_clients.fda_client import FDAClient
-from src.tools.api_clients.rxnorm_client import RxNormClient
-from src.tools.api_clients.civic_client import CIViCClient
-from src.tools.api_clients.gdc_client import GDCClient
-from src.tools.api_clients.cbioportal_client import cBioPortalClient  # 向后兼容
+from src.utils.lazy_import import lazy_exports
+
+# 按需导入：导入单个客户端（或熔断器）时不再连带加载全部客户端
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "NCBIClient": "src.tools.api_clients.ncbi_client",
+    "ClinicalTrialsClient": "src.tools.api_clients.clinicaltrials_client",
+    "FDAClient": "src.tools.api_clients.fda_client",
+    "RxNormClient": "src.tools.api_clients.rxnorm_client",
+    "CIViCClient": "src.tools.api_clients.civic_client",
+    "GDCClient": "src.tools.api_clients.gdc_client",
+    "cBioPortalClient": "src.tools.api_clients.cbioportal_client",  # 向后兼容
+})
 
 __all__ = [
     "NCBIClient",
@@ -4,13 +4,26 @@ cBioPortal API 客户端
 提供突变频率和癌症基因组数据查询 (替代 COSMIC)
 API 文档: https://www.cbioportal.org/api/swagger-ui/index.html
 """
+import json
+import os
+import re
 import time
 import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from typing import Dict, List, Any, Optional
+from config.settings import CBIOPORTAL_MAX_WORKERS, CBIOPORTAL_CACHE_DIR, CBIOPORTAL_CACHE_TTL_DAYS
 from src.utils.logger import mtb_logger as logger
+from src.utils.cassette import replaying
+from src.utils.shared_rate_limiter import shared_window
+from src.utils.tracing import in_trace_context, instant
+from src.tools.api_clients.circuit_breaker import (
+    CircuitBreakerAdapter, ServiceUnavailableError, get_breaker,
+)
 
 
 class cBioPortalClient:
@@ -40,13 +53,19 @@ class cBioPortalClient:
             allowed_methods=["GET", "POST"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("cbioportal", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
         self._cancer_types_cache = None
 
     def _rate_limit(self):
-        """全局速率限制 - 所有 cBioPortalClient 实例共享"""
+        """全局速率限制 - 所有 cBioPortalClient 实例共享（回放录像时跳过）"""
+        if replaying():
+            return
+        shared = shared_window("cbioportal", 1, cBioPortalClient._min_interval)
+        if shared is not None:
+            shared.acquire("cBioPortal")
+            return
         with cBioPortalClient._rate_lock:
             elapsed = time.time() - cBioPortalClient._last_request_time
             if elapsed < cBioPortalClient._min_interval:
@@ -60,9 +79,13 @@ class cBioPortalClient:
 
         - 每次请求前调用 _rate_limit() 主动限速
         - 收到 429 时读取 Retry-After（默认 30s），推迟所有线程后重试
+        - 上游熔断时直接抛出 ServiceUnavailableError，不再限速等待
         """
         response = None
         for attempt in range(max_retries + 1):
+            breaker = get_breaker("cbioportal")
+            if breaker.is_open():
+                raise ServiceUnavailableError("cbioportal", breaker.retry_after())
             self._rate_limit()
             response = self.session.request(method, url, **kwargs)
             if response.status_code != 429:
@@ -73,6 +96,9 @@ class cBioPortalClient:
                 f"[cBioPortal] 429 限流，等待 {retry_after}s "
                 f"(重试 {attempt + 1}/{max_retries})"
             )
+            shared = shared_window("cbioportal", 1, cBioPortalClient._min_interval)
+            if shared is not None:
+                shared.defer(retry_after)
             with cBioPortalClient._rate_lock:
                 # 将 _last_request_time 推到未来，阻止其他线程在退避期间发请求
                 cBioPortalClient._last_request_time = (
@@ -111,6 +137,7 @@ class cBioPortalClient:
         with cBioPortalClient._gene_cache_lock:
             if cache_key in cBioPortalClient._gene_cache:
                 logger.debug(f"[cBioPortal] 基因缓存命中: {gene_name}")
+                instant("cbioportal.gene", key=cache_key)
                 return cBioPortalClient._gene_cache[cache_key]
 
         url = f"{self.BASE_URL}/genes/{gene_name}"
@@ -169,44 +196,27 @@ class cBioPortalClient:
             "msk_impact_2017",           # MSK-IMPACT (10,945 样本，62 种癌症类型)
         ]
 
-        all_mutations = []
-        for study_id in major_study_ids:
-            mutations = self._get_study_mutations(study_id, entrez_id)
-            if mutations:
-                result["studies_analyzed"] += 1
-                all_mutations.extend(mutations)
-
-        if not all_mutations:
+        tables = self._fetch_frequency_tables(major_study_ids, entrez_id)
+        if not any(t["mutation_count"] for t in tables):
             # 尝试获取更多研究
             studies = self._get_major_studies(cancer_type)
-            for study in studies[:5]:
-                study_id = study.get("studyId")
-                mutations = self._get_study_mutations(study_id, entrez_id)
-                if mutations:
-                    result["studies_analyzed"] += 1
-                    all_mutations.extend(mutations)
-
-        # 统计突变
-        for mut in all_mutations:
-            # cBioPortal 使用 proteinChange 字段
-            aa_change = mut.get("proteinChange") or mut.get("aminoAcidChange", "")
-            if aa_change:
-                result["common_mutations"][aa_change] = result["common_mutations"].get(aa_change, 0) + 1
-
+            tables = self._fetch_frequency_tables([s.get("studyId") for s in studies[:5]], entrez_id)
+
+        # 合并各研究频率表（按研究顺序累加，保持首次出现顺序作为同频次排序依据）
+        common_mutations: Counter = Counter()
+        for table in tables:
+            if not table["mutation_count"]:
+                continue
+            result["studies_analyzed"] += 1
+            common_mutations.update(table["protein_changes"])
             # 按癌症类型统计
-            cancer = mut.get("studyId", "").split("_")[0] if mut.get("studyId") else "unknown"
-            if cancer not in result["by_cancer_type"]:
-                result["by_cancer_type"][cancer] = {"mutation_count": 0}
-            result["by_cancer_type"][cancer]["mutation_count"] += 1
-
-        # 排序常见突变
-        sorted_mutations = sorted(
-            result["common_mutations"].items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        result["top_mutations"] = [{"mutation": m[0], "count": m[1]} for m in sorted_mutations[:50]]
-        result["total_mutations"] = len(all_mutations)
+            cancer = table["study_id"].split("_")[0] if table["study_id"] else "unknown"
+            entry = result["by_cancer_type"].setdefault(cancer, {"mutation_count": 0})
+            entry["mutation_count"] += table["mutation_count"]
+
+        result["common_mutations"] = dict(common_mutations)
+        result["top_mutations"] = [{"mutation": m, "count": c} for m, c in common_mutations.most_common(50)]
+        result["total_mutations"] = sum(t["mutation_count"] for t in tables)
 
         return result
 
@@ -235,9 +245,83 @@ class cBioPortalClient:
             logger.error(f"[cBioPortal] 获取研究列表失败: {e}")
             return []
 
-    def _get_study_mutations(self, study_id: str, entrez_gene_id: int) -> List[Dict]:
-        """获取特定研究中基因的突变"""
-        # 使用 POST 端点查询突变
+    def _fetch_frequency_tables(self, study_ids: List[str], entrez_gene_id: int) -> List[Dict]:
+        """
+        并发获取多个研究的 (基因, 研究) 频率表，结果按 study_ids 顺序返回
+
+        共用 self.session 连接池；每个请求仍经过 _request() 的全局限速与 429 退避。
+        """
+        study_ids = [sid for sid in study_ids if sid]
+        if not study_ids:
+            return []
+        workers = max(1, min(CBIOPORTAL_MAX_WORKERS, len(study_ids)))
+        if workers == 1:
+            return [self._get_study_frequency_table(sid, entrez_gene_id) for sid in study_ids]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cbioportal") as pool:
+            return list(pool.map(in_trace_context(lambda sid: self._get_study_frequency_table(sid, entrez_gene_id)), study_ids))
+
+    @staticmethod
+    def _reduce_mutations(study_id: str, mutations: List[Dict]) -> Dict:
+        """把原始突变列表归约为频率表 {study_id, mutation_count, protein_changes}"""
+        # 先按列抽取字段，再一次性计数（cBioPortal 使用 proteinChange 字段）
+        changes = [m.get("proteinChange") or m.get("aminoAcidChange") or "" for m in mutations]
+        return {
+            "study_id": study_id,
+            "mutation_count": len(changes),
+            "protein_changes": dict(Counter(c for c in changes if c)),
+        }
+
+    def _cache_path(self, study_id: str, entrez_gene_id: int) -> Path:
+        safe_study = re.sub(r"[^A-Za-z0-9_.-]", "_", study_id)
+        return CBIOPORTAL_CACHE_DIR / f"{entrez_gene_id}__{safe_study}.json"
+
+    def _load_cached_table(self, study_id: str, entrez_gene_id: int) -> Optional[Dict]:
+        if CBIOPORTAL_CACHE_TTL_DAYS <= 0:
+            return None
+        path = self._cache_path(study_id, entrez_gene_id)
+        try:
+            if time.time() - path.stat().st_mtime > CBIOPORTAL_CACHE_TTL_DAYS * 86400:
+                return None
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _store_cached_table(self, study_id: str, entrez_gene_id: int, table: Dict) -> None:
+        if CBIOPORTAL_CACHE_TTL_DAYS <= 0:
+            return
+        path = self._cache_path(study_id, entrez_gene_id)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(table, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+        except OSError as e:
+            logger.debug(f"[cBioPortal] 写入频率表缓存失败: {e}")
+
+    def _get_study_frequency_table(self, study_id: str, entrez_gene_id: int) -> Dict:
+        """
+        获取 (基因, 研究) 频率表：优先读磁盘缓存，未命中时拉取突变并归约
+
+        请求失败时返回空表且不写缓存（404 视为该研究无此基因突变，正常缓存）。
+        """
+        cached = self._load_cached_table(study_id, entrez_gene_id)
+        if cached is not None:
+            logger.debug(f"[cBioPortal] 频率表缓存命中: {study_id} / {entrez_gene_id}")
+            instant("cbioportal.frequency_table", key=f"{study_id}/{entrez_gene_id}")
+            return cached
+
+        try:
+            mutations = self._fetch_study_mutations(study_id, entrez_gene_id)
+        except Exception as e:
+            logger.debug(f"[cBioPortal] 获取 {study_id} 突变失败: {e}")
+            return self._reduce_mutations(study_id, [])
+
+        table = self._reduce_mutations(study_id, mutations)
+        self._store_cached_table(study_id, entrez_gene_id, table)
+        return table
+
+    def _fetch_study_mutations(self, study_id: str, entrez_gene_id: int) -> List[Dict]:
+        """拉取特定研究中基因的原始突变（404 返回空列表，其他错误抛出）"""
         url = f"{self.BASE_URL}/molecular-profiles/{study_id}_mutations/mutations/fetch"
 
         # POST body - 查询特定基因
@@ -246,19 +330,23 @@ class cBioPortalClient:
             "sampleListId": f"{study_id}_all"  # 使用 all samples
         }
 
-        try:
-            response = self._request(
-                "POST", url,
-                json=body,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
+        response = self._request(
+            "POST", url,
+            json=body,
+            headers={"Content-Type": "application/json"},
+            timeout=30
+        )
 
-            if response.status_code == 404:
-                return []
+        if response.status_code == 404:
+            return []
 
-            response.raise_for_status()
-            mutations = response.json()
+        response.raise_for_status()
+        return response.json()
+
+    def _get_study_mutations(self, study_id: str, entrez_gene_id: int) -> List[Dict]:
+        """获取特定研究中基因的突变"""
+        try:
+            mutations = self._fetch_study_mutations(study_id, entrez_gene_id)
 
             # 添加 studyId 到每个突变
             for mut in mutations:
@@ -0,0 +1,370 @@
+"""
+上游熔断器（所有 API 客户端共享）
+
+上游服务（CIViC / GDC / cBioPortal / ClinicalTrials.gov 等）降级时，每个 Agent 线程
+仍会等满 30-60s 超时再加重试。熔断器按上游名称独立统计:
+    - CLOSED: 正常放行；滑动窗口内失败率（异常 / 5xx / 429 / 慢调用）超过阈值 → OPEN
+    - OPEN: 直接抛出 ServiceUnavailableError，不发请求；冷却期结束 → HALF_OPEN
+    - HALF_OPEN: 只放行一个探测请求，成功 → CLOSED，失败 → 重新 OPEN
+
+客户端通过挂载 CircuitBreakerAdapter 接入（一次逻辑请求含 urllib3 重试只计一次），
+工具层（BaseTool.upstreams）在熔断时直接返回"服务不可用"。
+
+熔断状态按进程共享；run_upstream_stats() 作用域内另外按运行统计请求 / 失败 / 拒绝与延迟，
+breaker_report(run) 只报告本次运行发出的请求及运行期间的状态变化。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from config.settings import (
+    UPSTREAM_BREAKER_ENABLED,
+    UPSTREAM_BREAKER_WINDOW_SECONDS,
+    UPSTREAM_BREAKER_MIN_REQUESTS,
+    UPSTREAM_BREAKER_FAILURE_RATE,
+    UPSTREAM_BREAKER_SLOW_CALL_SECONDS,
+    UPSTREAM_BREAKER_OPEN_SECONDS,
+)
+from src.utils.logger import mtb_logger as logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 上游名称 → 报告中的显示名
+UPSTREAM_DISPLAY_NAMES = {
+    "ncbi": "NCBI (PubMed / ClinVar)",
+    "clinicaltrials": "ClinicalTrials.gov",
+    "openfda": "openFDA",
+    "rxnorm": "RxNorm",
+    "civic": "CIViC",
+    "gdc": "NCI GDC",
+    "cbioportal": "cBioPortal",
+}
+
+
+class ServiceUnavailableError(RequestsConnectionError):
+    """上游熔断中，请求未发出"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(f"{upstream} 熔断中，约 {retry_after:.0f}s 后重试")
+
+
+class CircuitBreaker:
+    """单个上游的熔断器（线程安全）"""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = UPSTREAM_BREAKER_WINDOW_SECONDS,
+        min_requests: int = UPSTREAM_BREAKER_MIN_REQUESTS,
+        failure_rate: float = UPSTREAM_BREAKER_FAILURE_RATE,
+        slow_call_seconds: float = UPSTREAM_BREAKER_SLOW_CALL_SECONDS,
+        open_seconds: float = UPSTREAM_BREAKER_OPEN_SECONDS,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._window: deque = deque()  # (时间戳, 是否失败)
+
+        # 累计统计（写入运行报告）
+        self.stats = {"requests": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "trips": 0}
+        self._total_duration = 0.0
+        self._max_duration = 0.0
+        self._open_duration = 0.0
+        self._transitions: List[Dict[str, Any]] = []
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.time())
+            return self._state
+
+    def _set_state(self, state: str, now: float, reason: str = "") -> None:
+        if state == self._state:
+            return
+        if self._state == OPEN:
+            self._open_duration += now - self._opened_at
+        self._transitions.append({"at": round(now, 3), "from": self._state, "to": state, "reason": reason})
+        self._state = state
+        if state == OPEN:
+            self._opened_at = now
+            self.stats["trips"] += 1
+            logger.warning(f"[CircuitBreaker] {self.name} 熔断 ({reason})，{self.open_seconds:.0f}s 内请求直接失败")
+        elif state == CLOSED:
+            self._window.clear()
+            logger.info(f"[CircuitBreaker] {self.name} 恢复 ({reason})")
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN, now, "冷却结束")
+            self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.time() - self._opened_at))
+
+    def is_open(self) -> bool:
+        """是否拒绝请求（不占用半开探测名额）"""
+        with self._lock:
+            now = time.time()
+            self._maybe_half_open(now)
+            return self._state == OPEN or (self._state == HALF_OPEN and self._probe_in_flight)
+
+    def before_request(self) -> None:
+        """请求前检查；拒绝时抛出 ServiceUnavailableError"""
+        with self._lock:
+            now = time.time()
+            self._maybe_half_open(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True  # 放行一个探测请求
+                return
+            self.stats["rejected"] += 1
+            retry_after = self.open_seconds - (now - self._opened_at) if self._state == OPEN else self.open_seconds
+        _record_run(self.name, rejected=True)
+        raise ServiceUnavailableError(self.name, max(0.0, retry_after))
+
+    def record(self, ok: bool, duration: float) -> None:
+        """记录一次已发出请求的结果（慢调用计为失败）"""
+        slow = duration >= self.slow_call_seconds
+        failed = not ok or slow
+        _record_run(self.name, ok=ok, slow=slow, duration=duration)
+        with self._lock:
+            now = time.time()
+            self.stats["requests"] += 1
+            self.stats["failures"] += 0 if ok else 1
+            self.stats["slow_calls"] += 1 if slow else 0
+            self._total_duration += duration
+            self._max_duration = max(self._max_duration, duration)
+
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._set_state(OPEN, now, "探测失败" if not ok else f"探测慢调用 {duration:.1f}s")
+                else:
+                    self._set_state(CLOSED, now, "探测成功")
+                return
+            if self._state == OPEN:
+                return  # 熔断前已发出的请求
+
+            self._window.append((now, failed))
+            while self._window and self._window[0][0] < now - self.window_seconds:
+                self._window.popleft()
+            total = len(self._window)
+            failures = sum(1 for _, f in self._window if f)
+            if total >= self.min_requests and failures / total >= self.failure_rate:
+                self._set_state(OPEN, now, f"{failures}/{total} 失败或慢调用")
+
+    def _open_seconds_since(self, since: float, now: float) -> float:
+        """since 之后处于 OPEN 的时长（调用方持有 _lock）"""
+        state, mark, total = CLOSED, since, 0.0
+        for transition in self._transitions:
+            if transition["at"] <= since:
+                state = transition["to"]
+                continue
+            if state == OPEN:
+                total += transition["at"] - mark
+            state, mark = transition["to"], transition["at"]
+        return total + (now - mark if state == OPEN else 0.0)
+
+    def snapshot(self, since: Optional[float] = None) -> Dict[str, Any]:
+        """当前状态与累计统计；给定 since 时熔断次数 / 时长 / 状态变化只计 since 之后"""
+        with self._lock:
+            now = time.time()
+            self._maybe_half_open(now)
+            if since is not None:
+                transitions = [t for t in self._transitions if t["at"] > since]
+                return {
+                    "upstream": self.name,
+                    "display_name": UPSTREAM_DISPLAY_NAMES.get(self.name, self.name),
+                    "state": self._state,
+                    "trips": sum(1 for t in transitions if t["to"] == OPEN),
+                    "open_seconds_total": round(self._open_seconds_since(since, now), 1),
+                    "transitions": transitions,
+                }
+            open_duration = self._open_duration + (now - self._opened_at if self._state == OPEN else 0.0)
+            requests = self.stats["requests"]
+            return {
+                "upstream": self.name,
+                "display_name": UPSTREAM_DISPLAY_NAMES.get(self.name, self.name),
+                "state": self._state,
+                **self.stats,
+                "mean_latency": round(self._total_duration / requests, 3) if requests else 0.0,
+                "max_latency": round(self._max_duration, 3),
+                "open_seconds_total": round(open_duration, 1),
+                "transitions": list(self._transitions),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取（或创建）上游熔断器，按名称全局共享"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def reset_breakers() -> None:
+    with _breakers_lock:
+        _breakers.clear()
+
+
+class UpstreamRunStats:
+    """一次运行内各上游的请求统计（线程安全）"""
+
+    EMPTY = {"requests": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "mean_latency": 0.0, "max_latency": 0.0}
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, ok: bool = True, slow: bool = False, duration: float = 0.0,
+               rejected: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                "requests": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "total_duration": 0.0, "max_duration": 0.0,
+            })
+            if rejected:
+                stats["rejected"] += 1
+                return
+            stats["requests"] += 1
+            stats["failures"] += 0 if ok else 1
+            stats["slow_calls"] += 1 if slow else 0
+            stats["total_duration"] += duration
+            stats["max_duration"] = max(stats["max_duration"], duration)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats = {name: dict(s) for name, s in self._stats.items()}
+        out = {}
+        for name, s in stats.items():
+            requests = int(s["requests"])
+            out[name] = {
+                "requests": requests,
+                "failures": int(s["failures"]),
+                "slow_calls": int(s["slow_calls"]),
+                "rejected": int(s["rejected"]),
+                "mean_latency": round(s["total_duration"] / requests, 3) if requests else 0.0,
+                "max_latency": round(s["max_duration"], 3),
+            }
+        return out
+
+
+_run_stats: contextvars.ContextVar[Optional[UpstreamRunStats]] = contextvars.ContextVar(
+    "mtb_upstream_run_stats", default=None
+)
+
+
+@contextmanager
+def run_upstream_stats() -> Iterator[UpstreamRunStats]:
+    """本次运行的上游请求统计（熔断状态仍按进程共享）"""
+    stats = UpstreamRunStats()
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+
+def _record_run(name: str, **outcome: Any) -> None:
+    stats = _run_stats.get()
+    if stats is not None:
+        stats.record(name, **outcome)
+
+
+def breaker_report(run: Optional[UpstreamRunStats] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    上游的熔断状态与耗时（运行报告用）
+
+    Args:
+        run: 本次运行的统计；给定时只包含本次运行请求过或运行期间状态变化的上游，
+             请求 / 失败 / 拒绝 / 延迟只计本次运行，熔断次数与时长只计运行开始之后
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    if run is None:
+        return {b.name: b.snapshot() for b in breakers}
+    run_stats = run.snapshot()
+    report = {}
+    for b in breakers:
+        window = b.snapshot(since=run.started_at)
+        if b.name not in run_stats and not window["transitions"]:
+            continue
+        stats = run_stats.get(b.name) or UpstreamRunStats.EMPTY
+        report[b.name] = {
+            "upstream": b.name,
+            "display_name": window["display_name"],
+            "state": window["state"],
+            **stats,
+            "trips": window["trips"],
+            "open_seconds_total": window["open_seconds_total"],
+            "transitions": window["transitions"],
+        }
+    return report
+
+
+def format_breaker_report(report: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    report = breaker_report() if report is None else report
+    if not report:
+        return ""
+    lines = ["上游 | 状态 | 请求 | 失败 | 慢调用 | 拒绝 | 熔断次数 | 熔断时长(s) | 平均延迟(s) | 最大延迟(s)"]
+    for name, r in sorted(report.items()):
+        lines.append(
+            f"{r['display_name']} | {r['state']} | {r['requests']} | {r['failures']} | {r['slow_calls']} | "
+            f"{r['rejected']} | {r['trips']} | {r['open_seconds_total']} | {r['mean_latency']} | {r['max_latency']}"
+        )
+    return "\n".join(lines)
+
+
+class CircuitBreakerAdapter(HTTPAdapter):
+    """
+    带熔断的 HTTPAdapter
+
+    一次 send()（含 urllib3 内部重试）计一次结果：
+    连接/超时异常、5xx、429 为失败，其他状态码（含 404）为成功。
+    """
+
+    def __init__(self, upstream: str, *args, **kwargs):
+        self.upstream = upstream
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if not UPSTREAM_BREAKER_ENABLED:
+            return super().send(request, **kwargs)
+
+        breaker = get_breaker(self.upstream)
+        breaker.before_request()
+        start = time.time()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            breaker.record(False, time.time() - start)
+            raise
+        breaker.record(response.status_code < 500 and response.status_code != 429, time.time() - start)
+        return response
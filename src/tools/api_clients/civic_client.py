@@ -6,11 +6,13 @@ API 文档: https://griffithlab.github.io/civic-v2/
 GraphiQL: https://civicdb.org/api/graphiql
 许可证: CC0 (公共领域)
 """
+import threading
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+from config.settings import CIVIC_BATCH_MAX_ALIASES
 from src.utils.logger import mtb_logger as logger
+from src.tools.api_clients.circuit_breaker import CircuitBreakerAdapter
 
 
 class CIViCClient:
@@ -18,6 +20,50 @@ class CIViCClient:
 
     GRAPHQL_URL = "https://civicdb.org/api/graphql"
 
+    # CIViC v2 使用 Molecular Profile 模型（搜索格式: "EGFR L858R"），单查与批量共用字段
+    MOLECULAR_PROFILE_FRAGMENT = """
+    fragment MolecularProfileFields on MolecularProfile {
+        id
+        name
+        description
+        link
+        variants {
+            id
+            name
+            variantTypes {
+                name
+            }
+        }
+        evidenceItems(first: 20) {
+            totalCount
+            nodes {
+                id
+                status
+                evidenceType
+                evidenceLevel
+                evidenceDirection
+                significance
+                disease {
+                    name
+                    doid
+                }
+                therapies {
+                    name
+                    ncitId
+                }
+                source {
+                    sourceType
+                    citationId
+                }
+            }
+        }
+    }
+    """
+
+    # 类级别变异缓存（跨实例共享）：(基因, 变异) 大写 -> 格式化的 Molecular Profile / None
+    _variant_cache: Dict[Tuple[str, str], Optional[Dict]] = {}
+    _variant_cache_lock = threading.Lock()
+
     def __init__(self):
         self.session = requests.Session()
         self.session.headers.update({
@@ -31,7 +77,7 @@ class CIViCClient:
             allowed_methods=["GET", "POST"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("civic", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
@@ -113,77 +159,87 @@ class CIViCClient:
         Returns:
             变异信息
         """
-        # CIViC v2 使用 Molecular Profile 模型
-        # 搜索格式: "EGFR L858R"
-        mp_name = f"{gene} {variant}"
+        return self.search_variants([(gene, variant)]).get((gene, variant))
 
-        query = """
-        query MolecularProfileSearch($name: String!) {
-            molecularProfiles(name: $name) {
-                nodes {
-                    id
-                    name
-                    description
-                    link
-                    variants {
-                        id
-                        name
-                        variantTypes {
-                            name
-                        }
-                    }
-                    evidenceItems(first: 20) {
-                        totalCount
-                        nodes {
-                            id
-                            status
-                            evidenceType
-                            evidenceLevel
-                            evidenceDirection
-                            significance
-                            disease {
-                                name
-                                doid
-                            }
-                            therapies {
-                                name
-                                ncitId
-                            }
-                            source {
-                                sourceType
-                                citationId
-                            }
-                        }
-                    }
-                }
-            }
-        }
+    def search_variants(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Dict]]:
         """
+        批量搜索变异：未缓存的 (基因, 变异) 合并为别名化 GraphQL 请求
 
-        logger.debug(f"[CIViC] 搜索 Molecular Profile: {mp_name}")
-        data = self._execute_query(query, {"name": mp_name})
+        每个请求最多 CIVIC_BATCH_MAX_ALIASES 个别名（每个别名含最多 20 条证据），
+        响应按别名拆回各变异。结果（含"未收录"）按 (基因, 变异) 缓存，查询失败不缓存。
 
-        if not data:
-            return None
+        Args:
+            pairs: [(基因, 变异), ...]
 
-        nodes = data.get("molecularProfiles", {}).get("nodes", [])
+        Returns:
+            {(基因, 变异): 变异信息或 None}
+        """
+        results: Dict[Tuple[str, str], Optional[Dict]] = {}
+        misses: Dict[Tuple[str, str], Tuple[str, str]] = {}  # 缓存键 -> 原始 (基因, 变异)
+        with CIViCClient._variant_cache_lock:
+            for gene, variant in pairs:
+                key = (gene.upper(), variant.upper())
+                if key in CIViCClient._variant_cache:
+                    results[(gene, variant)] = CIViCClient._variant_cache[key]
+                else:
+                    misses.setdefault(key, (gene, variant))
+
+        if misses:
+            logger.debug(f"[CIViC] 批量搜索 Molecular Profile: {len(misses)} 个 (缓存命中 {len(results)})")
+            keys = list(misses)
+            for i in range(0, len(keys), CIVIC_BATCH_MAX_ALIASES):
+                fetched = self._fetch_profiles([misses[k] for k in keys[i:i + CIVIC_BATCH_MAX_ALIASES]])
+                with CIViCClient._variant_cache_lock:
+                    for (gene, variant), profile in fetched.items():
+                        CIViCClient._variant_cache[(gene.upper(), variant.upper())] = profile
+
+        with CIViCClient._variant_cache_lock:
+            for gene, variant in pairs:
+                if (gene, variant) not in results:
+                    results[(gene, variant)] = CIViCClient._variant_cache.get((gene.upper(), variant.upper()))
+        return results
+
+    def _fetch_profiles(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Dict]]:
+        """
+        一次别名化请求查询多个 Molecular Profile（mp0, mp1, ...）
 
-        # 查找精确匹配或包含匹配
-        target_mp = None
+        请求失败时二分重试；单个变异仍失败则不出现在返回值中（不缓存）。
+        """
+        variables = {f"n{i}": f"{gene} {variant}" for i, (gene, variant) in enumerate(pairs)}
+        declarations = ", ".join(f"$n{i}: String!" for i in range(len(pairs)))
+        selections = "\n".join(
+            f"    mp{i}: molecularProfiles(name: $n{i}) {{ nodes {{ ...MolecularProfileFields }} }}"
+            for i in range(len(pairs))
+        )
+        query = f"query MolecularProfileBatch({declarations}) {{\n{selections}\n}}\n{self.MOLECULAR_PROFILE_FRAGMENT}"
+
+        data = self._execute_query(query, variables)
+        if data is None:
+            if len(pairs) == 1:
+                return {}
+            mid = len(pairs) // 2
+            logger.warning(f"[CIViC] 批量查询失败，拆分重试 ({len(pairs)} → {mid}+{len(pairs) - mid})")
+            return {**self._fetch_profiles(pairs[:mid]), **self._fetch_profiles(pairs[mid:])}
+
+        fetched = {}
+        for i, (gene, variant) in enumerate(pairs):
+            nodes = (data.get(f"mp{i}") or {}).get("nodes", [])
+            target_mp = self._match_profile(nodes, gene, variant)
+            if not target_mp:
+                logger.info(f"[CIViC] 未找到 Molecular Profile: {gene} {variant}")
+            fetched[(gene, variant)] = self._format_molecular_profile(target_mp) if target_mp else None
+        return fetched
+
+    @staticmethod
+    def _match_profile(nodes: List[Dict], gene: str, variant: str) -> Optional[Dict]:
+        """查找精确匹配或包含匹配"""
         for mp in nodes:
             mp_name_upper = mp.get("name", "").upper()
             if mp_name_upper == f"{gene} {variant}".upper():
-                target_mp = mp
-                break
+                return mp
             elif gene.upper() in mp_name_upper and variant.upper() in mp_name_upper:
-                target_mp = mp
-                break
-
-        if not target_mp:
-            logger.info(f"[CIViC] 未找到 Molecular Profile: {mp_name}")
-            return None
-
-        return self._format_molecular_profile(target_mp)
+                return mp
+        return None
 
     def _format_molecular_profile(self, mp: Dict) -> Dict:
         """格式化 Molecular Profile 数据"""
@@ -280,7 +336,15 @@ class CIViCClient:
         Returns:
             治疗意义摘要
         """
-        variant_info = self.search_variant(gene, variant)
+        return self._therapeutic_implications(gene, variant, self.search_variant(gene, variant))
+
+    def get_therapeutic_implications_batch(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Dict]]:
+        """批量获取多个变异的治疗意义（合并为尽量少的 GraphQL 请求）"""
+        profiles = self.search_variants(pairs)
+        return {pair: self._therapeutic_implications(pair[0], pair[1], profiles.get(pair)) for pair in pairs}
+
+    @staticmethod
+    def _therapeutic_implications(gene: str, variant: str, variant_info: Optional[Dict]) -> Optional[Dict]:
         if not variant_info:
             return None
 
@@ -296,9 +360,9 @@ class CIViCClient:
                 "civic_url": variant_info.get("civic_url")
             }
 
-        # 按证据等级排序
+        # 按证据等级排序（新列表，不修改缓存中的数据）
         level_order = {"A": 0, "B": 1, "C": 2, "D": 3, "E": 4}
-        therapeutic.sort(key=lambda x: level_order.get(x.get("evidence_level", "E"), 4))
+        therapeutic = sorted(therapeutic, key=lambda x: level_order.get(x.get("evidence_level", "E"), 4))
 
         return {
             "gene": gene,
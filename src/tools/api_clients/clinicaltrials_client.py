@@ -2,12 +2,21 @@
 ClinicalTrials.gov API v2 客户端
 
 API 文档: https://clinicaltrials.gov/data-api/api
+
+检索分两级：search_trials 按 nextPageToken 分页拉取摘要字段；get_eligibility 只为
+调用方入围的试验（NCT 编号）拉取入组标准全文。结果写入本地试验索引（clinicaltrials_index），
+重复查询本地应答。
 """
+import time
+
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from config.settings import CLINICALTRIALS_PAGE_SIZE, CLINICALTRIALS_QUERY_TTL_HOURS
+from src.tools.api_clients.clinicaltrials_index import TrialIndex, get_trial_index, make_query_key
 from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import instant
+from src.tools.api_clients.circuit_breaker import CircuitBreakerAdapter
 
 
 class ClinicalTrialsClient:
@@ -15,7 +24,33 @@ class ClinicalTrialsClient:
 
     BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
 
-    def __init__(self):
+    # 第一级：摘要字段（不含入组标准全文）
+    SUMMARY_FIELDS = [
+        "NCTId",
+        "BriefTitle",
+        "Phase",
+        "OverallStatus",
+        "Condition",
+        "InterventionName",
+        "InterventionType",
+        "LocationFacility",
+        "LocationCity",
+        "LocationCountry",
+        "LeadSponsorName",
+        "EnrollmentCount",
+        "StartDate",
+        "PrimaryCompletionDate",
+        "LastUpdatePostDate",
+    ]
+    # 第二级：只对入围试验拉取
+    DETAIL_FIELDS = ["NCTId", "OfficialTitle", "EligibilityCriteria", "LastUpdatePostDate"]
+
+    def __init__(self, index: Optional[TrialIndex] = None):
+        """
+        Args:
+            index: 本地试验索引（默认全局索引；不可用时退化为纯在线查询）
+        """
+        self._index = index
         self.session = requests.Session()
         self.session.headers.update({
             "User-Agent": "MTB-Workflow/1.0"
@@ -27,27 +62,39 @@ class ClinicalTrialsClient:
             allowed_methods=["GET", "POST"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("clinicaltrials", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
+    @property
+    def index(self) -> Optional[TrialIndex]:
+        """首次使用时才打开全局索引"""
+        if self._index is None:
+            self._index = get_trial_index()
+        return self._index
+
     def search_trials(
         self,
         condition: str,
         intervention: str = None,
         location: str = "China",
         status: str = "RECRUITING",
-        max_results: int = 20
+        max_results: int = 20,
+        with_eligibility: bool = False
     ) -> List[Dict]:
         """
         搜索临床试验
 
+        相同查询在 CLINICALTRIALS_QUERY_TTL_HOURS 内由本地索引应答；否则分页拉取摘要。
+        默认只返回摘要，入组标准由 get_eligibility 按入围试验另行拉取。在线查询失败时回退到过期的本地结果。
+
         Args:
             condition: 疾病/条件 (如 "NSCLC", "EGFR mutation lung cancer")
             intervention: 干预措施/药物 (可选)
             location: 地点 (默认中国)
             status: 试验状态 (RECRUITING, NOT_YET_RECRUITING, COMPLETED 等)
             max_results: 最大结果数
+            with_eligibility: 是否同时为全部结果拉取入组标准全文（每项试验多一次详情请求）
 
         Returns:
             试验列表 [{nct_id, title, phase, status, conditions, interventions, locations, sponsors}]
@@ -55,7 +102,6 @@ class ClinicalTrialsClient:
         # 构建查询参数
         params = {
             "format": "json",
-            "pageSize": max_results,
             "query.cond": condition,
             "filter.overallStatus": status,
         }
@@ -66,43 +112,145 @@ class ClinicalTrialsClient:
         if location:
             params["query.locn"] = location
 
-        # 请求的字段
-        params["fields"] = ",".join([
-            "NCTId",
-            "BriefTitle",
-            "OfficialTitle",
-            "Phase",
-            "OverallStatus",
-            "Condition",
-            "InterventionName",
-            "InterventionType",
-            "LocationFacility",
-            "LocationCity",
-            "LocationCountry",
-            "LeadSponsorName",
-            "EnrollmentCount",
-            "StartDate",
-            "PrimaryCompletionDate",
-            "EligibilityCriteria"
-        ])
+        query_key = make_query_key(cond=condition, intr=intervention, locn=location, status=status)
+        cached = self.index.get_query(query_key) if self.index else None
+
+        trials = None
+        if cached:
+            nct_ids, exhausted, fetched_at = cached
+            fresh = time.time() - fetched_at < CLINICALTRIALS_QUERY_TTL_HOURS * 3600
+            if fresh and (exhausted or len(nct_ids) >= max_results):
+                logger.debug(f"[CT.gov] 本地索引应答: {condition}, 干预: {intervention}, 地点: {location}")
+                instant("clinicaltrials.query", key=query_key)
+                trials = self._filter_status(self.index.get_trials(nct_ids[:max_results]), status)
+
+        if trials is None:
+            try:
+                logger.debug(f"[CT.gov] 搜索: {condition}, 干预: {intervention}, 地点: {location}")
+                trials, exhausted = self._fetch_summaries(params, max_results)
+            except Exception as e:
+                logger.error(f"[CT.gov] 搜索失败: {e}")
+                if not cached:
+                    return []
+                logger.warning(f"[CT.gov] 使用本地索引中的历史结果: {condition}")
+                trials = self._filter_status(self.index.get_trials(cached[0][:max_results]), status)
+            else:
+                if self.index:
+                    self.index.upsert_summaries(trials)
+                    self.index.put_query(query_key, [t["nct_id"] for t in trials], exhausted)
+
+        if not trials:
+            logger.info(f"[CT.gov] 无匹配试验: {condition}")
+            return []
 
-        try:
-            logger.debug(f"[CT.gov] 搜索: {condition}, 干预: {intervention}, 地点: {location}")
-            response = self.session.get(self.BASE_URL, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+        if with_eligibility:
+            trials = self._attach_details(trials)
+
+        logger.debug(f"[CT.gov] 找到 {len(trials)} 项试验")
+        return trials
 
-            studies = data.get("studies", [])
-            if not studies:
-                logger.info(f"[CT.gov] 无匹配试验: {condition}")
-                return []
+    def get_eligibility(self, nct_ids: List[str]) -> List[Dict]:
+        """
+        第二级：只为入围试验拉取入组标准（本地索引已有且未更新的不再拉取）
 
-            logger.debug(f"[CT.gov] 找到 {len(studies)} 项试验")
-            return self._parse_studies(studies)
+        Args:
+            nct_ids: 入围试验的 NCT 编号
 
-        except Exception as e:
-            logger.error(f"[CT.gov] 搜索失败: {e}")
+        Returns:
+            [{nct_id, brief_title, official_title, eligibility_criteria, url, ...}]（按输入顺序；
+            索引中有摘要的带摘要字段，未取到入组标准的 eligibility_criteria 为空）
+        """
+        nct_ids = list(dict.fromkeys(i.strip().upper() for i in nct_ids if i and i.strip()))
+        if not nct_ids:
             return []
+        indexed = {t["nct_id"]: t for t in self.index.get_trials(nct_ids)} if self.index else {}
+        trials = [dict(indexed.get(i) or {"nct_id": i, "url": f"https://clinicaltrials.gov/study/{i}"}) for i in nct_ids]
+        return self._attach_details(trials)
+
+    @staticmethod
+    def _filter_status(trials: List[Dict], status: str) -> List[Dict]:
+        """本地应答时按索引中的最新状态过滤"""
+        if not status:
+            return trials
+        allowed = {s.strip().upper() for s in status.split(",")}
+        return [t for t in trials if t.get("status", "").upper() in allowed]
+
+    def iter_summary_pages(self, params: Dict[str, Any], limit: int) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+        """
+        按 nextPageToken 流式分页拉取摘要
+
+        Yields:
+            (本页试验, nextPageToken)；累计达到 limit 或无下一页时结束
+        """
+        page_params = dict(params)
+        page_params["fields"] = ",".join(self.SUMMARY_FIELDS)
+        page_params["pageSize"] = max(1, min(CLINICALTRIALS_PAGE_SIZE, limit))
+        fetched = 0
+        while fetched < limit:
+            response = self.session.get(self.BASE_URL, params=page_params, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+
+            page = self._parse_studies(data.get("studies", []))[:limit - fetched]
+            fetched += len(page)
+            token = data.get("nextPageToken")
+            yield page, token
+            if not token or not page:
+                return
+            page_params["pageToken"] = token
+
+    def _fetch_summaries(self, params: Dict[str, Any], limit: int) -> Tuple[List[Dict], bool]:
+        """返回 (摘要列表, 是否已取尽全部分页)"""
+        trials: List[Dict] = []
+        exhausted = True
+        for page, token in self.iter_summary_pages(params, limit):
+            trials.extend(page)
+            exhausted = token is None
+        return trials, exhausted
+
+    def _attach_details(self, trials: List[Dict]) -> List[Dict]:
+        """为入围试验补充入组标准（本地索引已有且未更新的不再拉取）"""
+        nct_ids = [t["nct_id"] for t in trials]
+        pending = self.index.needs_details(nct_ids) if self.index else nct_ids
+        details: Dict[str, Dict] = {}
+        if pending:
+            try:
+                details = self._fetch_details(pending)
+            except Exception as e:
+                logger.error(f"[CT.gov] 获取入组标准失败: {e}")
+            if self.index and details:
+                self.index.set_details(details)
+
+        # 摘要以本次结果为准，详情优先取自索引（索引中无摘要行的试验取本次拉取结果）
+        indexed = {t["nct_id"]: t for t in self.index.get_trials(nct_ids)} if self.index else {}
+        for trial in trials:
+            stored = indexed.get(trial["nct_id"], {})
+            detail = details.get(trial["nct_id"], {})
+            for field in ("official_title", "eligibility_criteria"):
+                trial[field] = stored.get(field) or detail.get(field) or trial.get(field, "")
+        return trials
+
+    def _fetch_details(self, nct_ids: List[str]) -> Dict[str, Dict]:
+        """按 filter.ids 批量拉取详情字段（请求错误抛出）"""
+        details: Dict[str, Dict] = {}
+        size = max(1, CLINICALTRIALS_PAGE_SIZE)
+        for start in range(0, len(nct_ids), size):
+            chunk = nct_ids[start:start + size]
+            params = {
+                "format": "json",
+                "filter.ids": ",".join(chunk),
+                "fields": ",".join(self.DETAIL_FIELDS),
+                "pageSize": len(chunk),
+            }
+            response = self.session.get(self.BASE_URL, params=params, timeout=30)
+            response.raise_for_status()
+            for trial in self._parse_studies(response.json().get("studies", [])):
+                details[trial["nct_id"]] = {
+                    "official_title": trial["official_title"],
+                    "eligibility_criteria": trial["eligibility_criteria"],
+                    "last_update": trial["last_update"],
+                }
+        return details
 
     def _parse_studies(self, studies: List[Dict]) -> List[Dict]:
         """解析试验数据"""
@@ -122,6 +270,7 @@ class ClinicalTrialsClient:
             overall_status = status_module.get("overallStatus", "")
             start_date = status_module.get("startDateStruct", {}).get("date", "")
             completion_date = status_module.get("primaryCompletionDateStruct", {}).get("date", "")
+            last_update = status_module.get("lastUpdatePostDateStruct", {}).get("date", "")
 
             # 设计
             design_module = protocol.get("designModule", {})
@@ -174,6 +323,7 @@ class ClinicalTrialsClient:
                 "locations": locations,  # 返回完整地点列表
                 "sponsor": lead_sponsor,
                 "eligibility_criteria": eligibility_criteria,  # 返回完整入选标准
+                "last_update": last_update,
                 "url": f"https://clinicaltrials.gov/study/{nct_id}"
             })
 
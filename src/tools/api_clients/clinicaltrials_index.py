@@ -0,0 +1,165 @@
+"""
+ClinicalTrials.gov 本地试验索引（SQLite）
+
+Recruiter 在 Phase 1 / Phase 2a 会重复相近的 条件 / 干预 / 地点 查询。索引保存:
+    - trials: 试验摘要、状态、最后更新时间（LastUpdatePostDate）、入组标准
+    - queries: 规范化查询 → 命中的 NCT 编号（按返回顺序）与拉取时间
+
+相同查询在 CLINICALTRIALS_QUERY_TTL_HOURS 内直接本地应答；过期后重新拉取摘要，
+只有最后更新时间变化（或尚无入组标准）的试验才重新拉取详情。
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config.settings import CLINICALTRIALS_INDEX_PATH
+from src.utils.logger import mtb_logger as logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    nct_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT '',
+    last_update TEXT NOT NULL DEFAULT '',
+    official_title TEXT,
+    eligibility TEXT,
+    detail_update TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query_key TEXT PRIMARY KEY,
+    nct_ids TEXT NOT NULL,
+    exhausted INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+def make_query_key(**params: Any) -> str:
+    """规范化查询参数（忽略大小写 / 多余空白 / 空值）"""
+    normalized = {
+        key: " ".join(str(value).split()).lower()
+        for key, value in params.items()
+        if value not in (None, "")
+    }
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+class TrialIndex:
+    """本地试验索引（单连接 + 锁）"""
+
+    def __init__(self, path: Path = CLINICALTRIALS_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 批处理多个进程共享同一索引：WAL 允许读写并发，写锁冲突时等待而不是立即报错
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ==================== 查询结果 ====================
+
+    def get_query(self, query_key: str) -> Optional[Tuple[List[str], bool, float]]:
+        """返回 (NCT 编号列表, 是否已取尽全部分页, 拉取时间)，未缓存返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM queries WHERE query_key = ?", (query_key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row["nct_ids"]), bool(row["exhausted"]), row["fetched_at"]
+
+    def put_query(self, query_key: str, nct_ids: List[str], exhausted: bool) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (query_key, nct_ids, exhausted, fetched_at) VALUES (?, ?, ?, ?)",
+                (query_key, json.dumps(nct_ids), int(exhausted), time.time()),
+            )
+
+    # ==================== 试验 ====================
+
+    def upsert_summaries(self, summaries: Iterable[Dict]) -> None:
+        """写入摘要；保留已有详情（是否过期由 needs_details 按 last_update 判断）"""
+        now = time.time()
+        with self._lock, self._conn:
+            for trial in summaries:
+                self._conn.execute(
+                    "INSERT INTO trials (nct_id, summary, status, last_update, fetched_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(nct_id) DO UPDATE SET summary = excluded.summary, status = excluded.status, "
+                    "last_update = excluded.last_update, fetched_at = excluded.fetched_at",
+                    (trial["nct_id"], json.dumps(trial, ensure_ascii=False), trial.get("status", ""),
+                     trial.get("last_update", ""), now),
+                )
+
+    def set_details(self, details: Dict[str, Dict]) -> None:
+        """写入详情 {nct_id: {official_title, eligibility_criteria, last_update}}"""
+        with self._lock, self._conn:
+            for nct_id, detail in details.items():
+                self._conn.execute(
+                    "UPDATE trials SET official_title = ?, eligibility = ?, detail_update = ? WHERE nct_id = ?",
+                    (detail.get("official_title", ""), detail.get("eligibility_criteria", ""),
+                     detail.get("last_update", ""), nct_id),
+                )
+
+    def needs_details(self, nct_ids: List[str]) -> List[str]:
+        """尚无详情、或详情早于当前摘要 last_update 的试验"""
+        if not nct_ids:
+            return []
+        placeholders = ",".join("?" * len(nct_ids))
+        with self._lock:
+            fresh = {
+                row["nct_id"]
+                for row in self._conn.execute(
+                    f"SELECT nct_id FROM trials WHERE nct_id IN ({placeholders}) "
+                    "AND eligibility IS NOT NULL AND detail_update = last_update",
+                    nct_ids,
+                )
+            }
+        return [nct_id for nct_id in nct_ids if nct_id not in fresh]
+
+    def get_trials(self, nct_ids: List[str]) -> List[Dict]:
+        """按给定顺序返回试验（摘要 + 已有详情）"""
+        if not nct_ids:
+            return []
+        placeholders = ",".join("?" * len(nct_ids))
+        with self._lock:
+            rows = {
+                row["nct_id"]: row
+                for row in self._conn.execute(f"SELECT * FROM trials WHERE nct_id IN ({placeholders})", nct_ids)
+            }
+        trials = []
+        for nct_id in nct_ids:
+            row = rows.get(nct_id)
+            if row is None:
+                continue
+            trial = json.loads(row["summary"])
+            trial["official_title"] = row["official_title"] or trial.get("official_title", "")
+            trial["eligibility_criteria"] = row["eligibility"] or ""
+            trials.append(trial)
+        return trials
+
+
+# ==================== 全局单例 ====================
+_index_instance: Optional[TrialIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_trial_index() -> Optional[TrialIndex]:
+    """获取全局试验索引；无法创建时返回 None（客户端退化为纯在线查询）"""
+    global _index_instance
+    if _index_instance is None:
+        with _index_lock:
+            if _index_instance is None:
+                try:
+                    _index_instance = TrialIndex(CLINICALTRIALS_INDEX_PATH)
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"[CT.gov] 本地试验索引不可用: {e}")
+                    return None
+    return _index_instance
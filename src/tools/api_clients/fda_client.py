@@ -1,14 +1,28 @@
 """
 openFDA API 客户端
 
-提供药物说明书查询
+提供药物说明书查询（存在本地索引时优先离线查询，见 fda_label_index）
 API 文档: https://open.fda.gov/apis/drug/label/
 """
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from typing import Dict, List, Any, Optional
+from config.settings import FDA_LABEL_OFFLINE_ONLY
 from src.utils.logger import mtb_logger as logger
+from src.tools.api_clients.circuit_breaker import CircuitBreakerAdapter, ServiceUnavailableError
+
+# 说明书章节 → openFDA 字段（按优先级，取第一个非空）
+LABEL_SECTIONS = {
+    "indications": ("indications_and_usage",),
+    "dosage": ("dosage_and_administration",),
+    "warnings": ("warnings_and_cautions", "warnings"),
+    "boxed_warning": ("boxed_warning",),
+    "contraindications": ("contraindications",),
+    "adverse_reactions": ("adverse_reactions",),
+    "drug_interactions": ("drug_interactions",),
+    "use_in_pregnancy": ("pregnancy", "use_in_specific_populations"),
+    "pharmacology": ("clinical_pharmacology",),
+}
 
 
 class FDAClient:
@@ -32,21 +46,40 @@ class FDAClient:
             allowed_methods=["GET", "POST"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("openfda", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
-    def search_drug_label(self, drug_name: str) -> Optional[Dict]:
+    def search_drug_label(self, drug_name: str, sections: Optional[List[str]] = None) -> Optional[Dict]:
         """
         搜索药物说明书
 
+        优先查本地索引（毫秒级、离线）；未命中时回退 openFDA（FDA_LABEL_OFFLINE_ONLY 时不回退）。
+        openFDA 熔断时抛出 ServiceUnavailableError（不能当作"未找到说明书"）。
+
         Args:
             drug_name: 药物名称 (通用名或商品名)
+            sections: 需要的章节（LABEL_SECTIONS 的键），None 表示全部
 
         Returns:
-            说明书内容 {drug_name, indications, dosage, warnings, contraindications,
-                       adverse_reactions, drug_interactions}
+            说明书内容 {generic_name, brand_name, set_id, ...} + 请求的章节
+            (indications, dosage, warnings, contraindications, adverse_reactions, drug_interactions 等)
+
+        Raises:
+            ServiceUnavailableError: 需要回退 openFDA 但其熔断中
         """
+        from src.tools.api_clients.fda_label_index import get_fda_label_index
+
+        index = get_fda_label_index()
+        if index is not None:
+            label = index.lookup(drug_name, sections)
+            if label:
+                logger.debug(f"[FDA] 本地索引命中: {drug_name}")
+                return label
+            if FDA_LABEL_OFFLINE_ONLY:
+                logger.info(f"[FDA] 本地索引未找到药物: {drug_name}")
+                return None
+
         # 搜索通用名或商品名
         search_query = f'openfda.generic_name:"{drug_name}" OR openfda.brand_name:"{drug_name}"'
 
@@ -69,7 +102,12 @@ class FDAClient:
                 logger.info(f"[FDA] 未找到药物: {drug_name}")
                 return None
 
-            return self._parse_label(results[0])
+            label = self._parse_label(results[0])
+            if sections:
+                for section in LABEL_SECTIONS:
+                    if section not in sections:
+                        label.pop(section, None)
+            return label
 
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
@@ -77,12 +115,15 @@ class FDAClient:
             else:
                 logger.error(f"[FDA] 请求失败: {e}")
             return None
+        except ServiceUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"[FDA] 搜索失败: {e}")
             return None
 
-    def _parse_label(self, label: Dict) -> Dict:
-        """解析药物说明书"""
+    @staticmethod
+    def _parse_label(label: Dict) -> Dict:
+        """解析药物说明书（openFDA 原始记录 → 头字段 + LABEL_SECTIONS 各章节）"""
         openfda = label.get("openfda", {})
 
         # 药物名称
@@ -96,22 +137,16 @@ class FDAClient:
                 return content[0]
             return ""
 
-        return {
+        parsed = {
             "generic_name": generic_names[0] if generic_names else "",
             "brand_name": brand_names[0] if brand_names else "",
             "manufacturer": openfda.get("manufacturer_name", [""])[0],
             "set_id": openfda.get("spl_set_id", [""])[0],
             "application_number": openfda.get("application_number", [""])[0],
-            "indications": get_section("indications_and_usage"),
-            "dosage": get_section("dosage_and_administration"),
-            "warnings": get_section("warnings_and_cautions") or get_section("warnings"),
-            "boxed_warning": get_section("boxed_warning"),
-            "contraindications": get_section("contraindications"),
-            "adverse_reactions": get_section("adverse_reactions"),
-            "drug_interactions": get_section("drug_interactions"),
-            "use_in_pregnancy": get_section("pregnancy") or get_section("use_in_specific_populations"),
-            "pharmacology": get_section("clinical_pharmacology"),
         }
+        for section, keys in LABEL_SECTIONS.items():
+            parsed[section] = next((get_section(k) for k in keys if get_section(k)), "")
+        return parsed
 
     def get_indications(self, drug_name: str) -> str:
         """获取适应症"""
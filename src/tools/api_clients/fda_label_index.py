@@ -0,0 +1,268 @@
+"""
+FDA 药品说明书本地索引（openFDA 批量标签 → SQLite / FTS5）
+
+openFDA 每次 search_fda_labels 调用都要联网，且返回整份说明书。本地索引:
+    - 导入 openFDA 批量下载的 drug-label JSON（.json 或 .json.zip）
+    - 按通用名 / 商品名（精确匹配优先，FTS5 分词匹配兜底）与 set_id 查找
+    - 各章节单独成行，只读取调用方请求的章节
+
+同一 set_id 多个版本时保留 effective_time 最新的一版；
+同名多个标签时优先原研（NDA / BLA），其次最新版本。
+
+用法:
+    python -m src.tools.api_clients.fda_label_index drug-label-0001-of-0013.json.zip ...
+    python -m src.tools.api_clients.fda_label_index --lookup osimertinib --sections dosage boxed_warning
+"""
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from config.settings import FDA_LABEL_INDEX_PATH
+from src.tools.api_clients.fda_client import FDAClient, LABEL_SECTIONS
+from src.utils.logger import mtb_logger as logger
+
+# 标签头字段（始终返回）
+HEADER_FIELDS = ("generic_name", "brand_name", "manufacturer", "set_id", "application_number")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    set_id TEXT PRIMARY KEY,
+    generic_name TEXT NOT NULL DEFAULT '',
+    brand_name TEXT NOT NULL DEFAULT '',
+    manufacturer TEXT NOT NULL DEFAULT '',
+    application_number TEXT NOT NULL DEFAULT '',
+    effective_time TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS label_names (
+    name TEXT NOT NULL,
+    set_id TEXT NOT NULL,
+    PRIMARY KEY (name, set_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS label_sections (
+    set_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (set_id, section)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS label_names_fts USING fts5(set_id UNINDEXED, names);
+"""
+
+# 原研标签优先，其次最新版本
+_RANK_ORDER = (
+    "ORDER BY (l.application_number LIKE 'NDA%' OR l.application_number LIKE 'BLA%') DESC, "
+    "l.effective_time DESC LIMIT 1"
+)
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join((name or "").split()).lower()
+
+
+def iter_bulk_labels(path: Path) -> Iterator[Dict]:
+    """逐条读取 openFDA 批量标签文件（{"meta": ..., "results": [...]}，支持 .zip）"""
+    path = Path(path)
+    if path.suffix == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.endswith(".json"):
+                    with archive.open(member) as fh:
+                        yield from json.load(fh).get("results", [])
+    else:
+        with open(path, encoding="utf-8") as fh:
+            yield from json.load(fh).get("results", [])
+
+
+class FDALabelIndex:
+    """SQLite 说明书索引（单连接 + 锁，查询为毫秒级）"""
+
+    def __init__(self, path: Path = FDA_LABEL_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+    # ==================== 导入 ====================
+
+    def import_labels(self, labels: Iterable[Dict]) -> Dict[str, int]:
+        """
+        导入原始 openFDA 标签记录（单事务）
+
+        Returns:
+            {"imported": 写入数, "skipped": 无 set_id 或已有更新版本而跳过的数}
+        """
+        stats = {"imported": 0, "skipped": 0}
+        with self._lock, self._conn:
+            for raw in labels:
+                if self._upsert(raw):
+                    stats["imported"] += 1
+                else:
+                    stats["skipped"] += 1
+        return stats
+
+    def import_files(self, paths: Iterable[Path]) -> Dict[str, int]:
+        """导入多个批量文件（每个文件一个事务）"""
+        totals = {"imported": 0, "skipped": 0}
+        for path in paths:
+            start = time.time()
+            stats = self.import_labels(iter_bulk_labels(path))
+            for key, value in stats.items():
+                totals[key] += value
+            logger.info(f"[FDAIndex] {Path(path).name}: 写入 {stats['imported']}，跳过 {stats['skipped']} ({time.time() - start:.1f}s)")
+        return totals
+
+    def _upsert(self, raw: Dict) -> bool:
+        parsed = FDAClient._parse_label(raw)
+        set_id = parsed["set_id"] or raw.get("set_id", "")
+        if not set_id:
+            return False
+        effective_time = str(raw.get("effective_time", ""))
+
+        row = self._conn.execute("SELECT effective_time FROM labels WHERE set_id = ?", (set_id,)).fetchone()
+        if row is not None and row["effective_time"] > effective_time:
+            return False
+
+        openfda = raw.get("openfda", {})
+        names = sorted({
+            _normalize_name(n)
+            for n in openfda.get("generic_name", []) + openfda.get("brand_name", [])
+            if _normalize_name(n)
+        })
+
+        for table in ("label_names", "label_sections", "label_names_fts"):
+            self._conn.execute(f"DELETE FROM {table} WHERE set_id = ?", (set_id,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO labels (set_id, generic_name, brand_name, manufacturer, application_number, effective_time) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (set_id, parsed["generic_name"], parsed["brand_name"], parsed["manufacturer"],
+             parsed["application_number"], effective_time),
+        )
+        self._conn.executemany("INSERT INTO label_names (name, set_id) VALUES (?, ?)", [(n, set_id) for n in names])
+        self._conn.executemany(
+            "INSERT INTO label_sections (set_id, section, content) VALUES (?, ?, ?)",
+            [(set_id, section, parsed[section]) for section in LABEL_SECTIONS if parsed.get(section)],
+        )
+        if names:
+            self._conn.execute("INSERT INTO label_names_fts (set_id, names) VALUES (?, ?)", (set_id, " ; ".join(names)))
+        return True
+
+    # ==================== 查询 ====================
+
+    def lookup(self, drug_name: str, sections: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        按通用名 / 商品名查找说明书
+
+        Args:
+            drug_name: 药物名称
+            sections: 需要的章节（LABEL_SECTIONS 的键），None 表示全部
+
+        Returns:
+            与 FDAClient._parse_label 同结构的字典（只含请求的章节），未找到返回 None
+        """
+        name = _normalize_name(drug_name)
+        if not name:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT l.* FROM label_names n JOIN labels l ON l.set_id = n.set_id WHERE n.name = ? " + _RANK_ORDER,
+                (name,),
+            ).fetchone()
+            if row is None:
+                tokens = re.findall(r"\w+", name)
+                if not tokens:
+                    return None
+                match = " ".join(f'"{t}"' for t in tokens)
+                row = self._conn.execute(
+                    "SELECT l.* FROM label_names_fts f JOIN labels l ON l.set_id = f.set_id "
+                    "WHERE label_names_fts MATCH ? " + _RANK_ORDER,
+                    (match,),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._assemble(row, sections)
+
+    def get(self, set_id: str, sections: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """按 set_id 读取说明书"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM labels l WHERE set_id = ?", (set_id,)).fetchone()
+            return self._assemble(row, sections) if row is not None else None
+
+    def _assemble(self, row: sqlite3.Row, sections: Optional[List[str]]) -> Dict[str, Any]:
+        wanted = [s for s in (sections or LABEL_SECTIONS) if s in LABEL_SECTIONS]
+        label = {field: row[field] for field in HEADER_FIELDS}
+        label.update({section: "" for section in wanted})
+        if wanted:
+            placeholders = ",".join("?" * len(wanted))
+            for section_row in self._conn.execute(
+                f"SELECT section, content FROM label_sections WHERE set_id = ? AND section IN ({placeholders})",
+                (row["set_id"], *wanted),
+            ):
+                label[section_row["section"]] = section_row["content"]
+        label["source"] = "local_index"
+        return label
+
+
+# ==================== 全局单例 ====================
+_index_instance: Optional[FDALabelIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_fda_label_index() -> Optional[FDALabelIndex]:
+    """
+    获取本地说明书索引；索引文件不存在时返回 None（调用方回退到 openFDA）
+    """
+    global _index_instance
+    if _index_instance is None:
+        with _index_lock:
+            if _index_instance is None and FDA_LABEL_INDEX_PATH.exists():
+                _index_instance = FDALabelIndex(FDA_LABEL_INDEX_PATH)
+                logger.info(f"[FDAIndex] 使用本地说明书索引: {FDA_LABEL_INDEX_PATH}")
+    return _index_instance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入 openFDA 批量药品说明书到本地 SQLite 索引")
+    parser.add_argument("files", nargs="*", help="openFDA drug-label 批量文件 (.json / .json.zip)")
+    parser.add_argument("--index", type=str, default=str(FDA_LABEL_INDEX_PATH), help="索引路径 (默认: FDA_LABEL_INDEX_PATH)")
+    parser.add_argument("--lookup", type=str, default=None, help="导入后按药物名查询测试")
+    parser.add_argument("--sections", nargs="*", default=None, help=f"查询的章节: {', '.join(LABEL_SECTIONS)}")
+    args = parser.parse_args()
+
+    index = FDALabelIndex(Path(args.index))
+    if args.files:
+        start = time.time()
+        totals = index.import_files(Path(f) for f in args.files)
+        print(f"导入完成: 写入 {totals['imported']}，跳过 {totals['skipped']}，耗时 {time.time() - start:.1f}s")
+    print(f"索引标签数: {index.count()}  ({index.path})")
+
+    if args.lookup:
+        start = time.perf_counter()
+        label = index.lookup(args.lookup, args.sections)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if not label:
+            print(f"未找到: {args.lookup} ({elapsed_ms:.1f}ms)")
+            return
+        print(f"{label['generic_name']} / {label['brand_name']} (set_id={label['set_id']}, {elapsed_ms:.1f}ms)")
+        for section in LABEL_SECTIONS:
+            if label.get(section):
+                print(f"\n[{section}]\n{label[section][:300]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,25 @@ NCI GDC (Genomic Data Commons) API 客户端
 
 提供基因突变频率和癌症基因组数据查询（替代 cBioPortal）
 基于 TCGA + ICGC 数据
+相互独立的子查询并发发出，计数尽量使用服务端分面（facets, size=0），
+按基因归约后的结果带 TTL 磁盘缓存。
 API 文档: https://docs.gdc.cancer.gov/API/Users_Guide/Data_Analysis/
 """
 import json
+import os
+import re
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from config.settings import GDC_MAX_WORKERS, GDC_CACHE_DIR, GDC_CACHE_TTL_DAYS
 from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import in_trace_context, instant
+from src.tools.api_clients.circuit_breaker import CircuitBreakerAdapter
 
 
 class GDCClient:
@@ -36,7 +46,7 @@ class GDCClient:
             allowed_methods=["GET", "POST"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("gdc", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
@@ -54,6 +64,7 @@ class GDCClient:
         with GDCClient._gene_cache_lock:
             if cache_key in GDCClient._gene_cache:
                 logger.debug(f"[GDC] 基因缓存命中: {gene_symbol}")
+                instant("gdc.gene", key=cache_key)
                 return GDCClient._gene_cache[cache_key]
 
         url = f"{self.BASE_URL}/genes"
@@ -66,7 +77,7 @@ class GDCClient:
         }
         params = {
             "filters": json.dumps(filters),
-            "fields": "gene_id,symbol,name",
+            "fields": "gene_id",
             "size": 1,
         }
 
@@ -104,56 +115,32 @@ class GDCClient:
         Returns:
             突变频率数据 {gene, by_cancer_type, top_mutations, ...}
         """
-        ensembl_id = self._get_ensembl_id(gene)
-        if not ensembl_id:
+        table = self._get_gene_table(gene)
+        if not table:
             return {"gene": gene, "error": "Gene not found in GDC"}
 
-        result = {
+        ensembl_id = table["ensembl_id"]
+        by_cancer_type = {
+            project_id: {"mutation_count": count}
+            for project_id, count in table["case_counts"].items()
+            if not cancer_type or cancer_type.lower() in project_id.lower()
+        }
+        return {
             "gene": gene,
             "ensembl_id": ensembl_id,
-            "studies_analyzed": 0,
-            "by_cancer_type": {},
-            "top_mutations": [],
-            "total_mutations": 0,
-            "common_mutations": {},
+            "studies_analyzed": len(by_cancer_type),
+            "by_cancer_type": by_cancer_type,
+            "top_mutations": self._top_mutations(table["aa_counts"]),
+            "total_mutations": table["ssm_total"],
+            "common_mutations": dict(table["aa_counts"]),
             "gdc_url": f"https://portal.gdc.cancer.gov/genes/{ensembl_id}",
         }
 
-        # 1. 获取各癌种的突变病例数
-        case_counts = self._get_cases_by_gene(ensembl_id)
-        if case_counts:
-            for project_id, count in case_counts.items():
-                if cancer_type and cancer_type.lower() not in project_id.lower():
-                    continue
-                result["by_cancer_type"][project_id] = {
-                    "mutation_count": count,
-                }
-            result["studies_analyzed"] = len(result["by_cancer_type"])
-
-        # 2. 获取高频突变列表
-        mutations = self._get_ssm_for_gene(gene)
-        if mutations:
-            # 统计氨基酸变化频率
-            aa_counts: Dict[str, int] = {}
-            for mut in mutations:
-                aa_changes = self._extract_aa_changes(mut)
-                for aa in aa_changes:
-                    aa_counts[aa] = aa_counts.get(aa, 0) + 1
-
-            sorted_mutations = sorted(aa_counts.items(), key=lambda x: x[1], reverse=True)
-            result["top_mutations"] = [
-                {"mutation": m[0], "count": m[1]} for m in sorted_mutations[:50]
-            ]
-            result["common_mutations"] = aa_counts
-            result["total_mutations"] = len(mutations)
-
-        return result
-
     def get_variant_frequency_summary(self, gene: str, variant: str) -> Dict:
         """
         获取特定变异的频率摘要
 
-        通过 SSM 的 occurrence 字段统计该变异在各项目中的出现次数（病例数）。
+        基因归约表与该变异的 occurrence 分面统计（病例数按项目分布）并发查询。
 
         Args:
             gene: 基因名称
@@ -162,27 +149,18 @@ class GDCClient:
         Returns:
             频率摘要
         """
-        ensembl_id = self._get_ensembl_id(gene)
-        if not ensembl_id:
+        results = self._gather({
+            "gene": lambda: self._get_gene_table(gene),
+            "variant": lambda: self._get_variant_occurrences(gene, variant),
+        })
+        table = results["gene"]
+        if not table:
             return {"gene": gene, "error": "Gene not found in GDC"}
 
-        # 1. 获取基因的整体突变病例数（按项目分布）
-        case_counts = self._get_cases_by_gene(ensembl_id)
-        total_gene_cases = sum(case_counts.values()) if case_counts else 0
-
-        # 2. 查询特定变异的 SSM 及其 occurrence（病例分布）
-        variant_count, variant_by_project = self._get_variant_occurrences(
-            gene, variant
-        )
-
-        # 3. 获取该基因的高频突变列表
-        mutations = self._get_ssm_for_gene(gene, size=500)
-        aa_counts: Dict[str, int] = {}
-        for mut in mutations:
-            for aa in self._extract_aa_changes(mut):
-                aa_counts[aa] = aa_counts.get(aa, 0) + 1
-        sorted_mutations = sorted(aa_counts.items(), key=lambda x: x[1], reverse=True)
-        top_mutations = [{"mutation": m[0], "count": m[1]} for m in sorted_mutations[:50]]
+        ensembl_id = table["ensembl_id"]
+        case_counts = table["case_counts"]
+        total_gene_cases = sum(case_counts.values())
+        variant_count, variant_by_project = results["variant"] or (0, {})
 
         return {
             "gene": gene,
@@ -193,7 +171,7 @@ class GDCClient:
                 variant_count / total_gene_cases * 100, 2
             ) if total_gene_cases > 0 else 0,
             "studies_analyzed": len(case_counts),
-            "top_mutations": top_mutations,
+            "top_mutations": self._top_mutations(table["aa_counts"]),
             "by_cancer_type": {
                 p: {"mutation_count": c} for p, c in case_counts.items()
             },
@@ -201,22 +179,132 @@ class GDCClient:
             "gdc_url": f"https://portal.gdc.cancer.gov/genes/{ensembl_id}",
         }
 
-    def _get_variant_occurrences(
-        self, gene_symbol: str, variant: str
-    ) -> tuple:
+    @staticmethod
+    def _top_mutations(aa_counts: Dict[str, int], limit: int = 50) -> List[Dict]:
+        sorted_mutations = sorted(aa_counts.items(), key=lambda x: x[1], reverse=True)
+        return [{"mutation": m[0], "count": m[1]} for m in sorted_mutations[:limit]]
+
+    def _gather(self, tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        并发执行互相独立的子查询
+
+        Returns:
+            {任务名: 结果}，抛出异常的子查询结果为 None
         """
-        查询特定变异的病例数和项目分布
+        def run(name: str) -> Any:
+            try:
+                return tasks[name]()
+            except Exception as e:
+                logger.error(f"[GDC] 子查询 {name} 失败: {e}")
+                return None
+
+        names = list(tasks)
+        workers = max(1, min(GDC_MAX_WORKERS, len(names)))
+        if workers == 1:
+            return {name: run(name) for name in names}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gdc") as pool:
+            return dict(zip(names, pool.map(in_trace_context(run), names)))
 
-        通过 SSM 过滤 aa_change 并统计 occurrence。
+    # ==================== 归约结果磁盘缓存 ====================
+
+    def _cache_path(self, key: str) -> Path:
+        return GDC_CACHE_DIR / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.json"
+
+    def _load_cached(self, key: str) -> Optional[Any]:
+        if GDC_CACHE_TTL_DAYS <= 0:
+            return None
+        path = self._cache_path(key)
+        try:
+            if time.time() - path.stat().st_mtime > GDC_CACHE_TTL_DAYS * 86400:
+                return None
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _store_cached(self, key: str, value: Any) -> None:
+        if GDC_CACHE_TTL_DAYS <= 0:
+            return
+        path = self._cache_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(path)
+        except OSError as e:
+            logger.debug(f"[GDC] 写入缓存失败: {e}")
+
+    def _get_gene_table(self, gene_symbol: str) -> Optional[Dict]:
+        """
+        获取基因归约表：优先读磁盘缓存，未命中时并发查询病例分布与氨基酸变化分面
+
+        Returns:
+            {gene, ensembl_id, case_counts, aa_counts, ssm_total}，基因未找到返回 None
+            （任一子查询失败时结果不写缓存）
+        """
+        symbol = gene_symbol.upper()
+        cached = self._load_cached(symbol)
+        if cached is not None:
+            logger.debug(f"[GDC] 基因归约表缓存命中: {symbol}")
+            instant("gdc.gene_summary", key=symbol)
+            return cached
+
+        results = self._gather({
+            "cases": lambda: self._fetch_cases_for_symbol(symbol),
+            "ssms": lambda: self._fetch_aa_change_facets(symbol),
+        })
+        ensembl_id, case_counts = results["cases"] or (None, None)
+        if not ensembl_id:
+            return None
+        ssm_total, aa_counts = results["ssms"] or (0, {})
+
+        table = {
+            "gene": symbol,
+            "ensembl_id": ensembl_id,
+            "case_counts": case_counts or {},
+            "aa_counts": aa_counts,
+            "ssm_total": ssm_total,
+        }
+        if case_counts is not None and results["ssms"] is not None:
+            self._store_cached(symbol, table)
+        return table
+
+    def _get_variant_occurrences(self, gene_symbol: str, variant: str) -> Tuple[int, Dict[str, int]]:
+        """
+        查询特定变异的病例数和项目分布（带磁盘缓存）
+
+        Returns:
+            (total_cases, {project_id: case_count})，失败返回 (0, {}) 且不写缓存
+        """
+        key = f"{gene_symbol.upper()}__{variant}"
+        cached = self._load_cached(key)
+        if cached is not None:
+            return cached["total"], cached["by_project"]
+
+        try:
+            total, by_project = self._fetch_variant_occurrences(gene_symbol, variant)
+        except Exception as e:
+            logger.error(f"[GDC] 查询变异 {gene_symbol} {variant} 失败: {e}")
+            return 0, {}
+
+        self._store_cached(key, {"total": total, "by_project": by_project})
+        return total, by_project
+
+    # ==================== 子查询（失败抛出异常） ====================
+
+    @staticmethod
+    def _facet_buckets(data: Dict, field: str) -> Dict[str, int]:
+        buckets = data.get("data", {}).get("aggregations", {}).get(field, {}).get("buckets", [])
+        return {b["key"]: b.get("doc_count", 0) for b in buckets if b.get("key") and b.get("key") != "_missing"}
+
+    def _fetch_variant_occurrences(self, gene_symbol: str, variant: str) -> Tuple[int, Dict[str, int]]:
+        """
+        变异 occurrence 按项目分面计数（/ssm_occurrences，size=0 只取聚合）
 
         Args:
             gene_symbol: 基因名称
             variant: 氨基酸变化（如 L858R）
-
-        Returns:
-            (total_cases, {project_id: case_count})
         """
-        url = f"{self.BASE_URL}/ssms"
+        url = f"{self.BASE_URL}/ssm_occurrences"
 
         # 支持多种变异格式匹配
         variant_values = [variant]
@@ -229,54 +317,46 @@ class GDCClient:
                 {
                     "op": "in",
                     "content": {
-                        "field": "consequence.transcript.gene.symbol",
+                        "field": "ssm.consequence.transcript.gene.symbol",
                         "value": [gene_symbol.upper()]
                     }
                 },
                 {
                     "op": "in",
                     "content": {
-                        "field": "consequence.transcript.aa_change",
+                        "field": "ssm.consequence.transcript.aa_change",
                         "value": variant_values
                     }
                 }
             ]
         }
-
         params = {
             "filters": json.dumps(filters),
-            "fields": "ssm_id,occurrence.case.project.project_id",
-            "size": 10,
+            "facets": "case.project.project_id",
+            "size": 0,
         }
 
-        try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+        response = self.session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        project_counts = self._facet_buckets(response.json(), "case.project.project_id")
+        return sum(project_counts.values()), project_counts
 
-            hits = data.get("data", {}).get("hits", [])
-            project_counts: Dict[str, int] = {}
-
-            for hit in hits:
-                for occ in hit.get("occurrence", []):
-                    project_id = (
-                        occ.get("case", {})
-                        .get("project", {})
-                        .get("project_id", "")
-                    )
-                    if project_id:
-                        project_counts[project_id] = (
-                            project_counts.get(project_id, 0) + 1
-                        )
-
-            total_cases = sum(project_counts.values())
-            return total_cases, project_counts
+    def _fetch_cases_for_symbol(self, gene_symbol: str) -> Tuple[Optional[str], Optional[Dict[str, int]]]:
+        """
+        基因符号 → (Ensembl ID, 各项目突变病例数)
 
+        基因未找到返回 (None, {})；病例计数失败返回 (ensembl_id, None)。
+        """
+        ensembl_id = self._get_ensembl_id(gene_symbol)
+        if not ensembl_id:
+            return None, {}
+        try:
+            return ensembl_id, self._fetch_cases_by_gene(ensembl_id)
         except Exception as e:
-            logger.error(f"[GDC] 查询变异 {gene_symbol} {variant} 失败: {e}")
-            return 0, {}
+            logger.error(f"[GDC] 获取病例计数失败: {e}")
+            return ensembl_id, None
 
-    def _get_cases_by_gene(self, ensembl_id: str) -> Dict[str, int]:
+    def _fetch_cases_by_gene(self, ensembl_id: str) -> Dict[str, int]:
         """
         获取各项目中基因突变的病例数
 
@@ -289,48 +369,39 @@ class GDCClient:
         url = f"{self.BASE_URL}/analysis/top_cases_counts_by_genes"
         params = {"gene_ids": ensembl_id}
 
-        try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            project_counts: Dict[str, int] = {}
-            # top_cases_counts_by_genes 返回顶层 aggregations（非嵌套在 data 下）
-            projects = data.get("aggregations", {}).get(
-                "projects", {}
-            ).get("buckets", [])
-
-            for project in projects:
-                project_id = project.get("key", "")
-                # 从嵌套 aggregation 提取基因的突变病例数
-                gene_buckets = (
-                    project.get("genes", {})
-                    .get("my_genes", {})
-                    .get("gene_id", {})
-                    .get("buckets", [])
-                )
-                for gene_bucket in gene_buckets:
-                    if gene_bucket.get("key") == ensembl_id:
-                        count = gene_bucket.get("doc_count", 0)
-                        if count > 0:
-                            project_counts[project_id] = count
-
-            return project_counts
-
-        except Exception as e:
-            logger.error(f"[GDC] 获取病例计数失败: {e}")
-            return {}
-
-    def _get_ssm_for_gene(self, gene_symbol: str, size: int = 500) -> List[Dict]:
+        response = self.session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+
+        project_counts: Dict[str, int] = {}
+        # top_cases_counts_by_genes 返回顶层 aggregations（非嵌套在 data 下）
+        projects = data.get("aggregations", {}).get(
+            "projects", {}
+        ).get("buckets", [])
+
+        for project in projects:
+            project_id = project.get("key", "")
+            # 从嵌套 aggregation 提取基因的突变病例数
+            gene_buckets = (
+                project.get("genes", {})
+                .get("my_genes", {})
+                .get("gene_id", {})
+                .get("buckets", [])
+            )
+            for gene_bucket in gene_buckets:
+                if gene_bucket.get("key") == ensembl_id:
+                    count = gene_bucket.get("doc_count", 0)
+                    if count > 0:
+                        project_counts[project_id] = count
+
+        return project_counts
+
+    def _fetch_aa_change_facets(self, gene_symbol: str) -> Tuple[int, Dict[str, int]]:
         """
-        获取基因的 SSM（Simple Somatic Mutations）列表
-
-        Args:
-            gene_symbol: 基因名称
-            size: 返回结果数量
+        基因 SSM 的氨基酸变化分面计数（size=0，不返回 SSM 明细）
 
         Returns:
-            SSM 列表
+            (SSM 总数, {aa_change: 含该变化的 SSM 数})
         """
         url = f"{self.BASE_URL}/ssms"
         filters = {
@@ -347,38 +418,15 @@ class GDCClient:
         }
         params = {
             "filters": json.dumps(filters),
-            "fields": "ssm_id,genomic_dna_change,consequence.transcript.aa_change,consequence.transcript.gene.symbol",
-            "size": size,
+            "facets": "consequence.transcript.aa_change",
+            "size": 0,
         }
 
-        try:
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("data", {}).get("hits", [])
-
-        except Exception as e:
-            logger.error(f"[GDC] 获取 SSM 失败: {e}")
-            return []
-
-    def _extract_aa_changes(self, ssm: Dict) -> List[str]:
-        """
-        从 SSM 记录中提取氨基酸变化
-
-        Args:
-            ssm: SSM 记录
-
-        Returns:
-            氨基酸变化列表（去重）
-        """
-        aa_changes = set()
-        consequences = ssm.get("consequence", [])
-        for consequence in consequences:
-            transcript = consequence.get("transcript", {})
-            aa_change = transcript.get("aa_change")
-            if aa_change and aa_change != "":
-                aa_changes.add(aa_change)
-        return list(aa_changes)
+        response = self.session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        total = data.get("data", {}).get("pagination", {}).get("total", 0)
+        return total, self._facet_buckets(data, "consequence.transcript.aa_change")
 
 
 # ==================== 全局单例 ====================
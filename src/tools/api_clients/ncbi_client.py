@@ -5,12 +5,13 @@ NCBI E-utilities 客户端
 API 文档: https://www.ncbi.nlm.nih.gov/books/NBK25500/
 """
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import time
 import xml.etree.ElementTree as ET
 from typing import Dict, List, Any, Optional
 from src.utils.logger import mtb_logger as logger
+from src.utils.cassette import replaying
+from src.tools.api_clients.circuit_breaker import CircuitBreakerAdapter
 
 
 class NCBIClient:
@@ -40,7 +41,7 @@ class NCBIClient:
             allowed_methods=["GET"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("ncbi", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
         # 请求间隔 (无 API Key 限制 3/秒)
@@ -48,7 +49,9 @@ class NCBIClient:
         self._min_interval = 0.34 if not api_key else 0.1
 
     def _rate_limit(self):
-        """速率限制"""
+        """速率限制（回放录像时跳过）"""
+        if replaying():
+            return
         elapsed = time.time() - self._last_request_time
         if elapsed < self._min_interval:
             time.sleep(self._min_interval - elapsed)
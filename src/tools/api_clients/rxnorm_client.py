@@ -2,13 +2,47 @@
 RxNorm API 客户端
 
 提供药物标准化和药物相互作用查询 (替代 DrugBank)
+药物名 → RxCUI 并发解析并持久化缓存；多药相互作用按 RxCUI 对缓存，
+药师在 Phase 1 / Phase 2b 对重叠用药列表复查时只查询新增的药物对。
+RxCUI 磁盘缓存由批处理各工作进程共享：写入在 fcntl 文件锁内"重读 → 合并 → 原子替换"，
+内存未命中时重新读入其他进程新写入的条目。
 API 文档: https://lhncbc.nlm.nih.gov/RxNav/APIs/
 """
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import combinations
+from pathlib import Path
+
 import requests
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from config.settings import RXNORM_MAX_WORKERS, RXNORM_CACHE_DIR, RXNORM_CACHE_TTL_DAYS
 from src.utils.logger import mtb_logger as logger
+from src.tools.api_clients.circuit_breaker import CircuitBreakerAdapter
+from src.utils.tracing import in_trace_context
+
+try:
+    import fcntl
+except ImportError:  # Windows：退回无锁写入（单进程使用不受影响）
+    fcntl = None
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """path 旁的 .lock 文件上的排他锁（跨进程）"""
+    if fcntl is None:
+        yield
+        return
+    with open(path.with_name(path.name + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
 
 class RxNormClient:
@@ -17,6 +51,16 @@ class RxNormClient:
     BASE_URL = "https://rxnav.nlm.nih.gov/REST"
     INTERACTION_URL = "https://rxnav.nlm.nih.gov/REST/interaction"
 
+    # 药物名（小写）→ {"rxcui": str|None, "ts": 写入时间}，进程内共享并持久化到磁盘
+    _rxcui_cache: Dict[str, Dict[str, Any]] = {}
+    _rxcui_cache_loaded = False
+    _rxcui_cache_stamp: Optional[Tuple[int, int]] = None   # 最近一次读入的磁盘文件 (inode, mtime_ns)
+    _rxcui_cache_lock = threading.Lock()
+
+    # (rxcui_a, rxcui_b)（升序）→ 该药物对的相互作用列表（空列表表示已查询、无相互作用）
+    _pair_cache: Dict[Tuple[str, str], List[Dict]] = {}
+    _pair_cache_lock = threading.Lock()
+
     def __init__(self):
         self.session = requests.Session()
         self.session.headers.update({
@@ -29,59 +73,196 @@ class RxNormClient:
             allowed_methods=["GET", "POST"],
             raise_on_status=False,
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = CircuitBreakerAdapter("rxnorm", max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
 
+    @staticmethod
+    def _name_key(drug_name: str) -> str:
+        return " ".join((drug_name or "").split()).lower()
+
+    @staticmethod
+    def _rxcui_cache_path() -> Path:
+        return RXNORM_CACHE_DIR / "rxcui.json"
+
+    @classmethod
+    def _ensure_rxcui_cache_loaded(cls) -> None:
+        """首次访问时从磁盘载入药物名 → RxCUI 缓存（调用方持有锁）"""
+        if cls._rxcui_cache_loaded:
+            return
+        cls._rxcui_cache_loaded = True
+        cls._rxcui_cache_stamp = None
+        cls._merge_rxcui_file()
+
+    @classmethod
+    def _merge_rxcui_file(cls) -> None:
+        """磁盘文件有变化时读入并合并，同一药物名保留较新的条目（调用方持有锁）"""
+        if RXNORM_CACHE_TTL_DAYS <= 0:
+            return
+        path = cls._rxcui_cache_path()
+        try:
+            stat = path.stat()
+            stamp = (stat.st_ino, stat.st_mtime_ns)     # 原子替换会换 inode，mtime 精度不足时也能识别
+            if stamp == cls._rxcui_cache_stamp:
+                return
+            entries = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        cls._rxcui_cache_stamp = stamp
+        if not isinstance(entries, dict):
+            return
+        for key, entry in entries.items():
+            current = cls._rxcui_cache.get(key)
+            if isinstance(entry, dict) and (current is None or entry.get("ts", 0) > current.get("ts", 0)):
+                cls._rxcui_cache[key] = entry
+
+    def _lookup_cached_rxcui(self, key: str) -> Tuple[bool, Optional[str]]:
+        """返回 (是否命中, RxCUI)；"未找到"也是有效的缓存结果"""
+        with RxNormClient._rxcui_cache_lock:
+            self._ensure_rxcui_cache_loaded()
+            entry = RxNormClient._rxcui_cache.get(key)
+            if not self._fresh(entry):
+                # 其他工作进程可能已解析过该药物
+                RxNormClient._merge_rxcui_file()
+                entry = RxNormClient._rxcui_cache.get(key)
+        if not self._fresh(entry):
+            return False, None
+        return True, entry.get("rxcui")
+
+    @staticmethod
+    def _fresh(entry: Optional[Dict[str, Any]]) -> bool:
+        if not entry:
+            return False
+        return RXNORM_CACHE_TTL_DAYS <= 0 or time.time() - entry.get("ts", 0) <= RXNORM_CACHE_TTL_DAYS * 86400
+
+    def _remember_rxcuis(self, resolved: Dict[str, Optional[str]]) -> None:
+        """写入内存缓存；在文件锁内重读磁盘、合并其他进程的条目后原子写回"""
+        if not resolved:
+            return
+        now = time.time()
+        with RxNormClient._rxcui_cache_lock:
+            self._ensure_rxcui_cache_loaded()
+            for key, rxcui in resolved.items():
+                RxNormClient._rxcui_cache[key] = {"rxcui": rxcui, "ts": now}
+            if RXNORM_CACHE_TTL_DAYS <= 0:
+                return
+            path = self._rxcui_cache_path()
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with _file_lock(path):
+                    RxNormClient._merge_rxcui_file()
+                    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                    tmp.write_text(json.dumps(RxNormClient._rxcui_cache, ensure_ascii=False), encoding="utf-8")
+                    tmp.replace(path)
+                    stat = path.stat()
+                    RxNormClient._rxcui_cache_stamp = (stat.st_ino, stat.st_mtime_ns)
+            except OSError as e:
+                logger.debug(f"[RxNorm] 写入 RxCUI 缓存失败: {e}")
+
     def get_rxcui(self, drug_name: str) -> Optional[str]:
         """
         获取药物的 RxCUI (RxNorm Concept Unique Identifier)
 
+        优先读缓存；请求失败时返回 None 且不写缓存。
+
         Args:
             drug_name: 药物名称
 
         Returns:
             RxCUI 字符串，未找到返回 None
         """
-        url = f"{self.BASE_URL}/rxcui.json"
-        params = {"name": drug_name}
+        key = self._name_key(drug_name)
+        if not key:
+            return None
+        hit, rxcui = self._lookup_cached_rxcui(key)
+        if hit:
+            return rxcui
+
+        ok, rxcui = self._fetch_rxcui(drug_name)
+        if ok:
+            self._remember_rxcuis({key: rxcui})
+        return rxcui
 
+    def _fetch_rxcui(self, drug_name: str) -> Tuple[bool, Optional[str]]:
+        """请求 RxNorm（不读写缓存），返回 (是否成功, RxCUI)"""
         try:
-            response = self.session.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            data = response.json()
+            return True, self._resolve_rxcui(drug_name)
+        except Exception as e:
+            logger.error(f"[RxNorm] 获取 RxCUI 失败: {e}")
+            return False, None
 
-            id_group = data.get("idGroup", {})
-            rxnorm_id = id_group.get("rxnormId", [])
+    def resolve_rxcuis(self, drug_names: List[str]) -> Dict[str, Optional[str]]:
+        """
+        并发解析多个药物名的 RxCUI（已缓存的不发请求，新结果一次性写回磁盘）
 
-            if rxnorm_id:
-                return rxnorm_id[0]
+        Args:
+            drug_names: 药物名称列表
 
-            # 尝试近似搜索
-            return self._approximate_search(drug_name)
+        Returns:
+            {药物名: RxCUI 或 None}
+        """
+        names = list(dict.fromkeys(n for n in drug_names if self._name_key(n)))
+        # 按规范化药物名去重，大小写 / 空白不同的写法只查询一次
+        by_key = {}
+        for name in names:
+            by_key.setdefault(self._name_key(name), name)
+
+        found: Dict[str, Optional[str]] = {}
+        pending = []
+        for key, name in by_key.items():
+            hit, rxcui = self._lookup_cached_rxcui(key)
+            if hit:
+                found[key] = rxcui
+            else:
+                pending.append((key, name))
+
+        if pending:
+            workers = max(1, min(RXNORM_MAX_WORKERS, len(pending)))
+            if len(pending) > 1 and workers > 1:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rxnorm") as pool:
+                    fetched = list(pool.map(in_trace_context(self._fetch_rxcui), [n for _, n in pending]))
+            else:
+                fetched = [self._fetch_rxcui(n) for _, n in pending]
+            resolved = {}
+            for (key, _), (ok, rxcui) in zip(pending, fetched):
+                found[key] = rxcui
+                if ok:  # 请求失败的不缓存
+                    resolved[key] = rxcui
+            self._remember_rxcuis(resolved)
+
+        return {name: found[self._name_key(name)] for name in names}
+
+    def _resolve_rxcui(self, drug_name: str) -> Optional[str]:
+        """精确匹配，未命中时近似搜索（请求错误抛出）"""
+        url = f"{self.BASE_URL}/rxcui.json"
+        params = {"name": drug_name}
 
-        except Exception as e:
-            logger.error(f"[RxNorm] 获取 RxCUI 失败: {e}")
-            return None
+        response = self.session.get(url, params=params, timeout=15)
+        response.raise_for_status()
+        data = response.json()
+
+        id_group = data.get("idGroup", {})
+        rxnorm_id = id_group.get("rxnormId", [])
+
+        if rxnorm_id:
+            return rxnorm_id[0]
+
+        # 尝试近似搜索
+        return self._approximate_search(drug_name)
 
     def _approximate_search(self, drug_name: str) -> Optional[str]:
-        """近似搜索药物"""
+        """近似搜索药物（请求错误抛出）"""
         url = f"{self.BASE_URL}/approximateTerm.json"
         params = {"term": drug_name, "maxEntries": 1}
 
-        try:
-            response = self.session.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            data = response.json()
-
-            candidates = data.get("approximateGroup", {}).get("candidate", [])
-            if candidates:
-                return candidates[0].get("rxcui")
-            return None
+        response = self.session.get(url, params=params, timeout=15)
+        response.raise_for_status()
+        data = response.json()
 
-        except Exception as e:
-            logger.debug(f"[RxNorm] 近似搜索失败: {e}")
-            return None
+        candidates = data.get("approximateGroup", {}).get("candidate", [])
+        if candidates:
+            return candidates[0].get("rxcui")
+        return None
 
     def get_drug_info(self, drug_name: str) -> Optional[Dict]:
         """
@@ -189,22 +370,7 @@ class RxNormClient:
             for group in groups:
                 for itype in group.get("interactionType", []):
                     for pair in itype.get("interactionPair", []):
-                        description = pair.get("description", "")
-                        severity = pair.get("severity", "N/A")
-
-                        # 获取相互作用的药物
-                        concepts = pair.get("interactionConcept", [])
-                        drugs_involved = []
-                        for concept in concepts:
-                            drug = concept.get("minConceptItem", {}).get("name", "")
-                            if drug:
-                                drugs_involved.append(drug)
-
-                        interactions.append({
-                            "drugs": drugs_involved,
-                            "description": description,
-                            "severity": severity
-                        })
+                        interactions.append(self._interaction_record(pair))
 
             logger.debug(f"[RxNorm] 找到 {len(interactions)} 个相互作用")
             return interactions
@@ -217,59 +383,87 @@ class RxNormClient:
         """
         检查多个药物之间的相互作用
 
+        按 RxCUI 对缓存结果：只有未缓存的药物对才发起 list.json 查询
+        （list.json 以药物集合为单位，一次请求覆盖涉及的所有药物对）。
+
         Args:
             drug_names: 药物名称列表
 
         Returns:
             相互作用列表
         """
-        # 获取所有药物的 RxCUI
-        rxcuis = []
-        for name in drug_names:
-            rxcui = self.get_rxcui(name)
-            if rxcui:
-                rxcuis.append(rxcui)
+        resolved = self.resolve_rxcuis(drug_names)
+        rxcuis = sorted({rxcui for rxcui in resolved.values() if rxcui})
 
         if len(rxcuis) < 2:
             logger.info("[RxNorm] 需要至少2个有效药物才能检查相互作用")
             return []
 
+        pairs = list(combinations(rxcuis, 2))
+        with RxNormClient._pair_cache_lock:
+            missing = [pair for pair in pairs if pair not in RxNormClient._pair_cache]
+
+        if missing:
+            query = sorted({rxcui for pair in missing for rxcui in pair})
+            logger.debug(f"[RxNorm] 检查 {len(query)} 个药物间的相互作用（{len(missing)}/{len(pairs)} 对未缓存）")
+            fetched = self._fetch_pair_interactions(query)
+            if fetched is not None:
+                with RxNormClient._pair_cache_lock:
+                    for pair in combinations(query, 2):
+                        RxNormClient._pair_cache[pair] = fetched.get(pair, [])
+        else:
+            logger.debug(f"[RxNorm] {len(pairs)} 个药物对均已缓存")
+
+        interactions = []
+        with RxNormClient._pair_cache_lock:
+            for pair in pairs:
+                interactions.extend(RxNormClient._pair_cache.get(pair, []))
+        return interactions
+
+    def _fetch_pair_interactions(self, rxcuis: List[str]) -> Optional[Dict[Tuple[str, str], List[Dict]]]:
+        """查询 list.json，按 (rxcui_a, rxcui_b) 拆分结果；请求失败返回 None"""
         url = f"{self.INTERACTION_URL}/list.json"
         params = {"rxcuis": "+".join(rxcuis)}
 
         try:
-            logger.debug(f"[RxNorm] 检查 {len(rxcuis)} 个药物间的相互作用")
             response = self.session.get(url, params=params, timeout=30)
             response.raise_for_status()
             data = response.json()
-
-            interactions = []
-            full_results = data.get("fullInteractionTypeGroup", [])
-
-            for group in full_results:
-                for itype in group.get("fullInteractionType", []):
-                    for pair in itype.get("interactionPair", []):
-                        description = pair.get("description", "")
-                        severity = pair.get("severity", "N/A")
-
-                        concepts = pair.get("interactionConcept", [])
-                        drugs_involved = []
-                        for concept in concepts:
-                            drug = concept.get("minConceptItem", {}).get("name", "")
-                            if drug:
-                                drugs_involved.append(drug)
-
-                        interactions.append({
-                            "drugs": drugs_involved,
-                            "description": description,
-                            "severity": severity
-                        })
-
-            return interactions
-
         except Exception as e:
             logger.error(f"[RxNorm] 检查相互作用失败: {e}")
-            return []
+            return None
+
+        by_pair: Dict[Tuple[str, str], List[Dict]] = {}
+        for group in data.get("fullInteractionTypeGroup", []):
+            for itype in group.get("fullInteractionType", []):
+                # minConcept 为请求中的两个药物概念
+                itype_rxcuis = [c.get("rxcui") for c in itype.get("minConcept", []) if c.get("rxcui")]
+                for pair in itype.get("interactionPair", []):
+                    pair_rxcuis = itype_rxcuis or [
+                        c.get("minConceptItem", {}).get("rxcui")
+                        for c in pair.get("interactionConcept", [])
+                        if c.get("minConceptItem", {}).get("rxcui")
+                    ]
+                    if len(set(pair_rxcuis)) != 2:
+                        logger.debug(f"[RxNorm] 无法归属药物对的相互作用: {pair_rxcuis}")
+                        continue
+                    key = tuple(sorted(set(pair_rxcuis)))
+                    by_pair.setdefault(key, []).append(self._interaction_record(pair))
+        return by_pair
+
+    @staticmethod
+    def _interaction_record(pair: Dict) -> Dict:
+        """interactionPair → {drugs, description, severity}"""
+        drugs_involved = []
+        for concept in pair.get("interactionConcept", []):
+            drug = concept.get("minConceptItem", {}).get("name", "")
+            if drug:
+                drugs_involved.append(drug)
+        return {
+            "drugs": drugs_involved,
+            "description": pair.get("description", ""),
+            "severity": pair.get("severity", "N/A"),
+        }
 
 
 if __name__ == "__main__":
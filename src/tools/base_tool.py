@@ -4,9 +4,12 @@
 只使用真实 API 数据
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, Optional, Tuple, Union
 import json
 from src.utils.logger import mtb_logger as logger
+from src.tools.api_clients.circuit_breaker import (
+    ServiceUnavailableError, UPSTREAM_DISPLAY_NAMES, get_breaker,
+)
 
 
 class BaseTool(ABC):
@@ -16,6 +19,9 @@ class BaseTool(ABC):
     所有工具继承此类，实现 _call_real_api 方法调用真实 API。
     """
 
+    # 依赖的上游服务（熔断器名称，见 api_clients.circuit_breaker）；任一熔断时直接返回"服务不可用"
+    upstreams: Tuple[str, ...] = ()
+
     def __init__(self, name: str, description: str):
         """
         初始化工具
@@ -41,20 +47,44 @@ class BaseTool(ABC):
         """
         logger.debug(f"[Tool:{self.name}] 调用参数: {kwargs}")
 
+        unavailable = self._unavailable_response()
+        if unavailable:
+            return unavailable
+
         try:
             result = self._call_real_api(**kwargs)
             if result:
                 logger.info(f"[Tool:{self.name}] API 调用成功")
                 return result
             else:
+                # 客户端吞掉了熔断异常时，空结果实为上游不可用
+                unavailable = self._unavailable_response()
+                if unavailable:
+                    return unavailable
                 error_msg = f"[Tool:{self.name}] API 返回空结果"
                 logger.warning(error_msg)
                 return f"错误: {self.name} 未返回数据，请检查输入参数或稍后重试。"
+        except ServiceUnavailableError as e:
+            logger.warning(f"[Tool:{self.name}] 上游熔断: {e}")
+            return self._unavailable_response() or f"错误: {self.name} 上游服务暂不可用 - {e}"
         except Exception as e:
             error_msg = f"[Tool:{self.name}] API 调用失败: {e}"
             logger.error(error_msg)
             return f"错误: {self.name} 调用失败 - {str(e)}"
 
+    def _unavailable_response(self) -> Optional[str]:
+        """依赖的上游处于熔断状态时返回"服务不可用"响应，否则返回 None"""
+        for upstream in self.upstreams:
+            breaker = get_breaker(upstream)
+            if breaker.is_open():
+                display = UPSTREAM_DISPLAY_NAMES.get(upstream, upstream)
+                logger.warning(f"[Tool:{self.name}] {display} 熔断中，跳过调用")
+                return (
+                    f"错误: {display} 服务暂不可用（近期请求大量失败或超时，已熔断，"
+                    f"约 {breaker.retry_after():.0f}s 后自动恢复探测）。请改用其他数据源或稍后重试，不要重复调用 {self.name}。"
+                )
+        return None
+
     @abstractmethod
     def _call_real_api(self, **kwargs) -> Optional[Union[str, Dict[str, Any]]]:
         """
@@ -13,9 +13,11 @@ GraphQueryTool - 证据图查询工具 (retrieve_from_graph)
     - 只读：不提供 add_to_graph 操作（图写入通过 entity_extractors 管道）
     - "Not found" 引导外部搜索：空结果明确提示使用 PubMed/CIViC 等外部工具
     - 单工具多动作：通过 action 参数路由到不同查询方法
+    - 响应缓存：按 (action, 归一化参数, 图版本) 缓存格式化结果，图未变更时重复查询直接命中
 """
 import json
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
 
 from src.tools.base_tool import BaseTool
 from src.models.evidence_graph import (
@@ -26,6 +28,7 @@ from src.models.evidence_graph import (
     CivicEvidenceType,
 )
 from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import instant
 
 
 class GraphQueryTool(BaseTool):
@@ -36,6 +39,11 @@ class GraphQueryTool(BaseTool):
     Agent 可在 tool_call 中查询图的局部结构。
     """
 
+    RESPONSE_CACHE_SIZE = 256
+
+    # 顺序无关的列表参数，归一化时排序
+    _UNORDERED_LIST_ARGS = ("entity_types", "predicate_filter")
+
     def __init__(self):
         super().__init__(
             name="query_evidence_graph",
@@ -49,6 +57,8 @@ class GraphQueryTool(BaseTool):
             ),
         )
         self._graph: Optional[EvidenceGraph] = None
+        self._response_cache: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+        self._cache_stats = {"hits": 0, "misses": 0}
 
     def set_graph(self, graph: EvidenceGraph):
         """
@@ -58,8 +68,33 @@ class GraphQueryTool(BaseTool):
             graph: 当前 EvidenceGraph 实例（同一 Python 对象，
                    entity extraction 后 tool 自动看到更新）
         """
+        if graph is not self._graph:
+            # 版本号仅在同一图实例内单调，换图时清空缓存
+            self._response_cache.clear()
         self._graph = graph
 
+    def cache_stats(self) -> Dict[str, Any]:
+        """响应缓存统计: hits / misses / hit_rate / size"""
+        total = self._cache_stats["hits"] + self._cache_stats["misses"]
+        return {
+            **self._cache_stats,
+            "hit_rate": self._cache_stats["hits"] / total if total else 0.0,
+            "size": len(self._response_cache),
+        }
+
+    def _cache_key(self, action: str, kwargs: Dict[str, Any]) -> Tuple[str, str, int]:
+        """(action, 归一化参数, 图版本)；字符串去首尾空白，无序列表参数小写排序，空值忽略"""
+        normalized = {}
+        for k, v in kwargs.items():
+            if k == "action" or v is None or v == "" or v == []:
+                continue
+            if isinstance(v, str):
+                v = v.strip()
+            elif k in self._UNORDERED_LIST_ARGS and isinstance(v, list):
+                v = sorted(str(x).strip().lower() for x in v)
+            normalized[k] = v
+        return action, json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str), self._graph.version
+
     def _get_parameters_schema(self) -> Dict[str, Any]:
         return {
             "type": "object",
@@ -167,12 +202,27 @@ class GraphQueryTool(BaseTool):
         if not handler:
             return f"Unknown action: '{action}'. Valid actions: {', '.join(handlers.keys())}"
 
+        cache_key = self._cache_key(action, kwargs)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            self._response_cache.move_to_end(cache_key)
+            self._cache_stats["hits"] += 1
+            logger.debug(f"[GraphQueryTool] 缓存命中 action={action}, version={cache_key[2]}")
+            instant("graph_query", action=action)
+            return cached
+        self._cache_stats["misses"] += 1
+
         try:
-            return handler(kwargs)
+            response = handler(kwargs)
         except Exception as e:
             logger.error(f"[GraphQueryTool] {action} failed: {e}")
             return f"Error executing {action}: {str(e)}"
 
+        self._response_cache[cache_key] = response
+        while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+        return response
+
     # ==================== Action Handlers ====================
 
     def _parse_entity_types(self, kwargs: Dict) -> Optional[List[EntityType]]:
@@ -9,6 +9,7 @@
 from typing import Dict, Any, Optional, List
 from src.tools.base_tool import BaseTool
 from src.tools.api_clients.fda_client import FDAClient
+from src.tools.api_clients.circuit_breaker import ServiceUnavailableError
 from src.tools.api_clients.rxnorm_client import RxNormClient
 from src.utils.logger import mtb_logger as logger
 
@@ -79,6 +80,7 @@ class NCCNImageTool(BaseTool):
 
     基于 byaldi + ColQwen2 的视觉文档检索
     通过页面图片内容进行多模态语义匹配
+    共享全局 NCCNImageRag 实例，重复/近似查询命中其查询嵌入 LRU 缓存
     """
 
     def __init__(self):
@@ -145,32 +147,75 @@ class NCCNImageTool(BaseTool):
 
 
 class FDALabelTool(BaseTool):
-    """FDA 药品说明书查询工具"""
+    """FDA 药品说明书查询工具（可按章节返回，减少无关内容进入上下文）"""
+
+    upstreams = ("openfda",)
+
+    # 章节 → 标题（输出顺序）
+    SECTION_TITLES = {
+        "indications": "适应症",
+        "dosage": "剂量与用法",
+        "boxed_warning": "⚠️ 黑框警告",
+        "warnings": "警告与注意事项",
+        "contraindications": "禁忌症",
+        "drug_interactions": "药物相互作用",
+        "adverse_reactions": "不良反应",
+        "use_in_pregnancy": "特殊人群用药",
+        "pharmacology": "临床药理",
+    }
+    # 未指定 sections 时返回的章节
+    DEFAULT_SECTIONS = (
+        "indications", "dosage", "boxed_warning", "warnings",
+        "contraindications", "drug_interactions", "adverse_reactions",
+    )
 
     def __init__(self):
         super().__init__(
             name="search_fda_labels",
-            description="查询 FDA 药品说明书获取剂量、禁忌症、警告信息"
+            description="查询 FDA 药品说明书获取剂量、禁忌症、警告信息（可用 sections 只取需要的章节）"
         )
         self.client = FDAClient()
 
-    def _call_real_api(self, drug_name: str = "", **kwargs) -> Optional[str]:
-        """调用 openFDA API"""
+    def _unavailable_response(self) -> Optional[str]:
+        # 本地说明书索引可用时先查索引；索引未命中需回退 openFDA 时再检查熔断（见 _call_real_api）
+        from src.tools.api_clients.fda_label_index import get_fda_label_index
+        if get_fda_label_index() is not None:
+            return None
+        return super()._unavailable_response()
+
+    def _call_real_api(self, drug_name: str = "", sections: List[str] = None, **kwargs) -> Optional[str]:
+        """
+        查询说明书（本地索引优先，openFDA 兜底）
+
+        Args:
+            drug_name: 药物名称
+            sections: 需要的章节（SECTION_TITLES 的键），为空时返回 DEFAULT_SECTIONS
+        """
         if not drug_name:
             return None
 
-        label = self.client.search_drug_label(drug_name)
+        if isinstance(sections, str):
+            sections = [sections]
+        selected = [s for s in (sections or []) if s in self.SECTION_TITLES] or list(self.DEFAULT_SECTIONS)
+
+        try:
+            label = self.client.search_drug_label(drug_name, sections=selected)
+        except ServiceUnavailableError as e:
+            # 本地索引未命中且 openFDA 熔断：如实返回服务不可用，不能说成"无 FDA 说明书"
+            logger.warning(f"[Tool:{self.name}] 本地索引未命中，openFDA 熔断: {e}")
+            return super()._unavailable_response() or f"错误: {self.name} 上游服务暂不可用 - {e}"
 
         if not label:
             return self._no_results_response(drug_name)
 
-        return self._format_results(drug_name, label)
+        return self._format_results(drug_name, label, selected)
 
-    def _format_results(self, drug_name: str, label: Dict) -> str:
-        """格式化结果"""
+    def _format_results(self, drug_name: str, label: Dict, sections: List[str] = None) -> str:
+        """格式化结果（只输出请求的章节）"""
         generic_name = label.get("generic_name", drug_name)
         brand_name = label.get("brand_name", "")
         manufacturer = label.get("manufacturer", "")
+        selected = set(sections or self.DEFAULT_SECTIONS)
 
         output = [
             "**FDA 药品说明书**\n",
@@ -184,53 +229,16 @@ class FDALabelTool(BaseTool):
 
         output.append("")
 
-        # 适应症
-        indications = label.get("indications", "")
-        if indications:
-            output.append("### 适应症")
-            output.append(indications)
-            output.append("")
-
-        # 剂量
-        dosage = label.get("dosage", "")
-        if dosage:
-            output.append("### 剂量与用法")
-            output.append(dosage)
-            output.append("")
-
-        # 黑框警告
-        boxed = label.get("boxed_warning", "")
-        if boxed:
-            output.append("### ⚠️ 黑框警告")
-            output.append(boxed)
-            output.append("")
-
-        # 警告
-        warnings = label.get("warnings", "")
-        if warnings:
-            output.append("### 警告与注意事项")
-            output.append(warnings)
-            output.append("")
-
-        # 禁忌症
-        contraindications = label.get("contraindications", "")
-        if contraindications:
-            output.append("### 禁忌症")
-            output.append(contraindications)
-            output.append("")
-
-        # 药物相互作用
-        interactions = label.get("drug_interactions", "")
-        if interactions:
-            output.append("### 药物相互作用")
-            output.append(interactions)
-            output.append("")
+        for section, title in self.SECTION_TITLES.items():
+            content = label.get(section, "")
+            if section in selected and content:
+                output.append(f"### {title}")
+                output.append(content)
+                output.append("")
 
-        # 不良反应
-        adverse = label.get("adverse_reactions", "")
-        if adverse:
-            output.append("### 不良反应")
-            output.append(adverse)
+        missing = [self.SECTION_TITLES[s] for s in self.SECTION_TITLES if s in selected and not label.get(s)]
+        if missing and sections:
+            output.append(f"*说明书中无以下章节: {', '.join(missing)}*")
 
         set_id = label.get("set_id", "")
         if set_id:
@@ -263,7 +271,12 @@ class FDALabelTool(BaseTool):
         return {
             "type": "object",
             "properties": {
-                "drug_name": {"type": "string", "description": "药物名称"}
+                "drug_name": {"type": "string", "description": "药物名称"},
+                "sections": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": list(self.SECTION_TITLES)},
+                    "description": "只返回这些章节（如只核对剂量用 [\"dosage\"]）；不填返回适应症、剂量、警告、禁忌、相互作用、不良反应"
+                }
             },
             "required": ["drug_name"]
         }
@@ -276,6 +289,8 @@ class RxNormTool(BaseTool):
     提供药物代谢和相互作用信息
     """
 
+    upstreams = ("rxnorm",)
+
     def __init__(self):
         super().__init__(
             name="search_rxnorm",
@@ -318,7 +333,7 @@ class RxNormTool(BaseTool):
         fda_interactions = None
         if not interactions:
             fda_client = FDAClient()
-            label = fda_client.search_drug_label(drug_name)
+            label = fda_client.search_drug_label(drug_name, sections=["drug_interactions"])
             if label:
                 fda_interactions = label.get("drug_interactions", "")
                 logger.info(f"[RxNormTool] RxNorm 无数据，使用 FDA 说明书补充")
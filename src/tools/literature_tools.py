@@ -11,6 +11,8 @@ from src.tools.smart_pubmed import get_smart_pubmed
 class PubMedTool(BaseTool):
     """PubMed 文献搜索工具（智能搜索版）"""
 
+    upstreams = ("ncbi",)
+
     def __init__(self):
         super().__init__(
             name="search_pubmed",
@@ -6,7 +6,8 @@
 - ClinVarTool: 变异致病性分类
 - GDCTool: 突变频率统计 (NCI GDC, 基于 TCGA/ICGC 数据)
 """
-from typing import Dict, Any, Optional, List
+import re
+from typing import Dict, Any, Optional, List, Tuple
 from src.tools.base_tool import BaseTool
 from src.tools.api_clients.civic_client import CIViCClient
 from src.tools.api_clients.ncbi_client import get_ncbi_client
@@ -21,10 +22,12 @@ class CIViCTool(BaseTool):
     提供变异的临床证据等级和治疗意义
     """
 
+    upstreams = ("civic",)
+
     def __init__(self):
         super().__init__(
             name="search_civic",
-            description="查询 CIViC 数据库获取变异的证据等级和治疗建议。输入格式：基因名-变异-肿瘤类型（如 EGFR-L858R-NSCLC）"
+            description="查询 CIViC 数据库获取变异的证据等级和治疗建议。输入格式：基因名-变异-肿瘤类型（如 EGFR-L858R-NSCLC）；多个变异请用 variants 一次查询"
         )
         self.client = CIViCClient()
 
@@ -33,19 +36,48 @@ class CIViCTool(BaseTool):
         gene: str = "",
         variant: str = "",
         cancer_type: str = "",
+        variants: Optional[List[str]] = None,
         **kwargs
     ) -> Optional[str]:
-        """调用 CIViC API"""
-        if not gene:
+        """调用 CIViC API（variants 多个变异合并为一次批量查询）"""
+        pairs = self._parse_variants(variants or [], default_gene=gene)
+        if gene and (variant or not pairs):
+            pairs.insert(0, (gene, variant))
+        pairs = list(dict.fromkeys(pairs))
+        if not pairs:
             return None
 
         # 获取治疗意义
-        implications = self.client.get_therapeutic_implications(gene, variant)
-
-        if not implications:
-            return self._no_results_response(gene, variant, cancer_type)
-
-        return self._format_results(gene, variant, cancer_type, implications)
+        implications = self.client.get_therapeutic_implications_batch(pairs)
+
+        sections = []
+        for g, v in pairs:
+            if implications.get((g, v)):
+                sections.append(self._format_results(g, v, cancer_type, implications[(g, v)]))
+            else:
+                sections.append(self._no_results_response(g, v, cancer_type))
+        return "\n\n---\n\n".join(sections)
+
+    # 基因符号（大写字母开头的大写字母/数字）；排除 L858R / V600E 这类氨基酸改变
+    _GENE_SYMBOL = re.compile(r"^[A-Z][A-Z0-9]{1,9}$")
+    _PROTEIN_CHANGE = re.compile(r"^[A-Z]\d+[A-Z*]?$")
+
+    @classmethod
+    def _parse_variants(cls, variants: List[str], default_gene: str = "") -> List[Tuple[str, str]]:
+        """
+        解析 ["EGFR L858R", "KRAS-G12C", "T790M", "exon 19 deletion"]
+
+        首个词是基因符号时拆为 (基因, 变异)，否则整项作为变异、基因取 default_gene
+        """
+        pairs = []
+        for item in variants:
+            text = str(item).strip()
+            parts = [p for p in re.split(r"[\s:\-]+", text, maxsplit=1) if p]
+            if len(parts) == 2 and cls._GENE_SYMBOL.match(parts[0]) and not cls._PROTEIN_CHANGE.match(parts[0]):
+                pairs.append((parts[0], parts[1]))
+            elif text and default_gene:
+                pairs.append((default_gene, text))
+        return pairs
 
     def _format_results(
         self,
@@ -128,15 +160,22 @@ class CIViCTool(BaseTool):
             "properties": {
                 "gene": {"type": "string", "description": "基因名称，如 EGFR"},
                 "variant": {"type": "string", "description": "变异，如 L858R"},
+                "variants": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "一次查询多个变异（合并为一次请求），格式 '基因 变异'，如 [\"EGFR L858R\", \"EGFR T790M\", \"KRAS G12C\"]；只写变异时使用 gene 参数的基因"
+                },
                 "cancer_type": {"type": "string", "description": "肿瘤类型，如 NSCLC"}
             },
-            "required": ["gene"]
+            "required": []
         }
 
 
 class ClinVarTool(BaseTool):
     """ClinVar 数据库查询工具"""
 
+    upstreams = ("ncbi",)
+
     def __init__(self):
         super().__init__(
             name="search_clinvar",
@@ -226,6 +265,8 @@ class GDCTool(BaseTool):
     基于 TCGA/ICGC 数据提供突变频率和癌症基因组数据
     """
 
+    upstreams = ("gdc",)
+
     def __init__(self):
         super().__init__(
             name="search_gdc",
@@ -5,7 +5,12 @@ NCCN 指南 RAG (Retrieval Augmented Generation) 模块
 - NCCNRag: 文本 RAG (ChromaDB + DashScope Embedding)
 - NCCNImageRag: 多模态图片 RAG (byaldi + ColQwen2)
 """
-from src.tools.rag.nccn_rag import NCCNRag
-from src.tools.rag.nccn_image_rag import NCCNImageRag
+from src.utils.lazy_import import lazy_exports
+
+# 按需导入：使用 PageIndex 时不加载多模态 RAG 的 numpy / byaldi 依赖
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "NCCNRag": "src.tools.rag.nccn_rag",
+    "NCCNImageRag": "src.tools.rag.nccn_image_rag",
+})
 
 __all__ = ["NCCNRag", "NCCNImageRag"]
@@ -8,6 +8,7 @@ NCCN 多模态图片索引构建脚本
     python -m src.tools.rag.build_image_index
     python -m src.tools.rag.build_image_index --pdf "path/to/custom.pdf"
     python -m src.tools.rag.build_image_index --rebuild
+    python -m src.tools.rag.build_image_index --export-mmap --dtype int8
 """
 import argparse
 import time
@@ -36,8 +37,20 @@ def main():
     parser.add_argument(
         "--device",
         type=str,
-        default="cuda",
-        help="推理设备 (默认: cuda)"
+        default="auto",
+        help="推理设备 (默认: auto，有 GPU 用 cuda)"
+    )
+    parser.add_argument(
+        "--export-mmap",
+        action="store_true",
+        help="导出页面多向量为 mmap 存储（CPU 检索路径）；索引已存在时只做导出"
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        choices=["float16", "int8"],
+        default=None,
+        help="mmap 存储精度 (默认: NCCN_IMAGE_STORE_DTYPE)"
     )
     args = parser.parse_args()
 
@@ -57,8 +70,13 @@ def main():
     # 检查索引是否已存在
     index_path = NCCN_IMAGE_VECTOR_DIR / args.index_name
     if index_path.exists() and not args.rebuild:
+        if args.export_mmap:
+            rag = NCCNImageRag(index_root=str(NCCN_IMAGE_VECTOR_DIR), model_name=COLPALI_MODEL)
+            store_dir = rag.export_mmap_store(args.index_name, dtype=args.dtype)
+            print(f"mmap 存储已导出: {store_dir}")
+            return
         print(f"索引已存在: {index_path}")
-        print("使用 --rebuild 参数强制重建")
+        print("使用 --rebuild 参数强制重建，或 --export-mmap 仅导出 mmap 存储")
         return
 
     print("=" * 60)
@@ -91,6 +109,10 @@ def main():
         print(f"\n错误: 索引构建失败 - {e}")
         raise
 
+    if args.export_mmap:
+        store_dir = rag.export_mmap_store(args.index_name, dtype=args.dtype)
+        print(f"mmap 存储已导出: {store_dir}")
+
     elapsed = time.time() - start_time
 
     # 打印统计
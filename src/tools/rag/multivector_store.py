@@ -0,0 +1,455 @@
+"""
+ColQwen 多向量页面存储（CPU 推理路径）
+
+将 byaldi 索引中的页面多向量嵌入导出为内存映射的 NumPy 存储，
+在 CPU 上完成向量化、分块的 MaxSim 晚交互检索：
+- float16 或 int8（逐 token 对称量化 + float32 scale）两种存储精度
+- np.load(mmap_mode="r") 冷启动，只在检索时按块读入页面 token
+- 查询编码器（ColQwen2）延迟加载一次，所有线程共享
+- 多查询批量检索：一次前向编码，一次矩阵乘对所有页面打分
+- 查询嵌入 LRU 缓存（按归一化文本）
+
+存储目录结构:
+    <store_dir>/
+        manifest.json     # dtype, dim, 页面数, token 数, 模型名
+        pages.json        # [{"doc_id": int, "page_num": int}]，与 offsets 顺序一致
+        embeddings.npy    # (total_tokens, dim) float16 / int8
+        scales.npy        # (total_tokens,) float32，仅 int8
+        offsets.npy       # (num_pages + 1,) int64，页面 token 区间
+"""
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.utils.logger import mtb_logger as logger
+
+STORE_DIRNAME = "mmap_store"
+SUPPORTED_DTYPES = ("float16", "int8")
+DEFAULT_BLOCK_TOKENS = 65536
+
+
+class MultiVectorStore:
+    """内存映射的页面多向量存储 + 分块 MaxSim"""
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        offsets: np.ndarray,
+        pages: List[Dict[str, int]],
+        scales: Optional[np.ndarray] = None,
+        manifest: Optional[Dict[str, Any]] = None,
+        block_tokens: int = DEFAULT_BLOCK_TOKENS,
+    ):
+        """
+        Args:
+            embeddings: (total_tokens, dim) 页面 token 嵌入（通常为 memmap）
+            offsets: (num_pages + 1,) 每页 token 起止位置
+            pages: 页面元数据 [{doc_id, page_num}]
+            scales: int8 存储的逐 token 反量化系数
+            manifest: 存储元数据
+            block_tokens: 每块参与矩阵乘的最大 token 数（控制峰值内存）
+        """
+        self.embeddings = embeddings
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.pages = pages
+        self.scales = scales
+        self.manifest = manifest or {}
+        self.block_tokens = max(1, int(block_tokens))
+        self._page_blocks = self._plan_blocks()
+
+    @property
+    def num_pages(self) -> int:
+        return len(self.pages)
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    # ==================== 导出 / 加载 ====================
+
+    @classmethod
+    def write(
+        cls,
+        store_dir: Path,
+        page_embeddings: Sequence[np.ndarray],
+        pages: List[Dict[str, int]],
+        dtype: str = "float16",
+        model_name: str = "",
+    ) -> Path:
+        """
+        将逐页多向量嵌入写入磁盘存储
+
+        Args:
+            store_dir: 输出目录
+            page_embeddings: 每页一个 (n_tokens, dim) 数组
+            pages: 与 page_embeddings 对齐的页面元数据
+            dtype: "float16" 或 "int8"
+            model_name: 生成嵌入的模型名称（写入 manifest）
+
+        Returns:
+            存储目录
+        """
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的存储精度: {dtype}，可选: {SUPPORTED_DTYPES}")
+        if len(page_embeddings) != len(pages):
+            raise ValueError(
+                f"页面嵌入数 ({len(page_embeddings)}) 与页面元数据数 ({len(pages)}) 不一致"
+            )
+        if not page_embeddings:
+            raise ValueError("没有可导出的页面嵌入")
+
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+        dim = int(page_embeddings[0].shape[1])
+        lengths = [int(e.shape[0]) for e in page_embeddings]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        total_tokens = int(offsets[-1])
+
+        # 逐页写入 memmap，避免一次性拼接整个索引
+        out = np.lib.format.open_memmap(
+            str(store_dir / "embeddings.npy"), mode="w+",
+            dtype=np.int8 if dtype == "int8" else np.float16,
+            shape=(total_tokens, dim),
+        )
+        scales = np.ones(total_tokens, dtype=np.float32) if dtype == "int8" else None
+
+        for i, emb in enumerate(page_embeddings):
+            emb = np.asarray(emb, dtype=np.float32)
+            if emb.ndim != 2 or emb.shape[1] != dim:
+                raise ValueError(f"第 {i} 页嵌入维度异常: {emb.shape}")
+            start, end = offsets[i], offsets[i + 1]
+            if dtype == "int8":
+                q, s = quantize_int8(emb)
+                out[start:end] = q
+                scales[start:end] = s
+            else:
+                out[start:end] = emb.astype(np.float16)
+        out.flush()
+        del out
+
+        np.save(store_dir / "offsets.npy", offsets)
+        if scales is not None:
+            np.save(store_dir / "scales.npy", scales)
+
+        with open(store_dir / "pages.json", "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False)
+
+        manifest = {
+            "dtype": dtype,
+            "dim": dim,
+            "num_pages": len(pages),
+            "total_tokens": total_tokens,
+            "model_name": model_name,
+        }
+        with open(store_dir / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        logger.info(
+            f"[MultiVectorStore] 导出完成: {store_dir} "
+            f"({len(pages)} 页, {total_tokens} tokens, dtype={dtype})"
+        )
+        return store_dir
+
+    @classmethod
+    def load(cls, store_dir: Path, block_tokens: int = DEFAULT_BLOCK_TOKENS) -> "MultiVectorStore":
+        """
+        以内存映射方式加载存储（不读入嵌入数据本身）
+
+        Args:
+            store_dir: 存储目录
+            block_tokens: MaxSim 分块大小
+
+        Returns:
+            MultiVectorStore 实例
+        """
+        store_dir = Path(store_dir)
+        manifest_path = store_dir / "manifest.json"
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"多向量存储不存在: {store_dir}")
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(store_dir / "pages.json", "r", encoding="utf-8") as f:
+            pages = json.load(f)
+
+        embeddings = np.load(store_dir / "embeddings.npy", mmap_mode="r")
+        offsets = np.load(store_dir / "offsets.npy")
+        scales = None
+        if manifest.get("dtype") == "int8":
+            scales = np.load(store_dir / "scales.npy", mmap_mode="r")
+
+        logger.info(
+            f"[MultiVectorStore] 加载存储: {store_dir} "
+            f"({manifest.get('num_pages')} 页, dtype={manifest.get('dtype')})"
+        )
+        return cls(embeddings, offsets, pages, scales=scales,
+                   manifest=manifest, block_tokens=block_tokens)
+
+    @staticmethod
+    def exists(store_dir: Path) -> bool:
+        return (Path(store_dir) / "manifest.json").exists()
+
+    # ==================== MaxSim 检索 ====================
+
+    def _plan_blocks(self) -> List[tuple]:
+        """
+        按 token 预算把页面划分为连续块 [(page_start, page_end)]
+
+        单页 token 数超过预算时独占一块。
+        """
+        blocks = []
+        page_start = 0
+        n = len(self.offsets) - 1
+        while page_start < n:
+            page_end = page_start + 1
+            limit = self.offsets[page_start] + self.block_tokens
+            while page_end < n and self.offsets[page_end + 1] <= limit:
+                page_end += 1
+            blocks.append((page_start, page_end))
+            page_start = page_end
+        return blocks
+
+    def maxsim(self, query_embedding: np.ndarray) -> np.ndarray:
+        """
+        计算单个查询对所有页面的 MaxSim 分数
+
+        score(page) = Σ_q max_t <q, t>
+
+        Args:
+            query_embedding: (n_query_tokens, dim) 查询多向量嵌入
+
+        Returns:
+            (num_pages,) float32 分数
+        """
+        return self.maxsim_batch([query_embedding])[0]
+
+    def maxsim_batch(self, query_embeddings: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        批量计算多个查询对所有页面的 MaxSim 分数
+
+        所有查询 token 拼接成一个矩阵，每个页面块只做一次矩阵乘，
+        再分别按页（token 维度 max）和按查询（query token 维度 sum）归约。
+
+        Args:
+            query_embeddings: 每个查询一个 (n_query_tokens, dim) 数组
+
+        Returns:
+            (n_queries, num_pages) float32 分数
+        """
+        if not query_embeddings:
+            return np.empty((0, self.num_pages), dtype=np.float32)
+
+        queries = [np.asarray(q, dtype=np.float32) for q in query_embeddings]
+        for q in queries:
+            if q.ndim != 2 or q.shape[1] != self.dim:
+                raise ValueError(f"查询维度 {q.shape} 与存储维度 {self.dim} 不一致")
+        q_lengths = np.array([len(q) for q in queries], dtype=np.int64)
+        if np.any(q_lengths == 0):
+            raise ValueError("查询嵌入不能为空")
+        q_offsets = np.concatenate(([0], np.cumsum(q_lengths)[:-1]))
+        query = np.ascontiguousarray(np.concatenate(queries, axis=0).T)
+
+        scores = np.full((len(queries), self.num_pages), -np.inf, dtype=np.float32)
+        for page_start, page_end in self._page_blocks:
+            tok_start = int(self.offsets[page_start])
+            tok_end = int(self.offsets[page_end])
+            if tok_end == tok_start:
+                continue
+
+            block = np.asarray(self.embeddings[tok_start:tok_end], dtype=np.float32)
+            sims = block @ query  # (block_tokens, total_query_tokens)
+            if self.scales is not None:
+                sims *= np.asarray(self.scales[tok_start:tok_end])[:, None]
+
+            # 跳过空页，按页做 token 维度的 max（reduceat 要求区间非空）
+            local = self.offsets[page_start:page_end] - tok_start
+            lengths = np.diff(self.offsets[page_start:page_end + 1])
+            nonempty = lengths > 0
+            page_max = np.maximum.reduceat(sims, local[nonempty], axis=0)
+            per_query = np.add.reduceat(page_max, q_offsets, axis=1)  # (pages, n_queries)
+            scores[:, page_start:page_end][:, nonempty] = per_query.T
+        return scores
+
+    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        检索 top-k 页面
+
+        Returns:
+            [{doc_id, page_num, score, metadata}]，按分数降序
+        """
+        scores = self.maxsim(query_embedding)
+        return self._top_k(scores, k)
+
+    def search_batch(self, query_embeddings: Sequence[np.ndarray], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """批量检索，返回与输入顺序一致的 top-k 结果列表"""
+        scores = self.maxsim_batch(query_embeddings)
+        return [self._top_k(row, k) for row in scores]
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        k = min(k, self.num_pages)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {
+                "doc_id": int(self.pages[i]["doc_id"]),
+                "page_num": int(self.pages[i]["page_num"]),
+                "score": float(scores[i]),
+                "metadata": {},
+            }
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+
+def quantize_int8(emb: np.ndarray) -> tuple:
+    """
+    逐 token 对称 int8 量化
+
+    Returns:
+        (int8 数组, float32 scale)，反量化为 q * scale[:, None]
+    """
+    max_abs = np.abs(emb).max(axis=1)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    q = np.clip(np.rint(emb / scale[:, None]), -127, 127).astype(np.int8)
+    return q, scale
+
+
+# ==================== 查询编码器（延迟加载，线程共享）====================
+
+class ColQwenQueryEncoder:
+    """
+    ColQwen2 查询编码器
+
+    只加载模型和 processor，不加载 byaldi 索引；
+    首次 encode 时加载，之后所有线程共享同一实例。
+    """
+
+    def __init__(self, model_name: str, device: str = "cpu"):
+        self.model_name = model_name
+        self.device = device
+        self._model = None
+        self._processor = None
+        self._load_lock = threading.Lock()
+        # torch CPU 推理自身已多线程并行，串行化 forward 避免线程过度订阅
+        self._infer_lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            import torch
+            from colpali_engine.models import ColQwen2, ColQwen2Processor
+
+            device = self.device
+            if device == "auto":
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+            dtype = torch.bfloat16 if device.startswith("cuda") else torch.float32
+
+            logger.info(f"[ImageRAG] 加载查询编码器: {self.model_name} (device={device})")
+            model = ColQwen2.from_pretrained(
+                self.model_name, torch_dtype=dtype, device_map=device
+            ).eval()
+            self._processor = ColQwen2Processor.from_pretrained(self.model_name)
+            self.device = device
+            self._model = model
+
+    def encode(self, query: str) -> np.ndarray:
+        """
+        编码单个查询
+
+        Returns:
+            (n_query_tokens, dim) float32
+        """
+        return self.encode_batch([query])[0]
+
+    def encode_batch(self, queries: List[str]) -> List[np.ndarray]:
+        """
+        一次前向传播编码多个查询（padding token 按 attention_mask 去除）
+
+        Returns:
+            每个查询一个 (n_query_tokens, dim) float32 数组
+        """
+        if not queries:
+            return []
+        self._ensure_loaded()
+        import torch
+
+        with self._infer_lock, torch.inference_mode():
+            batch = self._processor.process_queries(list(queries)).to(self.device)
+            emb = self._model(**batch)
+            masks = batch["attention_mask"].bool()
+            return [emb[i][masks[i]].float().cpu().numpy() for i in range(len(queries))]
+
+
+def normalize_query(query: str) -> str:
+    """查询缓存键：去首尾空白、合并空白、小写"""
+    return re.sub(r"\s+", " ", query.strip()).lower()
+
+
+class QueryEmbeddingCache:
+    """线程安全的查询嵌入 LRU 缓存（键为归一化查询文本）"""
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = normalize_query(query)
+        with self._lock:
+            emb = self._data.get(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return emb
+
+    def put(self, query: str, embedding: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        key = normalize_query(query)
+        with self._lock:
+            self._data[key] = embedding
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_encoders: Dict[tuple, ColQwenQueryEncoder] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_query_encoder(model_name: str, device: str = "cpu") -> ColQwenQueryEncoder:
+    """获取进程内共享的查询编码器（按模型名和设备复用）"""
+    key = (model_name, device)
+    with _encoders_lock:
+        if key not in _encoders:
+            _encoders[key] = ColQwenQueryEncoder(model_name, device)
+        return _encoders[key]
@@ -4,37 +4,70 @@ NCCN 多模态图片 RAG
 基于 byaldi + ColQwen2.5 的多模态文档检索
 PDF 每页转为图片，生成多向量嵌入，MaxSim 晚交互检索
 检索后由多模态 LLM（Gemini）读取页面图片，生成结构化分析
+
+两种检索后端:
+- mmap: 索引目录下存在 mmap_store/ 时，使用内存映射 NumPy 存储 + CPU 分块 MaxSim
+- byaldi: 回退到 byaldi 内存索引
 """
 import base64
 import gzip
+import importlib.util
 import json
 import requests
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 from src.utils.logger import mtb_logger as logger
-
-try:
-    from byaldi import RAGMultiModalModel
-    HAS_BYALDI = True
-except (ImportError, RuntimeError) as e:
-    HAS_BYALDI = False
-    if "flash_attn" in str(e):
-        logger.warning(f"[ImageRAG] flash_attn 组件导入失败 (可能与 Torch 版本不兼容)，已禁用多模态 RAG。错误: {e}")
-    else:
-        logger.warning(f"[ImageRAG] byaldi 未安装或导入失败 ({e})，请运行: pip install byaldi colpali-engine --no-deps")
-
-try:
-    import fitz  # PyMuPDF
-    HAS_PYMUPDF = True
-except ImportError:
-    HAS_PYMUPDF = False
-    logger.warning("[ImageRAG] PyMuPDF 未安装，多模态读图功能不可用。请运行: pip install PyMuPDF")
-
-try:
-    from transformers.utils.import_utils import is_flash_attn_2_available
-    HAS_FLASH_ATTN = is_flash_attn_2_available()
-except ImportError:
-    HAS_FLASH_ATTN = False
+from src.tools.rag.multivector_store import (
+    MultiVectorStore,
+    QueryEmbeddingCache,
+    STORE_DIRNAME,
+    get_query_encoder,
+    normalize_query,
+)
+
+_INSTALL_BYALDI = "pip install byaldi colpali-engine --no-deps"
+
+# byaldi 会连带导入 torch / transformers（数秒），推迟到首次建立 / 加载 byaldi 索引时
+_byaldi_model_cls = None
+_byaldi_error: Optional[str] = None
+_pymupdf_checked: Optional[bool] = None
+
+
+def _require_byaldi(message: str):
+    """返回 RAGMultiModalModel 类；byaldi 不可用时抛出 ImportError(message)（导入失败原因只记录一次）"""
+    global _byaldi_model_cls, _byaldi_error
+    if _byaldi_model_cls is None and _byaldi_error is None:
+        try:
+            from byaldi import RAGMultiModalModel
+            _byaldi_model_cls = RAGMultiModalModel
+        except (ImportError, RuntimeError) as e:
+            _byaldi_error = str(e)
+            if "flash_attn" in _byaldi_error:
+                logger.warning(f"[ImageRAG] flash_attn 组件导入失败 (可能与 Torch 版本不兼容)，已禁用多模态 RAG。错误: {e}")
+            else:
+                logger.warning(f"[ImageRAG] byaldi 未安装或导入失败 ({e})，请运行: {_INSTALL_BYALDI}")
+    if _byaldi_model_cls is None:
+        raise ImportError(message)
+    return _byaldi_model_cls
+
+
+def _flash_attn_available() -> bool:
+    """byaldi 导入后 transformers 已加载，此时查询不再有额外开销"""
+    try:
+        from transformers.utils.import_utils import is_flash_attn_2_available
+    except ImportError:
+        return False
+    return is_flash_attn_2_available()
+
+
+def _has_pymupdf() -> bool:
+    """只查找不导入 PyMuPDF，真正渲染页面时才导入"""
+    global _pymupdf_checked
+    if _pymupdf_checked is None:
+        _pymupdf_checked = importlib.util.find_spec("fitz") is not None
+        if not _pymupdf_checked:
+            logger.warning("[ImageRAG] PyMuPDF 未安装，多模态读图功能不可用。请运行: pip install PyMuPDF")
+    return _pymupdf_checked
 
 
 class NCCNImageRag:
@@ -49,7 +82,7 @@ class NCCNImageRag:
         self,
         index_root: str = None,
         model_name: str = None,
-        device: str = "cuda",
+        device: str = None,
         enable_multimodal_reading: bool = True
     ):
         """
@@ -58,11 +91,13 @@ class NCCNImageRag:
         Args:
             index_root: 索引存储根目录
             model_name: ColPali/ColQwen 模型名称
-            device: 推理设备 ("cuda" 或 "cpu")
+            device: 推理设备 ("auto" / "cuda" / "cpu"，默认 NCCN_IMAGE_DEVICE)
             enable_multimodal_reading: 是否启用多模态 LLM 读图（False 则仅返回页码）
         """
         from config.settings import (
-            NCCN_IMAGE_VECTOR_DIR, COLPALI_MODEL,
+            NCCN_IMAGE_VECTOR_DIR, COLPALI_MODEL, NCCN_IMAGE_DEVICE,
+            NCCN_IMAGE_USE_MMAP_STORE, NCCN_IMAGE_MAXSIM_BLOCK_TOKENS,
+            NCCN_IMAGE_QUERY_CACHE_SIZE,
             NCCN_IMAGE_READER_MODEL, NCCN_IMAGE_READER_TEMPERATURE,
             NCCN_IMAGE_READER_TIMEOUT, NCCN_IMAGE_RENDER_SCALE,
             NCCN_IMAGE_SCORE_THRESHOLD,
@@ -72,10 +107,17 @@ class NCCNImageRag:
 
         self.index_root = Path(index_root) if index_root else NCCN_IMAGE_VECTOR_DIR
         self.model_name = model_name or COLPALI_MODEL
-        self.device = device
+        self.device = device or NCCN_IMAGE_DEVICE
         self.model = None
         self._initialized = False
 
+        # mmap 多向量存储（CPU 检索路径）
+        self.use_mmap_store = NCCN_IMAGE_USE_MMAP_STORE
+        self.maxsim_block_tokens = NCCN_IMAGE_MAXSIM_BLOCK_TOKENS
+        self.store: Optional[MultiVectorStore] = None
+        # 查询嵌入 LRU 缓存（与模型绑定，切换索引不失效）
+        self.query_cache = QueryEmbeddingCache(NCCN_IMAGE_QUERY_CACHE_SIZE)
+
         # 多模态读图配置
         self.enable_multimodal_reading = enable_multimodal_reading
         self.reader_model = NCCN_IMAGE_READER_MODEL
@@ -111,8 +153,8 @@ class NCCNImageRag:
             index_name: 索引名称
             overwrite: 是否覆盖已有索引
         """
-        if not HAS_BYALDI:
-            raise ImportError("byaldi 未安装或不可用，请检查日志中的导入错误或运行: pip install byaldi colpali-engine --no-deps")
+        RAGMultiModalModel = _require_byaldi(
+            f"byaldi 未安装或不可用，请检查日志中的导入错误或运行: {_INSTALL_BYALDI}")
 
         index_name = index_name or self._default_index_name()
         pdf_path = Path(pdf_path)
@@ -123,15 +165,16 @@ class NCCNImageRag:
         # 确保索引目录存在
         self.index_root.mkdir(parents=True, exist_ok=True)
 
-        attn_impl = "flash_attention_2" if HAS_FLASH_ATTN else "sdpa"
+        device = self._resolve_device()
+        attn_impl = "flash_attention_2" if _flash_attn_available() else "sdpa"
         logger.info(
             f"[ImageRAG] 加载模型: {self.model_name} "
-            f"(device={self.device}, attn={attn_impl})"
+            f"(device={device}, attn={attn_impl})"
         )
         self.model = RAGMultiModalModel.from_pretrained(
             self.model_name,
             index_root=str(self.index_root),
-            device=self.device
+            device=device
         )
 
         logger.info(f"[ImageRAG] 开始构建索引: {pdf_path.name}")
@@ -144,19 +187,35 @@ class NCCNImageRag:
             overwrite=overwrite
         )
 
+        self.store = None
         self._initialized = True
+        self._current_index = index_name
+        self._doc_id_to_pdf = {}
         logger.info(f"[ImageRAG] 索引构建完成: {index_name}")
 
+    def _resolve_device(self) -> str:
+        """解析 "auto" 设备（延迟导入 torch）"""
+        if self.device != "auto":
+            return self.device
+        try:
+            import torch
+            return "cuda" if torch.cuda.is_available() else "cpu"
+        except ImportError:
+            return "cpu"
+
+    def _store_dir(self, index_name: str) -> Path:
+        return self.index_root / index_name / STORE_DIRNAME
+
     def load_index(self, index_name: str = None) -> None:
         """
         从磁盘加载已有索引
 
+        优先加载 mmap 多向量存储（无需 byaldi、不占用整份索引内存），
+        不存在时回退到 byaldi 索引。
+
         Args:
             index_name: 索引名称
         """
-        if not HAS_BYALDI:
-            raise ImportError("byaldi 未安装或不可用，请检查日志中的导入错误或运行: pip install byaldi colpali-engine --no-deps")
-
         index_name = index_name or self._default_index_name()
         index_path = self.index_root / index_name
 
@@ -166,12 +225,26 @@ class NCCNImageRag:
                 f"请先运行: python -m src.tools.rag.build_image_index"
             )
 
-        attn_impl = "flash_attention_2" if HAS_FLASH_ATTN else "sdpa"
+        store_dir = self._store_dir(index_name)
+        if self.use_mmap_store and MultiVectorStore.exists(store_dir):
+            self.store = MultiVectorStore.load(store_dir, block_tokens=self.maxsim_block_tokens)
+            self.model = None
+            self._initialized = True
+            self._current_index = index_name
+            self._doc_id_to_pdf = {}
+            logger.info(f"[ImageRAG] 索引加载完成 (mmap): {index_name}")
+            return
+
+        RAGMultiModalModel = _require_byaldi(
+            f"byaldi 未安装或不可用，请检查日志中的导入错误或运行: {_INSTALL_BYALDI}")
+
+        attn_impl = "flash_attention_2" if _flash_attn_available() else "sdpa"
         logger.info(f"[ImageRAG] 加载索引: {index_path} (attn={attn_impl})")
         self.model = RAGMultiModalModel.from_index(
             index_name,
             index_root=str(self.index_root)
         )
+        self.store = None
         self._initialized = True
         self._current_index = index_name
         self._doc_id_to_pdf = {}  # 清空旧映射缓存
@@ -193,6 +266,44 @@ class NCCNImageRag:
             return
         self.load_index(index_name)
 
+    def export_mmap_store(self, index_name: str = None, dtype: str = None) -> Path:
+        """
+        将 byaldi 索引中的页面多向量导出为 mmap 存储
+
+        导出后 load_index 会优先使用 mmap 存储（CPU 检索路径）。
+
+        Args:
+            index_name: 索引名称
+            dtype: "float16" 或 "int8"（默认 NCCN_IMAGE_STORE_DTYPE）
+
+        Returns:
+            存储目录
+        """
+        from config.settings import NCCN_IMAGE_STORE_DTYPE
+
+        RAGMultiModalModel = _require_byaldi(f"导出 mmap 存储需要 byaldi 读取原始索引: {_INSTALL_BYALDI}")
+
+        index_name = index_name or self._current_index or self._default_index_name()
+        if self.model is None or self._current_index != index_name:
+            self.model = RAGMultiModalModel.from_index(index_name, index_root=str(self.index_root))
+            self._current_index = index_name
+
+        colpali = self.model.model
+        page_embeddings = []
+        pages = []
+        for embed_id, emb in enumerate(colpali.indexed_embeddings):
+            meta = colpali.embed_id_to_doc_id[embed_id]
+            page_embeddings.append(emb.float().cpu().numpy())
+            pages.append({"doc_id": int(meta["doc_id"]), "page_num": int(meta["page_id"])})
+
+        return MultiVectorStore.write(
+            self._store_dir(index_name),
+            page_embeddings,
+            pages,
+            dtype=dtype or NCCN_IMAGE_STORE_DTYPE,
+            model_name=self.model_name,
+        )
+
     def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         MaxSim 检索
@@ -204,24 +315,73 @@ class NCCNImageRag:
         Returns:
             结果列表 [{doc_id, page_num, score, metadata}]
         """
-        if not self._initialized:
-            self.load_index()
+        return self.search_batch([query], top_k)[0]
 
-        logger.debug(f"[ImageRAG] 检索: {query[:50]}...")
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        批量 MaxSim 检索
 
-        results = self.model.search(query, k=top_k)
+        mmap 后端：未命中缓存的查询在一次前向传播中编码，
+        所有查询在一次矩阵运算中对页面存储打分。
+        byaldi 后端：直接把查询列表交给 byaldi（无嵌入缓存）。
 
-        formatted = []
-        for r in results:
-            formatted.append({
-                "doc_id": r.doc_id,
-                "page_num": r.page_num,
-                "score": r.score,
-                "metadata": r.metadata if hasattr(r, "metadata") else {}
-            })
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数
 
-        logger.debug(f"[ImageRAG] 返回 {len(formatted)} 个结果")
-        return formatted
+        Returns:
+            与 queries 顺序一致的结果列表
+        """
+        if not queries:
+            return []
+        if not self._initialized:
+            self.load_index()
+
+        logger.debug(f"[ImageRAG] 批量检索: {len(queries)} 个查询")
+
+        if self.store is not None:
+            embeddings = self._encode_queries(queries)
+            batch_results = self.store.search_batch(embeddings, k=top_k)
+            logger.debug(f"[ImageRAG] 返回 {[len(r) for r in batch_results]} 个结果 (mmap)")
+            return batch_results
+
+        raw = self.model.search(queries if len(queries) > 1 else queries[0], k=top_k)
+        if len(queries) == 1:
+            raw = [raw]
+
+        batch_results = []
+        for results in raw:
+            formatted = []
+            for r in results:
+                formatted.append({
+                    "doc_id": r.doc_id,
+                    "page_num": r.page_num,
+                    "score": r.score,
+                    "metadata": r.metadata if hasattr(r, "metadata") else {}
+                })
+            batch_results.append(formatted)
+
+        logger.debug(f"[ImageRAG] 返回 {[len(r) for r in batch_results]} 个结果")
+        return batch_results
+
+    def _encode_queries(self, queries: List[str]):
+        """编码查询（先查 LRU 缓存，未命中的去重后一次前向传播）"""
+        embeddings = [self.query_cache.get(q) for q in queries]
+        missing: Dict[str, str] = {}  # 归一化键 -> 首个原始查询
+        for q, emb in zip(queries, embeddings):
+            if emb is None:
+                missing.setdefault(normalize_query(q), q)
+        if missing:
+            encoder = get_query_encoder(self.model_name, self.device)
+            encoded = dict(zip(missing, encoder.encode_batch(list(missing.values()))))
+            for key, emb in encoded.items():
+                self.query_cache.put(missing[key], emb)
+            embeddings = [
+                emb if emb is not None else encoded[normalize_query(q)]
+                for q, emb in zip(queries, embeddings)
+            ]
+            logger.debug(f"[ImageRAG] 查询编码: {len(missing)}/{len(queries)} 个未命中缓存")
+        return embeddings
 
     def query(self, question: str, top_k: int = 5) -> str:
         """
@@ -263,7 +423,7 @@ class NCCNImageRag:
         results = filtered
 
         # 多模态读图
-        if self.enable_multimodal_reading and HAS_PYMUPDF:
+        if self.enable_multimodal_reading and _has_pymupdf():
             llm_analysis = self._multimodal_read(question, results)
             if llm_analysis:
                 return self._format_multimodal_results(question, results, llm_analysis)
@@ -293,7 +453,7 @@ class NCCNImageRag:
         if not self._initialized:
             self.load_index()
 
-        if not HAS_PYMUPDF:
+        if not _has_pymupdf():
             logger.error("[ImageRAG] PyMuPDF 未安装，无法提取页面图片")
             return {"text": "错误: PyMuPDF 未安装，无法提取 NCCN 指南页面图片", "images": []}
 
@@ -471,6 +631,8 @@ class NCCNImageRag:
         Returns:
             [{"page_num": int, "base64": str}]
         """
+        import fitz  # PyMuPDF
+
         images = []
         try:
             doc = fitz.open(str(pdf_path))
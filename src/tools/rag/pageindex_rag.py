@@ -9,22 +9,21 @@ Tree Search + Expert Preference 实现结构化章节检索。
 import json
 import re
 import copy
+import threading
 import time
 import requests
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-import tiktoken
-import PyPDF2
-
 from config.settings import (
     OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
     NCCN_PAGEINDEX_DIR,
     NCCN_PAGEINDEX_TREE_SEARCH_MODEL,
-    NCCN_PAGEINDEX_REASONING_EFFORT,
-    AGENT_TIMEOUT,
 )
 from src.utils.logger import mtb_logger as logger
+from src.utils.llm_budget import CallBudget, get_budget, run_with_budget
+from src.utils.llm_hedging import hedged_call
 
 
 # ============================================================
@@ -33,6 +32,10 @@ from src.utils.logger import mtb_logger as logger
 
 def get_page_tokens(pdf_path, model="gpt-4o-2024-11-20"):
     """PDF 页面文本提取 + token 计数"""
+    # 仅在加载索引时调用，推迟导入以免拖慢工作流启动
+    import tiktoken
+    import PyPDF2
+
     try:
         enc = tiktoken.encoding_for_model(model)
     except KeyError:
@@ -139,12 +142,17 @@ class PageIndexRAG:
 
     def __init__(self):
         self._indices: Dict[str, Dict[str, Any]] = {}
+        self._load_lock = threading.Lock()
 
     def _load_index(self, cancer_type: str):
-        """延迟加载指定癌种的 tree structure + PDF"""
+        """延迟加载指定癌种的 tree structure + PDF（并发病例只加载一次）"""
         if cancer_type in self._indices:
             return
+        with self._load_lock:
+            if cancer_type not in self._indices:
+                self._load_index_locked(cancer_type)
 
+    def _load_index_locked(self, cancer_type: str):
         cancer_dir = NCCN_PAGEINDEX_DIR / cancer_type
         structure_path = cancer_dir / "structure.json"
         pdf_path = cancer_dir / "guideline.pdf"
@@ -225,25 +233,29 @@ Directly return the final JSON structure. Do not output anything else."""
             "messages": [{"role": "user", "content": prompt}],
             "temperature": 0,
         }
-        if NCCN_PAGEINDEX_REASONING_EFFORT:
-            payload["reasoning"] = {"effort": NCCN_PAGEINDEX_REASONING_EFFORT}
 
+        def send(budget: CallBudget) -> Dict[str, Any]:
+            response = requests.post(
+                url=OPENROUTER_BASE_URL,
+                headers=headers,
+                data=json.dumps(budget.apply(dict(payload)), ensure_ascii=False),
+                timeout=budget.timeout,
+            )
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
+
+            result = response.json()
+            if "error" in result:
+                raise Exception(f"API error: {result['error']}")
+            return result
+
+        budget = get_budget("pageindex_tree_search")
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = requests.post(
-                    url="https://openrouter.ai/api/v1/chat/completions",
-                    headers=headers,
-                    data=json.dumps(payload, ensure_ascii=False),
-                    timeout=AGENT_TIMEOUT,
+                result = run_with_budget(
+                    budget, lambda b: hedged_call(b.site, NCCN_PAGEINDEX_TREE_SEARCH_MODEL, lambda: send(b))
                 )
-                if response.status_code != 200:
-                    raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
-
-                result = response.json()
-                if "error" in result:
-                    raise Exception(f"API error: {result['error']}")
-
                 content = result["choices"][0]["message"]["content"]
 
                 # 解析 JSON（处理可能的 markdown 包裹）
@@ -333,11 +345,14 @@ Directly return the final JSON structure. Do not output anything else."""
 # ============================================================
 
 _instance: Optional[PageIndexRAG] = None
+_instance_lock = threading.Lock()
 
 
 def get_pageindex_rag() -> PageIndexRAG:
     """获取 PageIndexRAG 单例"""
     global _instance
     if _instance is None:
-        _instance = PageIndexRAG()
+        with _instance_lock:
+            if _instance is None:
+                _instance = PageIndexRAG()
     return _instance
@@ -9,14 +9,6 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 from src.utils.logger import mtb_logger as logger
 
-# 尝试导入 PyMuPDF
-try:
-    import fitz  # PyMuPDF
-    HAS_PYMUPDF = True
-except ImportError:
-    HAS_PYMUPDF = False
-    logger.warning("[PDF] PyMuPDF 未安装，请运行: pip install PyMuPDF")
-
 
 class NCCNPdfProcessor:
     """NCCN PDF 文本提取和分块处理器"""
@@ -74,8 +66,11 @@ class NCCNPdfProcessor:
         Returns:
             提取的文本内容
         """
-        if not HAS_PYMUPDF:
-            logger.error("[PDF] PyMuPDF 未安装")
+        # 首次提取时才导入 PyMuPDF
+        try:
+            import fitz
+        except ImportError:
+            logger.error("[PDF] PyMuPDF 未安装，请运行: pip install PyMuPDF")
             return ""
 
         try:
@@ -9,22 +9,6 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 from src.utils.logger import mtb_logger as logger
 
-# 尝试导入依赖
-try:
-    import chromadb
-    from chromadb.config import Settings
-    HAS_CHROMADB = True
-except ImportError:
-    HAS_CHROMADB = False
-    logger.warning("[VectorStore] ChromaDB 未安装，请运行: pip install chromadb")
-
-try:
-    from openai import OpenAI
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
-    logger.warning("[VectorStore] openai 未安装，请运行: pip install openai")
-
 
 class NCCNVectorStore:
     """NCCN 指南向量存储"""
@@ -55,10 +39,18 @@ class NCCNVectorStore:
         if self._initialized:
             return
 
-        if not HAS_CHROMADB:
+        # chromadb / openai 导入较慢，推迟到首次初始化
+        try:
+            import chromadb
+            from chromadb.config import Settings
+        except ImportError:
+            logger.warning("[VectorStore] ChromaDB 未安装，请运行: pip install chromadb")
             raise ImportError("ChromaDB 未安装")
 
-        if not HAS_OPENAI:
+        try:
+            from openai import OpenAI
+        except ImportError:
+            logger.warning("[VectorStore] openai 未安装，请运行: pip install openai")
             raise ImportError("openai 未安装")
 
         from config.settings import DASHSCOPE_API_KEY, DASHSCOPE_BASE_URL, EMBEDDING_DIMENSIONS
@@ -19,11 +19,13 @@ from typing import Dict, List, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.tools.api_clients.ncbi_client import get_ncbi_client
 from src.utils.logger import mtb_logger as logger
+from src.utils.llm_budget import CallBudget, get_budget, run_with_budget
+from src.utils.llm_hedging import hedged_call
+from src.utils.tracing import in_trace_context
 from config.settings import (
     OPENROUTER_API_KEY,
     OPENROUTER_BASE_URL,
     SUBGRAPH_MODEL,  # 使用 flash 模型降低成本
-    MAX_TOKENS_SUBGRAPH,
     DEFAULT_YEAR_WINDOW,
     PUBMED_BROAD_SEARCH_COUNT,
     PUBMED_BUCKET_QUOTAS,
@@ -233,8 +235,8 @@ IMPORTANT: Return evaluation for ALL articles in the input, maintaining the same
         self.ncbi_client = get_ncbi_client()
         self.model = SUBGRAPH_MODEL
 
-    def _call_llm(self, prompt: str, max_tokens: int = MAX_TOKENS_SUBGRAPH) -> str:
-        """Call LLM (using flash model to reduce cost)"""
+    def _call_llm(self, prompt: str, call_site: str = "pubmed_relevance") -> str:
+        """Call LLM (using flash model to reduce cost); 预算取自调用点 call_site"""
         # ========== 全局速率限制检查 ==========
         from src.agents.base_agent import BaseAgent
         BaseAgent._check_rate_limit()
@@ -247,29 +249,33 @@ IMPORTANT: Return evaluation for ALL articles in the input, maintaining the same
             "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
             "temperature": 0.1,  # 低温度确保稳定输出
-            "max_tokens": max_tokens,
         }
 
+        def send(budget: CallBudget) -> Dict[str, Any]:
+            response = requests.post(
+                OPENROUTER_BASE_URL,
+                headers=headers,
+                json=budget.apply(dict(payload)),
+                timeout=budget.timeout
+            )
+            response.raise_for_status()
+            result = response.json()
+
+            # 检查响应格式
+            if "choices" not in result:
+                raise ValueError(f"API 错误: {result.get('error', result)}")
+            return result
+
         # 重试逻辑
+        budget = get_budget(call_site)
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = requests.post(
-                    OPENROUTER_BASE_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=60
-                )
-                response.raise_for_status()
-                result = response.json()
-
-                # 检查响应格式
-                if "choices" not in result:
-                    raise ValueError(f"API 错误: {result.get('error', result)}")
+                result = run_with_budget(budget, lambda b: hedged_call(b.site, self.model, lambda: send(b)))
 
                 finish_reason = result["choices"][0].get("finish_reason", "unknown")
                 if finish_reason == "length":
-                    logger.warning(f"[SmartPubMed] LLM 响应被截断 (finish_reason=length, max_tokens={max_tokens})")
+                    logger.warning(f"[SmartPubMed] LLM 响应被截断 (finish_reason=length, call_site={call_site})")
                 content = result["choices"][0]["message"]["content"].strip()
                 # Clean potential markdown code blocks
                 if content.startswith("```"):
@@ -312,7 +318,7 @@ IMPORTANT: Return evaluation for ALL articles in the input, maintaining the same
         failed_str = "\n".join(f"  - {q}" for q in failed_queries) if failed_queries else "(none)"
 
         prompt = prompt_template.format(query=query, failed_queries=failed_str)
-        result = self._call_llm(prompt)
+        result = self._call_llm(prompt, call_site="pubmed_query_build")
 
         if not result:
             result = self._fallback_query_cleanup(query)
@@ -472,7 +478,7 @@ IMPORTANT: Return evaluation for ALL articles in the input, maintaining the same
             articles_json=json.dumps(articles_for_eval, ensure_ascii=False)
         )
 
-        response = self._call_llm(prompt)
+        response = self._call_llm(prompt, call_site="pubmed_relevance")
 
         # 解析返回的 JSON 数组
         filtered = []
@@ -555,7 +561,7 @@ IMPORTANT: Return evaluation for ALL articles in the input, maintaining the same
         filtered = []
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             futures = {
-                executor.submit(self._filter_batch, original_query, batch, idx): idx
+                executor.submit(in_trace_context(self._filter_batch), original_query, batch, idx): idx
                 for idx, batch in enumerate(batches)
             }
             for future in as_completed(futures):
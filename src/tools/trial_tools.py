@@ -1,7 +1,7 @@
 """
 临床试验工具
 
-提供 ClinicalTrials.gov 搜索功能
+提供 ClinicalTrials.gov 搜索功能（两级：搜索只返回摘要，入组标准按入围试验的 nct_ids 另查）
 """
 from typing import Dict, Any, Optional, List
 from src.tools.base_tool import BaseTool
@@ -12,10 +12,18 @@ from src.utils.logger import mtb_logger as logger
 class ClinicalTrialsTool(BaseTool):
     """ClinicalTrials.gov 搜索工具"""
 
+    upstreams = ("clinicaltrials",)
+
+    # 单次最多查看入组标准的试验数（全文较长，只给入围试验）
+    MAX_ELIGIBILITY_TRIALS = 5
+
     def __init__(self):
         super().__init__(
             name="search_clinical_trials",
-            description="搜索 ClinicalTrials.gov 中国招募中的试验。输入肿瘤类型、生物标志物、干预措施"
+            description=(
+                "搜索 ClinicalTrials.gov 中国招募中的试验。输入肿瘤类型、生物标志物、干预措施，返回试验摘要；"
+                "对入围试验再传 nct_ids 查看入组标准全文"
+            )
         )
         self.client = ClinicalTrialsClient()
 
@@ -26,6 +34,7 @@ class ClinicalTrialsTool(BaseTool):
         intervention: str = "",
         location: str = "China",
         max_results: int = 20,
+        nct_ids: List[str] = None,
         **kwargs
     ) -> Optional[str]:
         """
@@ -37,10 +46,16 @@ class ClinicalTrialsTool(BaseTool):
             intervention: 干预措施/药物
             location: 地点
             max_results: 最大结果数
+            nct_ids: 入围试验的 NCT 编号；给定时只返回这些试验的入组标准
 
         Returns:
-            格式化的搜索结果
+            格式化的搜索结果（摘要）或入组标准
         """
+        if nct_ids:
+            if isinstance(nct_ids, str):
+                nct_ids = [i for i in nct_ids.replace(",", " ").split() if i]
+            return self._eligibility(list(nct_ids))
+
         # 构建条件查询
         condition_parts = []
         if cancer_type:
@@ -63,6 +78,24 @@ class ClinicalTrialsTool(BaseTool):
 
         return self._format_results(cancer_type, biomarker, intervention, results)
 
+    def _eligibility(self, nct_ids: List[str]) -> str:
+        """第二级：入围试验的入组标准全文"""
+        skipped = nct_ids[self.MAX_ELIGIBILITY_TRIALS:]
+        trials = self.client.get_eligibility(nct_ids[:self.MAX_ELIGIBILITY_TRIALS])
+        output = [f"**ClinicalTrials.gov 入组标准（{len(trials)} 项入围试验）**\n", "---\n"]
+        for trial in trials:
+            nct_id = trial["nct_id"]
+            title = trial.get("official_title") or trial.get("brief_title") or ""
+            output.append(f"### {nct_id} - {title}\n")
+            if trial.get("status"):
+                output.append(f"**状态**: {trial['status']}")
+            output.append(f"**入组标准**:\n{trial.get('eligibility_criteria') or '未获取到入组标准（请稍后重试或查看原始页面）'}")
+            output.append(f"\n**参考**: {trial.get('url') or f'https://clinicaltrials.gov/study/{nct_id}'}")
+            output.append("\n---\n")
+        if skipped:
+            output.append(f"*单次最多查看 {self.MAX_ELIGIBILITY_TRIALS} 项，未返回: {', '.join(skipped)}*")
+        return "\n".join(output)
+
     def _format_results(
         self,
         cancer_type: str,
@@ -92,7 +125,6 @@ class ClinicalTrialsTool(BaseTool):
             sponsor = trial.get("sponsor", "")
             interventions = trial.get("interventions", [])
             locations = trial.get("locations", [])
-            eligibility = trial.get("eligibility_criteria", "")
 
             output.append(f"### {i}. {nct_id} - {title}\n")
             output.append(f"**Phase**: {phase}")
@@ -105,10 +137,6 @@ class ClinicalTrialsTool(BaseTool):
                 drug_list = [f"{intr.get('name', '')} ({intr.get('type', '')})" for intr in interventions]
                 output.append(f"**药物**: {', '.join(drug_list)}")
 
-            # 入选标准
-            if eligibility:
-                output.append(f"\n**关键入组标准**:\n{eligibility}")
-
             # 中国中心
             if locations:
                 china_sites = [f"{loc.get('facility', '')} ({loc.get('city', '')})" for loc in locations]
@@ -119,7 +147,8 @@ class ClinicalTrialsTool(BaseTool):
             output.append(f"\n**参考**: {trial.get('url', '')}")
             output.append("\n---\n")
 
-        output.append("\n**备注**: 以上为实时数据，实际试验入组需联系各中心PI确认资格。")
+        output.append("\n**下一步**: 对入围试验调用 search_clinical_trials(nct_ids=[...]) 查看入组标准全文。")
+        output.append("**备注**: 以上为实时数据，实际试验入组需联系各中心PI确认资格。")
 
         return "\n".join(output)
 
@@ -149,7 +178,12 @@ class ClinicalTrialsTool(BaseTool):
                 "cancer_type": {"type": "string", "description": "肿瘤类型，如 NSCLC, 乳腺癌"},
                 "biomarker": {"type": "string", "description": "生物标志物，如 EGFR mutation"},
                 "intervention": {"type": "string", "description": "干预措施/药物，如 osimertinib"},
-                "max_results": {"type": "integer", "description": "最大结果数，默认 5", "default": 5}
+                "max_results": {"type": "integer", "description": "最大结果数，默认 5", "default": 5},
+                "nct_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": f"入围试验的 NCT 编号（最多 {self.MAX_ELIGIBILITY_TRIALS} 个）；填写时只返回这些试验的入组标准全文，忽略其他参数"
+                }
             },
             "required": []
         }
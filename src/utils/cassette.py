@@ -0,0 +1,372 @@
+"""
+运行录制 / 回放（cassette）
+
+在 requests.Session.send 一处拦截全部出站 HTTP：BaseAgent._call_api、辅助 LLM
+调用（实体提取 / PageIndex 树搜索 / PubMed 查询构建等，均经 requests.post）以及
+api_clients 的 Session 请求。
+
+    - 录制: 透传请求，记录 (请求指纹, 响应/异常, 网络耗时)，结束时写入 gzip JSONL
+    - 回放: 按指纹返回录制的响应，不访问网络；未命中抛 ConnectionError（按离线处理），
+      同时跳过各客户端的主动限速，使墙钟时间只包含本地计算
+
+指纹容忍时间戳与随机 ID：按规范化后的 (方法, URL, 请求体) 精确匹配。可选的宽松匹配
+（CASSETTE_LOOSE_MATCH=true）在精确未命中时再忽略请求体中独立的 1-4 位数字（并行阶段
+证据图计数等随调度顺序变化的内容）；URL 与 PMID / NCT 编号 / 变异名等标识符始终精确比较，
+每次宽松命中都记录警告。
+同一指纹多次请求按录制顺序依次返回，用尽后重复最后一次。
+
+用法:
+    with Cassette.recording() as cassette:
+        run(...)
+    cassette.save(path)
+
+    with Cassette.replaying(path) as cassette:
+        run(...)
+    cassette.summary()
+"""
+import base64
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from src.utils.logger import mtb_logger as logger
+
+# 不参与指纹、也不写入录像的查询参数（凭据）
+_SECRET_PARAMS = {"api_key", "apikey", "key", "email", "tool", "token"}
+# 回放需要的响应头
+_KEPT_HEADERS = ("Content-Type", "Retry-After")
+
+_VOLATILE_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b\d{8}_\d{6}\b"), "<ts>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"), "<uuid>"),
+    (re.compile(r"(?<=[A-Za-z])_[0-9a-f]{8}\b"), "_<id>"),         # 证据图 ID: {source}_{uuid8}
+    (re.compile(r"\bcall_[A-Za-z0-9]{6,}\b"), "call_<id>"),      # tool_call id
+]
+# 宽松匹配只忽略独立的短数字（计数 / 评分）；与字母相邻或 5 位以上的数字视为标识符
+_COUNTS = re.compile(r"(?<![\w.])\d{1,4}(?:\.\d+)?(?!\w|\.\d)")
+_SPACES = re.compile(r"\s+")
+
+
+def _normalize_text(text: str) -> str:
+    for pattern, replacement in _VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return _normalize_text(value)
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize_value(v) for v in value]
+    return value
+
+
+def _public_url(url: str) -> str:
+    """去掉凭据参数、参数排序后的 URL"""
+    parts = urlsplit(url)
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in _SECRET_PARAMS)
+    query = f"?{urlencode(params)}" if params else ""
+    return f"{parts.scheme}://{parts.netloc}{parts.path}{query}"
+
+
+def _body_text(body: Any) -> str:
+    if body is None:
+        return ""
+    if isinstance(body, bytes):
+        return body.decode("utf-8", errors="replace")
+    return str(body)
+
+
+def fingerprint(method: str, url: str, body: Any) -> Tuple[str, str]:
+    """
+    请求指纹
+
+    Returns:
+        (精确指纹, 宽松指纹)；二者均已去除时间戳 / UUID / 证据图 ID / 凭据，
+        宽松指纹另外忽略请求体中的独立短数字
+    """
+    text = _body_text(body)
+    try:
+        normalized_body = json.dumps(_normalize_value(json.loads(text)), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        normalized_body = _normalize_text(text)
+    head = f"{method.upper()} {_normalize_text(_public_url(url))}"
+    canonical = f"{head}\n{normalized_body}"
+    loose = f"{head}\n{_SPACES.sub(' ', _COUNTS.sub('<n>', normalized_body))}"
+    return (
+        hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        hashlib.sha256(loose.encode("utf-8")).hexdigest(),
+    )
+
+
+def _error_kind(error: BaseException) -> str:
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    return "request"
+
+
+_ERROR_TYPES = {
+    "timeout": requests.exceptions.Timeout,
+    "connection": requests.exceptions.ConnectionError,
+    "request": requests.exceptions.RequestException,
+}
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """回放时录像中没有匹配的请求（调用方按网络不可用处理）"""
+
+
+class Cassette:
+    """
+    一次运行的 HTTP 交换录像
+
+    Args:
+        mode: "record" 或 "replay"
+        entries: 回放用的录制条目（load() 读入）
+        loose_match: 精确未命中时是否按宽松指纹回放，默认取 CASSETTE_LOOSE_MATCH
+    """
+
+    _active: Optional["Cassette"] = None
+    _active_lock = threading.Lock()
+    _original_send = None
+
+    def __init__(self, mode: str, entries: Optional[List[Dict[str, Any]]] = None,
+                 loose_match: Optional[bool] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的录像模式: {mode}")
+        if loose_match is None:
+            from config.settings import CASSETTE_LOOSE_MATCH
+            loose_match = CASSETTE_LOOSE_MATCH
+        self.mode = mode
+        self.loose_match = loose_match
+        self.entries: List[Dict[str, Any]] = list(entries or [])
+        self._lock = threading.Lock()
+        self._exact: Dict[str, List[int]] = {}
+        self._loose: Dict[str, List[int]] = {}
+        self._used: set = set()
+        self.hits = 0
+        self.loose_hits = 0
+        self.misses = 0
+        # 指纹在读入时重新计算，规范化规则调整后旧录像仍可用
+        for i, entry in enumerate(self.entries):
+            key, loose_key = fingerprint(entry["method"], entry["url"], entry["request_body"])
+            self._exact.setdefault(key, []).append(i)
+            self._loose.setdefault(loose_key, []).append(i)
+
+    # ==================== 生命周期 ====================
+
+    @classmethod
+    @contextmanager
+    def recording(cls) -> Iterator["Cassette"]:
+        cassette = cls("record")
+        with cassette._installed():
+            yield cassette
+
+    @classmethod
+    @contextmanager
+    def replaying(cls, path: Path, loose_match: Optional[bool] = None) -> Iterator["Cassette"]:
+        cassette = cls.load(path, loose_match)
+        with cassette._installed():
+            yield cassette
+
+    @classmethod
+    def active(cls) -> Optional["Cassette"]:
+        return cls._active
+
+    @contextmanager
+    def _installed(self) -> Iterator[None]:
+        with Cassette._active_lock:
+            if Cassette._active is not None:
+                raise RuntimeError("已有录像处于激活状态")
+            Cassette._active = self
+            Cassette._original_send = requests.Session.send
+            requests.Session.send = _patched_send
+        logger.info(f"[Cassette] {'录制' if self.mode == 'record' else '回放'}开始（{len(self.entries)} 条录制交换）")
+        try:
+            yield
+        finally:
+            with Cassette._active_lock:
+                requests.Session.send = Cassette._original_send
+                Cassette._active = None
+
+    # ==================== 持久化 ====================
+
+    def save(self, path: Path) -> Path:
+        """写入 gzip JSONL（先写临时文件再替换）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with self._lock:
+            entries = list(self.entries)
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        tmp.replace(path)
+        logger.info(f"[Cassette] 已写入 {len(entries)} 条交换: {path}")
+        return path
+
+    def save_for_run(self, run_folder: Optional[str]) -> Optional[Path]:
+        """录制结束后写入 CASSETTE_PATH，未设置时写入 {run_folder}/cassette.jsonl.gz"""
+        from config.settings import CASSETTE_PATH
+
+        if CASSETTE_PATH:
+            return self.save(Path(CASSETTE_PATH))
+        if run_folder:
+            return self.save(Path(run_folder) / "cassette.jsonl.gz")
+        logger.warning("[Cassette] 未设置 CASSETTE_PATH 且无运行目录，录像未保存")
+        return None
+
+    @classmethod
+    def load(cls, path: Path, loose_match: Optional[bool] = None) -> "Cassette":
+        with gzip.open(Path(path), "rt", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return cls("replay", entries, loose_match)
+
+    # ==================== 录制 ====================
+
+    def record(self, request: requests.PreparedRequest, response: Optional[requests.Response],
+               error: Optional[BaseException], elapsed: float) -> None:
+        entry: Dict[str, Any] = {
+            "method": request.method,
+            "url": _public_url(request.url),
+            "request_body": _body_text(request.body),
+            "elapsed": round(elapsed, 4),
+        }
+        if error is not None:
+            entry["error"] = {"kind": _error_kind(error), "type": type(error).__name__, "message": str(error)}
+        else:
+            content = response.content or b""
+            try:
+                entry["text"] = content.decode("utf-8")
+            except UnicodeDecodeError:
+                entry["base64"] = base64.b64encode(content).decode("ascii")
+            entry.update(
+                status=response.status_code,
+                reason=response.reason or "",
+                encoding=response.encoding,
+                headers={h: response.headers[h] for h in _KEPT_HEADERS if h in response.headers},
+            )
+        with self._lock:
+            self.entries.append(entry)
+
+    # ==================== 回放 ====================
+
+    def _match(self, request: requests.PreparedRequest) -> Optional[Dict[str, Any]]:
+        key, loose_key = fingerprint(request.method, request.url, request.body)
+        with self._lock:
+            entry = self._take(self._exact.get(key))
+            if entry is not None:
+                self.hits += 1
+                return entry
+            entry = self._take(self._loose.get(loose_key)) if self.loose_match else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.loose_hits += 1
+        logger.warning(f"[Cassette] 宽松命中（请求体中的计数与录制不同）: {request.method} {_public_url(request.url)[:160]}")
+        return entry
+
+    def _take(self, candidates: Optional[List[int]]) -> Optional[Dict[str, Any]]:
+        """按录制顺序取下一条未用过的条目，用尽后重复最后一条（调用方持有 _lock）"""
+        if not candidates:
+            return None
+        chosen = next((i for i in candidates if i not in self._used), candidates[-1])
+        self._used.add(chosen)
+        return self.entries[chosen]
+
+    def serve(self, request: requests.PreparedRequest) -> requests.Response:
+        entry = self._match(request)
+        if entry is None:
+            logger.warning(f"[Cassette] 回放未命中: {request.method} {_public_url(request.url)[:160]}")
+            raise CassetteMiss(f"录像中无匹配请求: {request.method} {_public_url(request.url)}", request=request)
+
+        if "error" in entry:
+            error_type = _ERROR_TYPES.get(entry["error"]["kind"], requests.exceptions.RequestException)
+            raise error_type(f"[回放] {entry['error']['type']}: {entry['error']['message']}", request=request)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason", "")
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response.encoding = entry.get("encoding")
+        response._content = base64.b64decode(entry["base64"]) if "base64" in entry else entry.get("text", "").encode("utf-8")
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(0)
+        return response
+
+    # ==================== 统计 ====================
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            recorded = sum(entry.get("elapsed", 0.0) for entry in self.entries)
+            by_host: Dict[str, int] = {}
+            for entry in self.entries:
+                host = urlsplit(entry["url"]).netloc
+                by_host[host] = by_host.get(host, 0) + 1
+            result = {
+                "mode": self.mode,
+                "exchanges": len(self.entries),
+                "recorded_network_seconds": round(recorded, 2),
+                "by_host": by_host,
+            }
+            if self.mode == "replay":
+                result.update(hits=self.hits, loose_hits=self.loose_hits, misses=self.misses,
+                              unused=len(self.entries) - len(self._used))
+        return result
+
+
+def _patched_send(session: requests.Session, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+    cassette = Cassette._active
+    if cassette is None:
+        return Cassette._original_send(session, request, **kwargs)
+    if cassette.mode == "replay":
+        return cassette.serve(request)
+
+    start = time.perf_counter()
+    try:
+        response = Cassette._original_send(session, request, **kwargs)
+    except requests.exceptions.RequestException as e:
+        cassette.record(request, None, e, time.perf_counter() - start)
+        raise
+    cassette.record(request, response, None, time.perf_counter() - start)
+    return response
+
+
+@contextmanager
+def open_configured_cassette() -> Iterator[Optional[Cassette]]:
+    """按 CASSETTE_MODE / CASSETTE_PATH 打开录像；off 时返回 None"""
+    from config.settings import CASSETTE_MODE, CASSETTE_PATH
+
+    if CASSETTE_MODE == "replay":
+        if not CASSETTE_PATH:
+            raise ValueError("CASSETTE_MODE=replay 需要设置 CASSETTE_PATH")
+        with Cassette.replaying(Path(CASSETTE_PATH)) as cassette:
+            yield cassette
+    elif CASSETTE_MODE == "record":
+        with Cassette.recording() as cassette:
+            yield cassette
+    else:
+        yield None
+
+
+def replaying() -> bool:
+    """当前是否处于回放模式（各客户端据此跳过主动限速）"""
+    cassette = Cassette._active
+    return cassette is not None and cassette.mode == "replay"
@@ -4,8 +4,6 @@
 from pathlib import Path
 from typing import Optional
 
-import fitz  # PyMuPDF
-
 
 def read_pdf_file(file_path: str) -> str:
     """
@@ -29,7 +27,9 @@ def read_pdf_file(file_path: str) -> str:
     if path.suffix.lower() != ".pdf":
         raise ValueError(f"仅支持 PDF 文件格式，当前: {path.suffix}")
 
-    # 使用 PyMuPDF 提取文本
+    # 使用 PyMuPDF 提取文本（首次读取 PDF 时才导入）
+    import fitz
+
     doc = fitz.open(str(path))
     text_parts = []
 
@@ -8,6 +8,7 @@ from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, Optional
 from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import traced
 
 
 def save_evidence_graph_json(
@@ -103,6 +104,7 @@ def load_evidence_graph_json(filepath: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+@traced("checkpoint_evidence_graph", "graph")
 def checkpoint_evidence_graph(
     state: Dict[str, Any],
     phase: str,
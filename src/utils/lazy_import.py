@@ -0,0 +1,31 @@
+"""
+包级延迟导出（PEP 562）
+
+包的 __init__ 只声明 名称 → 模块 映射，首次访问名称时才导入对应子模块:
+    __getattr__, __dir__ = lazy_exports(__name__, {
+        "CIViCTool": "src.tools.molecular_tools",
+        "OncoKBTool": "src.tools.molecular_tools:CIViCTool",   # 别名：模块:属性
+    })
+这样导入包内任一子模块（如 src.tools.base_tool）不会连带加载全部兄弟模块。
+"""
+import importlib
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def lazy_exports(package: str, exports: Dict[str, str]) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """返回包模块使用的 (__getattr__, __dir__)；导入结果写回包命名空间，之后的访问不再经过 __getattr__"""
+    namespace = importlib.import_module(package).__dict__
+
+    def __getattr__(name: str) -> Any:
+        target = exports.get(name)
+        if target is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        module_name, _, attr = target.partition(":")
+        value = getattr(importlib.import_module(module_name), attr or name)
+        namespace[name] = value
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(namespace) | set(exports))
+
+    return __getattr__, __dir__
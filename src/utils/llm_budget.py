@@ -0,0 +1,247 @@
+"""
+按调用点的 LLM 预算（最大输出 token / reasoning effort / 超时）与用量遥测
+
+预算表见 config.settings.LLM_CALL_SITE_BUDGETS。调用方把单次 HTTP 请求封装为
+send(budget) -> 响应 JSON，交给 run_with_budget()：
+    - 按调用点取预算
+    - 自适应模式下 finish_reason=length 时放宽 max_tokens 重试
+    - 记录实际 token 用量，供按数据调整预算（budget_telemetry.summary()）
+
+budget_telemetry 为进程级累计；run_budget_telemetry() 作用域内的调用另外记入
+本次运行的遥测（服务 / 批处理中多个病例共用进程，运行报告只统计自己的调用）。
+"""
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from config.settings import (
+    LLM_CALL_SITE_BUDGETS,
+    LLM_CALL_SITE_BUDGETS_OVERRIDE,
+    LLM_BUDGET_ADAPTIVE,
+    LLM_BUDGET_MAX_WIDENINGS,
+)
+from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import span
+from src.utils.usage_ledger import guard_budget, record_usage
+
+
+@dataclass(frozen=True)
+class CallBudget:
+    """单个调用点的预算"""
+    site: str
+    max_tokens: int
+    reasoning_effort: str
+    timeout: int
+    max_tokens_ceiling: int
+
+    def widened(self) -> Optional["CallBudget"]:
+        """放宽一档（max_tokens 翻倍，不超过上限）；已到上限返回 None"""
+        if self.max_tokens >= self.max_tokens_ceiling:
+            return None
+        return replace(self, max_tokens=min(self.max_tokens * 2, self.max_tokens_ceiling))
+
+    def apply(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """把 max_tokens / reasoning 写入请求 payload（原地修改并返回）"""
+        payload["max_tokens"] = self.max_tokens
+        if self.reasoning_effort:
+            payload["reasoning"] = {"effort": self.reasoning_effort}
+        else:
+            payload.pop("reasoning", None)
+        return payload
+
+
+def _load_table() -> Dict[str, Dict[str, Any]]:
+    table = {site: dict(cfg) for site, cfg in LLM_CALL_SITE_BUDGETS.items()}
+    if LLM_CALL_SITE_BUDGETS_OVERRIDE:
+        try:
+            for site, cfg in json.loads(LLM_CALL_SITE_BUDGETS_OVERRIDE).items():
+                table.setdefault(site, {}).update(cfg)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"[LLMBudget] LLM_CALL_SITE_BUDGETS_OVERRIDE 解析失败，忽略: {e}")
+    return table
+
+
+_BUDGET_TABLE = _load_table()
+
+
+def get_budget(site: str, fallback: Optional[CallBudget] = None) -> CallBudget:
+    """
+    取调用点预算
+
+    Args:
+        site: 调用点名（见 LLM_CALL_SITE_BUDGETS）
+        fallback: 未登记调用点使用的预算；缺省时报错
+    """
+    cfg = _BUDGET_TABLE.get(site)
+    if cfg is None:
+        if fallback is None:
+            raise KeyError(f"未登记的 LLM 调用点: {site}")
+        return replace(fallback, site=site)
+    max_tokens = int(cfg["max_tokens"])
+    return CallBudget(
+        site=site,
+        max_tokens=max_tokens,
+        reasoning_effort=cfg.get("reasoning_effort", "") or "",
+        timeout=int(cfg.get("timeout", 120)),
+        max_tokens_ceiling=max(max_tokens, int(cfg.get("max_tokens_ceiling", max_tokens))),
+    )
+
+
+def finish_reason_of(result: Dict[str, Any]) -> str:
+    choices = result.get("choices") or [{}]
+    return choices[0].get("finish_reason") or ""
+
+
+class BudgetTelemetry:
+    """按调用点累计实际用量（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[str, List[Dict[str, Any]]] = {}
+
+    def record(self, budget: CallBudget, result: Dict[str, Any], latency: float) -> None:
+        usage = result.get("usage") or {}
+        entry = {
+            "max_tokens": budget.max_tokens,
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "reasoning_tokens": (usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0,
+            "finish_reason": finish_reason_of(result),
+            "latency": latency,
+        }
+        with self._lock:
+            self._records.setdefault(budget.site, []).append(entry)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        每个调用点: calls / truncated (finish_reason=length) / completion p50/p95/max /
+        reasoning 均值 / p95 占预算比例 / 平均延迟 / prompt 与 completion token 合计
+        """
+        with self._lock:
+            records = {site: list(rs) for site, rs in self._records.items()}
+        out = {}
+        for site, rs in records.items():
+            completions = sorted(r["completion_tokens"] for r in rs)
+            n = len(completions)
+            p95 = completions[min(n - 1, int(n * 0.95))]
+            out[site] = {
+                "calls": n,
+                "truncated": sum(1 for r in rs if r["finish_reason"] == "length"),
+                "completion_p50": completions[n // 2],
+                "completion_p95": p95,
+                "completion_max": completions[-1],
+                "reasoning_mean": round(sum(r["reasoning_tokens"] for r in rs) / n),
+                "p95_budget_utilization": round(p95 / max(1, rs[-1]["max_tokens"]), 3),
+                "latency_mean": round(sum(r["latency"] for r in rs) / n, 2),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in rs),
+                "completion_tokens": sum(completions),
+            }
+        return out
+
+    def format_summary(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return ""
+        lines = ["调用点 | 次数 | 截断 | 输出p50 | 输出p95 | 输出max | reasoning均值 | p95/预算 | 平均延迟(s)"]
+        for site, r in sorted(rows.items()):
+            lines.append(
+                f"{site} | {r['calls']} | {r['truncated']} | {r['completion_p50']} | {r['completion_p95']} | "
+                f"{r['completion_max']} | {r['reasoning_mean']} | {r['p95_budget_utilization']} | {r['latency_mean']}"
+            )
+        return "\n".join(lines)
+
+
+budget_telemetry = BudgetTelemetry()
+
+_run_telemetry: contextvars.ContextVar[Optional[BudgetTelemetry]] = contextvars.ContextVar(
+    "mtb_run_budget_telemetry", default=None
+)
+
+
+@contextmanager
+def run_budget_telemetry() -> Iterator[BudgetTelemetry]:
+    """本次运行的调用点遥测（进程级 budget_telemetry 照常累计）"""
+    telemetry = BudgetTelemetry()
+    token = _run_telemetry.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _run_telemetry.reset(token)
+
+
+def _record_telemetry(budget: CallBudget, result: Dict[str, Any], latency: float) -> None:
+    budget_telemetry.record(budget, result, latency)
+    run_telemetry = _run_telemetry.get()
+    if run_telemetry is not None and run_telemetry is not budget_telemetry:
+        run_telemetry.record(budget, result, latency)
+
+# 当前发送所用预算（hedged_call 的落败请求在后台线程完成时按它记账）
+_active_budget: contextvars.ContextVar[Optional[CallBudget]] = contextvars.ContextVar("mtb_llm_budget", default=None)
+
+
+def record_discarded(result: Dict[str, Any], latency: float) -> None:
+    """对冲落败但已完成的请求同样计费：记入预算遥测与用量账本"""
+    budget = _active_budget.get()
+    if budget is None or not isinstance(result, dict):
+        return
+    _record_telemetry(budget, result, latency)
+    record_usage(budget, result, latency, hedge_discarded=True)
+
+
+def run_with_budget(
+    budget: CallBudget,
+    send: Callable[[CallBudget], Dict[str, Any]],
+    adaptive: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    按预算发送请求；自适应模式下 finish_reason=length 时放宽 max_tokens 重试
+
+    Args:
+        budget: 初始预算
+        send: budget -> 响应 JSON（自行处理网络重试，失败抛异常）
+        adaptive: 是否自适应放宽，缺省读取 LLM_BUDGET_ADAPTIVE
+
+    Returns:
+        最后一次响应 JSON
+    """
+    adaptive = LLM_BUDGET_ADAPTIVE if adaptive is None else adaptive
+    guarded = guard_budget(budget)
+    downgraded = guarded is not budget
+    budget = guarded
+    widenings = 0
+    while True:
+        start = time.time()
+        with span(budget.site, "llm", max_tokens=budget.max_tokens, widening=widenings) as llm_span:
+            token = _active_budget.set(budget)
+            try:
+                result = send(budget)
+            finally:
+                _active_budget.reset(token)
+            usage = result.get("usage") or {}
+            llm_span.set(
+                prompt_tokens=usage.get("prompt_tokens") or 0,
+                completion_tokens=usage.get("completion_tokens") or 0,
+                finish_reason=finish_reason_of(result),
+            )
+        _record_telemetry(budget, result, time.time() - start)
+        record_usage(budget, result, time.time() - start, downgraded)
+
+        if finish_reason_of(result) != "length" or not adaptive or widenings >= LLM_BUDGET_MAX_WIDENINGS:
+            return result
+        wider = budget.widened()
+        if wider is None:
+            return result
+        logger.warning(
+            f"[LLMBudget] {budget.site} 输出被截断 (max_tokens={budget.max_tokens})，"
+            f"放宽至 {wider.max_tokens} 重试"
+        )
+        budget = wider
+        widenings += 1
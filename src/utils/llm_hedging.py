@@ -0,0 +1,276 @@
+"""
+LLM 对冲请求与延迟直方图（长尾延迟控制）
+
+并行阶段的汇总节点要等最慢的 Agent，少数耗时数倍于中位数的 OpenRouter 请求
+会拖住整个阶段。对幂等调用点（LLM_HEDGE_CALL_SITES）:
+    - 按 (模型, 调用点) 维护最近请求的延迟直方图
+    - 请求超过历史 p95（样本不足时用初始延迟）仍未返回，判定为停滞，
+      在速率限制余量内发出一份相同请求
+    - 先成功返回者胜出，另一份被放弃。requests 无法从其他线程中断进行中的 HTTP 读取，
+      落败请求仍会完成并计费：其响应交给 on_discarded（默认记入预算遥测与用量账本）
+
+对冲延迟取进程级 latency_registry（跨病例积累样本）；run_latency_registry() 作用域内的
+观测与对冲计数另外记入本次运行的统计，运行报告只含自己的请求。
+"""
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from config.settings import (
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_CALL_SITES,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_INITIAL_DELAY,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MAX_DELAY,
+    LLM_HEDGE_RATE_RESERVE,
+    LLM_LATENCY_WINDOW,
+)
+from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import in_trace_context
+
+T = TypeVar("T")
+
+
+class LatencyHistogram:
+    """最近 N 次请求延迟（秒）的滑动窗口直方图"""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0}
+        n = len(samples)
+        return {
+            "count": n,
+            "p50": round(samples[n // 2], 2),
+            "p95": round(samples[min(n - 1, int(n * 0.95))], 2),
+            "p99": round(samples[min(n - 1, int(n * 0.99))], 2),
+            "max": round(samples[-1], 2),
+        }
+
+
+class LatencyRegistry:
+    """按 (模型, 调用点) 的延迟直方图与对冲计数（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._hedge_stats: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    def histogram(self, model: str, site: str) -> LatencyHistogram:
+        with self._lock:
+            key = (model, site)
+            if key not in self._histograms:
+                self._histograms[key] = LatencyHistogram()
+                self._hedge_stats[key] = {"hedged": 0, "hedge_won": 0, "skipped_rate_limit": 0}
+            return self._histograms[key]
+
+    def count(self, model: str, site: str, stat: str) -> None:
+        self.histogram(model, site)
+        with self._lock:
+            self._hedge_stats[(model, site)][stat] += 1
+
+    def hedge_delay(self, model: str, site: str) -> float:
+        """对冲延迟：历史分位数，限制在 [LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_DELAY]"""
+        hist = self.histogram(model, site)
+        if len(hist) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_DELAY
+        return min(LLM_HEDGE_MAX_DELAY, max(LLM_HEDGE_MIN_DELAY, hist.quantile(LLM_HEDGE_QUANTILE)))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._hedge_stats.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            keys = list(self._histograms)
+        out = {}
+        for model, site in keys:
+            row = self._histograms[(model, site)].snapshot()
+            row.update(self._hedge_stats[(model, site)])
+            out[f"{model} | {site}"] = row
+        return out
+
+    def format_summary(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return ""
+        lines = ["模型 | 调用点 | 次数 | p50 | p95 | p99 | max | 对冲 | 对冲胜出 | 限流跳过"]
+        for key, r in sorted(rows.items()):
+            lines.append(
+                f"{key} | {r['count']} | {r.get('p50', '-')} | {r.get('p95', '-')} | {r.get('p99', '-')} | "
+                f"{r.get('max', '-')} | {r['hedged']} | {r['hedge_won']} | {r['skipped_rate_limit']}"
+            )
+        return "\n".join(lines)
+
+
+latency_registry = LatencyRegistry()
+
+_run_registry: contextvars.ContextVar[Optional[LatencyRegistry]] = contextvars.ContextVar(
+    "mtb_run_latency_registry", default=None
+)
+
+
+@contextmanager
+def run_latency_registry() -> Iterator[LatencyRegistry]:
+    """本次运行的延迟分布与对冲计数（对冲决策仍用进程级 latency_registry）"""
+    registry = LatencyRegistry()
+    token = _run_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _run_registry.reset(token)
+
+
+def _registries() -> Tuple[LatencyRegistry, ...]:
+    run_registry = _run_registry.get()
+    if run_registry is None or run_registry is latency_registry:
+        return (latency_registry,)
+    return latency_registry, run_registry
+
+
+def _observe(model: str, site: str, latency: float) -> None:
+    for registry in _registries():
+        registry.histogram(model, site).observe(latency)
+
+
+def _count(model: str, site: str, stat: str) -> None:
+    for registry in _registries():
+        registry.count(model, site, stat)
+
+
+def _acquire_hedge_slot() -> bool:
+    from src.agents.base_agent import BaseAgent
+    return BaseAgent._try_acquire_rate_slot(reserve=LLM_HEDGE_RATE_RESERVE)
+
+
+def _record_discarded(result: Any, latency: float) -> None:
+    from src.utils.llm_budget import record_discarded
+    record_discarded(result, latency)
+
+
+def hedged_call(
+    site: str,
+    model: str,
+    fn: Callable[[], T],
+    enabled: Optional[bool] = None,
+    acquire_slot: Callable[[], bool] = _acquire_hedge_slot,
+    on_discarded: Callable[[T, float], None] = _record_discarded,
+) -> T:
+    """
+    执行单次 LLM HTTP 请求；幂等调用点停滞时发出对冲请求
+
+    Args:
+        site: 调用点（仅 LLM_HEDGE_CALL_SITES 中的调用点对冲）
+        model: 模型名（延迟直方图的键）
+        fn: 单次请求（无参，成功返回结果，失败抛异常）
+        enabled: 是否允许对冲，缺省读取 LLM_HEDGE_ENABLED
+        acquire_slot: 非阻塞占用速率限制配额，失败则不发对冲请求
+        on_discarded: 落败但成功完成的请求 (结果, 延迟)，在请求所在线程中回调
+
+    Returns:
+        先成功返回的结果；全部失败时抛出最后一个异常
+    """
+    enabled = LLM_HEDGE_ENABLED if enabled is None else enabled
+
+    if not enabled or site not in LLM_HEDGE_CALL_SITES:
+        start = time.time()
+        result = fn()
+        _observe(model, site, time.time() - start)
+        return result
+
+    results: queue.Queue = queue.Queue()
+    decided = threading.Lock()
+    state = {"done": False}
+
+    def run(tag: str) -> None:
+        start = time.time()
+        try:
+            value = fn()
+        except BaseException as e:
+            results.put((tag, None, e, time.time() - start))
+            return
+        latency = time.time() - start
+        with decided:
+            discarded = state["done"]
+            if not discarded:
+                results.put((tag, value, None, latency))
+        if discarded:
+            _discard(tag, value, latency)
+
+    def _discard(tag: str, value: Any, latency: float) -> None:
+        logger.debug(f"[Hedge] {model} / {site} 落败的 {tag} 请求完成 ({latency:.1f}s)，记入用量")
+        try:
+            on_discarded(value, latency)
+        except Exception as e:
+            logger.warning(f"[Hedge] 记录落败请求用量失败: {e}")
+
+    def start(tag: str, name: str) -> None:
+        # 线程继承当前上下文（运行账本 / 预算 / Trace），落败请求的用量记入同一次运行
+        threading.Thread(target=in_trace_context(run), args=(tag,), daemon=True, name=name).start()
+
+    start("primary", f"llm-{site}")
+    pending = 1
+
+    delay = latency_registry.hedge_delay(model, site)
+    try:
+        first = results.get(timeout=delay)
+    except queue.Empty:
+        first = None
+        if acquire_slot():
+            logger.warning(f"[Hedge] {model} / {site} 请求超过 {delay:.1f}s 未返回，发出对冲请求")
+            _count(model, site, "hedged")
+            start("hedge", f"llm-{site}-hedge")
+            pending += 1
+        else:
+            logger.info(f"[Hedge] {model} / {site} 请求停滞 {delay:.1f}s，速率限制余量不足，不发对冲请求")
+            _count(model, site, "skipped_rate_limit")
+
+    last_error: Optional[BaseException] = None
+    while pending:
+        tag, value, error, latency = first if first is not None else results.get()
+        first = None
+        pending -= 1
+        if error is None:
+            _observe(model, site, latency)
+            if tag == "hedge":
+                _count(model, site, "hedge_won")
+                logger.info(f"[Hedge] {model} / {site} 对冲请求先返回 ({latency:.1f}s)")
+            with decided:
+                state["done"] = True
+            # 两份几乎同时完成时，另一份已在队列中
+            while pending and not results.empty():
+                other_tag, other_value, other_error, other_latency = results.get()
+                pending -= 1
+                if other_error is None:
+                    _discard(other_tag, other_value, other_latency)
+            return value
+        last_error = error
+        if pending:
+            logger.debug(f"[Hedge] {model} / {site} {tag} 请求失败，等待另一份: {error}")
+    raise last_error
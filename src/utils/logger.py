@@ -3,6 +3,7 @@
 """
 import sys
 from pathlib import Path
+from typing import Optional
 
 from loguru import logger
 
@@ -11,7 +12,7 @@ from config.settings import LOGS_DIR
 
 def setup_logger(
     log_level: str = "INFO",
-    log_file: str = "mtb.log",
+    log_file: Optional[str] = "mtb.log",
     console: bool = True
 ) -> logger:
     """
@@ -19,7 +20,7 @@ def setup_logger(
 
     Args:
         log_level: 日志级别
-        log_file: 日志文件名
+        log_file: 日志文件名（None 不写文件）
         console: 是否输出到控制台
 
     Returns:
@@ -50,22 +51,23 @@ def setup_logger(
         )
 
     # 文件输出
-    log_path = LOGS_DIR / log_file
-    logger.add(
-        str(log_path),
-        format=log_format,
-        level=log_level,
-        rotation="10 MB",  # 文件大小达到 10MB 时轮转
-        retention="7 days",  # 保留 7 天
-        compression="zip",  # 压缩旧日志
-        encoding="utf-8"
-    )
+    if log_file:
+        log_path = LOGS_DIR / log_file
+        logger.add(
+            str(log_path),
+            format=log_format,
+            level=log_level,
+            rotation="10 MB",  # 文件大小达到 10MB 时轮转
+            retention="7 days",  # 保留 7 天
+            compression="zip",  # 压缩旧日志
+            encoding="utf-8"
+        )
 
     return logger
 
 
-# 默认配置
-mtb_logger = setup_logger()
+# 默认配置：导入时只输出到控制台，文件日志由入口（CLI / 服务 / 批处理）调用 setup_logger() 开启
+mtb_logger = setup_logger(log_file=None)
 
 
 # ==================== 进度显示辅助函数 ====================
@@ -330,6 +332,7 @@ def log_convergence_status(phase: str, iteration: int, max_iter: int,
 
 if __name__ == "__main__":
     # 测试日志
+    setup_logger()
     mtb_logger.info("日志模块测试")
     mtb_logger.debug("调试信息")
     mtb_logger.warning("警告信息")
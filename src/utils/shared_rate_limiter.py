@@ -0,0 +1,105 @@
+"""
+跨进程速率限制
+
+进程内限速（BaseAgent 的 OpenRouter 滑动窗口、cBioPortal 的最小间隔）只约束本进程；
+批处理多进程并发时配置 RATE_LIMIT_SHARED_DIR，各进程改为共享同一个文件窗口:
+    {RATE_LIMIT_SHARED_DIR}/{name}.window   窗口内的请求时间戳（每行一个）
+读写在 fcntl 排他文件锁内完成；不支持 fcntl 的平台退回进程内限速。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from config.settings import RATE_LIMIT_SHARED_DIR
+from src.utils.logger import mtb_logger as logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class SharedRateWindow:
+    """文件锁保护的滑动窗口：window 秒内最多 max_requests 个请求（跨进程、跨线程）"""
+
+    def __init__(self, path: Path, max_requests: int, window: float):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_requests = max_requests
+        self.window = window
+
+    @contextmanager
+    def _locked(self) -> Iterator[TextIO]:
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _exchange(self, f: TextIO, update) -> float:
+        """读出窗口内时间戳 → update(stamps, now) 返回 (新时间戳, 结果) → 写回"""
+        f.seek(0)
+        now = time.time()
+        stamps: List[float] = sorted(float(line) for line in f.read().split() if line)
+        stamps = [t for t in stamps if t > now - self.window]
+        stamps, result = update(stamps, now)
+        f.seek(0)
+        f.truncate()
+        f.write("".join(f"{t:.6f}\n" for t in stamps))
+        f.flush()
+        return result
+
+    def try_acquire(self, reserve: int = 0) -> float:
+        """占用一个配额：成功返回 0，否则返回到有空闲配额还需等待的秒数（预留 reserve 个给主请求）"""
+        limit = max(1, self.max_requests - reserve)
+
+        def update(stamps: List[float], now: float):
+            if len(stamps) < limit:
+                return stamps + [now], 0.0
+            return stamps, max(stamps[len(stamps) - limit] + self.window - now, 0.01)
+
+        with self._locked() as f:
+            return self._exchange(f, update)
+
+    def acquire(self, name: str = "") -> None:
+        """阻塞直到占用一个配额（在锁外等待）"""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            logger.info(f"[RateLimiter] 共享窗口 {name or self.path.stem} 已满 ({self.max_requests}/{self.window}s)，等待 {wait:.1f}s")
+            time.sleep(wait)
+
+    def defer(self, seconds: float) -> None:
+        """占满窗口直到 seconds 秒后（上游 429 退避时阻止所有进程发请求）"""
+        def update(stamps: List[float], now: float):
+            return [now + seconds - self.window] * self.max_requests, 0.0
+
+        with self._locked() as f:
+            self._exchange(f, update)
+
+
+_windows: Dict[str, SharedRateWindow] = {}
+_windows_lock = threading.Lock()
+_warned = False
+
+
+def shared_window(name: str, max_requests: int, window: float) -> Optional[SharedRateWindow]:
+    """未配置 RATE_LIMIT_SHARED_DIR（或平台无 fcntl）时返回 None，调用方使用进程内限速"""
+    global _warned
+    shared_dir = RATE_LIMIT_SHARED_DIR
+    if not shared_dir:
+        return None
+    if fcntl is None:
+        if not _warned:
+            _warned = True
+            logger.warning("[RateLimiter] 当前平台不支持 fcntl，跨进程速率限制退回进程内限速")
+        return None
+    with _windows_lock:
+        key = f"{shared_dir}/{name}"
+        if key not in _windows:
+            _windows[key] = SharedRateWindow(Path(shared_dir) / f"{name}.window", max_requests, window)
+        return _windows[key]
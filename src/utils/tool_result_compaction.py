@@ -0,0 +1,164 @@
+"""
+工具结果压缩（多轮工具调用上下文控制）
+
+多轮工具调用时，每轮都会重发完整消息历史，原始工具结果（FDA 说明书章节、
+临床试验列表、PubMed 摘要）原样累积会使输入 token 随轮次二次增长。
+
+压缩策略:
+    - 工具消息总量超出预算时，从最早一轮开始把结果替换为结构化摘要
+      （保留 PMID / NCT / VCV 等标识符、标题行和关键字段）
+    - 当前轮结果模型尚未看到，不压缩
+    - 压缩只作用于发给模型的消息历史；完整结果仍保存在 agent 的
+      tool_call_history 中，用于报告与溯源，模型如需原文应重新调用工具
+"""
+import re
+from typing import Dict, List, Any
+
+from src.models.evidence_graph import estimate_tokens
+
+
+# 摘要保留的标识符（名称, 正则, 捕获组格式化）
+IDENTIFIER_PATTERNS = [
+    ("PMID", re.compile(r"(?:PMID\**[:：\s]*\**\s*|pubmed\.ncbi\.nlm\.nih\.gov/)(\d{5,9})", re.IGNORECASE)),
+    ("NCT", re.compile(r"\b(NCT\d{8})\b")),
+    ("ClinVar", re.compile(r"\b(VCV\d{6,})\b")),
+    ("CIViC", re.compile(r"\b((?:EID|MP|AID)\d+)\b")),
+    ("rsID", re.compile(r"\b(rs\d{3,})\b")),
+]
+
+# 标题行 / 字段行（markdown 标题、**字段**: 值）
+_HEADING_RE = re.compile(r"^\s*#{1,6}\s+\S")
+_FIELD_RE = re.compile(r"^\s*(?:[-*]\s*)?\*\*([^*]{1,40})\*\*\s*[:：]")
+
+# 长文本字段只保留开头
+LONG_TEXT_FIELDS = ("摘要", "abstract", "关键入组标准", "eligibility", "入组标准", "description", "warnings")
+FIELD_LINE_MAX_CHARS = 160
+LONG_FIELD_MAX_CHARS = 80
+
+DIGEST_HEADER = "[已压缩的工具结果]"
+
+
+def extract_identifiers(text: str) -> Dict[str, List[str]]:
+    """提取标识符（保序去重）"""
+    found: Dict[str, List[str]] = {}
+    for name, pattern in IDENTIFIER_PATTERNS:
+        ids = list(dict.fromkeys(m.group(1).upper() if name != "rsID" else m.group(1) for m in pattern.finditer(text)))
+        if ids:
+            found[name] = ids
+    return found
+
+
+def digest_tool_result(tool_name: str, content: str, max_chars: int = 1200) -> str:
+    """
+    生成工具结果的结构化摘要
+
+    Args:
+        tool_name: 工具名
+        content: 完整结果文本
+        max_chars: 摘要字符上限（标识符行不计入截断）
+
+    Returns:
+        摘要文本
+    """
+    lines = [
+        f"{DIGEST_HEADER} {tool_name} (原文约 {estimate_tokens(content)} tokens)",
+        "较早轮次的结果已压缩为摘要，以下标识符与字段可直接引用；如需原文请重新调用该工具。",
+    ]
+
+    identifiers = extract_identifiers(content)
+    if identifiers:
+        lines.append("标识符: " + "; ".join(f"{name} {', '.join(ids)}" for name, ids in identifiers.items()))
+
+    key_lines: List[str] = []
+    used = sum(len(line) for line in lines)
+    for raw in content.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        field_match = _FIELD_RE.match(line)
+        if not (_HEADING_RE.match(line) or field_match):
+            continue
+        limit = FIELD_LINE_MAX_CHARS
+        if field_match and any(f in field_match.group(1).lower() for f in LONG_TEXT_FIELDS):
+            limit = LONG_FIELD_MAX_CHARS
+        if len(line) > limit:
+            line = line[:limit] + "…"
+        if used + len(line) > max_chars:
+            key_lines.append("…")
+            break
+        key_lines.append(line)
+        used += len(line)
+
+    if key_lines:
+        lines.append("要点:")
+        lines.extend(key_lines)
+    elif not identifiers:
+        head = content.strip()[:max_chars]
+        lines.append(head + ("…" if len(content.strip()) > max_chars else ""))
+
+    return "\n".join(lines)
+
+
+def _tool_names_by_call_id(messages: List[Dict[str, Any]]) -> Dict[str, str]:
+    """从助手消息的 tool_calls 中建立 tool_call_id -> 工具名 映射"""
+    names: Dict[str, str] = {}
+    for m in messages:
+        if m.get("role") != "assistant":
+            continue
+        for tc in m.get("tool_calls") or []:
+            names[tc.get("id")] = (tc.get("function") or {}).get("name") or "tool"
+    return names
+
+
+def compact_tool_messages(
+    messages: List[Dict[str, Any]],
+    budget_tokens: int,
+    protect_from: int,
+    digest_max_chars: int = 1200,
+) -> int:
+    """
+    工具消息总量超出预算时，按时间顺序把较早的工具结果替换为摘要（原地修改）
+
+    Args:
+        messages: 消息历史
+        budget_tokens: 工具消息 token 预算（<=0 时不压缩）
+        protect_from: 该下标及之后的消息（当前轮）不压缩
+        digest_max_chars: 单条摘要字符上限
+
+    Returns:
+        节省的 token 数
+    """
+    if budget_tokens <= 0:
+        return 0
+
+    tool_indices = [
+        i for i, m in enumerate(messages)
+        if m.get("role") == "tool" and isinstance(m.get("content"), str)
+    ]
+    total = sum(estimate_tokens(messages[i]["content"]) for i in tool_indices)
+    if total <= budget_tokens:
+        return 0
+
+    tool_names = _tool_names_by_call_id(messages)
+    saved = 0
+
+    for i in tool_indices:
+        if total <= budget_tokens:
+            break
+        if i >= protect_from:
+            break
+        msg = messages[i]
+        content = msg["content"]
+        if content.startswith(DIGEST_HEADER):
+            continue
+        tool_name = tool_names.get(msg.get("tool_call_id"), "tool")
+        digest = digest_tool_result(tool_name, content, digest_max_chars)
+        before = estimate_tokens(content)
+        after = estimate_tokens(digest)
+        if after >= before:
+            continue
+        msg["content"] = digest
+        total -= before - after
+        saved += before - after
+
+    return saved
@@ -0,0 +1,445 @@
+"""
+运行追踪（span）与 Chrome trace / OTLP 导出
+
+一次工作流运行对应一个 Trace（run_trace()），经 contextvars 传递：
+    - LangGraph 节点：graph_callback() 注册为 invoke 回调，按节点开始 / 结束记 span
+      （子图节点的父 span 为子图节点）
+    - 研究方向、LLM 请求（含速率限制排队）、工具调用、证据图合并 / 检查点：span()
+    - 缓存命中：instant()
+
+LangGraph 会把调用方上下文复制到并行节点线程；自建线程池需用 in_trace_context()
+包装任务函数，否则池内 span 不会被记录。
+
+运行结束:
+    - export_chrome(): {run_folder}/trace.json，可在 chrome://tracing 或 ui.perfetto.dev 打开
+    - export_otlp(): 可选，OTLP/HTTP JSON 发往本地 collector
+    - phase_summary(): 按阶段的关键路径耗时与 LLM / 工具 / 限速等待占用
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config.settings import TRACE_ENABLED, TRACE_MAX_EVENTS
+from src.utils.logger import mtb_logger as logger
+
+# 阶段汇总中统计占用时间的 span 类别
+BUSY_CATEGORIES = ("llm", "rate_limit", "tool", "graph")
+
+_PHASE_PATTERN = re.compile(r"phase(\d[ab]?)")
+
+
+@dataclass
+class SpanRecord:
+    """一个 span（end 为 None 表示尚未结束）"""
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    category: str
+    start: float
+    tid: int
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    end: Optional[float] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else self.start) - self.start
+
+
+class _NullSpan:
+    """追踪关闭时 span() 返回的占位对象"""
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("mtb_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[SpanRecord]] = contextvars.ContextVar("mtb_span", default=None)
+
+
+class Trace:
+    """一次运行的 span 集合（线程安全）"""
+
+    def __init__(self, name: str, max_events: int = TRACE_MAX_EVENTS):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.max_events = max_events
+        self.dropped = 0
+        self._t0 = time.perf_counter()
+        self._wall_t0 = time.time()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spans: List[SpanRecord] = []
+        self._instants: List[SpanRecord] = []
+        self._threads: Dict[int, str] = {}
+        self._open_nodes: Dict[int, List[SpanRecord]] = {}
+
+    # ==================== 记录 ====================
+
+    def _new_record(self, name: str, category: str, parent_id: Optional[str], attrs: Dict[str, Any]) -> SpanRecord:
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            span_id = f"{next(self._ids):016x}"
+        return SpanRecord(span_id, parent_id, name, category, time.perf_counter(), thread.ident, dict(attrs))
+
+    def _append(self, target: List[SpanRecord], record: SpanRecord) -> None:
+        with self._lock:
+            if len(self._spans) + len(self._instants) >= self.max_events:
+                self.dropped += 1
+                return
+            target.append(record)
+
+    def _parent_for_current_thread(self) -> Optional[str]:
+        current = _current_span.get()
+        if current is not None:
+            return current.span_id
+        with self._lock:
+            stack = self._open_nodes.get(threading.get_ident())
+            return stack[-1].span_id if stack else None
+
+    def open_span(self, name: str, category: str, parent_id: Optional[str] = None, **attrs: Any) -> SpanRecord:
+        record = self._new_record(name, category, parent_id, attrs)
+        self._append(self._spans, record)
+        return record
+
+    def close_span(self, record: SpanRecord) -> None:
+        record.end = time.perf_counter()
+
+    def instant(self, name: str, category: str, **attrs: Any) -> None:
+        record = self._new_record(name, category, self._parent_for_current_thread(), attrs)
+        record.end = record.start
+        self._append(self._instants, record)
+
+    # ==================== LangGraph 节点 ====================
+
+    def graph_callback(self):
+        """LangGraph 回调：为每个节点（含子图内节点）记 span"""
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        trace = self
+
+        class _NodeSpanHandler(BaseCallbackHandler):
+            def __init__(self):
+                self._lock = threading.Lock()
+                self._owner: Dict[Any, Optional[str]] = {}     # run_id → 最近的节点 span_id
+                self._nodes: Dict[Any, SpanRecord] = {}
+
+            def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+                with self._lock:
+                    owner = self._owner.get(parent_run_id)
+                name = kwargs.get("name")
+                is_node = bool(name) and not name.startswith("__") \
+                    and name == (metadata or {}).get("langgraph_node") \
+                    and any(tag.startswith("graph:step:") for tag in tags or [])
+                if is_node:
+                    record = trace.open_span(name, "node", parent_id=owner)
+                    with trace._lock:
+                        trace._open_nodes.setdefault(record.tid, []).append(record)
+                    with self._lock:
+                        self._nodes[run_id] = record
+                    owner = record.span_id
+                with self._lock:
+                    self._owner[run_id] = owner
+
+            def _finish(self, run_id, error: Optional[BaseException] = None):
+                with self._lock:
+                    self._owner.pop(run_id, None)
+                    record = self._nodes.pop(run_id, None)
+                if record is None:
+                    return
+                if error is not None:
+                    record.set(error=type(error).__name__)
+                trace.close_span(record)
+                with trace._lock:
+                    stack = trace._open_nodes.get(record.tid, [])
+                    if record in stack:
+                        stack.remove(record)
+
+            def on_chain_end(self, outputs, *, run_id, **kwargs):
+                self._finish(run_id)
+
+            def on_chain_error(self, error, *, run_id, **kwargs):
+                self._finish(run_id, error)
+
+        return _NodeSpanHandler()
+
+    # ==================== 导出 ====================
+
+    def _snapshot(self) -> Tuple[List[SpanRecord], List[SpanRecord], Dict[int, str]]:
+        with self._lock:
+            spans = [s for s in self._spans if s.end is not None]
+            return spans, list(self._instants), dict(self._threads)
+
+    def _us(self, t: float) -> float:
+        return round((t - self._t0) * 1e6, 1)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Chrome trace event 格式（Perfetto 兼容）"""
+        spans, instants, threads = self._snapshot()
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": f"MTB {self.name}"}}
+        ]
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        for s in spans:
+            events.append({
+                "name": s.name, "cat": s.category, "ph": "X", "pid": pid, "tid": s.tid,
+                "ts": self._us(s.start), "dur": self._us(s.end) - self._us(s.start),
+                "args": {**s.attrs, "span_id": s.span_id, "parent_id": s.parent_id},
+            })
+        for s in instants:
+            events.append({
+                "name": s.name, "cat": s.category, "ph": "i", "s": "t", "pid": pid, "tid": s.tid,
+                "ts": self._us(s.start), "args": dict(s.attrs),
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"run": self.name, "trace_id": self.trace_id, "dropped_events": self.dropped},
+        }
+
+    def export_chrome(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(self.to_chrome(), ensure_ascii=False, default=str), encoding="utf-8")
+        tmp.replace(path)
+        return path
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/HTTP JSON（resourceSpans）；缓存命中等瞬时事件记为零时长 span"""
+        spans, instants, _ = self._snapshot()
+
+        def unix_nanos(t: float) -> str:
+            return str(int((self._wall_t0 + t - self._t0) * 1e9))
+
+        def attribute(key: str, value: Any) -> Dict[str, Any]:
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        otlp_spans = []
+        for s in spans + instants:
+            otlp_spans.append({
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": unix_nanos(s.start),
+                "endTimeUnixNano": unix_nanos(s.end),
+                "attributes": [attribute("mtb.category", s.category)] + [attribute(k, v) for k, v in s.attrs.items()],
+                "status": {"code": 2} if "error" in s.attrs else {},
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", "mtb-workflow"), attribute("mtb.run", self.name)]},
+            "scopeSpans": [{"scope": {"name": "src.utils.tracing"}, "spans": otlp_spans}],
+        }]}
+
+    def export_otlp(self, endpoint: str) -> bool:
+        import requests
+
+        try:
+            response = requests.post(endpoint, json=self.to_otlp(), timeout=10)
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"[Trace] OTLP 导出失败 ({endpoint}): {e}")
+            return False
+
+    # ==================== 阶段汇总 ====================
+
+    def phase_summary(self) -> List[Dict[str, Any]]:
+        """
+        按阶段的关键路径耗时
+
+        阶段 = 顶层节点；含子图的顶层节点按子图节点名中的 phaseN 再分组。
+        关键路径从阶段末尾向前，每次选取结束最晚的节点，跳过与其并行的节点。
+        """
+        spans, instants, _ = self._snapshot()
+        nodes = [s for s in spans if s.category == "node"]
+        children: Dict[Optional[str], List[SpanRecord]] = {}
+        for s in nodes:
+            children.setdefault(s.parent_id, []).append(s)
+
+        groups: Dict[str, List[SpanRecord]] = {}
+        for top in sorted(children.get(None, []), key=lambda s: s.start):
+            inner = children.get(top.span_id)
+            if not inner:
+                groups.setdefault(top.name, []).append(top)
+                continue
+            for s in inner:
+                groups.setdefault(phase_of(s.name), []).append(s)
+
+        busy = {
+            category: _merge([(s.start, s.end) for s in spans if s.category == category])
+            for category in BUSY_CATEGORIES
+        }
+        summary = []
+        for phase, members in sorted(groups.items(), key=lambda item: min(s.start for s in item[1])):
+            windows = _merge([(s.start, s.end) for s in members])
+            on_path: Dict[str, float] = {}
+            for s in _critical_path(members):
+                on_path[s.name] = on_path.get(s.name, 0.0) + s.duration
+            row = {
+                "phase": phase,
+                "wall_seconds": round(sum(end - start for start, end in windows), 3),
+                "critical_path": [
+                    {"node": name, "seconds": round(seconds, 3)}
+                    for name, seconds in sorted(on_path.items(), key=lambda kv: -kv[1])
+                ],
+                "llm_calls": sum(1 for s in spans if s.category == "llm" and _inside(s.start, windows)),
+                "tool_calls": sum(1 for s in spans if s.category == "tool" and _inside(s.start, windows)),
+                "cache_hits": sum(1 for s in instants if s.category == "cache" and _inside(s.start, windows)),
+            }
+            for category in BUSY_CATEGORIES:
+                row[f"{category}_seconds"] = round(_overlap(busy[category], windows), 3)
+            summary.append(row)
+        return summary
+
+
+def phase_of(node: str) -> str:
+    """节点名 → 阶段名（phase1_pathologist → phase1；其余节点即阶段本身）"""
+    match = _PHASE_PATTERN.search(node)
+    return f"phase{match.group(1)}" if match else node
+
+
+def _merge(intervals: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    merged: List[Tuple[float, float]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _overlap(a: List[Tuple[float, float]], b: List[Tuple[float, float]]) -> float:
+    """两个已合并区间列表的交集长度"""
+    total, i, j = 0.0, 0, 0
+    while i < len(a) and j < len(b):
+        total += max(0.0, min(a[i][1], b[j][1]) - max(a[i][0], b[j][0]))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return total
+
+
+def _inside(t: float, windows: List[Tuple[float, float]]) -> bool:
+    return any(start <= t <= end for start, end in windows)
+
+
+def _critical_path(members: List[SpanRecord]) -> List[SpanRecord]:
+    path: List[SpanRecord] = []
+    cursor = max(s.end for s in members)
+    remaining = sorted(members, key=lambda s: s.end, reverse=True)
+    while True:
+        chosen = next((s for s in remaining if s.end <= cursor + 1e-6), None)
+        if chosen is None:
+            break
+        path.append(chosen)
+        cursor = chosen.start
+        remaining = [s for s in remaining if s.end <= cursor + 1e-6]
+    return path[::-1]
+
+
+def format_phase_summary(summary: List[Dict[str, Any]]) -> str:
+    if not summary:
+        return ""
+    lines = ["阶段 | 墙钟(s) | 关键路径(前3) | LLM(s) | 限速等待(s) | 工具(s) | 图合并/检查点(s) | LLM调用 | 工具调用 | 缓存命中"]
+    for r in summary:
+        path = ", ".join(f"{p['node']} {p['seconds']:.1f}s" for p in r["critical_path"][:3])
+        lines.append(
+            f"{r['phase']} | {r['wall_seconds']:.1f} | {path} | {r['llm_seconds']:.1f} | {r['rate_limit_seconds']:.1f} | "
+            f"{r['tool_seconds']:.1f} | {r['graph_seconds']:.1f} | {r['llm_calls']} | {r['tool_calls']} | {r['cache_hits']}"
+        )
+    return "\n".join(lines)
+
+
+# ==================== 模块级接口 ====================
+
+@contextmanager
+def run_trace(name: str) -> Iterator[Optional[Trace]]:
+    """为一次运行建立 Trace（TRACE_ENABLED=false 时为 None）"""
+    if not TRACE_ENABLED:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, category: str, **attrs: Any) -> Iterator[Any]:
+    """在当前 Trace 中记一个 span；无 Trace 时为空操作。产出对象可 .set(**attrs) 补充属性"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    record = trace.open_span(name, category, parent_id=trace._parent_for_current_thread(), **attrs)
+    token = _current_span.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.close_span(record)
+
+
+def traced(name: str, category: str) -> Callable[[Callable], Callable]:
+    """装饰器：每次调用记一个 span"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instant(name: str, category: str = "cache", **attrs: Any) -> None:
+    """瞬时事件（缓存命中等）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.instant(name, category, **attrs)
+
+
+def in_trace_context(fn: Callable) -> Callable:
+    """把当前上下文（Trace 与父 span）带入线程池任务"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
@@ -0,0 +1,304 @@
+"""
+Token 用量账本与阶段软预算
+
+每次 LLM 调用（run_with_budget 的每次发送）记一条:
+    阶段 / 节点 / 迭代 / Agent / 研究方向 / 调用点 / 模型
+    prompt / 缓存命中 / completion / reasoning token、延迟、费用（美元）
+
+标签来源:
+    - 节点与阶段：当前 LangGraph 节点（langgraph.config.get_config），phase1_* → phase1
+    - Agent / 迭代 / 方向 / 模型：usage_tags() 上下文（research_iterate、BaseAgent._call_api）
+费用优先取 OpenRouter 响应的 usage.cost，否则按 MODEL_PRICING 估算。
+
+阶段软预算（PHASE_TOKEN_BUDGETS）: 阶段累计 token 超出后，
+    - guard_budget(): reasoning effort 降一档
+    - guard_tool_rounds(): 研究方向工具轮数减半（最少 1 轮）
+
+用法:
+    python -m src.utils.usage_ledger reports/<运行目录> [更多目录或 usage_ledger.jsonl] --by phase agent
+"""
+import argparse
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.settings import MODEL_PRICING, MODEL_PRICING_OVERRIDE, PHASE_TOKEN_BUDGETS
+from src.utils.logger import mtb_logger as logger
+from src.utils.tracing import phase_of
+
+if TYPE_CHECKING:
+    from src.utils.llm_budget import CallBudget
+
+LEDGER_FILENAME = "usage_ledger.jsonl"
+GROUP_FIELDS = ("phase", "node", "iteration", "agent", "direction", "call_site", "model")
+_EFFORT_LADDER = ("high", "medium", "low", "minimal")
+
+
+def _load_json_setting(name: str, raw: str) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    try:
+        return dict(json.loads(raw))
+    except (ValueError, TypeError) as e:
+        logger.warning(f"[UsageLedger] {name} 解析失败，忽略: {e}")
+        return {}
+
+
+_PRICING = {**MODEL_PRICING, **_load_json_setting("MODEL_PRICING_OVERRIDE", MODEL_PRICING_OVERRIDE)}
+_PHASE_BUDGETS = {k: int(v) for k, v in _load_json_setting("PHASE_TOKEN_BUDGETS", PHASE_TOKEN_BUDGETS).items()}
+
+
+def estimate_cost(model: str, usage: Dict[str, Any]) -> Tuple[float, str]:
+    """返回 (美元, 来源)；来源为 openrouter / estimate / unpriced"""
+    if isinstance(usage.get("cost"), (int, float)):
+        return float(usage["cost"]), "openrouter"
+    price = _PRICING.get(model)
+    if not price:
+        return 0.0, "unpriced"
+    prompt = usage.get("prompt_tokens") or 0
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    completion = usage.get("completion_tokens") or 0
+    cost = (
+        (prompt - cached) * price.get("prompt", 0.0)
+        + cached * price.get("cached_prompt", price.get("prompt", 0.0))
+        + completion * price.get("completion", 0.0)
+    ) / 1_000_000
+    return cost, "estimate"
+
+
+class UsageLedger:
+    """一次运行的用量账本（线程安全）"""
+
+    def __init__(self, phase_budgets: Optional[Dict[str, int]] = None):
+        self.phase_budgets = _PHASE_BUDGETS if phase_budgets is None else dict(phase_budgets)
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        self._phase_tokens: Dict[str, int] = {}
+        self._warned: set = set()
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+            phase = entry.get("phase") or ""
+            self._phase_tokens[phase] = (
+                self._phase_tokens.get(phase, 0) + entry["prompt_tokens"] + entry["completion_tokens"]
+            )
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._entries)
+
+    # ==================== 软预算 ====================
+
+    def over_budget(self, phase: str) -> bool:
+        limit = self.phase_budgets.get(phase)
+        if not limit:
+            return False
+        with self._lock:
+            spent = self._phase_tokens.get(phase, 0)
+            first = spent >= limit and phase not in self._warned
+            if first:
+                self._warned.add(phase)
+        if first:
+            logger.warning(
+                f"[UsageLedger] {phase} 已用 {spent} token，超出软预算 {limit}："
+                f"后续调用 reasoning effort 降一档、研究工具轮数减半"
+            )
+        return spent >= limit
+
+    # ==================== 持久化 ====================
+
+    def save(self, path: Path, run_id: str = "") -> Path:
+        """写入 JSONL（先写临时文件再替换）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.entries():
+                f.write(json.dumps({"run_id": run_id, **entry}, ensure_ascii=False) + "\n")
+        tmp.replace(path)
+        return path
+
+    @staticmethod
+    def load(path: Path) -> List[Dict[str, Any]]:
+        """读取账本文件；传入运行目录时读取其中的 usage_ledger.jsonl"""
+        path = Path(path)
+        if path.is_dir():
+            path = path / LEDGER_FILENAME
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def summary(self, by: Sequence[str] = ("phase",)) -> Dict[str, Any]:
+        return summarize(self.entries(), by)
+
+
+def summarize(entries: List[Dict[str, Any]], by: Sequence[str] = ("phase",)) -> Dict[str, Any]:
+    """按字段分组汇总；返回 {"total": {...}, "groups": {"a / b": {...}}}"""
+    def empty() -> Dict[str, Any]:
+        return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+                "reasoning_tokens": 0, "cost_usd": 0.0, "latency": 0.0, "downgraded": 0}
+
+    total = empty()
+    groups: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        key = " / ".join(str(entry.get(field) if entry.get(field) not in (None, "") else "-") for field in by)
+        for row in (total, groups.setdefault(key, empty())):
+            row["calls"] += 1
+            for field in ("prompt_tokens", "cached_tokens", "completion_tokens", "reasoning_tokens", "cost_usd", "latency"):
+                row[field] += entry.get(field) or 0
+            row["downgraded"] += 1 if entry.get("downgraded") else 0
+    for row in [total, *groups.values()]:
+        row["cost_usd"] = round(row["cost_usd"], 4)
+        row["latency"] = round(row["latency"], 2)
+    return {"by": list(by), "total": total, "groups": groups}
+
+
+def format_summary(summary: Dict[str, Any], sort: str = "cost_usd") -> str:
+    if not summary["groups"]:
+        return ""
+    lines = [f"{' / '.join(summary['by'])} | 调用 | prompt | 缓存命中 | completion | reasoning | 费用($) | 延迟(s) | 降级"]
+    rows = sorted(summary["groups"].items(), key=lambda kv: -kv[1][sort])
+    for key, r in rows + [("合计", summary["total"])]:
+        lines.append(
+            f"{key} | {r['calls']} | {r['prompt_tokens']} | {r['cached_tokens']} | {r['completion_tokens']} | "
+            f"{r['reasoning_tokens']} | {r['cost_usd']:.4f} | {r['latency']:.1f} | {r['downgraded']}"
+        )
+    return "\n".join(lines)
+
+
+# ==================== 运行上下文 ====================
+
+_current_ledger: contextvars.ContextVar[Optional[UsageLedger]] = contextvars.ContextVar("mtb_usage_ledger", default=None)
+_current_tags: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("mtb_usage_tags", default={})
+
+
+@contextmanager
+def run_ledger(phase_budgets: Optional[Dict[str, int]] = None) -> Iterator[UsageLedger]:
+    ledger = UsageLedger(phase_budgets)
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+def current_ledger() -> Optional[UsageLedger]:
+    return _current_ledger.get()
+
+
+@contextmanager
+def usage_tags(**tags: Any) -> Iterator[None]:
+    """为其中的 LLM 调用附加标签（agent / iteration / direction / model）"""
+    token = _current_tags.set({**_current_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _current_tags.reset(token)
+
+
+def _current_node() -> str:
+    try:
+        from langgraph.config import get_config
+        return (get_config().get("metadata") or {}).get("langgraph_node") or ""
+    except (ImportError, RuntimeError):
+        return ""
+
+
+def _current_phase() -> str:
+    node = _current_node()
+    return phase_of(node) if node else ""
+
+
+def guard_budget(budget: "CallBudget") -> "CallBudget":
+    """当前阶段超出软预算时 reasoning effort 降一档（未超出原样返回）"""
+    ledger = _current_ledger.get()
+    if ledger is None or budget.reasoning_effort not in _EFFORT_LADDER[:-1]:
+        return budget
+    if not ledger.over_budget(_current_phase()):
+        return budget
+    lower = _EFFORT_LADDER[_EFFORT_LADDER.index(budget.reasoning_effort) + 1]
+    return replace(budget, reasoning_effort=lower)
+
+
+def guard_tool_rounds(rounds: int) -> int:
+    """当前阶段超出软预算时工具轮数减半（最少 1 轮）"""
+    ledger = _current_ledger.get()
+    if ledger is None or not ledger.over_budget(_current_phase()):
+        return rounds
+    return max(1, rounds // 2)
+
+
+def record_usage(
+    budget: "CallBudget",
+    result: Dict[str, Any],
+    latency: float,
+    downgraded: bool = False,
+    hedge_discarded: bool = False,
+) -> None:
+    """记一次 LLM 调用（无运行账本时忽略）；hedge_discarded 标记对冲落败但已计费的请求"""
+    ledger = _current_ledger.get()
+    if ledger is None:
+        return
+    tags = _current_tags.get()
+    usage = result.get("usage") or {}
+    model = tags.get("model") or result.get("model") or ""
+    cost, cost_source = estimate_cost(model, usage)
+    node = _current_node()
+    ledger.record({
+        "ts": round(time.time(), 3),
+        "phase": phase_of(node) if node else "",
+        "node": node,
+        "iteration": tags.get("iteration"),
+        "agent": tags.get("agent", ""),
+        "direction": tags.get("direction", ""),
+        "call_site": budget.site,
+        "model": model,
+        "reasoning_effort": budget.reasoning_effort,
+        "downgraded": downgraded,
+        "hedge_discarded": hedge_discarded,
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "reasoning_tokens": (usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0,
+        "latency": round(latency, 3),
+        "cost_usd": round(cost, 6),
+        "cost_source": cost_source,
+        "finish_reason": ((result.get("choices") or [{}])[0].get("finish_reason") or ""),
+    })
+
+
+# ==================== CLI 报告 ====================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="按阶段 / Agent / 调用点汇总运行的 token 用量与费用")
+    parser.add_argument("paths", nargs="+", help="运行目录或 usage_ledger.jsonl（多个时合并统计）")
+    parser.add_argument("--by", nargs="+", default=["phase"], choices=GROUP_FIELDS, help="分组字段 (默认: phase)")
+    parser.add_argument("--sort", default="cost_usd", choices=("cost_usd", "prompt_tokens", "completion_tokens", "calls", "latency"))
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    entries: List[Dict[str, Any]] = []
+    for path in args.paths:
+        try:
+            entries.extend(UsageLedger.load(Path(path)))
+        except OSError as e:
+            print(f"[ERROR] 无法读取 {path}: {e}")
+            return 1
+    summary = summarize(entries, args.by)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(format_summary(summary, args.sort) or "账本为空")
+        unpriced = sorted({e.get("model", "") for e in entries if e.get("cost_source") == "unpriced"})
+        if unpriced:
+            print(f"\n未定价模型（费用按 0 计，可用 MODEL_PRICING_OVERRIDE 补充）: {', '.join(unpriced)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,664 @@
+"""
+API 客户端单元测试（mock HTTP，不访问真实上游）
+
+测试覆盖:
+- cBioPortal：多研究并发拉取、频率表归约与合并、(基因, 研究) 磁盘缓存、失败不写缓存
+- CIViC：别名化批量 GraphQL、按别名拆分结果、别名数上限、缓存、失败二分重试、工具多变异输入
+- GDC：子查询并发、服务端分面替代客户端计数、按基因归约结果磁盘缓存、失败不写缓存
+- ClinicalTrials.gov：nextPageToken 分页、两级拉取（搜索只取摘要 / 入组标准只取入围试验）、工具 nct_ids 参数、
+  本地试验索引应答与增量刷新
+- FDA 说明书本地索引：批量文件导入（zip / 新版本覆盖）、按名称 / set_id 查找、按章节返回、工具 sections 参数、
+  索引未命中且 openFDA 熔断时返回服务不可用
+- RxNorm：药物名 → RxCUI 并发解析与持久化缓存（多进程合并写入、读到其他进程的条目）、
+  按 RxCUI 对缓存相互作用（超集只查新增药物对）
+"""
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import zipfile
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.tools.api_clients import cbioportal_client
+from src.tools.api_clients.cbioportal_client import cBioPortalClient
+from src.tools.api_clients import civic_client
+from src.tools.api_clients.civic_client import CIViCClient
+from src.tools.api_clients import gdc_client
+from src.tools.api_clients.gdc_client import GDCClient
+from src.tools.api_clients import clinicaltrials_client
+from src.tools.api_clients.clinicaltrials_client import ClinicalTrialsClient
+from src.tools.api_clients.clinicaltrials_index import TrialIndex
+from src.tools.api_clients import fda_label_index
+from src.tools.api_clients.fda_label_index import FDALabelIndex
+from src.tools.api_clients import rxnorm_client
+from src.tools.api_clients.rxnorm_client import RxNormClient
+
+
+def _response(status=200, payload=None):
+    resp = MagicMock(status_code=status)
+    resp.json.return_value = payload
+    resp.raise_for_status.side_effect = None if status < 400 else Exception(f"HTTP {status}")
+    return resp
+
+
+class TestCBioPortalFrequency:
+
+    STUDY_MUTATIONS = {
+        "msk_met_2021": ["G12C", "G12D", "G12C", None, "G13D"],
+        "msk_impact_2017": ["G12D", "G12D", "Q61H"],
+    }
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        with patch.object(cbioportal_client, "CBIOPORTAL_CACHE_DIR", tmp_path), \
+                patch.object(cbioportal_client, "CBIOPORTAL_CACHE_TTL_DAYS", 30), \
+                patch.object(cBioPortalClient, "_rate_limit", lambda self: None), \
+                patch.object(cBioPortalClient, "_gene_cache", {"KRAS": {"entrezGeneId": 3845, "hugoGeneSymbol": "KRAS"}}):
+            yield cBioPortalClient()
+
+    def _serve(self, client, delay=0.0, fail=()):
+        calls = []
+        active = [0, 0]  # 当前并发数, 最大并发数
+        lock = threading.Lock()
+
+        def request(method, url, **kwargs):
+            study = url.split("/molecular-profiles/")[1].split("_mutations")[0]
+            with lock:
+                calls.append(study)
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(delay)
+            with lock:
+                active[0] -= 1
+            if study in fail:
+                return _response(503)
+            return _response(200, [{"proteinChange": c} for c in self.STUDY_MUTATIONS.get(study, [])])
+
+        client._request = request
+        return calls, active
+
+    def test_aggregation_matches_serial_tally(self, client):
+        self._serve(client)
+        result = client.get_mutation_frequency("KRAS")
+
+        assert result["studies_analyzed"] == 2
+        assert result["total_mutations"] == 8
+        assert result["common_mutations"] == {"G12C": 2, "G12D": 3, "G13D": 1, "Q61H": 1}
+        assert result["top_mutations"][:2] == [{"mutation": "G12D", "count": 3}, {"mutation": "G12C", "count": 2}]
+        assert result["by_cancer_type"] == {"msk": {"mutation_count": 8}}
+
+    def test_studies_fetched_concurrently(self, client):
+        calls, active = self._serve(client, delay=0.1)
+        client.get_mutation_frequency("KRAS")
+        assert sorted(calls) == ["msk_impact_2017", "msk_met_2021"]
+        assert active[1] == 2
+
+    def test_disk_cache_holds_reduced_tables(self, client, tmp_path):
+        calls, _ = self._serve(client)
+        first = client.get_mutation_frequency("KRAS")
+        second = client.get_mutation_frequency("KRAS")
+
+        assert len(calls) == 2
+        assert first == second
+        cached = sorted(p.name for p in tmp_path.iterdir())
+        assert cached == ["3845__msk_impact_2017.json", "3845__msk_met_2021.json"]
+        assert "proteinChange" not in (tmp_path / cached[0]).read_text()
+
+    def test_failed_study_not_cached(self, client, tmp_path):
+        calls, _ = self._serve(client, fail={"msk_met_2021"})
+        result = client.get_mutation_frequency("KRAS")
+        assert result["studies_analyzed"] == 1
+        assert [p.name for p in tmp_path.iterdir()] == ["3845__msk_impact_2017.json"]
+
+        client.get_mutation_frequency("KRAS")
+        assert calls.count("msk_met_2021") == 2
+
+
+def _civic_profile(name, mp_id, level="A", drug="Osimertinib"):
+    return {
+        "id": mp_id, "name": name, "description": "", "link": f"/molecular-profiles/{mp_id}", "variants": [],
+        "evidenceItems": {"totalCount": 1, "nodes": [{
+            "id": mp_id * 10, "status": "ACCEPTED", "evidenceType": "PREDICTIVE", "evidenceLevel": level,
+            "evidenceDirection": "SUPPORTS", "significance": "SENSITIVITYRESPONSE",
+            "disease": {"name": "NSCLC"}, "therapies": [{"name": drug}],
+            "source": {"sourceType": "PUBMED", "citationId": "123"},
+        }]},
+    }
+
+
+class TestCIViCBatch:
+
+    KNOWN = {"EGFR L858R": 33, "EGFR T790M": 34, "KRAS G12C": 78}
+
+    @pytest.fixture
+    def client(self):
+        with patch.object(CIViCClient, "_variant_cache", {}):
+            client = CIViCClient()
+            client.queries = []
+
+            def execute(query, variables=None):
+                client.queries.append((query, variables))
+                if getattr(client, "fail_batches", False) and len(variables) > 1:
+                    return None
+                return {
+                    f"mp{key[1:]}": {"nodes": [_civic_profile(name, self.KNOWN[name])] if name in self.KNOWN else []}
+                    for key, name in variables.items()
+                }
+
+            client._execute_query = execute
+            yield client
+
+    def test_single_request_demultiplexed(self, client):
+        pairs = [("EGFR", "L858R"), ("KRAS", "G12C"), ("BRAF", "V600K")]
+        results = client.search_variants(pairs)
+
+        assert len(client.queries) == 1
+        query, variables = client.queries[0]
+        assert "mp2: molecularProfiles(name: $n2)" in query
+        assert variables == {"n0": "EGFR L858R", "n1": "KRAS G12C", "n2": "BRAF V600K"}
+        assert results[("EGFR", "L858R")]["id"] == 33
+        assert results[("KRAS", "G12C")]["id"] == 78
+        assert results[("BRAF", "V600K")] is None
+
+    def test_alias_cap_and_cache(self, client):
+        with patch.object(civic_client, "CIVIC_BATCH_MAX_ALIASES", 2):
+            client.search_variants([("EGFR", "L858R"), ("EGFR", "T790M"), ("KRAS", "G12C")])
+            assert [len(v) for _, v in client.queries] == [2, 1]
+
+            client.search_variants([("egfr", "l858r"), ("BRAF", "V600K"), ("BRAF", "V600K")])
+        assert client.queries[-1][1] == {"n0": "BRAF V600K"}
+        assert client.search_variant("KRAS", "G12C")["id"] == 78
+        assert len(client.queries) == 3
+
+    def test_failed_batch_is_split(self, client):
+        client.fail_batches = True
+        results = client.search_variants([("EGFR", "L858R"), ("KRAS", "G12C")])
+        # 2 个别名失败 → 各自单独查询
+        assert [len(v) for _, v in client.queries] == [2, 1, 1]
+        assert results[("KRAS", "G12C")]["id"] == 78
+
+    def test_implications_do_not_mutate_cache(self, client):
+        first = client.get_therapeutic_implications("EGFR", "L858R")
+        first["top_therapeutic_evidence"].clear()
+        assert client.get_therapeutic_implications("EGFR", "L858R")["top_therapeutic_evidence"]
+
+    def test_tool_accepts_multiple_variants(self, client):
+        from src.tools.molecular_tools import CIViCTool
+
+        tool = CIViCTool()
+        tool.client = client
+        output = tool.invoke(gene="EGFR", variants=["L858R", "T790M", "KRAS-G12C", "BRAF V600K"])
+
+        assert len(client.queries) == 1
+        for header in ("EGFR L858R", "EGFR T790M", "KRAS G12C", "BRAF V600K"):
+            assert f"**变异**: {header}" in output
+        assert "未找到该变异在 CIViC 数据库中的记录" in output
+
+    def test_parse_variants_without_gene(self):
+        from src.tools.molecular_tools import CIViCTool
+
+        parse = CIViCTool._parse_variants
+        assert parse(["exon 19 deletion", "V600E mutation", "ERBB2 amplification"], default_gene="EGFR") == [
+            ("EGFR", "exon 19 deletion"), ("EGFR", "V600E mutation"), ("ERBB2", "amplification")]
+        assert parse(["exon 19 deletion"]) == []
+
+
+class TestGDCFacets:
+
+    ENSEMBL = "ENSG00000146648"
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        with patch.object(gdc_client, "GDC_CACHE_DIR", tmp_path), \
+                patch.object(gdc_client, "GDC_CACHE_TTL_DAYS", 30), \
+                patch.object(GDCClient, "_gene_cache", {}):
+            client = GDCClient()
+            client.calls = []
+            client.session.get = self._serve(client)
+            yield client
+
+    def _serve(self, client):
+        lock = threading.Lock()
+        active = client.active = [0, 0]  # 当前并发数, 最大并发数
+
+        def get(url, params=None, **kwargs):
+            endpoint = url.split("api.gdc.cancer.gov/")[1]
+            client.calls.append((endpoint, dict(params or {})))
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(getattr(client, "delay", 0.0))
+            with lock:
+                active[0] -= 1
+            if endpoint in getattr(client, "fail", ()):
+                return _response(503)
+            if endpoint == "genes":
+                return _response(200, {"data": {"hits": [{"gene_id": self.ENSEMBL}]}})
+            if endpoint == "analysis/top_cases_counts_by_genes":
+                return _response(200, {"aggregations": {"projects": {"buckets": [
+                    {"key": project, "genes": {"my_genes": {"gene_id": {"buckets": [{"key": self.ENSEMBL, "doc_count": n}]}}}}
+                    for project, n in (("TCGA-LUAD", 60), ("TCGA-LUSC", 15), ("TCGA-GBM", 25))
+                ]}}})
+            if endpoint == "ssms":
+                return _response(200, {"data": {"hits": [], "pagination": {"total": 812}, "aggregations": {
+                    "consequence.transcript.aa_change": {"buckets": [
+                        {"key": "L858R", "doc_count": 40}, {"key": "T790M", "doc_count": 12}, {"key": "_missing", "doc_count": 9},
+                    ]}}}})
+            if endpoint == "ssm_occurrences":
+                return _response(200, {"data": {"hits": [], "aggregations": {
+                    "case.project.project_id": {"buckets": [{"key": "TCGA-LUAD", "doc_count": 18}, {"key": "TCGA-LUSC", "doc_count": 2}]}}}})
+            return _response(404)
+
+        return get
+
+    def test_frequency_from_server_side_facets(self, client):
+        result = client.get_mutation_frequency("EGFR", cancer_type="tcga-lu")
+
+        assert result["by_cancer_type"] == {"TCGA-LUAD": {"mutation_count": 60}, "TCGA-LUSC": {"mutation_count": 15}}
+        assert result["studies_analyzed"] == 2
+        assert result["total_mutations"] == 812
+        assert result["top_mutations"] == [{"mutation": "L858R", "count": 40}, {"mutation": "T790M", "count": 12}]
+
+        params = dict(client.calls)
+        assert params["ssms"]["size"] == 0 and params["ssms"]["facets"] == "consequence.transcript.aa_change"
+        assert params["genes"]["fields"] == "gene_id"
+
+    def test_sub_queries_concurrent(self, client):
+        client.delay = 0.1
+        client.get_variant_frequency_summary("EGFR", "L858R")
+        assert client.active[1] >= 2
+
+    def test_variant_summary_and_cache(self, client, tmp_path):
+        summary = client.get_variant_frequency_summary("EGFR", "L858R")
+        assert summary["variant_count"] == 20
+        assert summary["variant_by_project"] == {"TCGA-LUAD": 18, "TCGA-LUSC": 2}
+        assert summary["frequency_percentage"] == 20.0
+        occurrence_params = dict(client.calls)["ssm_occurrences"]
+        assert occurrence_params["size"] == 0 and "p.L858R" in occurrence_params["filters"]
+
+        calls = len(client.calls)
+        with patch.object(GDCClient, "_gene_cache", {}):
+            assert client.get_variant_frequency_summary("EGFR", "L858R") == summary
+            client.get_mutation_frequency("egfr")
+        assert len(client.calls) == calls
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["EGFR.json", "EGFR__L858R.json"]
+
+    def test_failed_sub_query_not_cached(self, client, tmp_path):
+        client.fail = {"ssms"}
+        result = client.get_mutation_frequency("EGFR")
+        assert result["studies_analyzed"] == 3
+        assert result["top_mutations"] == []
+        assert not list(tmp_path.iterdir())
+
+        client.fail = ()
+        assert client.get_mutation_frequency("EGFR")["total_mutations"] == 812
+        assert [p.name for p in tmp_path.iterdir()] == ["EGFR.json"]
+
+
+class TestClinicalTrialsIndex:
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        with patch.object(clinicaltrials_client, "CLINICALTRIALS_PAGE_SIZE", 3), \
+                patch.object(clinicaltrials_client, "CLINICALTRIALS_QUERY_TTL_HOURS", 24):
+            index = TrialIndex(tmp_path / "trials.sqlite")
+            client = ClinicalTrialsClient(index=index)
+            client.calls = []
+            client.updated = {f"NCT0000000{i}": "2025-01-01" for i in range(7)}
+            client.session.get = self._serve(client)
+            yield client
+            index.close()
+
+    def _serve(self, client):
+        def study(nct_id, fields):
+            protocol = {
+                "identificationModule": {"nctId": nct_id, "briefTitle": f"Trial {nct_id}", "officialTitle": f"Official {nct_id}"},
+                "statusModule": {"overallStatus": "RECRUITING", "lastUpdatePostDateStruct": {"date": client.updated[nct_id]}},
+            }
+            if "EligibilityCriteria" in fields:
+                protocol["eligibilityModule"] = {"eligibilityCriteria": f"Inclusion for {nct_id} ({client.updated[nct_id]})"}
+            return {"protocolSection": protocol}
+
+        def get(url, params=None, **kwargs):
+            params = dict(params or {})
+            client.calls.append(params)
+            if getattr(client, "offline", False):
+                return _response(503)
+            fields = params["fields"].split(",")
+            if "filter.ids" in params:
+                return _response(200, {"studies": [study(i, fields) for i in params["filter.ids"].split(",")]})
+            ids = sorted(client.updated)
+            offset = int(params.get("pageToken", 0))
+            page = ids[offset:offset + params["pageSize"]]
+            payload = {"studies": [study(i, fields) for i in page]}
+            if offset + len(page) < len(ids):
+                payload["nextPageToken"] = str(offset + len(page))
+            return _response(200, payload)
+
+        return get
+
+    def _split_calls(self, client):
+        details = [c for c in client.calls if "filter.ids" in c]
+        return [c for c in client.calls if "filter.ids" not in c], details
+
+    def test_paginated_two_tier_fetch(self, client):
+        trials = client.search_trials("NSCLC", intervention="osimertinib", max_results=5)
+
+        summaries, details = self._split_calls(client)
+        assert [c.get("pageToken") for c in summaries] == [None, "3"]
+        assert all("EligibilityCriteria" not in c["fields"] for c in summaries)
+        # 搜索只返回摘要，不为每项试验拉取详情
+        assert details == [] and len(trials) == 5
+        assert not any(t["eligibility_criteria"] for t in trials)
+
+        # 入组标准只为入围试验批量拉取（按页大小分块），保留入围顺序
+        shortlist = [trials[4]["nct_id"], trials[0]["nct_id"], trials[2]["nct_id"], trials[1]["nct_id"]]
+        eligible = client.get_eligibility(shortlist)
+        assert [d["filter.ids"].split(",") for d in self._split_calls(client)[1]] == [shortlist[:3], shortlist[3:]]
+        assert [t["nct_id"] for t in eligible] == shortlist
+        assert eligible[0]["eligibility_criteria"] == f"Inclusion for {shortlist[0]} (2025-01-01)"
+        assert eligible[0]["official_title"] == f"Official {shortlist[0]}"
+        assert eligible[0]["brief_title"] == f"Trial {shortlist[0]}"
+
+        # 已有且未更新的入组标准不再拉取；索引中没有摘要的试验也能直接查询
+        calls = len(client.calls)
+        assert client.get_eligibility(shortlist[:1]) == eligible[:1]
+        assert len(client.calls) == calls
+        assert client.get_eligibility([" nct00000006 "])[0]["eligibility_criteria"].startswith("Inclusion for NCT00000006")
+
+    def test_tool_returns_summaries_then_eligibility(self, client):
+        from src.tools.trial_tools import ClinicalTrialsTool
+
+        tool = ClinicalTrialsTool()
+        tool.client = client
+        summary = tool.invoke(cancer_type="NSCLC", max_results=3)
+        assert "NCT00000002" in summary and "Inclusion for" not in summary
+        assert self._split_calls(client)[1] == []
+
+        detail = tool.invoke(nct_ids=["NCT00000002"])
+        assert "Inclusion for NCT00000002" in detail and "NCT00000001" not in detail
+        assert [d["filter.ids"] for d in self._split_calls(client)[1]] == ["NCT00000002"]
+
+    def test_repeated_search_answered_locally(self, client):
+        first = client.search_trials("NSCLC", max_results=5)
+        calls = len(client.calls)
+
+        assert client.search_trials(" nsclc ", max_results=5) == first
+        assert client.search_trials("NSCLC", max_results=2) == first[:2]
+        assert len(client.calls) == calls
+
+        # 超出已缓存数量且未取尽 → 重新拉取
+        assert len(client.search_trials("NSCLC", max_results=7)) == 7
+        assert len(client.calls) > calls
+
+    def test_incremental_refresh_by_last_update(self, client):
+        client.get_eligibility([t["nct_id"] for t in client.search_trials("NSCLC", max_results=7)])
+        client.updated["NCT00000004"] = "2025-06-01"
+
+        with patch.object(clinicaltrials_client, "CLINICALTRIALS_QUERY_TTL_HOURS", 0):
+            client.calls.clear()
+            trials = client.get_eligibility([t["nct_id"] for t in client.search_trials("NSCLC", max_results=7)])
+
+        summaries, details = self._split_calls(client)
+        assert len(summaries) == 3
+        assert [d["filter.ids"] for d in details] == ["NCT00000004"]
+        assert trials[4]["eligibility_criteria"] == "Inclusion for NCT00000004 (2025-06-01)"
+
+    def test_stale_results_when_offline(self, client):
+        first = client.search_trials("NSCLC", max_results=4)
+        client.offline = True
+        with patch.object(clinicaltrials_client, "CLINICALTRIALS_QUERY_TTL_HOURS", 0):
+            assert client.search_trials("NSCLC", max_results=4) == first
+            assert client.search_trials("SCLC", max_results=4) == []
+
+
+def _fda_label(set_id, generic, brand, application="NDA208065", effective_time="20240101", **sections):
+    label = {
+        "set_id": set_id,
+        "effective_time": effective_time,
+        "openfda": {
+            "generic_name": [generic], "brand_name": [brand], "manufacturer_name": ["AstraZeneca"],
+            "spl_set_id": [set_id], "application_number": [application],
+        },
+    }
+    label.update({key: [value] for key, value in sections.items()})
+    return label
+
+
+class TestFDALabelIndex:
+
+    @pytest.fixture
+    def index(self, tmp_path):
+        index = FDALabelIndex(tmp_path / "labels.sqlite")
+        bulk = tmp_path / "drug-label-0001-of-0001.json.zip"
+        with zipfile.ZipFile(bulk, "w") as archive:
+            archive.writestr("drug-label-0001-of-0001.json", json.dumps({"meta": {}, "results": [
+                _fda_label("set-osi", "OSIMERTINIB MESYLATE", "TAGRISSO",
+                           indications_and_usage="EGFR-mutated NSCLC", dosage_and_administration="80 mg once daily",
+                           warnings_and_cautions="ILD/pneumonitis", adverse_reactions="diarrhea, rash"),
+                _fda_label("set-osi", "OSIMERTINIB MESYLATE", "TAGRISSO", effective_time="20230101",
+                           indications_and_usage="old indications"),  # 旧版本，跳过
+                _fda_label("set-osi-old", "OSIMERTINIB MESYLATE", "TAGRISSO", effective_time="20220101",
+                           indications_and_usage="superseded"),
+                _fda_label("set-generic", "osimertinib", "Osimertinib", application="ANDA000001", effective_time="20250101",
+                           indications_and_usage="generic label"),
+                {"effective_time": "20240101", "openfda": {}},  # 无 set_id
+            ]}))
+        stats = index.import_files([bulk])
+        assert stats == {"imported": 3, "skipped": 2}
+        yield index
+        index.close()
+
+    def test_lookup_by_name_prefers_originator(self, index):
+        label = index.lookup("Tagrisso")
+        assert label["set_id"] == "set-osi"
+        assert label["indications"] == "EGFR-mutated NSCLC"
+        assert label["warnings"] == "ILD/pneumonitis"
+
+        # 通用名同时命中原研与仿制药标签 → 原研优先
+        assert index.lookup("osimertinib mesylate")["set_id"] == "set-osi"
+        # 分词匹配兜底
+        assert index.lookup("osimertinib")["set_id"] == "set-generic"
+        assert index.lookup("mesylate osimertinib")["set_id"] == "set-osi"
+        assert index.lookup("erlotinib") is None
+
+    def test_only_requested_sections(self, index):
+        label = index.lookup("tagrisso", sections=["dosage", "boxed_warning"])
+        assert label["dosage"] == "80 mg once daily"
+        assert label["boxed_warning"] == ""
+        assert "indications" not in label and "adverse_reactions" not in label
+        assert index.get("set-osi", sections=["dosage"])["dosage"] == "80 mg once daily"
+
+    def test_tool_sections_offline(self, index):
+        from src.tools.guideline_tools import FDALabelTool
+
+        tool = FDALabelTool()
+        tool.client.session.get = MagicMock(side_effect=AssertionError("不应访问 openFDA"))
+        with patch.object(fda_label_index, "get_fda_label_index", return_value=index):
+            full = tool.invoke(drug_name="Tagrisso")
+            dosage_only = tool.invoke(drug_name="Tagrisso", sections=["dosage"])
+
+        assert "### 适应症" in full and "### 不良反应" in full
+        assert "### 剂量与用法" in dosage_only and "80 mg once daily" in dosage_only
+        assert "### 适应症" not in dosage_only and "diarrhea" not in dosage_only
+        assert "setid=set-osi" in dosage_only
+        assert len(dosage_only) < len(full)
+
+    def test_index_miss_with_open_breaker(self, index):
+        from src.tools.api_clients import circuit_breaker
+        from src.tools.guideline_tools import FDALabelTool
+
+        tool = FDALabelTool()
+        breaker = circuit_breaker.get_breaker("openfda")
+        try:
+            for _ in range(breaker.min_requests):
+                breaker.record(False, 0.1)
+            with patch.object(fda_label_index, "get_fda_label_index", return_value=index), \
+                    patch.object(circuit_breaker, "UPSTREAM_BREAKER_ENABLED", True):
+                assert "80 mg once daily" in tool.invoke(drug_name="Tagrisso", sections=["dosage"])
+                missing = tool.invoke(drug_name="sotorasib")
+        finally:
+            circuit_breaker.reset_breakers()
+
+        assert "openFDA 服务暂不可用" in missing and "未找到该药物" not in missing
+
+
+def _remember_in_worker(cache_dir, names, ready):
+    """模拟批处理工作进程：先载入（此时为空的）磁盘缓存，再逐个写入新解析的药物"""
+    with patch.object(rxnorm_client, "RXNORM_CACHE_DIR", Path(cache_dir)), \
+            patch.object(rxnorm_client, "RXNORM_CACHE_TTL_DAYS", 30):
+        RxNormClient._rxcui_cache.clear()
+        RxNormClient._rxcui_cache_loaded = False
+        client = RxNormClient()
+        client._lookup_cached_rxcui("warm-up")
+        ready.wait()
+        for name in names:
+            client._remember_rxcuis({name: name.upper()})
+
+
+class TestRxNormInteractions:
+
+    RXCUIS = {"osimertinib": "1721560", "rifampin": "9384", "ketoconazole": "6135", "omeprazole": "7646"}
+    # (rxcui_a, rxcui_b) → 严重程度
+    KNOWN_PAIRS = {("1721560", "9384"): "high", ("1721560", "6135"): "high"}
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        with patch.object(rxnorm_client, "RXNORM_CACHE_DIR", tmp_path), \
+                patch.object(rxnorm_client, "RXNORM_CACHE_TTL_DAYS", 30), \
+                patch.object(RxNormClient, "_rxcui_cache", {}), \
+                patch.object(RxNormClient, "_rxcui_cache_loaded", False), \
+                patch.object(RxNormClient, "_rxcui_cache_stamp", None), \
+                patch.object(RxNormClient, "_pair_cache", {}):
+            client = RxNormClient()
+            client.calls = []
+            client.session.get = self._serve(client)
+            yield client
+
+    def _serve(self, client, delay=0.0):
+        lock = threading.Lock()
+        active = client.active = [0, 0]  # 当前并发数, 最大并发数
+
+        def get(url, params=None, **kwargs):
+            client.calls.append((url.rsplit("/", 1)[-1], dict(params or {})))
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(getattr(client, "delay", delay))
+            with lock:
+                active[0] -= 1
+            if url.endswith("rxcui.json"):
+                rxcui = self.RXCUIS.get(params["name"].lower())
+                return _response(200, {"idGroup": {"rxnormId": [rxcui] if rxcui else []}})
+            if url.endswith("approximateTerm.json"):
+                return _response(200, {"approximateGroup": {}})
+            if url.endswith("list.json"):
+                requested = params["rxcuis"].split("+")
+                itypes = [{
+                    "minConcept": [{"rxcui": a}, {"rxcui": b}],
+                    "interactionPair": [{
+                        "severity": severity, "description": f"{a}-{b}",
+                        "interactionConcept": [{"minConceptItem": {"rxcui": a, "name": a}},
+                                               {"minConceptItem": {"rxcui": b, "name": b}}],
+                    }],
+                } for (a, b), severity in self.KNOWN_PAIRS.items() if a in requested and b in requested]
+                return _response(200, {"fullInteractionTypeGroup": [{"fullInteractionType": itypes}]})
+            return _response(404)
+
+        return get
+
+    def _endpoint_calls(self, client, endpoint):
+        return [params for name, params in client.calls if name == endpoint]
+
+    def test_names_resolved_concurrently(self, client):
+        client.delay = 0.1
+        resolved = client.resolve_rxcuis(["osimertinib", "rifampin", "ketoconazole", "Osimertinib"])
+
+        assert resolved == {"osimertinib": "1721560", "rifampin": "9384", "ketoconazole": "6135", "Osimertinib": "1721560"}
+        assert len(self._endpoint_calls(client, "rxcui.json")) == 3
+        assert client.active[1] > 1
+
+    def test_batch_resolution_writes_cache_once(self, client):
+        with patch.object(RxNormClient, "_remember_rxcuis", autospec=True,
+                          side_effect=RxNormClient._remember_rxcuis) as remember:
+            resolved = client.resolve_rxcuis(["osimertinib", "rifampin", "unknown-drug"])
+
+        assert resolved["unknown-drug"] is None
+        assert remember.call_count == 1
+        # 未找到的药物（rxcui + approximateTerm）不会被重复请求
+        assert len(client.calls) == 4
+
+    def test_batch_failures_not_retried_serially(self, client):
+        client.session.get = MagicMock(side_effect=requests.exceptions.ConnectionError("down"))
+        assert client.resolve_rxcuis(["osimertinib", "rifampin"]) == {"osimertinib": None, "rifampin": None}
+        assert client.session.get.call_count == 2
+        assert RxNormClient._rxcui_cache == {}
+
+    def test_rxcui_cache_persisted(self, client, tmp_path):
+        client.get_rxcui("Rifampin")
+        client.get_rxcui("unknown-drug")
+        assert len(client.calls) == 3  # rxcui + approximateTerm + rxcui
+
+        with patch.object(RxNormClient, "_rxcui_cache", {}), patch.object(RxNormClient, "_rxcui_cache_loaded", False):
+            assert client.get_rxcui("rifampin") == "9384"
+            assert client.get_rxcui("unknown-drug") is None
+        assert len(client.calls) == 3
+        assert (tmp_path / "rxcui.json").exists()
+
+    def test_rxcui_cache_shared_across_processes(self, client, tmp_path):
+        assert client.get_rxcui("rifampin") == "9384"     # 本进程先载入并写入缓存
+        context = multiprocessing.get_context("fork")
+        ready = context.Barrier(3)
+        workers = [context.Process(target=_remember_in_worker, args=(str(tmp_path), [f"{tag}{i}" for i in range(20)], ready))
+                   for tag in ("a", "b")]
+        for worker in workers:
+            worker.start()
+        ready.wait()
+        for worker in workers:
+            worker.join(timeout=30)
+            assert worker.exitcode == 0
+
+        on_disk = json.loads((tmp_path / "rxcui.json").read_text(encoding="utf-8"))
+        assert {f"{tag}{i}" for tag in "ab" for i in range(20)} | {"rifampin"} <= set(on_disk)
+        # 已载入缓存的进程在内存未命中时读到其他进程写入的条目，不再请求
+        calls = len(client.calls)
+        assert client.get_rxcui("A7") == "A7" and client.get_rxcui("b19") == "B19"
+        assert len(client.calls) == calls
+
+    def test_failed_lookup_not_cached(self, client):
+        client.session.get = MagicMock(side_effect=requests.exceptions.ConnectionError("down"))
+        assert client.get_rxcui("rifampin") is None
+        assert "rifampin" not in RxNormClient._rxcui_cache
+
+    def test_superset_queries_only_new_pairs(self, client):
+        first = client.check_interaction(["osimertinib", "rifampin"])
+        assert [i["severity"] for i in first] == ["high"]
+
+        again = client.check_interaction(["rifampin", "osimertinib"])
+        assert again == first
+        assert len(self._endpoint_calls(client, "list.json")) == 1
+
+        superset = client.check_interaction(["osimertinib", "rifampin", "ketoconazole"])
+        lists = self._endpoint_calls(client, "list.json")
+        assert len(lists) == 2
+        assert sorted(i["description"] for i in superset) == ["1721560-6135", "1721560-9384"]
+
+        # 所有药物对已缓存（含无相互作用的 rifampin-ketoconazole）
+        client.check_interaction(["ketoconazole", "rifampin"])
+        assert len(self._endpoint_calls(client, "list.json")) == 2
+
+    def test_failed_list_not_cached(self, client):
+        get = client.session.get
+        client.session.get = lambda url, **kw: _response(503) if url.endswith("list.json") else get(url, **kw)
+        assert client.check_interaction(["osimertinib", "rifampin"]) == []
+        assert RxNormClient._pair_cache == {}
+
+        client.session.get = get
+        assert len(client.check_interaction(["osimertinib", "rifampin"])) == 1
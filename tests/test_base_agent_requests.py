@@ -0,0 +1,134 @@
+"""
+BaseAgent 请求构建单元测试
+
+测试覆盖:
+- 稳定前缀（系统提示 → 病例上下文）在前，cache_control 只加在前缀消息上
+- 关闭缓存时不加 cache_control，原消息列表不被修改
+- usage 中缓存命中 token 的统计
+- mock OpenRouter 上重复前缀命中缓存
+- 按调用点预算：查表/回退、finish_reason=length 自适应放宽、用量遥测
+"""
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.agents import base_agent
+from src.agents.base_agent import BaseAgent, CACHE_PREFIX_FLAG
+
+
+@pytest.fixture
+def agent():
+    with patch.object(BaseAgent, "_build_system_prompt", return_value="SYSTEM " * 2000):
+        yield BaseAgent(role="Test", prompt_file="x.txt")
+
+
+class TestCacheablePrefix:
+
+    def test_message_layout(self, agent):
+        messages = agent._build_messages("task", case_context="case text")
+        outgoing = agent._apply_cache_control(messages)
+
+        assert [m["role"] for m in outgoing] == ["system", "user", "user"]
+        assert outgoing[1]["content"][0]["text"].endswith("case text")
+        assert all(m["content"][0]["cache_control"] == {"type": "ephemeral"} for m in outgoing[:2])
+        assert outgoing[2]["content"] == "task"
+        assert all(CACHE_PREFIX_FLAG not in m for m in outgoing)
+        assert isinstance(messages[0]["content"], str)  # 原列表不变
+
+    def test_disabled(self, agent):
+        messages = agent._build_messages("task")
+        with patch.object(base_agent, "PROMPT_CACHE_ENABLED", False):
+            outgoing = agent._apply_cache_control(messages)
+        assert len(outgoing) == 2
+        assert isinstance(outgoing[0]["content"], str)
+
+    def test_record_usage(self, agent):
+        agent._record_usage({"usage": {"prompt_tokens": 1000, "completion_tokens": 50,
+                                       "prompt_tokens_details": {"cached_tokens": 800}}})
+        agent._record_usage({})
+        assert agent.usage_stats == {"requests": 1, "prompt_tokens": 1000, "cached_tokens": 800,
+                                     "completion_tokens": 50}
+
+
+class TestMockServer:
+
+    def test_repeated_prefix_is_cached(self, agent):
+        from benchmarks.mock_openrouter import MockOpenRouter
+
+        with MockOpenRouter(base_latency=0, uncached_token_latency=0, cached_token_latency=0) as server, \
+                patch.object(BaseAgent, "_check_rate_limit", lambda *a: None):
+            agent.api_url = server.url
+            agent.invoke("task 1", case_context="case " * 100)
+            agent.invoke("task 2", case_context="case " * 100)
+
+        assert agent.usage_stats["requests"] == 2
+        assert 0 < agent.usage_stats["cached_tokens"] < agent.usage_stats["prompt_tokens"]
+
+
+class TestCallSiteBudgets:
+
+    def test_lookup_and_fallback(self, agent):
+        from src.utils.llm_budget import get_budget
+
+        budget = get_budget("pubmed_query_build")
+        assert budget.max_tokens <= budget.max_tokens_ceiling
+        with pytest.raises(KeyError):
+            get_budget("nope")
+        assert get_budget("nope", fallback=agent._legacy_budget()).site == "nope"
+
+    def test_widened_stops_at_ceiling(self):
+        from src.utils.llm_budget import CallBudget
+
+        budget = CallBudget("x", 1000, "low", 30, 3000)
+        assert budget.widened().max_tokens == 2000
+        assert budget.widened().widened().max_tokens == 3000
+        assert budget.widened().widened().widened() is None
+
+    def test_apply_reasoning(self):
+        from src.utils.llm_budget import CallBudget
+
+        payload = CallBudget("x", 10, "", 30, 10).apply({"reasoning": {"effort": "high"}})
+        assert payload == {"max_tokens": 10}
+
+    def test_adaptive_widening_on_length(self):
+        from src.utils.llm_budget import CallBudget, BudgetTelemetry, run_with_budget
+        from src.utils import llm_budget
+
+        sent = []
+
+        def send(budget):
+            sent.append(budget.max_tokens)
+            reason = "length" if budget.max_tokens < 4000 else "stop"
+            return {"choices": [{"finish_reason": reason}], "usage": {"completion_tokens": budget.max_tokens}}
+
+        telemetry = BudgetTelemetry()
+        with patch.object(llm_budget, "budget_telemetry", telemetry):
+            result = run_with_budget(CallBudget("x", 1000, "", 30, 8000), send, adaptive=True)
+            run_with_budget(CallBudget("x", 1000, "", 30, 8000), send, adaptive=False)
+
+        assert sent == [1000, 2000, 4000, 1000]
+        assert result["choices"][0]["finish_reason"] == "stop"
+        summary = telemetry.summary()["x"]
+        assert summary["calls"] == 4 and summary["truncated"] == 3
+        assert summary["completion_max"] == 4000
+
+    def test_agent_uses_call_site_budget(self, agent):
+        payloads = []
+
+        def post(payload, timeout):
+            payloads.append((payload, timeout))
+            return {"choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}]}
+
+        with patch.object(agent, "_post_completion", side_effect=post):
+            agent.invoke("task", call_site="pubmed_query_build")
+            agent.invoke("task")
+
+        from src.utils.llm_budget import get_budget
+        site = get_budget("pubmed_query_build")
+        assert payloads[0][0]["max_tokens"] == site.max_tokens
+        assert payloads[0][1] == site.timeout
+        assert payloads[1][0]["max_tokens"] == agent._legacy_budget().max_tokens
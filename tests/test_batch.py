@@ -0,0 +1,119 @@
+"""
+批处理单元测试
+
+测试覆盖:
+- 病例画像与调度：癌种归并、驱动基因提取、同癌种相邻且大组优先
+- 跨进程共享速率窗口：多进程合计不超过窗口配额、429 退避占满窗口
+- 进程池执行：单病例失败重试、工作进程崩溃后重建进程池、吞吐 / 延迟汇总
+- 工作进程日志写入各自的文件
+"""
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.service import batch
+from src.service.batch import case_profile, run_batch, run_case, schedule, summarize
+from src.utils.shared_rate_limiter import SharedRateWindow
+
+
+def _case(name, cancer, genes=()):
+    return {"name": name, "path": name, "cancer": cancer, "genes": genes, "attempts": 0}
+
+
+def _fake_runner(path):
+    """ok* 成功；flaky* 首次失败；crash* 首次让工作进程崩溃；bad* 总是失败"""
+    marker = Path(os.environ["BATCH_TEST_DIR"]) / f"{Path(path).name}.seen"
+    first = not marker.exists()
+    marker.touch()
+    name = Path(path).name
+    if name.startswith("crash") and first:
+        os._exit(1)
+    if name.startswith("bad") or (name.startswith("flaky") and first):
+        return {"ok": False, "error": "boom", "seconds": 0.01}
+    return {"ok": True, "seconds": 0.05, "llm_calls": 3, "prompt_tokens": 100, "cost_usd": 0.01}
+
+
+def _acquire_many(path, count, out):
+    window = SharedRateWindow(Path(path), max_requests=2, window=0.5)
+    for _ in range(count):
+        window.acquire()
+        out.put(time.time())
+
+
+class TestSchedule:
+
+    def test_profile(self):
+        assert case_profile("诊断：乙状结肠中分化腺癌，KRAS G12C 突变，MSI-H") == ("结直肠癌", ("KRAS", "MSI-H"))
+        assert case_profile("诊断：非小细胞肺癌（腺癌），EGFR L858R")[0] == "非小细胞肺癌"
+        assert case_profile("广泛期小细胞肺癌")[0] == "小细胞肺癌"
+        assert case_profile("不明原发")[0] == "其他"
+
+    def test_order_groups_cancer_types(self):
+        cases = [_case("a", "非小细胞肺癌", ("EGFR",)), _case("b", "结直肠癌", ("KRAS",)),
+                 _case("c", "非小细胞肺癌", ("ALK",)), _case("d", "结直肠癌", ("BRAF",)),
+                 _case("e", "非小细胞肺癌", ("EGFR",))]
+        assert [c["name"] for c in schedule(cases)] == ["c", "a", "e", "d", "b"]
+
+
+class TestSharedRateWindow:
+
+    def test_processes_share_window(self, tmp_path):
+        context = multiprocessing.get_context("spawn")
+        out = context.Queue()
+        procs = [context.Process(target=_acquire_many, args=(tmp_path / "llm.window", 3, out)) for _ in range(2)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+        stamps = sorted(out.get(timeout=5) for _ in range(6))
+        # 2 个/0.5s：6 次请求至少跨越 1s，任意 0.5s 内不超过 2 次
+        assert stamps[-1] - stamps[0] >= 0.95
+        assert all(stamps[i + 2] - stamps[i] >= 0.49 for i in range(len(stamps) - 2))
+
+    def test_try_acquire_and_defer(self, tmp_path):
+        window = SharedRateWindow(tmp_path / "x.window", max_requests=3, window=10)
+        assert window.try_acquire(reserve=1) == 0 and window.try_acquire(reserve=1) == 0
+        assert window.try_acquire(reserve=1) > 0          # 预留的最后一个配额只给主请求
+        assert window.try_acquire() == 0
+        window.defer(5)
+        assert 4.5 < window.try_acquire() <= 5
+
+
+class TestRunBatch:
+
+    def test_retries_and_crash_isolation(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("BATCH_TEST_DIR", str(tmp_path))
+        cases = [_case("ok1", "结直肠癌"), _case("flaky1", "结直肠癌"), _case("crash1", "非小细胞肺癌"),
+                 _case("bad1", "非小细胞肺癌"), _case("ok2", "胃癌")]
+        results = run_batch(cases, workers=2, max_retries=2, runner=_fake_runner)
+
+        # 崩溃时同一进程池中执行的其他病例也计一次尝试，因此只断言下限
+        status = {r["name"]: (r["status"], r["attempts"]) for r in results}
+        assert status["ok1"][0] == "succeeded" and status["ok2"][0] == "succeeded"
+        assert status["flaky1"][0] == "succeeded" and status["flaky1"][1] >= 2
+        assert status["crash1"][0] == "succeeded" and status["crash1"][1] >= 2
+        assert status["bad1"] == ("failed", 3)
+        assert [r["name"] for r in results] == [c["name"] for c in cases]
+
+        summary = summarize(results, wall_seconds=2.0, workers=2)
+        assert summary["total"]["succeeded"] == 4 and summary["total"]["failed"] == 1
+        assert summary["total"]["cases_per_hour"] == 7200.0
+        assert summary["by_cancer"]["结直肠癌"]["llm_calls"] == 6
+
+    def test_worker_log_file_per_process(self, tmp_path, monkeypatch):
+        case = tmp_path / "case.txt"
+        case.write_text("结肠癌 KRAS G12C", encoding="utf-8")
+        monkeypatch.setattr(batch, "_worker_log_ready", False)
+        final_state = {"output_path": "r.html", "usage_summary": {"total": {"calls": 2}}}
+        with patch.object(batch, "setup_logger") as setup, \
+                patch("src.graph.state_graph.run_mtb_workflow", return_value=final_state):
+            assert run_case(str(case))["llm_calls"] == 2
+            assert run_case(str(case))["ok"]
+
+        setup.assert_called_once_with(log_file=f"mtb_batch_worker_{os.getpid()}.log")
+        assert batch.worker_log_file(123) != batch.worker_log_file(456)
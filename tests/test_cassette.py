@@ -0,0 +1,116 @@
+"""
+运行录制 / 回放单元测试
+
+测试覆盖:
+- 请求指纹容忍时间戳 / 证据图 ID / 凭据参数，宽松指纹容忍计数变化但区分 PMID / NCT 编号
+- 录制 → 保存 → 离线回放：NCBIClient 在上游关闭后得到相同结果
+- 同一指纹按录制顺序返回；录制的超时按超时回放；未命中按连接失败处理
+- 宽松匹配默认关闭，开启后命中计入 loose_hits
+"""
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.cassette import Cassette, CassetteMiss, fingerprint, replaying
+
+
+def _llm_body(content: str) -> str:
+    return json.dumps({"model": "m", "messages": [{"role": "user", "content": content}]}, ensure_ascii=False)
+
+
+class TestFingerprint:
+
+    def test_volatile_parts_ignored(self):
+        a = fingerprint("POST", "https://x/api?api_key=AAA&db=pubmed",
+                        _llm_body("**时间**: 2026-10-18T09:15:02.123456\nid: search_gdc_a3ac583c"))
+        b = fingerprint("post", "https://x/api?db=pubmed&api_key=BBB",
+                        _llm_body("**时间**: 2026-10-19T21:40:11.000001\nid: search_gdc_e8d78175"))
+        assert a == b
+
+    def test_loose_key_tolerates_counts(self):
+        exact_a, loose_a = fingerprint("POST", "https://x/api", _llm_body("总实体数: 13"))
+        exact_b, loose_b = fingerprint("POST", "https://x/api", _llm_body("总实体数: 14"))
+        assert exact_a != exact_b and loose_a == loose_b
+        assert fingerprint("POST", "https://x/api", _llm_body("KRAS"))[1] != loose_a
+
+    def test_loose_key_keeps_identifiers(self):
+        for a, b in (("PMID: 34567890", "PMID: 34567891"), ("NCT04303780", "NCT04303781"),
+                     ("KRAS G12C", "KRAS G13C")):
+            assert fingerprint("POST", "https://x/api", _llm_body(a))[1] != \
+                fingerprint("POST", "https://x/api", _llm_body(b))[1]
+        assert fingerprint("GET", "https://x/esummary?id=1", None)[1] != \
+            fingerprint("GET", "https://x/esummary?id=2", None)[1]
+
+
+class TestRecordReplay:
+
+    @pytest.fixture(autouse=True)
+    def fresh_breakers(self):
+        from src.tools.api_clients import circuit_breaker
+
+        circuit_breaker.reset_breakers()
+        yield
+        circuit_breaker.reset_breakers()
+
+    def test_round_trip_offline(self, tmp_path):
+        from benchmarks.mock_upstreams import MockUpstreams
+        from src.tools.api_clients.ncbi_client import NCBIClient
+
+        with MockUpstreams(pubmed_hits=3) as upstreams, \
+                patch.object(NCBIClient, "BASE_URL", f"{upstreams.url}/ncbi"):
+            with Cassette.recording() as cassette:
+                recorded = NCBIClient(api_key="secret").search_pubmed("KRAS G12C", max_results=5)
+            path = cassette.save(tmp_path / "run.jsonl.gz")
+            url = upstreams.url
+        assert "secret" not in path.read_bytes().decode("latin-1")
+
+        with patch.object(NCBIClient, "BASE_URL", f"{url}/ncbi"), Cassette.replaying(path) as replay:
+            assert replaying()
+            replayed = NCBIClient(api_key="other").search_pubmed("KRAS G12C", max_results=5)
+
+        assert not replaying()
+        assert replayed == recorded
+        assert replay.summary()["hits"] == 2 and replay.summary()["misses"] == 0
+
+    def test_sequence_errors_and_miss(self):
+        url = "https://llm.invalid/api/v1/chat/completions"
+        entries = [
+            {"method": "POST", "url": url, "request_body": _llm_body("q"), "elapsed": 1.0,
+             "error": {"kind": "timeout", "type": "ReadTimeout", "message": "read timed out"}},
+            {"method": "POST", "url": url, "request_body": _llm_body("q"), "elapsed": 2.0,
+             "status": 200, "reason": "OK", "encoding": "utf-8",
+             "headers": {"Content-Type": "application/json"}, "text": '{"ok": true}'},
+        ]
+
+        with Cassette("replay", entries)._installed():
+            with pytest.raises(requests.exceptions.Timeout):
+                requests.post(url, data=_llm_body("q"))
+            assert requests.post(url, data=_llm_body("q")).json() == {"ok": True}
+            assert requests.post(url, data=_llm_body("q")).json() == {"ok": True}  # 用尽后重复最后一次
+            with pytest.raises(CassetteMiss):
+                requests.post(url, data=_llm_body("another question"))
+
+    def test_loose_match_opt_in(self):
+        url = "https://llm.invalid/api/v1/chat/completions"
+        entries = [{"method": "POST", "url": url, "request_body": _llm_body("总实体数: 13"), "elapsed": 1.0,
+                    "status": 200, "reason": "OK", "encoding": "utf-8",
+                    "headers": {"Content-Type": "application/json"}, "text": '{"ok": true}'}]
+
+        strict = Cassette("replay", entries, loose_match=False)
+        with strict._installed():
+            with pytest.raises(CassetteMiss):
+                requests.post(url, data=_llm_body("总实体数: 14"))
+        assert strict.summary()["misses"] == 1
+
+        loose = Cassette("replay", entries, loose_match=True)
+        with loose._installed():
+            assert requests.post(url, data=_llm_body("总实体数: 14")).json() == {"ok": True}
+            with pytest.raises(CassetteMiss):
+                requests.post(url, data=_llm_body("PMID: 34567890"))
+        assert loose.summary()["loose_hits"] == 1 and loose.summary()["hits"] == 0
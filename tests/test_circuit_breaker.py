@@ -0,0 +1,186 @@
+"""
+上游熔断器单元测试
+
+测试覆盖:
+- 失败率（含慢调用）超过阈值后熔断，熔断期内请求被拒绝
+- 冷却后半开：只放行一个探测请求，成功恢复 / 失败重新熔断
+- CircuitBreakerAdapter：5xx / 429 / 异常计为失败，404 计为成功
+- BaseTool：上游熔断时不调用 API，直接返回"服务不可用"
+- 按运行的上游报告：只计本次运行的请求 / 拒绝与运行开始后的熔断
+"""
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.tools.api_clients import circuit_breaker
+from src.tools.api_clients.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerAdapter, ServiceUnavailableError,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    circuit_breaker.reset_breakers()
+    yield
+    circuit_breaker.reset_breakers()
+
+
+@pytest.fixture
+def clock():
+    now = [1000.0]
+    with patch.object(circuit_breaker.time, "time", lambda: now[0]):
+        yield now
+
+
+def _breaker(**kwargs):
+    params = dict(window_seconds=60, min_requests=4, failure_rate=0.5, slow_call_seconds=10, open_seconds=30)
+    params.update(kwargs)
+    return CircuitBreaker("civic", **params)
+
+
+class TestCircuitBreaker:
+
+    def test_trips_on_failure_rate(self, clock):
+        breaker = _breaker()
+        for ok in (True, False, True):
+            breaker.record(ok, 0.1)
+        assert breaker.state == CLOSED  # 未达最小请求数
+        breaker.record(False, 0.1)
+        assert breaker.state == OPEN
+
+        with pytest.raises(ServiceUnavailableError) as exc:
+            breaker.before_request()
+        assert exc.value.retry_after == 30
+        assert breaker.snapshot()["rejected"] == 1
+
+    def test_slow_calls_count_as_failures(self, clock):
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.record(True, 15)
+        assert breaker.state == OPEN
+        assert breaker.snapshot()["slow_calls"] == 4
+
+    def test_old_failures_leave_window(self, clock):
+        breaker = _breaker()
+        for _ in range(3):
+            breaker.record(False, 0.1)
+        clock[0] += 61
+        breaker.record(False, 0.1)
+        assert breaker.state == CLOSED
+
+    def test_half_open_probe(self, clock):
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.record(False, 0.1)
+        clock[0] += 30
+        assert breaker.state == HALF_OPEN
+        assert not breaker.is_open()
+
+        breaker.before_request()  # 探测请求
+        assert breaker.is_open()
+        with pytest.raises(ServiceUnavailableError):
+            breaker.before_request()
+
+        breaker.record(True, 0.1)
+        assert breaker.state == CLOSED
+        snapshot = breaker.snapshot()
+        assert snapshot["trips"] == 1 and snapshot["open_seconds_total"] == 30
+        assert [t["to"] for t in snapshot["transitions"]] == [OPEN, HALF_OPEN, CLOSED]
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.record(False, 0.1)
+        clock[0] += 30
+        breaker.before_request()
+        breaker.record(False, 0.1)
+        assert breaker.state == OPEN
+        assert breaker.snapshot()["trips"] == 2
+
+
+class TestAdapter:
+
+    def _adapter(self, status=None, exc=None):
+        adapter = CircuitBreakerAdapter("gdc")
+        response = MagicMock(status_code=status)
+        patcher = patch.object(requests.adapters.HTTPAdapter, "send",
+                               side_effect=exc, return_value=response)
+        return adapter, patcher
+
+    @pytest.mark.parametrize("status, ok", [(200, True), (404, True), (429, False), (503, False)])
+    def test_status_classification(self, status, ok):
+        adapter, patcher = self._adapter(status=status)
+        with patcher:
+            adapter.send(MagicMock())
+        assert circuit_breaker.get_breaker("gdc").snapshot()["failures"] == (0 if ok else 1)
+
+    def test_open_breaker_skips_network(self):
+        breaker = circuit_breaker.get_breaker("gdc")
+        for _ in range(breaker.min_requests):
+            breaker.record(False, 0.1)
+
+        adapter, patcher = self._adapter(status=200)
+        with patcher as send, pytest.raises(requests.exceptions.ConnectionError):
+            adapter.send(MagicMock())
+        send.assert_not_called()
+
+    def test_exception_recorded(self):
+        adapter, patcher = self._adapter(exc=requests.exceptions.ReadTimeout("slow"))
+        with patcher, pytest.raises(requests.exceptions.ReadTimeout):
+            adapter.send(MagicMock())
+        assert circuit_breaker.get_breaker("gdc").snapshot()["failures"] == 1
+
+
+class TestToolFailFast:
+
+    def test_open_upstream_returns_unavailable(self):
+        from src.tools.molecular_tools import GDCTool
+
+        tool = GDCTool()
+        breaker = circuit_breaker.get_breaker("gdc")
+        for _ in range(breaker.min_requests):
+            breaker.record(False, 0.1)
+
+        with patch.object(tool, "_call_real_api") as call:
+            result = tool.invoke(gene="KRAS")
+        call.assert_not_called()
+        assert "NCI GDC 服务暂不可用" in result
+
+    def test_closed_upstream_calls_api(self):
+        from src.tools.molecular_tools import GDCTool
+
+        tool = GDCTool()
+        with patch.object(tool, "_call_real_api", return_value="ok"):
+            assert tool.invoke(gene="KRAS") == "ok"
+
+    def test_report(self):
+        circuit_breaker.get_breaker("civic").record(True, 0.5)
+        report = circuit_breaker.breaker_report()
+        assert report["civic"]["display_name"] == "CIViC"
+        assert report["civic"]["mean_latency"] == 0.5
+        assert "CIViC | closed" in circuit_breaker.format_breaker_report(report)
+
+    def test_run_report(self, clock):
+        circuit_breaker.get_breaker("gdc").record(True, 0.2)       # 运行开始前的请求不计入
+        with circuit_breaker.run_upstream_stats() as run:
+            clock[0] += 10
+            breaker = circuit_breaker.get_breaker("civic")
+            for _ in range(breaker.min_requests):
+                breaker.record(False, 1.0)
+            with pytest.raises(ServiceUnavailableError):
+                breaker.before_request()
+        circuit_breaker.get_breaker("civic").record(True, 0.1)     # 运行结束后的请求不计入
+        clock[0] += 5
+
+        report = circuit_breaker.breaker_report(run)
+        assert set(report) == {"civic"}
+        civic = report["civic"]
+        assert civic["requests"] == breaker.min_requests and civic["failures"] == breaker.min_requests
+        assert civic["rejected"] == 1 and civic["trips"] == 1 and civic["state"] == OPEN
+        assert civic["open_seconds_total"] == 5.0 and civic["mean_latency"] == 1.0
+        assert "CIViC | open" in circuit_breaker.format_breaker_report(report)
@@ -0,0 +1,318 @@
+"""
+Entity Extractors 单元测试（规则快速路径 + 批量提取）
+
+测试覆盖:
+- CIViC / ClinVar / ClinicalTrials / FDA / GDC 结构化 finding 不调用 LLM
+- 谓词、置信度、证据等级、来源映射
+- 自由文本 finding 回退 LLM，实体索引惰性求值
+- 批量提取：装箱、稳定 id、缺失条目二分重试、批内重复实体合并
+- 批量提取：LLM 调用失败时不二分，后续批次停止调用
+- 证据图更新：批量提取失败时逐条回退
+"""
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.models.entity_extractors import (
+    ClinVarEntityExtractor,
+    extract_entities_from_finding,
+)
+from src.models.evidence_graph import EntityType, EvidenceGrade, Predicate
+
+
+def _no_llm(*args, **kwargs):
+    raise AssertionError("LLM should not be called for structured findings")
+
+
+def _extract(finding, source_tool, llm_caller=_no_llm, existing_entities=""):
+    return extract_entities_from_finding(
+        finding=finding,
+        source_agent="Geneticist",
+        source_tool=source_tool,
+        iteration=0,
+        llm_caller=llm_caller,
+        existing_entities=existing_entities,
+    )
+
+
+def _edges(result):
+    return {(e.source_id, e.target_id, e.predicate): e.confidence for e in result.edges}
+
+
+class TestStructuredExtraction:
+
+    def test_civic_therapeutic_items(self):
+        finding = {
+            "gene": "EGFR",
+            "variant": "L858R",
+            "top_therapeutic_evidence": [
+                {"drugs": ["Osimertinib"], "disease": "Lung Non-small Cell Carcinoma",
+                 "clinical_significance": "SENSITIVITYRESPONSE", "evidence_level": "A", "pubmed_id": "28854312"},
+                {"drugs": ["Gefitinib"], "disease": "",
+                 "clinical_significance": "RESISTANCE", "evidence_level": "C"},
+            ],
+            "civic_url": "https://civicdb.org/molecular-profiles/33",
+        }
+        result = _extract(finding, "search_civic")
+
+        assert result.method == "rule"
+        ids = {e.canonical_id for e in result.entities}
+        assert {"GENE:EGFR", "EGFR_L858R", "DRUG:OSIMERTINIB", "DRUG:GEFITINIB",
+                "DISEASE:LUNG_NON-SMALL_CELL_CARCINOMA"} <= ids
+        edges = _edges(result)
+        assert edges[("EGFR_L858R", "DRUG:OSIMERTINIB", Predicate.SENSITIZES)] == 0.95
+        assert edges[("EGFR_L858R", "DRUG:GEFITINIB", Predicate.CAUSES_RESISTANCE)] == 0.85
+        assert ("EGFR_L858R", "GENE:EGFR", Predicate.MEMBER_OF) in edges
+
+        obs = result.entities[0].observation
+        assert obs.provenance == "CIViC:MP33"
+        assert obs.evidence_grade == EvidenceGrade.A
+        # 所有实体和边共享同一 observation
+        assert all(e.observation is obs for e in result.entities + result.edges)
+
+    def test_civic_free_text_falls_back_to_llm(self):
+        llm = MagicMock(return_value='{"entities": [{"canonical_id": "GENE:KRAS", "entity_type": "gene", "name": "KRAS"}], "observation": "x"}')
+        index = MagicMock(return_value="GENE:KRAS")
+        result = _extract(
+            {"gene": "KRAS", "content": "KRAS G12C confers sensitivity to sotorasib"},
+            "search_civic", llm_caller=llm, existing_entities=index,
+        )
+
+        assert result.method == "llm"
+        llm.assert_called_once()
+        index.assert_called_once()
+        assert "GENE:KRAS" in llm.call_args[0][1]
+
+    def test_lazy_index_not_built_on_rule_path(self):
+        index = MagicMock(return_value="")
+        _extract({"gene": "BRAF", "variant": "V600E", "clinical_significance": "SENSITIVITYRESPONSE",
+                  "drug": "Dabrafenib", "grade": "B"}, "search_civic", existing_entities=index)
+        index.assert_not_called()
+
+    def test_clinvar_hgvs_protein_change(self):
+        finding = {
+            "variation_id": "16609",
+            "variation_name": "NM_005228.5(EGFR):c.2573T>G (p.Leu858Arg)",
+            "gene": "EGFR",
+            "classification": "Pathogenic",
+        }
+        result = _extract(finding, "search_clinvar")
+
+        assert {e.canonical_id for e in result.entities} == {"GENE:EGFR", "EGFR_L858R"}
+        assert result.entities[0].observation.provenance == "ClinVar:16609"
+        assert "Pathogenic" in result.entities[0].observation.statement
+
+    def test_clinvar_protein_change_parser(self):
+        assert ClinVarEntityExtractor._protein_change("c.35G>T (p.Gly12Cys)") == "G12C"
+        assert ClinVarEntityExtractor._protein_change("c.1799T>A") == ""
+
+    def test_clinical_trial(self):
+        finding = {
+            "nct_id": "NCT04487080",
+            "brief_title": "Amivantamab and Lazertinib in EGFR NSCLC",
+            "conditions": ["NSCLC"],
+            "interventions": [
+                {"name": "Amivantamab", "type": "BIOLOGICAL"},
+                {"name": "Lazertinib", "type": "DRUG"},
+                {"name": "Radiotherapy", "type": "RADIATION"},
+            ],
+        }
+        result = _extract(finding, "search_clinical_trials")
+
+        ids = {e.canonical_id for e in result.entities}
+        assert ids == {"NCT:NCT04487080", "DRUG:AMIVANTAMAB", "DRUG:LAZERTINIB", "DISEASE:NSCLC"}
+        edges = _edges(result)
+        assert ("NCT:NCT04487080", "DRUG:LAZERTINIB", Predicate.EVALUATES) in edges
+        assert result.entities[0].observation.provenance == "NCT:NCT04487080"
+
+    def test_fda_requires_structured_disease(self):
+        llm = MagicMock(return_value="{}")
+        _extract({"drug_name": "osimertinib", "content": "Indicated for EGFR-mutant NSCLC"},
+                 "search_fda_labels", llm_caller=llm)
+        llm.assert_called_once()
+
+        result = _extract({"generic_name": "osimertinib", "brand_name": "Tagrisso", "disease": "NSCLC"},
+                          "search_fda_labels")
+        drug = next(e for e in result.entities if e.entity_type == EntityType.DRUG)
+        assert drug.aliases == ["TAGRISSO"]
+        assert _edges(result)[("DRUG:OSIMERTINIB", "DISEASE:NSCLC", Predicate.TREATS)] == 0.99
+
+    def test_gdc_frequency(self):
+        finding = {"gene": "KRAS", "variant": "G12C", "frequency_percentage": 11.3,
+                   "cancer_type": "Colorectal Cancer",
+                   "gdc_url": "https://portal.gdc.cancer.gov/genes/ENSG00000133703"}
+        result = _extract(finding, "search_gdc")
+
+        assert ("KRAS_G12C", "DISEASE:COLORECTAL_CANCER", Predicate.ASSOCIATED_WITH) in _edges(result)
+        obs = result.entities[0].observation
+        assert obs.provenance == "GDC:ENSG00000133703"
+        assert "11.3%" in obs.statement
+
+
+class TestBatchExtraction:
+
+    @staticmethod
+    def _llm_answering(ids_to_skip=()):
+        """按批量提示中的 id 回答，跳过指定 id 模拟缺失条目"""
+        import json
+        import re
+
+        def caller(system_prompt, user_prompt):
+            ids = re.findall(r'"id": "(F\d+)"', user_prompt)
+            if not ids:  # 单条提示
+                return json.dumps({"entities": [{"canonical_id": "GENE:TP53", "entity_type": "gene", "name": "TP53"}],
+                                   "observation": "single"})
+            return json.dumps({"results": [
+                {"id": fid, "entities": [{"canonical_id": f"GENE:G{fid}", "entity_type": "gene", "name": f"G{fid}"}],
+                 "observation": f"obs {fid}"}
+                for fid in ids if fid not in ids_to_skip
+            ]})
+        return MagicMock(side_effect=caller)
+
+    def _findings(self, n):
+        return [{"content": f"free text finding {i}", "source_tool": "search_pubmed"} for i in range(n)]
+
+    def test_packs_into_one_call_and_keeps_order(self):
+        from src.models.entity_extractors import extract_entities_batch
+
+        llm = self._llm_answering()
+        index = MagicMock(return_value="GENE:EGFR")
+        structured = {"gene": "EGFR", "frequency_percentage": 12, "source_tool": "search_gdc"}
+        findings = self._findings(3)
+        findings.insert(1, structured)
+
+        results = extract_entities_batch(findings, "Geneticist", 0, llm_caller=llm, existing_entities=index,
+                                         max_batch_tokens=10000, max_batch_items=8)
+
+        assert llm.call_count == 1
+        index.assert_called_once()
+        assert [r.method for r in results] == ["llm", "rule", "llm", "llm"]
+        assert [r.entities[0].canonical_id for r in results] == ["GENE:GF1", "GENE:EGFR", "GENE:GF3", "GENE:GF4"]
+        assert "批量模式" in llm.call_args[0][0]
+
+    def test_token_budget_splits_batches(self):
+        from src.models.entity_extractors import extract_entities_batch
+
+        llm = self._llm_answering()
+        extract_entities_batch(self._findings(4), "Geneticist", 0, llm_caller=llm,
+                               max_batch_tokens=55, max_batch_items=8)
+        assert llm.call_count == 2
+
+    def test_missing_items_retried(self):
+        from src.models.entity_extractors import extract_entities_batch
+
+        llm = self._llm_answering(ids_to_skip={"F2"})
+        results = extract_entities_batch(self._findings(3), "Geneticist", 0, llm_caller=llm,
+                                         max_batch_tokens=10000, max_batch_items=8)
+
+        # 一次批量 + F2 单条重试
+        assert llm.call_count == 2
+        assert results[1].entities[0].canonical_id == "GENE:TP53"
+        assert results[0].entities[0].observation.statement == "obs F1"
+
+    def test_garbled_batch_is_split(self):
+        from src.models.entity_extractors import extract_entities_batch
+
+        llm = MagicMock(side_effect=lambda s, u: "not json" if '"id"' in u else '{"entities": [], "observation": ""}')
+        results = extract_entities_batch(self._findings(4), "Geneticist", 0, llm_caller=llm,
+                                         max_batch_tokens=10000, max_batch_items=8)
+
+        # 4 → 2+2 → 1+1+1+1
+        assert llm.call_count == 1 + 2 + 4
+        assert len(results) == 4
+
+    def test_transport_failure_not_split(self):
+        from src.models.entity_extractors import extract_entities_batch
+
+        # _default_llm_call 重试用尽后返回 "{}"
+        llm = MagicMock(return_value="{}")
+        results = extract_entities_batch(self._findings(8), "Geneticist", 0, llm_caller=llm,
+                                         max_batch_tokens=10000, max_batch_items=4)
+
+        # 首批失败即停止：不二分、不再调用第二批
+        assert llm.call_count == 1
+        assert len(results) == 8
+        assert all(r.entities == [] for r in results)
+
+    def test_transport_failure_during_split_stops(self):
+        from src.models.entity_extractors import extract_entities_batch
+
+        replies = iter(["not json", RuntimeError("connection reset")])
+
+        def caller(system_prompt, user_prompt):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        llm = MagicMock(side_effect=caller)
+        results = extract_entities_batch(self._findings(4), "Geneticist", 0, llm_caller=llm,
+                                         max_batch_tokens=10000, max_batch_items=8)
+
+        # 4 → 解析失败二分 → 前半批调用失败，后半批不再调用
+        assert llm.call_count == 2
+        assert len(results) == 4
+
+    def test_dedupe_across_findings_in_batch(self):
+        from src.models.entity_extractors import (
+            ExtractedEdge, ExtractedEntity, ExtractionResult, dedupe_batch_entities,
+        )
+
+        first = ExtractionResult(entities=[
+            ExtractedEntity("DRUG:OSIMERTINIB", EntityType.DRUG, "Osimertinib", aliases=["AZD9291"])], edges=[])
+        second = ExtractionResult(
+            entities=[ExtractedEntity("DRUG:AZD9291", EntityType.DRUG, "AZD9291"),
+                      ExtractedEntity("GENE:AZD9291", EntityType.GENE, "AZD9291"),
+                      ExtractedEntity("EGFR_T790M", EntityType.VARIANT, "EGFR T790M")],
+            edges=[ExtractedEdge("EGFR_T790M", "DRUG:AZD9291", Predicate.SENSITIZES)],
+        )
+
+        assert dedupe_batch_entities([first, second]) == 1
+        assert second.entities[0].canonical_id == "DRUG:OSIMERTINIB"
+        assert "AZD9291" in second.entities[0].aliases
+        assert second.entities[1].canonical_id == "GENE:AZD9291"  # 类型不同不合并
+        assert second.edges[0].target_id == "DRUG:OSIMERTINIB"
+
+
+class TestEvidenceGraphUpdate:
+
+    def test_batch_failure_falls_back_per_finding(self):
+        from unittest.mock import patch
+
+        from src.agents.research_mixin import ResearchMixin
+        from src.models.entity_extractors import ExtractedEntity, ExtractionResult
+        from src.models.evidence_graph import EvidenceGraph
+        from src.models.research_plan import ResearchMode
+
+        def single(finding, **kwargs):
+            if finding["content"] == "bad":
+                raise ValueError("unparseable")
+            name = finding["content"].upper()
+            return ExtractionResult(entities=[ExtractedEntity(f"GENE:{name}", EntityType.GENE, name)], edges=[])
+
+        findings = [{"content": c, "source_tool": "search_pubmed"} for c in ("kras", "bad", "braf")]
+        graph = EvidenceGraph()
+        with patch("src.agents.research_mixin.extract_entities_batch", side_effect=RuntimeError("timeout")), \
+                patch("src.agents.research_mixin.extract_entities_from_finding", side_effect=single):
+            new_ids, _, _ = ResearchMixin()._update_evidence_graph(
+                graph, findings, "Geneticist", 0, ResearchMode.BREADTH_FIRST)
+
+        assert new_ids == ["GENE:KRAS", "GENE:BRAF"]
+
+
+class TestEntityIndexSelector:
+
+    def test_selector_filters_to_finding(self):
+        from src.models.entity_extractors import make_entity_index_selector
+        from src.models.evidence_graph import EvidenceGraph
+
+        graph = EvidenceGraph()
+        graph.get_or_create_entity("GENE:EGFR", EntityType.GENE, "EGFR", "test")
+        graph.get_or_create_entity("GENE:ALK", EntityType.GENE, "ALK", "test")
+        select = make_entity_index_selector(graph, max_tokens=500)
+
+        index = select([{"gene": "EGFR", "content": "EGFR exon 19 deletion", "source_tool": "search_pubmed"}])
+        assert "GENE:EGFR" in index
+        assert "GENE:ALK" not in index
@@ -0,0 +1,210 @@
+"""
+EvidenceGraph 检索单元测试
+
+测试覆盖:
+- 图版本号随变更递增
+- 相关实体索引：词项/别名匹配、类型加权、token 上限、按版本缓存
+- 去重质量统计 (过滤索引 vs 全量索引)，默认不在证据图更新时计算
+- 方向上下文按相关性截断
+- 批量子图检索：与逐方向检索一致、缓存命中、增量失效
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.models.evidence_graph import (
+    EvidenceGraph, EntityType, Observation, Predicate, estimate_tokens,
+)
+
+
+def _obs(text="obs"):
+    return Observation(id=Observation.generate_id("test"), statement=text, source_agent="Test")
+
+
+@pytest.fixture
+def graph():
+    g = EvidenceGraph()
+    g.get_or_create_entity("GENE:EGFR", EntityType.GENE, "EGFR", "test", aliases=["ERBB1"])
+    g.get_or_create_entity("EGFR_L858R", EntityType.VARIANT, "L858R", "test")
+    g.get_or_create_entity("EGFR_T790M", EntityType.VARIANT, "T790M", "test")
+    g.get_or_create_entity("DRUG:OSIMERTINIB", EntityType.DRUG, "OSIMERTINIB", "test", aliases=["TAGRISSO"])
+    g.get_or_create_entity("GENE:KRAS", EntityType.GENE, "KRAS", "test")
+    g.get_or_create_entity("DISEASE:NON-SMALL_CELL_LUNG_CANCER", EntityType.DISEASE, "NON-SMALL CELL LUNG CANCER", "test")
+    for i in range(30):
+        g.get_or_create_entity(f"DRUG:FILLER{i}", EntityType.DRUG, f"FILLER{i}", "test")
+    g.add_edge("EGFR_L858R", "DRUG:OSIMERTINIB", Predicate.SENSITIZES, _obs(), 0.95)
+    return g
+
+
+class TestGraphVersion:
+
+    def test_mutations_bump_version(self, graph):
+        v = graph.version
+        graph.get_or_create_entity("GENE:EGFR", EntityType.GENE, "EGFR", "test")  # 已存在，无新别名
+        assert graph.version == v
+        graph.get_or_create_entity("GENE:EGFR", EntityType.GENE, "EGFR", "test", aliases=["HER1"])
+        assert graph.version == v + 1
+        graph.add_observation_to_entity("GENE:EGFR", _obs())
+        graph.add_edge("GENE:EGFR", "DRUG:OSIMERTINIB", Predicate.ASSOCIATED_WITH, _obs())
+        assert graph.version == v + 3
+
+
+class TestRelevantEntityIndex:
+
+    def test_lexical_and_alias_match(self, graph):
+        index = graph.get_relevant_entity_index("Tagrisso shows activity in EGFR L858R NSCLC", max_tokens=1000)
+
+        assert "DRUG:OSIMERTINIB" in index
+        assert "EGFR_L858R" in index
+        assert "GENE:KRAS" not in index
+        assert "FILLER" not in index
+
+    def test_phrase_match(self, graph):
+        index = graph.get_relevant_entity_index("advanced non-small cell lung cancer", max_tokens=1000)
+        assert index.splitlines()[0].startswith("- DISEASE:NON-SMALL_CELL_LUNG_CANCER")
+
+    def test_preferred_types_boost(self, graph):
+        ranked = graph.get_relevant_entity_ids("EGFR L858R", preferred_types=[EntityType.VARIANT])
+        assert ranked[0] == "EGFR_L858R"
+
+    def test_token_cap(self, graph):
+        query = " ".join(f"FILLER{i}" for i in range(30))
+        index = graph.get_relevant_entity_index(query, max_tokens=40)
+        assert 0 < estimate_tokens(index) <= 40 + len(index.splitlines())
+
+    def test_cached_per_version(self, graph):
+        first = graph.get_relevant_entity_index("EGFR", max_tokens=1000)
+        assert graph.get_relevant_entity_index("egfr", max_tokens=1000) is first
+
+        graph.get_or_create_entity("EGFR_EXON19DEL", EntityType.VARIANT, "EXON19DEL", "test")
+        refreshed = graph.get_relevant_entity_index("EGFR", max_tokens=1000)
+        assert "EGFR_EXON19DEL" in refreshed
+
+    def test_index_stats_recall(self, graph):
+        filtered = graph.get_relevant_entity_index("osimertinib for EGFR", max_tokens=1000)
+        stats = graph.entity_index_stats(filtered, ["DRUG:OSIMERTINIB", "GENE:KRAS"])
+
+        assert stats["referenced"] == 2
+        assert stats["recalled"] == 1
+        assert stats["recall"] == 0.5
+        assert stats["filtered_tokens"] < stats["full_tokens"]
+
+    def test_quality_log_gated(self, graph, monkeypatch):
+        from unittest.mock import MagicMock
+
+        from src.agents.research_mixin import ResearchMixin
+        from src.models.entity_extractors import ExtractedEntity, ExtractionResult
+
+        results = [ExtractionResult(entities=[ExtractedEntity("GENE:KRAS", EntityType.GENE, "KRAS")], edges=[])]
+        selector = MagicMock(return_value="- GENE:KRAS: KRAS")
+        full_index = MagicMock(wraps=graph.get_entity_index)
+        monkeypatch.setattr(graph, "get_entity_index", full_index)
+
+        # 默认关闭：不构建全量索引
+        ResearchMixin._log_entity_index_quality(graph, selector, [{}], results, "Test")
+        full_index.assert_not_called()
+
+        monkeypatch.setattr("config.settings.ENTITY_INDEX_QUALITY_LOG", True)
+        ResearchMixin._log_entity_index_quality(graph, selector, [{}], results, "Test")
+        full_index.assert_called_once()
+
+
+class TestDirectionContextSelection:
+
+    def test_truncates_by_relevance_keeps_anchor(self, graph):
+        from src.agents.research_mixin import ResearchMixin
+
+        direction = {"id": "D1", "topic": "Osimertinib resistance", "queries": ["T790M"], "entity_ids": ["GENE:KRAS"]}
+        sub = graph.retrieve_subgraph(anchor_ids=list(graph.entities), max_hops=1, include_observations=False)
+        for e in sub["entities"]:
+            e["hop_distance"] = 0 if e["canonical_id"] == "GENE:KRAS" else 1
+
+        kept, edges = ResearchMixin()._select_context_entities(
+            direction, graph, sub["entities"], sub["edges"], max_tokens=30
+        )
+        kept_ids = [e["canonical_id"] for e in kept]
+
+        assert kept_ids[0] == "GENE:KRAS"
+        assert "DRUG:OSIMERTINIB" in kept_ids and "EGFR_T790M" in kept_ids
+        assert len(kept) < len(sub["entities"])
+        assert all(e["source_id"] in kept_ids and e["target_id"] in kept_ids for e in edges)
+
+    def test_no_truncation_under_budget(self, graph):
+        from src.agents.research_mixin import ResearchMixin
+
+        sub = graph.retrieve_subgraph(anchor_ids=["EGFR_L858R"], max_hops=1, include_observations=False)
+        kept, edges = ResearchMixin()._select_context_entities(
+            {"id": "D1", "topic": "x"}, graph, sub["entities"], sub["edges"], max_tokens=10000
+        )
+        assert kept == sub["entities"] and edges == sub["edges"]
+
+
+class TestBatchedSubgraphs:
+
+    @pytest.fixture
+    def chain_graph(self, graph):
+        graph.add_edge("EGFR_L858R", "GENE:EGFR", Predicate.MEMBER_OF, _obs())
+        graph.add_edge("EGFR_T790M", "GENE:EGFR", Predicate.MEMBER_OF, _obs())
+        graph.add_edge("EGFR_T790M", "DRUG:OSIMERTINIB", Predicate.SENSITIZES, _obs())
+        graph.add_edge("GENE:KRAS", "DRUG:FILLER0", Predicate.ASSOCIATED_WITH, _obs())
+        graph.add_edge("DRUG:FILLER0", "DRUG:FILLER1", Predicate.ASSOCIATED_WITH, _obs())
+        return graph
+
+    @staticmethod
+    def _shape(sub):
+        return (
+            {(e["canonical_id"], e["hop_distance"]) for e in sub["entities"]},
+            {(e["source_id"], e["target_id"], e["predicate"]) for e in sub["edges"]},
+        )
+
+    @pytest.mark.parametrize("hops", [1, 2, 3])
+    def test_matches_single_retrieval(self, chain_graph, hops):
+        anchor_sets = {"D1": ["EGFR_L858R"], "D2": ["GENE:KRAS"], "D3": ["GENE:EGFR", "GENE:KRAS"]}
+        batch = chain_graph.retrieve_subgraphs(anchor_sets, max_hops=hops)
+
+        for key, anchors in anchor_sets.items():
+            single = chain_graph.retrieve_subgraph(anchors, max_hops=hops)
+            assert self._shape(batch[key]) == self._shape(single)
+
+    def test_type_filter_and_cap(self, chain_graph):
+        sub = chain_graph.retrieve_subgraphs(
+            {"D1": ["EGFR_L858R"]}, max_hops=3, entity_type_filter=[EntityType.VARIANT, EntityType.GENE]
+        )["D1"]
+        assert {e["canonical_id"] for e in sub["entities"]} == {"EGFR_L858R", "GENE:EGFR", "EGFR_T790M"}
+
+        capped = chain_graph.retrieve_subgraphs({"D1": ["EGFR_L858R"]}, max_hops=3, max_entities=2)["D1"]
+        assert len(capped["entities"]) == 2
+
+    def test_cache_hit_and_copy(self, chain_graph):
+        first = chain_graph.retrieve_subgraphs({"D1": ["EGFR_L858R"], "D2": ["EGFR_L858R"]})
+        first["D1"]["entities"].clear()
+        second = chain_graph.retrieve_subgraphs({"D3": ["EGFR_L858R"]})
+
+        stats = chain_graph.subgraph_cache_stats()
+        assert stats["misses"] == 1 and stats["hits"] == 1
+        assert second["D3"]["entities"]
+
+    def test_incremental_invalidation(self, chain_graph):
+        chain_graph.retrieve_subgraphs({"D1": ["GENE:KRAS"]}, max_hops=1)
+
+        # 与子图无关的变更：增量校验后复用
+        chain_graph.add_edge("EGFR_L858R", "DISEASE:NON-SMALL_CELL_LUNG_CANCER", Predicate.ASSOCIATED_WITH, _obs())
+        chain_graph.retrieve_subgraphs({"D1": ["GENE:KRAS"]}, max_hops=1)
+        assert chain_graph.subgraph_cache_stats()["revalidated"] == 1
+
+        # 触及子图实体的变更：失效并重新遍历
+        chain_graph.add_edge("GENE:KRAS", "DRUG:FILLER5", Predicate.ASSOCIATED_WITH, _obs())
+        sub = chain_graph.retrieve_subgraphs({"D1": ["GENE:KRAS"]}, max_hops=1)["D1"]
+        assert "DRUG:FILLER5" in {e["canonical_id"] for e in sub["entities"]}
+        assert chain_graph.subgraph_cache_stats()["misses"] == 2
+
+    def test_missing_anchor(self, chain_graph):
+        sub = chain_graph.retrieve_subgraphs({"D1": ["GENE:NOPE"]})["D1"]
+        assert sub["entities"] == [] and sub["edges"] == []
+
+        chain_graph.get_or_create_entity("GENE:NOPE", EntityType.GENE, "NOPE", "test")
+        sub = chain_graph.retrieve_subgraphs({"D1": ["GENE:NOPE"]})["D1"]
+        assert [e["canonical_id"] for e in sub["entities"]] == ["GENE:NOPE"]
@@ -0,0 +1,69 @@
+"""
+GraphQueryTool 响应缓存单元测试
+
+测试覆盖:
+- 图未变更时重复查询命中缓存（参数归一化）
+- 图变更后版本号变化，重新计算
+- 换绑新图清空缓存、LRU 上限
+"""
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.models.evidence_graph import EvidenceGraph, EntityType, Observation, Predicate
+from src.tools.graph_query_tool import GraphQueryTool
+
+
+def _obs(text="obs"):
+    return Observation(id=Observation.generate_id("test"), statement=text, source_agent="Test")
+
+
+@pytest.fixture
+def tool():
+    graph = EvidenceGraph()
+    graph.get_or_create_entity("EGFR_L858R", EntityType.VARIANT, "L858R", "test")
+    graph.get_or_create_entity("DRUG:OSIMERTINIB", EntityType.DRUG, "OSIMERTINIB", "test")
+    graph.add_edge("EGFR_L858R", "DRUG:OSIMERTINIB", Predicate.SENSITIZES, _obs(), 0.95)
+    t = GraphQueryTool()
+    t.set_graph(graph)
+    return t
+
+
+class TestResponseCache:
+
+    def test_repeat_query_hits(self, tool):
+        first = tool.invoke(action="get_neighborhood", entity_id="EGFR_L858R", entity_types=["drug", "variant"])
+        with patch.object(tool._graph, "get_neighborhood", side_effect=AssertionError("recomputed")):
+            second = tool.invoke(action="get_neighborhood", entity_id=" EGFR_L858R ", entity_types=["Variant", "DRUG"])
+
+        assert second == first
+        stats = tool.cache_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_mutation_invalidates(self, tool):
+        before = tool.invoke(action="get_stats")
+        tool._graph.get_or_create_entity("GENE:EGFR", EntityType.GENE, "EGFR", "test")
+        after = tool.invoke(action="get_stats")
+
+        assert before != after
+        assert "**Total entities**: 3" in after
+        assert tool.cache_stats()["hits"] == 0
+
+    def test_set_new_graph_clears(self, tool):
+        tool.invoke(action="get_stats")
+        tool.set_graph(tool._graph)  # 同一实例不清空
+        assert tool.cache_stats()["size"] == 1
+
+        tool.set_graph(EvidenceGraph())
+        assert tool.cache_stats()["size"] == 0
+
+    def test_lru_bound(self, tool):
+        tool.RESPONSE_CACHE_SIZE = 2
+        for q in ("egfr", "osim", "l858r"):
+            tool.invoke(action="search_entities", query=q)
+        assert tool.cache_stats()["size"] == 2
@@ -0,0 +1,100 @@
+"""
+导入耗时回归测试（python -X importtime）
+
+测试覆盖:
+- CLI 入口：不加载 LangGraph / LangChain 与重型可选依赖，累计导入耗时在预算内
+- 工作流：torch / byaldi / chromadb / neo4j / PyPDF2 / tiktoken / fitz 推迟到首次使用
+- 包级延迟导出：导入单个子模块不连带加载兄弟模块；别名与 dir() 保持不变
+- 导入无副作用：不创建目录、不打开日志文件
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+ROOT = Path(__file__).parent.parent
+
+# 重型可选依赖：只允许在真正使用时导入
+HEAVY_OPTIONAL = ("torch", "transformers", "byaldi", "chromadb", "neo4j", "PyPDF2", "tiktoken", "fitz")
+
+# 累计导入耗时预算（秒）；本机实测约 0.15s，预算留足 CI 抖动
+MAIN_IMPORT_BUDGET = float(os.getenv("MTB_MAIN_IMPORT_BUDGET", "1.5"))
+
+
+def _importtime(code: str) -> Tuple[Dict[str, int], str]:
+    """子进程执行 code，返回 ({模块: 累计微秒}, stdout)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    modules = {}
+    # 格式: "import time: <self us> | <cumulative us> | <缩进的模块名>"
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules, proc.stdout
+
+
+def _top_level(modules: Dict[str, int]) -> set:
+    return {name.split(".")[0] for name in modules}
+
+
+class TestStartupBudget:
+
+    def test_cli_entry(self):
+        modules, _ = _importtime("import main")
+        loaded = _top_level(modules)
+        assert not loaded & {"langgraph", "langchain_core", "numpy", "openai", *HEAVY_OPTIONAL}
+        assert modules["main"] / 1e6 < MAIN_IMPORT_BUDGET
+
+    def test_workflow_defers_heavy_optional(self):
+        modules, _ = _importtime("import src.graph.state_graph")
+        assert not _top_level(modules) & set(HEAVY_OPTIONAL)
+        assert "src.tools.rag.nccn_image_rag" not in modules
+
+    def test_submodules_do_not_pull_siblings(self):
+        modules, _ = _importtime("import src.tools.base_tool, src.tools.rag.pageindex_rag")
+        assert "src.tools.molecular_tools" not in modules
+        assert "src.tools.api_clients.civic_client" not in modules
+        assert "src.tools.rag.nccn_image_rag" not in modules and "numpy" not in modules
+
+
+class TestLazyExports:
+
+    def test_aliases_and_dir(self):
+        import src.tools as tools
+        from src.tools import CIViCTool, OncoKBTool
+
+        assert OncoKBTool is CIViCTool
+        assert set(tools.__all__) <= set(dir(tools))
+        with pytest.raises(AttributeError):
+            tools.NoSuchTool
+
+
+class TestNoImportSideEffects:
+
+    def test_import_creates_no_files(self):
+        code = (
+            "import builtins, json, pathlib\n"
+            "calls = []\n"
+            "pathlib.Path.mkdir = lambda self, *a, **k: calls.append(('mkdir', str(self)))\n"
+            "_open = builtins.open\n"
+            "def spy(file, mode='r', *a, **k):\n"
+            "    if any(m in mode for m in 'wax+'):\n"
+            "        calls.append(('open', str(file)))\n"
+            "    return _open(file, mode, *a, **k)\n"
+            "builtins.open = spy\n"
+            "import main, src.service.server, src.service.batch\n"
+            "print(json.dumps(calls))\n"
+        )
+        _, stdout = _importtime(code)
+        assert json.loads(stdout.strip().splitlines()[-1]) == []
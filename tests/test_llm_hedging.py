@@ -0,0 +1,178 @@
+"""
+LLM 对冲请求单元测试
+
+测试覆盖:
+- 延迟直方图分位数 / 对冲延迟（样本不足用初始延迟，上下限截断）
+- 主请求停滞时发出对冲请求，先返回者胜出；落败请求完成后用量仍记入账本
+- 速率限制余量不足时不对冲
+- 非幂等调用点不对冲、失败时等待另一份
+- BaseAgent 非阻塞配额占用保留余量
+"""
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils import llm_hedging
+from src.utils.llm_hedging import LatencyHistogram, LatencyRegistry, hedged_call
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    reg = LatencyRegistry()
+    with patch.object(llm_hedging, "latency_registry", reg), \
+            patch.object(llm_hedging, "LLM_HEDGE_CALL_SITES", ["idempotent"]):
+        yield reg
+
+
+def _slow_then_fast(first_delay):
+    """第一次调用慢、之后的调用快"""
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            calls.append(threading.current_thread().name)
+            n = len(calls)
+        time.sleep(first_delay if n == 1 else 0.01)
+        return f"call{n}"
+    return fn, calls
+
+
+class TestLatencyHistogram:
+
+    def test_quantiles(self):
+        hist = LatencyHistogram(window=100)
+        for i in range(1, 101):
+            hist.observe(float(i))
+        assert hist.quantile(0.5) == 51
+        assert hist.snapshot()["p95"] == 96
+        assert LatencyHistogram().quantile(0.95) is None
+
+    def test_window(self):
+        hist = LatencyHistogram(window=3)
+        for v in (100, 1, 2, 3):
+            hist.observe(v)
+        assert hist.snapshot()["max"] == 3
+
+    def test_hedge_delay(self, registry):
+        with patch.object(llm_hedging, "LLM_HEDGE_INITIAL_DELAY", 42), \
+                patch.object(llm_hedging, "LLM_HEDGE_MIN_DELAY", 2), \
+                patch.object(llm_hedging, "LLM_HEDGE_MAX_DELAY", 30):
+            assert registry.hedge_delay("m", "s") == 42
+            hist = registry.histogram("m", "s")
+            for _ in range(20):
+                hist.observe(0.5)
+            assert registry.hedge_delay("m", "s") == 2
+            for _ in range(20):
+                hist.observe(100)
+            assert registry.hedge_delay("m", "s") == 30
+
+
+class TestHedgedCall:
+
+    def test_hedge_wins_when_primary_stalls(self, registry):
+        fn, calls = _slow_then_fast(1.0)
+        with patch.object(llm_hedging, "LLM_HEDGE_INITIAL_DELAY", 0.05):
+            start = time.time()
+            result = hedged_call("idempotent", "m", fn, enabled=True, acquire_slot=lambda: True)
+
+        assert result == "call2"
+        assert time.time() - start < 0.5
+        stats = registry.summary()["m | idempotent"]
+        assert stats["hedged"] == 1 and stats["hedge_won"] == 1
+
+    def test_no_hedge_without_rate_budget(self, registry):
+        fn, calls = _slow_then_fast(0.2)
+        with patch.object(llm_hedging, "LLM_HEDGE_INITIAL_DELAY", 0.05):
+            result = hedged_call("idempotent", "m", fn, enabled=True, acquire_slot=lambda: False)
+
+        assert result == "call1" and len(calls) == 1
+        assert registry.summary()["m | idempotent"]["skipped_rate_limit"] == 1
+
+    def test_fast_primary_not_hedged(self, registry):
+        acquire = []
+        result = hedged_call("idempotent", "m", lambda: "ok", enabled=True,
+                             acquire_slot=lambda: acquire.append(1) or True)
+        assert result == "ok" and not acquire
+        assert registry.histogram("m", "idempotent").snapshot()["count"] == 1
+
+    def test_non_idempotent_site_runs_inline(self, registry):
+        names = []
+        hedged_call("chair", "m", lambda: names.append(threading.current_thread().name), enabled=True)
+        assert names == [threading.current_thread().name]
+        assert len(registry.histogram("m", "chair")) == 1
+
+    def test_failure_waits_for_other_copy(self, registry):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                raise ConnectionError("primary failed")
+            time.sleep(0.2)
+            return "hedge"
+
+        with patch.object(llm_hedging, "LLM_HEDGE_INITIAL_DELAY", 0.02):
+            assert hedged_call("idempotent", "m", fn, enabled=True, acquire_slot=lambda: True) == "hedge"
+
+    def test_discarded_copy_reported(self, registry):
+        fn, calls = _slow_then_fast(0.3)
+        discarded = []
+        done = threading.Event()
+        with patch.object(llm_hedging, "LLM_HEDGE_INITIAL_DELAY", 0.05):
+            result = hedged_call("idempotent", "m", fn, enabled=True, acquire_slot=lambda: True,
+                                 on_discarded=lambda value, latency: (discarded.append(value), done.set()))
+
+        assert result == "call2"
+        assert done.wait(2) and discarded == ["call1"]
+
+    def test_discarded_usage_reaches_ledger(self, registry):
+        from src.utils.llm_budget import CallBudget, run_with_budget
+        from src.utils.usage_ledger import run_ledger
+
+        fn, calls = _slow_then_fast(0.3)
+
+        def send_once():
+            return {"usage": {"prompt_tokens": 100, "completion_tokens": 10}, "tag": fn(),
+                    "choices": [{"finish_reason": "stop"}]}
+
+        budget = CallBudget(site="idempotent", max_tokens=100, reasoning_effort="", timeout=10, max_tokens_ceiling=100)
+        with run_ledger({}) as ledger, patch.object(llm_hedging, "LLM_HEDGE_INITIAL_DELAY", 0.05):
+            result = run_with_budget(budget, lambda b: hedged_call(
+                b.site, "m", send_once, enabled=True, acquire_slot=lambda: True))
+            deadline = time.time() + 2
+            while len(ledger.entries()) < 2 and time.time() < deadline:
+                time.sleep(0.02)
+
+        assert result["tag"] == "call2"
+        # 落败的主请求同样计费
+        assert sorted(e["hedge_discarded"] for e in ledger.entries()) == [False, True]
+        assert sum(e["prompt_tokens"] for e in ledger.entries()) == 200
+
+    def test_error_propagates(self):
+        def fn():
+            raise ValueError("bad")
+
+        with pytest.raises(ValueError):
+            hedged_call("idempotent", "m", fn, enabled=True, acquire_slot=lambda: True)
+
+
+class TestRateSlot:
+
+    def test_reserve_left_for_primary_requests(self):
+        from src.agents.base_agent import BaseAgent
+
+        with patch.object(BaseAgent, "_request_timestamps", deque()), \
+                patch.object(BaseAgent, "_RATE_LIMIT_MAX_REQUESTS", 4):
+            assert BaseAgent._try_acquire_rate_slot(reserve=2)
+            assert BaseAgent._try_acquire_rate_slot(reserve=2)
+            assert not BaseAgent._try_acquire_rate_slot(reserve=2)
+            assert BaseAgent._try_acquire_rate_slot(reserve=0)
@@ -0,0 +1,187 @@
+"""
+MultiVectorStore 单元测试
+
+测试覆盖:
+- 导出 / mmap 加载往返
+- 分块 MaxSim 与朴素实现一致（含空页、单页超出块预算）
+- int8 量化存储的排序与 float16 一致
+- NCCNImageRag 优先使用 mmap 存储（mock 查询编码器）
+- 批量 MaxSim 与逐个检索一致、查询嵌入 LRU 缓存
+"""
+import sys
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.tools.rag.multivector_store import (
+    MultiVectorStore, QueryEmbeddingCache, STORE_DIRNAME, quantize_int8,
+)
+
+
+DIM = 16
+
+
+def naive_maxsim(query, pages):
+    scores = []
+    for emb in pages:
+        if len(emb) == 0:
+            scores.append(-np.inf)
+            continue
+        scores.append((emb @ query.T).max(axis=0).sum())
+    return np.array(scores, dtype=np.float32)
+
+
+@pytest.fixture
+def page_embeddings():
+    rng = np.random.default_rng(0)
+    lengths = [7, 3, 12, 0, 5, 9, 1]
+    return [rng.standard_normal((n, DIM)).astype(np.float32) for n in lengths]
+
+
+@pytest.fixture
+def pages(page_embeddings):
+    return [{"doc_id": 0, "page_num": i + 1} for i in range(len(page_embeddings))]
+
+
+class TestMultiVectorStore:
+
+    def test_roundtrip_mmap(self, tmp_path, page_embeddings, pages):
+        MultiVectorStore.write(tmp_path, page_embeddings, pages, dtype="float16")
+        store = MultiVectorStore.load(tmp_path)
+
+        assert isinstance(store.embeddings, np.memmap)
+        assert store.num_pages == len(pages)
+        assert store.dim == DIM
+        assert store.manifest["total_tokens"] == sum(len(e) for e in page_embeddings)
+
+    def test_maxsim_matches_naive(self, tmp_path, page_embeddings, pages):
+        MultiVectorStore.write(tmp_path, page_embeddings, pages, dtype="float16")
+        store = MultiVectorStore.load(tmp_path)
+        query = np.random.default_rng(1).standard_normal((4, DIM)).astype(np.float32)
+
+        expected = naive_maxsim(query, [e.astype(np.float16).astype(np.float32) for e in page_embeddings])
+        np.testing.assert_allclose(store.maxsim(query), expected, rtol=1e-4)
+
+    @pytest.mark.parametrize("block_tokens", [1, 5, 10, 1000])
+    def test_block_size_does_not_change_scores(self, tmp_path, page_embeddings, pages, block_tokens):
+        MultiVectorStore.write(tmp_path, page_embeddings, pages, dtype="float16")
+        full = MultiVectorStore.load(tmp_path)
+        blocked = MultiVectorStore.load(tmp_path, block_tokens=block_tokens)
+        query = np.random.default_rng(2).standard_normal((3, DIM)).astype(np.float32)
+
+        np.testing.assert_allclose(blocked.maxsim(query), full.maxsim(query), rtol=1e-5)
+
+    def test_empty_page_never_returned(self, tmp_path, page_embeddings, pages):
+        MultiVectorStore.write(tmp_path, page_embeddings, pages, dtype="float16")
+        store = MultiVectorStore.load(tmp_path)
+        query = np.random.default_rng(3).standard_normal((2, DIM)).astype(np.float32)
+
+        results = store.search(query, k=len(pages))
+        assert 4 not in [r["page_num"] for r in results]
+        assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+
+    def test_int8_preserves_ranking(self, tmp_path, page_embeddings, pages):
+        MultiVectorStore.write(tmp_path / "f16", page_embeddings, pages, dtype="float16")
+        MultiVectorStore.write(tmp_path / "i8", page_embeddings, pages, dtype="int8")
+        f16 = MultiVectorStore.load(tmp_path / "f16")
+        i8 = MultiVectorStore.load(tmp_path / "i8")
+        query = np.random.default_rng(4).standard_normal((4, DIM)).astype(np.float32)
+
+        assert [r["page_num"] for r in i8.search(query, k=3)] == [r["page_num"] for r in f16.search(query, k=3)]
+
+    def test_quantize_int8_zero_row(self):
+        q, scale = quantize_int8(np.zeros((2, DIM), dtype=np.float32))
+        assert q.dtype == np.int8
+        assert np.all(scale == 1.0)
+
+    def test_invalid_dtype(self, tmp_path, page_embeddings, pages):
+        with pytest.raises(ValueError):
+            MultiVectorStore.write(tmp_path, page_embeddings, pages, dtype="float64")
+
+
+class TestNCCNImageRagMmap:
+
+    def test_load_index_prefers_mmap_store(self, tmp_path, page_embeddings, pages):
+        from src.tools.rag.nccn_image_rag import NCCNImageRag
+
+        MultiVectorStore.write(tmp_path / "nccn_test" / STORE_DIRNAME, page_embeddings, pages)
+        rag = NCCNImageRag(index_root=str(tmp_path), device="cpu", enable_multimodal_reading=False)
+        rag.load_index("nccn_test")
+
+        assert rag.store is not None
+        assert rag.model is None
+
+        query = np.random.default_rng(5).standard_normal((3, DIM)).astype(np.float32)
+        encoder = MagicMock()
+        encoder.encode_batch.return_value = [query]
+        with patch("src.tools.rag.nccn_image_rag.get_query_encoder", return_value=encoder):
+            results = rag.search("KRAS G12C", top_k=2)
+
+        assert len(results) == 2
+        assert results[0]["score"] >= results[1]["score"]
+        encoder.encode_batch.assert_called_once_with(["KRAS G12C"])
+
+
+class TestBatchSearch:
+
+    def test_maxsim_batch_matches_single(self, tmp_path, page_embeddings, pages):
+        MultiVectorStore.write(tmp_path, page_embeddings, pages)
+        store = MultiVectorStore.load(tmp_path, block_tokens=8)
+        rng = np.random.default_rng(6)
+        queries = [rng.standard_normal((n, DIM)).astype(np.float32) for n in (2, 5, 1)]
+
+        batch = store.maxsim_batch(queries)
+        assert batch.shape == (3, len(pages))
+        for row, q in zip(batch, queries):
+            np.testing.assert_allclose(row, store.maxsim(q), rtol=1e-5)
+
+    def test_search_batch_empty(self, tmp_path, page_embeddings, pages):
+        MultiVectorStore.write(tmp_path, page_embeddings, pages)
+        store = MultiVectorStore.load(tmp_path)
+        assert store.search_batch([], k=3) == []
+
+
+class TestQueryEmbeddingCache:
+
+    def test_normalized_key_hits(self):
+        cache = QueryEmbeddingCache(max_size=4)
+        emb = np.ones((2, DIM), dtype=np.float32)
+        cache.put("  KRAS   G12C ", emb)
+
+        assert cache.get("kras g12c") is emb
+        assert cache.stats()["hits"] == 1
+
+    def test_lru_eviction(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        for q in ("a", "b"):
+            cache.put(q, np.zeros((1, DIM)))
+        cache.get("a")  # a 变为最近使用
+        cache.put("c", np.zeros((1, DIM)))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert len(cache) == 2
+
+    def test_rag_search_batch_encodes_misses_once(self, tmp_path, page_embeddings, pages):
+        from src.tools.rag.nccn_image_rag import NCCNImageRag
+
+        MultiVectorStore.write(tmp_path / "nccn_test" / STORE_DIRNAME, page_embeddings, pages)
+        rag = NCCNImageRag(index_root=str(tmp_path), device="cpu", enable_multimodal_reading=False)
+        rag.load_index("nccn_test")
+
+        rng = np.random.default_rng(7)
+        encoder = MagicMock()
+        encoder.encode_batch.side_effect = lambda qs: [rng.standard_normal((3, DIM)).astype(np.float32) for _ in qs]
+        with patch("src.tools.rag.nccn_image_rag.get_query_encoder", return_value=encoder):
+            first = rag.search_batch(["MSI-H immunotherapy", "msi-h  immunotherapy", "KRAS"], top_k=2)
+            second = rag.search_batch(["KRAS", "MSI-H Immunotherapy"], top_k=2)
+
+        # 首次调用：两个归一化键，一次前向；第二次全部命中缓存
+        encoder.encode_batch.assert_called_once()
+        assert len(encoder.encode_batch.call_args[0][0]) == 2
+        assert first[0] == first[1]
+        assert second == [first[2], first[0]]
@@ -0,0 +1,232 @@
+"""
+服务模式单元测试
+
+测试覆盖:
+- 任务队列：按序领取、完成 / 失败 / 取消、进度事件序号、重启后中断任务重新排队，
+  达到最多执行次数的标记失败
+- HTTP API：提交 → 工作线程并发执行 → 查询结果；节点进度事件（JSON 与 SSE）；
+  非法请求 / 查询参数 400、取消已结束任务 409
+- 并发病例的 LLM 调用点遥测、延迟分布与上游状态按运行隔离
+"""
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import TypedDict
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.service.job_queue import JobQueue
+from src.service.server import MtbService, create_server
+
+
+class TestJobQueue:
+
+    def test_lifecycle(self, tmp_path):
+        queue = JobQueue(tmp_path / "jobs.sqlite")
+        first = queue.submit("病例一", label="a")
+        second = queue.submit("病例二")
+        third = queue.submit("病例三")
+
+        claimed = queue.claim()
+        assert claimed["id"] == first and claimed["input_text"] == "病例一" and claimed["attempts"] == 1
+        queue.finish(first, {"output_path": "r.html"})
+        assert queue.get(first)["status"] == "succeeded" and queue.get(first)["result"] == {"output_path": "r.html"}
+        assert [e["kind"] for e in queue.events(first)] == ["queued", "succeeded"]
+        assert queue.events(first, after=1)[0]["output_path"] == "r.html"
+
+        assert queue.cancel(third) and not queue.cancel(first)
+        assert queue.claim()["id"] == second
+        assert queue.claim() is None
+        queue.close()
+
+        reopened = JobQueue(tmp_path / "jobs.sqlite")
+        assert reopened.requeue_interrupted() == 1
+        job = reopened.claim()
+        assert job["id"] == second and job["attempts"] == 2
+        reopened.fail(second, "boom")
+        assert reopened.stats() == {"succeeded": 1, "failed": 1, "cancelled": 1}
+        assert [j["id"] for j in reopened.list_jobs(status="failed")] == [second]
+
+    def test_requeue_attempt_cap(self, tmp_path):
+        queue = JobQueue(tmp_path / "jobs.sqlite")
+        job_id = queue.submit("反复中断的病例")
+        for attempt in range(1, 3):
+            assert queue.claim()["attempts"] == attempt
+            assert queue.requeue_interrupted(max_attempts=2) == (1 if attempt < 2 else 0)
+
+        job = queue.get(job_id)
+        assert job["status"] == "failed" and "2 次" in job["error"]
+        assert [e["kind"] for e in queue.events(job_id)] == ["queued", "requeued", "failed"]
+        assert queue.claim() is None
+
+
+def _fake_workflow(input_text, callbacks=None):
+    """两节点的小图代替完整工作流，回调照常触发"""
+    from langgraph.graph import StateGraph, END
+
+    class S(TypedDict):
+        text: str
+
+    def slow(state):
+        time.sleep(0.2)
+        if "fail" in state["text"]:
+            raise RuntimeError("upstream down")
+        return {"text": state["text"]}
+
+    graph = StateGraph(S)
+    graph.add_node("pdf_parser", lambda s: s)
+    graph.add_node("chair", slow)
+    graph.set_entry_point("pdf_parser")
+    graph.add_edge("pdf_parser", "chair")
+    graph.add_edge("chair", END)
+    graph.compile().invoke({"text": input_text}, config={"callbacks": callbacks})
+    return {"run_id": f"run_{input_text}", "output_path": f"/reports/{input_text}.html",
+            "execution_time": 0.2, "usage_summary": {"total": {"calls": 3}}}
+
+
+class TestHttpApi:
+
+    @pytest.fixture
+    def api(self, tmp_path):
+        service = MtbService(JobQueue(tmp_path / "jobs.sqlite"), workers=2)
+        server = create_server(service, "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        with patch("src.graph.state_graph.run_mtb_workflow", _fake_workflow):
+            service.start()
+            thread.start()
+            yield f"http://127.0.0.1:{server.server_address[1]}", service
+            server.shutdown()
+            service.stop(timeout=5)
+        server.server_close()
+
+    @staticmethod
+    def _request(url, method="GET", body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def _wait(self, base, job_id):
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            job = self._request(f"{base}/jobs/{job_id}")[1]
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.05)
+        raise AssertionError(f"任务 {job_id} 未结束")
+
+    def test_submit_run_and_events(self, api):
+        base, service = api
+        start = time.time()
+        ids = [self._request(f"{base}/jobs", "POST", {"case_text": t})[1]["job_id"] for t in ("c1", "c2")]
+        jobs = [self._wait(base, i) for i in ids]
+        assert time.time() - start < 0.39  # 两个病例并发执行
+
+        assert [j["status"] for j in jobs] == ["succeeded", "succeeded"]
+        assert jobs[0]["result"]["output_path"] == "/reports/c1.html" and jobs[0]["result"]["usage"] == {"calls": 3}
+
+        status, events = self._request(f"{base}/jobs/{ids[0]}/events")
+        assert [(e["kind"], e.get("node")) for e in events] == [
+            ("queued", None), ("started", None), ("node_start", "pdf_parser"), ("node_end", "pdf_parser"),
+            ("node_start", "chair"), ("node_end", "chair"), ("succeeded", None)]
+
+        with urllib.request.urlopen(f"{base}/jobs/{ids[0]}/events?stream=1&after=5", timeout=10) as response:
+            stream = response.read().decode()
+        assert stream.count("\n\n") == 2 and "event: succeeded" in stream
+
+        assert self._request(f"{base}/health")[1]["jobs"] == {"succeeded": 2}
+
+    def test_failures_and_errors(self, api):
+        base, _ = api
+        job_id = self._request(f"{base}/jobs", "POST", {"case_text": "fail"})[1]["job_id"]
+        job = self._wait(base, job_id)
+        assert job["status"] == "failed" and "upstream down" in job["error"]
+        assert self._request(f"{base}/jobs/{job_id}/events")[1][-2]["error"].startswith("RuntimeError")
+
+        assert self._request(f"{base}/jobs", "POST", {"label": "x"})[0] == 400
+        assert self._request(f"{base}/jobs/{job_id}", "DELETE")[0] == 409
+        assert self._request(f"{base}/jobs/999")[0] == 404
+        for path in ("jobs?limit=abc", "jobs?limit=0", "jobs?limit=100000", f"jobs/{job_id}/events?after=x",
+                     f"jobs/{job_id}/events?after=-1"):
+            assert self._request(f"{base}/{path}")[0] == 400, path
+        assert len(self._request(f"{base}/jobs?limit=1")[1]) == 1
+
+
+def _counting_workflow():
+    """单节点图：按病例文本中的数字发出若干次 LLM 调用与上游请求"""
+    from langgraph.graph import StateGraph, END
+    from src.tools.api_clients.circuit_breaker import get_breaker
+    from src.utils.llm_budget import CallBudget, run_with_budget
+    from src.utils.llm_hedging import hedged_call
+
+    class S(TypedDict):
+        input_text: str
+
+    def call():
+        time.sleep(0.02)
+        get_breaker("civic").record(True, 0.02)
+        return {"usage": {"prompt_tokens": 10, "completion_tokens": 5}, "choices": [{"finish_reason": "stop"}]}
+
+    def node(state):
+        budget = CallBudget("isolation_test", 100, "", 30, 100)
+        for _ in range(int(state["input_text"])):
+            run_with_budget(budget, lambda b: hedged_call(b.site, "m", call, enabled=False))
+        return {}
+
+    graph = StateGraph(S)
+    graph.add_node("chair", node)
+    graph.set_entry_point("chair")
+    graph.add_edge("chair", END)
+    return graph.compile()
+
+
+class TestRunIsolation:
+
+    @pytest.fixture(autouse=True)
+    def fresh_breakers(self):
+        from src.tools.api_clients import circuit_breaker
+
+        circuit_breaker.reset_breakers()
+        yield
+        circuit_breaker.reset_breakers()
+
+    def test_concurrent_jobs_report_own_calls(self, tmp_path):
+        from src.graph import state_graph
+        from src.utils.llm_budget import budget_telemetry
+
+        run_workflow = state_graph.run_mtb_workflow
+        final_states = {}
+
+        def capture(input_text, callbacks=None):
+            final_states[input_text] = run_workflow(input_text, callbacks=callbacks)
+            return {**final_states[input_text], "output_path": f"/reports/{input_text}.html"}
+
+        before = budget_telemetry.summary().get("isolation_test", {}).get("calls", 0)
+        service = MtbService(JobQueue(tmp_path / "jobs.sqlite"), workers=2)
+        with patch.object(state_graph, "get_mtb_workflow", _counting_workflow), \
+                patch.object(state_graph, "run_mtb_workflow", capture):
+            service.start()
+            ids = [service.submit(text) for text in ("2", "5")]
+            deadline = time.time() + 10
+            while time.time() < deadline and any(service.queue.get(i)["status"] != "succeeded" for i in ids):
+                time.sleep(0.05)
+            service.stop(timeout=5)
+
+        assert [service.queue.get(i)["status"] for i in ids] == ["succeeded", "succeeded"]
+        for text, calls in (("2", 2), ("5", 5)):
+            state = final_states[text]
+            assert state["llm_budget_telemetry"]["isolation_test"]["calls"] == calls
+            assert state["upstream_health"]["civic"]["requests"] == calls
+            assert state["usage_summary"]["total"]["calls"] == calls
+        # 进程级统计仍累计全部病例（对冲延迟与熔断依赖跨病例样本）
+        assert budget_telemetry.summary()["isolation_test"]["calls"] - before == 7
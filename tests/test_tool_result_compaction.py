@@ -0,0 +1,126 @@
+"""
+工具结果压缩单元测试
+
+测试覆盖:
+- 摘要保留 PMID / NCT 等标识符与字段行，长文本字段截断
+- 超出预算时从最早一轮开始压缩，当前轮不压缩
+- 已压缩的结果不重复压缩，完整结果保留在 tool_call_history
+- 多轮工具调用中每轮输入规模基本平稳（mock API）
+"""
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.tool_result_compaction import (
+    DIGEST_HEADER, compact_tool_messages, digest_tool_result, extract_identifiers,
+)
+
+
+def _pubmed_result(n, pmid_start=30000000):
+    parts = ["## PubMed 检索结果", ""]
+    for i in range(n):
+        parts += [
+            f"### {i + 1}. Osimertinib trial {i}",
+            f"- **PMID**: {pmid_start + i}",
+            f"- **摘要**: {'long abstract text ' * 60}",
+            f"- **链接**: https://pubmed.ncbi.nlm.nih.gov/{pmid_start + i}/",
+            "---",
+        ]
+    return "\n".join(parts)
+
+
+class TestDigest:
+
+    def test_keeps_identifiers_and_fields(self):
+        content = _pubmed_result(3) + "\n### 4. NCT04487080 - Amivantamab\n**Phase**: PHASE3"
+        digest = digest_tool_result("search_pubmed", content)
+
+        assert digest.startswith(f"{DIGEST_HEADER} search_pubmed")
+        assert "ref=" not in digest
+        assert "PMID 30000000, 30000001, 30000002" in digest
+        assert "NCT04487080" in digest
+        assert "**Phase**: PHASE3" in digest
+        assert len(digest) < len(content) / 3
+
+    def test_identifier_dedup(self):
+        ids = extract_identifiers("PMID: 12345678 ... pubmed.ncbi.nlm.nih.gov/12345678 VCV000016609 rs121434568")
+        assert ids == {"PMID": ["12345678"], "ClinVar": ["VCV000016609"], "rsID": ["rs121434568"]}
+
+
+class TestCompaction:
+
+    def _messages(self, rounds):
+        messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "task"}]
+        for r in range(rounds):
+            call_id = f"call_{r}"
+            messages.append({"role": "assistant", "content": "", "tool_calls": [
+                {"id": call_id, "type": "function", "function": {"name": "search_pubmed", "arguments": "{}"}},
+            ]})
+            content = _pubmed_result(5, 30000000 + r * 10)
+            messages.append({"role": "tool", "tool_call_id": call_id, "content": content})
+        return messages
+
+    def test_oldest_compacted_current_round_protected(self):
+        messages = self._messages(3)
+        original = [m["content"] for m in messages]
+
+        saved = compact_tool_messages(messages, budget_tokens=10, protect_from=6)
+
+        assert saved > 0
+        assert messages[3]["content"].startswith(f"{DIGEST_HEADER} search_pubmed")
+        assert messages[5]["content"].startswith(DIGEST_HEADER)
+        assert messages[7]["content"] == original[7]
+
+    def test_digest_not_recompacted(self):
+        messages = self._messages(3)
+        compact_tool_messages(messages, budget_tokens=10, protect_from=6)
+        digests = [messages[3]["content"], messages[5]["content"]]
+
+        assert compact_tool_messages(messages, budget_tokens=10, protect_from=6) == 0
+        assert [messages[3]["content"], messages[5]["content"]] == digests
+
+    def test_under_budget_untouched(self):
+        messages = self._messages(2)
+        assert compact_tool_messages(messages, budget_tokens=10 ** 6, protect_from=4) == 0
+        assert compact_tool_messages(messages, budget_tokens=0, protect_from=4) == 0
+
+
+class TestAgentRounds:
+
+    def test_round_input_stays_flat(self):
+        from src.agents.base_agent import BaseAgent
+
+        class _Tool:
+            name = "search_pubmed"
+            calls = 0
+
+            def invoke(self, **kwargs):
+                _Tool.calls += 1
+                return _pubmed_result(6, 30000000 + _Tool.calls * 100)
+
+            def to_openai_function(self):
+                return {"type": "function", "function": {"name": self.name, "parameters": {}}}
+
+        sent_sizes = []
+
+        def fake_api(messages, include_tools=False):
+            sent_sizes.append(len(json.dumps(messages, ensure_ascii=False)))
+            call = {"id": f"c{len(sent_sizes)}", "function": {"name": "search_pubmed", "arguments": "{}"}}
+            return {"choices": [{"message": {"content": "", "tool_calls": [call]}}]}
+
+        with patch.object(BaseAgent, "_build_system_prompt", return_value="sys"), \
+                patch("src.agents.base_agent.TOOL_RESULT_CONTEXT_BUDGET_TOKENS", 2500):
+            agent = BaseAgent(role="Test", prompt_file="x.md", tools=[_Tool()])
+            with patch.object(agent, "_call_api", side_effect=fake_api):
+                agent.invoke("task", max_tool_iterations=5)
+
+        # 每轮新增的只是上一轮结果的摘要，而非完整结果
+        raw_size = len(_pubmed_result(6))
+        growth = [b - a for a, b in zip(sent_sizes[1:], sent_sizes[2:])]
+        assert all(g < raw_size / 3 for g in growth)
+        # 消息历史被压缩，但 tool_call_history 仍保留完整结果用于报告
+        assert len(agent.tool_call_history) == 5
+        assert agent.tool_call_history[0].result == _pubmed_result(6, 30000100)
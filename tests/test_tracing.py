@@ -0,0 +1,114 @@
+"""
+运行追踪单元测试
+
+测试覆盖:
+- 无 Trace 时 span() 为空操作；嵌套 span 的父子关系与 Chrome trace 导出
+- in_trace_context() 把 Trace 带入线程池
+- LangGraph 节点回调：子图节点的父 span、并行分支中最慢者进入关键路径
+- OTLP JSON 结构
+"""
+import operator
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Annotated, TypedDict
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.tracing import (
+    current_trace,
+    in_trace_context,
+    instant,
+    run_trace,
+    span,
+)
+
+
+class TestSpans:
+
+    def test_noop_without_trace(self):
+        assert current_trace() is None
+        with span("x", "llm") as s:
+            s.set(tokens=1)
+        instant("cache.x")
+
+    def test_nesting_and_chrome_export(self, tmp_path):
+        def work(i):
+            with span(f"t{i}", "tool"):
+                pass
+
+        with run_trace("t") as trace:
+            with span("direction D1", "research") as outer:
+                with span("research_turn", "llm") as inner:
+                    inner.set(prompt_tokens=10)
+                instant("gdc.gene", key="KRAS")
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="pool") as pool:
+                list(pool.map(in_trace_context(work), range(2)))
+
+        data = trace.to_chrome()
+        complete = {e["name"]: e for e in data["traceEvents"] if e["ph"] == "X"}
+        assert complete["research_turn"]["args"]["parent_id"] == outer.span_id
+        assert complete["research_turn"]["args"]["prompt_tokens"] == 10
+        assert complete["direction D1"]["dur"] >= complete["research_turn"]["dur"]
+        assert [e["name"] for e in data["traceEvents"] if e["ph"] == "i"] == ["gdc.gene"]
+        assert {"t0", "t1"} <= set(complete)
+        assert any(e["args"]["name"].startswith("pool") for e in data["traceEvents"] if e["name"] == "thread_name")
+
+        path = trace.export_chrome(tmp_path / "trace.json")
+        assert path.exists() and current_trace() is None
+
+    def test_otlp_parents(self):
+        with run_trace("t") as trace:
+            with span("a", "graph"):
+                with span("b", "graph"):
+                    pass
+        spans = {s["name"]: s for s in trace.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+        assert spans["b"]["parentSpanId"] == spans["a"]["spanId"]
+        assert len(spans["a"]["traceId"]) == 32 and int(spans["a"]["endTimeUnixNano"]) >= int(spans["a"]["startTimeUnixNano"])
+
+
+class TestGraphCallback:
+
+    def test_nodes_and_critical_path(self):
+        from langgraph.graph import StateGraph, END
+
+        class S(TypedDict):
+            x: Annotated[list, operator.add]
+
+        def sleeper(name, seconds):
+            def node(state):
+                with span("llm call", "llm"):
+                    time.sleep(seconds)
+                return {"x": [name]}
+            return node
+
+        sub = StateGraph(S)
+        sub.add_node("phase1_fast", sleeper("fast", 0.01))
+        sub.add_node("phase1_slow", sleeper("slow", 0.08))
+        sub.add_node("phase1_aggregator", sleeper("agg", 0.0))
+        sub.set_entry_point("phase1_fast")
+        sub.add_edge("__start__", "phase1_slow")
+        sub.add_edge(["phase1_fast", "phase1_slow"], "phase1_aggregator")
+        sub.add_edge("phase1_aggregator", END)
+
+        graph = StateGraph(S)
+        graph.add_node("plan", sleeper("plan", 0.0))
+        graph.add_node("research", sub.compile())
+        graph.set_entry_point("plan")
+        graph.add_edge("plan", "research")
+        graph.add_edge("research", END)
+
+        with run_trace("t") as trace:
+            graph.compile().invoke({"x": []}, config={"callbacks": [trace.graph_callback()]})
+
+        nodes = {s.name: s for s in trace._spans if s.category == "node"}
+        assert nodes["phase1_slow"].parent_id == nodes["research"].span_id
+        assert nodes["plan"].parent_id is None
+
+        summary = {row["phase"]: row for row in trace.phase_summary()}
+        assert list(summary) == ["plan", "phase1"]
+        path = [p["node"] for p in summary["phase1"]["critical_path"]]
+        assert "phase1_slow" in path and "phase1_fast" not in path
+        assert summary["phase1"]["llm_calls"] == 3
+        assert summary["phase1"]["llm_seconds"] >= 0.08
@@ -0,0 +1,109 @@
+"""
+Token 用量账本单元测试
+
+测试覆盖:
+- run_with_budget 记账：标签、缓存命中、usage.cost 优先、按单价估算、无账本时忽略
+- 阶段软预算：超出后 reasoning effort 降一档、工具轮数减半
+- 保存 / 读取与 CLI 汇总
+"""
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.llm_budget import CallBudget, run_with_budget
+from src.utils import usage_ledger
+from src.utils.usage_ledger import (
+    UsageLedger,
+    estimate_cost,
+    guard_tool_rounds,
+    main,
+    run_ledger,
+    usage_tags,
+)
+
+
+def _response(prompt=1000, cached=0, completion=200, cost=None):
+    usage = {"prompt_tokens": prompt, "completion_tokens": completion,
+             "prompt_tokens_details": {"cached_tokens": cached}}
+    if cost is not None:
+        usage["cost"] = cost
+    return {"model": "google/gemini-3-flash-preview", "usage": usage,
+            "choices": [{"finish_reason": "stop", "message": {"content": "ok"}}]}
+
+
+def _budget(effort):
+    return CallBudget(site="research_turn", max_tokens=1000, reasoning_effort=effort, timeout=60, max_tokens_ceiling=4000)
+
+
+class TestRecording:
+
+    def test_tags_and_cost(self):
+        budget = _budget("high")
+        with run_ledger({}) as ledger, patch.object(usage_ledger, "_current_node", return_value="phase2a_oncologist"):
+            with usage_tags(agent="Oncologist", iteration=2, direction="D3"):
+                run_with_budget(budget, lambda b: _response(cached=400, cost=0.0123))
+            run_with_budget(budget, lambda b: _response(cached=400))
+
+        first, second = ledger.entries()
+        assert (first["phase"], first["node"], first["agent"], first["iteration"], first["direction"]) == \
+            ("phase2a", "phase2a_oncologist", "Oncologist", 2, "D3")
+        assert first["cached_tokens"] == 400 and first["call_site"] == "research_turn"
+        assert (first["cost_usd"], first["cost_source"]) == (0.0123, "openrouter")
+        assert second["agent"] == "" and second["cost_source"] == "estimate"
+        assert second["cost_usd"] == round((600 * 0.5 + 400 * 0.05 + 200 * 3.0) / 1e6, 6)
+
+    def test_unpriced_and_no_ledger(self):
+        assert estimate_cost("unknown/model", {"prompt_tokens": 10}) == (0.0, "unpriced")
+        run_with_budget(_budget(""), lambda b: _response())  # 无账本不报错
+
+
+class TestPhaseBudget:
+
+    def test_downgrade_after_budget(self):
+        budget = _budget("high")
+        sent = []
+
+        def send(b):
+            sent.append(b.reasoning_effort)
+            return _response(prompt=800, completion=400)
+
+        with run_ledger({"phase1": 1000}) as ledger, \
+                patch.object(usage_ledger, "_current_node", return_value="phase1_geneticist"):
+            assert guard_tool_rounds(5) == 5
+            run_with_budget(budget, send)
+            run_with_budget(budget, send)
+            assert guard_tool_rounds(5) == 2 and guard_tool_rounds(1) == 1
+
+        assert sent == ["high", "medium"]
+        assert [e["downgraded"] for e in ledger.entries()] == [False, True]
+
+    def test_other_phase_unaffected(self):
+        with run_ledger({"phase1": 10}) as ledger:
+            ledger.record({"phase": "phase1", "prompt_tokens": 100, "completion_tokens": 0})
+            with patch.object(usage_ledger, "_current_node", return_value="chair"):
+                assert guard_tool_rounds(3) == 3
+
+
+class TestReport:
+
+    def test_save_load_and_cli(self, tmp_path, capsys):
+        ledger = UsageLedger({})
+        for phase, agent, cost in (("phase1", "Pathologist", 0.01), ("phase1", "Geneticist", 0.02), ("chair", "Chair", 0.05)):
+            ledger.record({"phase": phase, "agent": agent, "call_site": "s", "prompt_tokens": 100,
+                           "completion_tokens": 10, "cost_usd": cost, "latency": 1.0})
+        ledger.save(tmp_path / usage_ledger.LEDGER_FILENAME, run_id="r1")
+
+        loaded = UsageLedger.load(tmp_path)
+        assert len(loaded) == 3 and loaded[0]["run_id"] == "r1"
+
+        assert main([str(tmp_path), "--by", "phase", "--json"]) == 0
+        summary = json.loads(capsys.readouterr().out)
+        assert summary["groups"]["phase1"]["calls"] == 2
+        assert summary["total"]["cost_usd"] == 0.08 and summary["total"]["prompt_tokens"] == 300
+
+        assert main([str(tmp_path), "--by", "phase", "agent"]) == 0
+        out = capsys.readouterr().out
+        assert out.splitlines()[1].startswith("chair / Chair") and "合计" in out
@@ -0,0 +1,131 @@
+"""
+离线端到端基准组件单元测试
+
+测试覆盖:
+- 延迟分布描述解析
+- 脚本化回复：研究计划可通过 PlanAgent 解析与模块覆盖校验；研究轮次先调工具后输出 findings
+- 本地上游替身：PubMed 检索 / 摘要、ClinicalTrials.gov 分页与详情
+- 基准结果对比
+"""
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.mock_openrouter import latency_distribution
+from benchmarks.mock_upstreams import MockUpstreams
+from benchmarks.workflow_benchmark import ScriptedResponder, compare
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class TestLatencyDistribution:
+
+    def test_specs(self):
+        assert latency_distribution("fixed:0.5")() == 0.5
+        assert all(0.2 <= latency_distribution("uniform:0.2,0.4")() <= 0.4 for _ in range(20))
+        samples = [latency_distribution("lognormal:1.0,0.5", seed=1)() for _ in range(3)]
+        assert all(s > 0 for s in samples)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            latency_distribution("gamma:1")
+
+
+class TestScriptedResponder:
+
+    def test_plan_covers_required_modules(self):
+        from src.agents.plan_agent import PlanAgent
+
+        case_text = (FIXTURES / "test_case_crc.txt").read_text(encoding="utf-8")
+        responder = ScriptedResponder()
+        agent = PlanAgent.__new__(PlanAgent)
+        agent.role = "PlanAgent"
+        output = responder({"messages": [{"role": "user", "content": agent._build_analysis_prompt(case_text)}]})
+
+        plan = agent._parse_plan_output(output)  # 覆盖不完整时抛出 ValueError
+        assert plan.key_entities["cancer_type"] == ["colorectal cancer"]
+        assert "KRAS" in plan.key_entities["genes"]
+        assert responder.snapshot() == {"plan": 1}
+
+    def test_research_turn_calls_tools_then_reports(self):
+        responder = ScriptedResponder(tool_rounds=1, tools_per_round=2)
+        tools = [
+            {"type": "function", "function": {"name": "query_evidence_graph", "parameters": {"properties": {}}}},
+            {"type": "function", "function": {"name": "search_pubmed", "parameters": {
+                "properties": {"query": {"type": "string"}, "max_results": {"type": "integer"}}, "required": ["query"]}}},
+            {"type": "function", "function": {"name": "search_civic", "parameters": {
+                "properties": {"gene": {"type": "string"}, "variant": {"type": "string"}}}}},
+        ]
+        messages = [{"role": "user", "content": '## 研究模式: BFRS\n请以 JSON 格式输出（direction_id 固定为 "D3"）'}]
+
+        first = responder({"messages": messages, "tools": tools})
+        names = [c["function"]["name"] for c in first["tool_calls"]]
+        assert sorted(names) == ["search_civic", "search_pubmed"]
+        args = json.loads(next(c for c in first["tool_calls"] if c["function"]["name"] == "search_civic")["function"]["arguments"])
+        assert set(args) == {"gene", "variant"}
+
+        messages += [first] + [
+            {"role": "tool", "tool_call_id": c["id"], "content": "PMID: 31234567 synthetic"} for c in first["tool_calls"]
+        ]
+        final = responder({"messages": messages, "tools": tools})
+        data = json.loads(final.split("```json\n", 1)[1].rsplit("\n```", 1)[0])
+        assert [f["direction_id"] for f in data["findings"]] == ["D3", "D3"]
+        assert data["findings"][0]["pmid"] == "31234567"
+        assert "entities" in data["findings"][0] and "entities" not in data["findings"][1]
+
+
+class TestMockUpstreams:
+
+    @pytest.fixture(autouse=True)
+    def fresh_breakers(self):
+        from src.tools.api_clients import circuit_breaker
+
+        circuit_breaker.reset_breakers()
+        yield
+        circuit_breaker.reset_breakers()
+
+    def test_pubmed(self):
+        from src.tools.api_clients.ncbi_client import NCBIClient
+
+        with MockUpstreams(pubmed_hits=3) as upstreams, \
+                patch.object(NCBIClient, "BASE_URL", f"{upstreams.url}/ncbi"):
+            articles = NCBIClient(api_key="k").search_pubmed("KRAS G12C", max_results=5)
+            again = NCBIClient(api_key="k").search_pubmed("KRAS G12C", max_results=5)
+
+        assert len(articles) == 3 and all(a["abstract"] for a in articles)
+        assert [a["pmid"] for a in articles] == [a["pmid"] for a in again]
+        assert upstreams.snapshot() == {"ncbi": 4}
+
+    def test_clinical_trials_pages(self):
+        from src.tools.api_clients import clinicaltrials_client
+        from src.tools.api_clients.clinicaltrials_client import ClinicalTrialsClient
+
+        with MockUpstreams(trials_per_query=7) as upstreams, \
+                patch.object(ClinicalTrialsClient, "BASE_URL", f"{upstreams.url}/ctgov"), \
+                patch.object(clinicaltrials_client, "CLINICALTRIALS_PAGE_SIZE", 3):
+            client = ClinicalTrialsClient()
+            pages = list(client.iter_summary_pages({"query.cond": "colorectal cancer"}, limit=10))
+            details = client._fetch_details([pages[0][0][0]["nct_id"]])
+
+        assert [len(page) for page, _ in pages] == [3, 3, 1]
+        assert pages[-1][1] is None
+        assert next(iter(details.values()))["eligibility_criteria"].startswith("Inclusion Criteria")
+
+
+class TestCompare:
+
+    def test_relative_change(self):
+        def case(wall, calls):
+            return {"case": "a.txt", "wall_seconds": wall, "peak_rss_mb": 100,
+                    "llm": {"calls": calls, "prompt_tokens": 10, "completion_tokens": 5},
+                    "graph": {"entities": 4}}
+
+        result = compare({"cases": [case(5.0, 90)]}, {"cases": [case(10.0, 100), {"case": "b.txt", "error": "x"}]})
+        assert result["a.txt"]["wall_seconds"]["change"] == -0.5
+        assert result["a.txt"]["llm_calls"] == {"baseline": 100, "current": 90, "change": -0.1}
+        assert set(result) == {"a.txt"}